@@ -0,0 +1,12 @@
+#!/usr/bin/env bash
+
+FILE_DIR=$(dirname "$0")
+
+. "$FILE_DIR/lib/setup_ssh_keys.sh"
+setup_ssh_keys "selected_tests"
+
+export LC_ALL=C.UTF-8
+export LANG=C.UTF-8
+
+poetry run mappings --log-format json update-all
+exit 0 # Since this is meant to be run as a cronjob in kubernetes, always exit 0.
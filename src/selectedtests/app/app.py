@@ -1,21 +1,30 @@
 """Application to serve API of selected-tests service."""
 import traceback
 
+from time import perf_counter
+from typing import Awaitable, Callable, Optional
+
 import structlog
 
 from evergreen import EvergreenApi
 from fastapi import FastAPI
 from miscutils.logging_config import Verbosity
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Match
 
+from selectedtests.app import server_timing
+from selectedtests.app.config_watcher import ConfigWatcher, ProjectGenerations
 from selectedtests.app.controllers import (
     health_controller,
+    metrics_controller,
     project_task_mappings_controller,
     project_test_mappings_controller,
 )
+from selectedtests.app.mapping_index import MappingIndex
 from selectedtests.config.logging_config import config_logging
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.metrics import REQUEST_SECONDS
 
 LOGGER = structlog.get_logger(__name__)
 
@@ -29,12 +38,36 @@ def log_exception(ex: Exception) -> None:
     )
 
 
-def create_app(mongo_wrapper: MongoWrapper, evg_api: EvergreenApi) -> FastAPI:
+def route_of(request: Request) -> str:
+    """
+    Get the path template of the route a request is for, to label its metrics by.
+
+    :param request: The request.
+    :return: The path of the matching route, 'unmatched' if none match.
+    """
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def create_app(
+    mongo_wrapper: MongoWrapper,
+    evg_api: EvergreenApi,
+    mapping_index: Optional[MappingIndex] = None,
+    watch_config: bool = True,
+) -> FastAPI:
     """
     Create a selected-tests REST API.
 
     :param mongo_wrapper: MongoDB wrapper.
     :param evg_api: Evergreen Api.
+    :param mapping_index: In-memory index to serve the mappings from, loaded when the application
+     starts up and invalidated by a watcher of project_config. The mappings are read from the
+     database if not given.
+    :param watch_config: Whether project_config is watched to invalidate the mapping index. If
+     not, the projects of the index are only loaded when the caller invalidates them.
     :return: The application.
     """
     config_logging(verbosity=Verbosity.INFO, human_readable=False)
@@ -48,6 +81,7 @@ def create_app(mongo_wrapper: MongoWrapper, evg_api: EvergreenApi) -> FastAPI:
         openapi_url="/swagger.json",
     )
     app.include_router(health_controller.router, prefix="/health", tags=["health"])
+    app.include_router(metrics_controller.router, prefix="/metrics", tags=["metrics"])
     app.include_router(
         project_task_mappings_controller.router,
         prefix="/projects/{project}/task-mappings",
@@ -60,6 +94,35 @@ def create_app(mongo_wrapper: MongoWrapper, evg_api: EvergreenApi) -> FastAPI:
     )
     app.state.db = mongo_wrapper
     app.state.evg_api = evg_api
+    app.state.mapping_index = mapping_index
+    app.state.project_generations = ProjectGenerations()
+    if mapping_index is not None:
+        app.state.project_generations.subscribe(mapping_index.invalidate)
+        app.add_event_handler("startup", mapping_index.start)
+        if watch_config:
+            config_watcher = ConfigWatcher.from_env(mongo_wrapper, app.state.project_generations)
+            app.add_event_handler("startup", config_watcher.start)
+            app.add_event_handler("shutdown", config_watcher.stop)
+        app.add_event_handler("shutdown", mapping_index.stop)
+
+    @app.middleware("http")
+    async def time_request(
+        request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        """Record the time taken to answer a request, by route."""
+        start = perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            REQUEST_SECONDS.labels(request.method, route_of(request), str(status)).observe(
+                perf_counter() - start
+            )
+
+    if server_timing.is_enabled():
+        app.middleware("http")(server_timing.server_timing_middleware)
 
     @app.exception_handler(Exception)
     async def uncaught_exception_handler(request: Request, exc: Exception) -> JSONResponse:
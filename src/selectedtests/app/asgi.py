@@ -1,6 +1,11 @@
 """ASGI Support."""
 
 from selectedtests.app.app import create_app
+from selectedtests.app.mapping_index import MappingIndex
 from selectedtests.helpers import get_evg_api, get_mongo_wrapper
 
-app = create_app(get_mongo_wrapper(), get_evg_api())
+# The API only reads the mappings, which can be slightly out of date.
+API_READ_PREFERENCE = "secondaryPreferred"
+
+mongo = get_mongo_wrapper(default_read_preference=API_READ_PREFERENCE)
+app = create_app(mongo, get_evg_api(), MappingIndex.from_env(mongo))
@@ -0,0 +1,185 @@
+"""Watch project_config to tell the in-process caches when the mappings of a project change."""
+from __future__ import annotations
+
+import os
+import threading
+
+from typing import Callable, Dict, List, Mapping, Optional
+
+import structlog
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.project_config import GENERATION_KEY
+
+LOGGER = structlog.get_logger(__name__)
+
+POLL_SECONDS_ENV_VAR = "SELECTED_TESTS_CONFIG_POLL_SECONDS"
+DEFAULT_POLL_SECONDS = 60.0
+# How long the change stream waits for a change before checking whether it was stopped.
+MAX_AWAIT_TIME_MS = 1000
+# Errors of servers that are not replica sets, or that are too old to support change streams.
+CHANGE_STREAMS_UNSUPPORTED_CODES = {40573, 40324}
+
+GenerationListener = Callable[[str, int], None]
+
+
+class ProjectGenerations(object):
+    """
+    The latest generation seen of the project_config of each project.
+
+    Listeners are called with the project and its new generation whenever a project is first seen
+    or its generation changes, so caches can drop what they hold for the project.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty ProjectGenerations."""
+        self._generations: Dict[str, int] = {}
+        self._listeners: List[GenerationListener] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener: GenerationListener) -> None:
+        """
+        Call the given listener whenever the generation of a project changes.
+
+        :param listener: Function called with the project and its new generation.
+        """
+        self._listeners.append(listener)
+
+    def get(self, project: str) -> Optional[int]:
+        """
+        Get the latest generation seen of a project.
+
+        :param project: The evergreen project.
+        :return: The generation, None if the project has not been seen.
+        """
+        return self._generations.get(project)
+
+    def publish(self, project: str, generation: int) -> bool:
+        """
+        Record the generation of a project, notifying the listeners if it changed.
+
+        :param project: The evergreen project.
+        :param generation: The generation of the project_config of the project.
+        :return: Whether the generation changed.
+        """
+        with self._lock:
+            if self._generations.get(project) == generation:
+                return False
+            self._generations[project] = generation
+
+        LOGGER.info("Project config advanced", project=project, generation=generation)
+        for listener in self._listeners:
+            try:
+                listener(project, generation)
+            except Exception:
+                LOGGER.exception("Project generation listener failed", project=project)
+        return True
+
+
+class ConfigWatcher(object):
+    """
+    Background thread publishing the generations of the project configs.
+
+    The generations are published again whenever a change stream on project_config reports a
+    change. Change streams need a replica set, so the watcher falls back to polling the
+    generations when they are not available.
+    """
+
+    def __init__(
+        self,
+        mongo: MongoWrapper,
+        generations: ProjectGenerations,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+    ):
+        """
+        Create a ConfigWatcher.
+
+        :param mongo: An instance of MongoWrapper.
+        :param generations: Where the generations are published to.
+        :param poll_seconds: The time between polls, and between attempts to reopen a change
+         stream that failed.
+        """
+        self.mongo = mongo
+        self.generations = generations
+        self.poll_seconds = poll_seconds
+        self.use_change_stream = True
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(
+        cls,
+        mongo: MongoWrapper,
+        generations: ProjectGenerations,
+        environ: Optional[Mapping[str, str]] = None,
+    ) -> ConfigWatcher:
+        """
+        Create a ConfigWatcher with the poll interval set by the environment.
+
+        :param mongo: An instance of MongoWrapper.
+        :param generations: Where the generations are published to.
+        :param environ: The environment to read, os.environ if not given.
+        :return: An instance of ConfigWatcher.
+        """
+        env: Mapping[str, str] = os.environ if environ is None else environ
+        poll_seconds = env.get(POLL_SECONDS_ENV_VAR)
+        return cls(
+            mongo, generations, float(poll_seconds) if poll_seconds else DEFAULT_POLL_SECONDS
+        )
+
+    def poll(self) -> None:
+        """Publish the current generation of every project config."""
+        projection = {"project": True, GENERATION_KEY: True}
+        for project_config in self.mongo.project_config().find({}, projection=projection):
+            self.generations.publish(
+                project_config["project"], project_config.get(GENERATION_KEY, 0)
+            )
+
+    def start(self) -> None:
+        """Start watching project_config in the background."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching project_config."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self) -> None:
+        """Publish the generations every time project_config changes, until stopped."""
+        with self.mongo.project_config().watch(max_await_time_ms=MAX_AWAIT_TIME_MS) as stream:
+            # Poll once the stream is open, so no change is missed between the two.
+            self.poll()
+            while not self._stop_event.is_set():
+                if stream.try_next() is not None:
+                    self.poll()
+
+    def _run(self) -> None:
+        """Watch or poll project_config until stopped."""
+        while True:
+            if self.use_change_stream:
+                try:
+                    self._watch()
+                except OperationFailure as err:
+                    if err.code in CHANGE_STREAMS_UNSUPPORTED_CODES:
+                        LOGGER.warning("Change streams are unavailable, polling instead")
+                        self.use_change_stream = False
+                        continue
+                    LOGGER.exception("Project config change stream failed")
+                except PyMongoError:
+                    LOGGER.exception("Project config change stream failed")
+            else:
+                try:
+                    self.poll()
+                except PyMongoError:
+                    LOGGER.exception("Failed to poll project config")
+
+            if self._stop_event.wait(self.poll_seconds):
+                break
@@ -0,0 +1,12 @@
+"""Controller for the metrics endpoint."""
+from fastapi import APIRouter
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from starlette.responses import Response
+
+router = APIRouter()
+
+
+@router.get("", include_in_schema=False)
+def metrics() -> Response:
+    """Get the metrics of the service in the Prometheus text format."""
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
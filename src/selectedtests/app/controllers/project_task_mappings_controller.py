@@ -1,20 +1,24 @@
 """Controller for task mappings."""
 from decimal import Decimal
-from typing import List
+from typing import List, Optional
 
 import structlog
 
 from evergreen import EvergreenApi
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 
-from selectedtests.app.dependencies import get_db, get_evg
+from selectedtests.app.dependencies import get_db, get_evg, get_mapping_index
 from selectedtests.app.evergreen import try_retrieve_evergreen_project
+from selectedtests.app.mapping_index import MappingIndex
 from selectedtests.app.models import CustomResponse
 from selectedtests.app.parsers import parse_changed_files
+from selectedtests.app.server_timing import INDEX_TIMING, MONGO_TIMING, timed, timed_endpoint
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.metrics import MAPPINGS_QUERY_SECONDS, MAPPINGS_RETURNED, TASK_MAPPINGS
 from selectedtests.task_mappings.get_task_mappings import get_correlated_task_mappings
 from selectedtests.work_items.task_mapping_work_item import ProjectTaskMappingWorkItem
+from selectedtests.work_items.work_item_priority import Priority
 
 LOGGER = structlog.get_logger(__name__)
 router = APIRouter()
@@ -37,6 +41,11 @@ class TaskMappingsWorkItem(BaseModel):
         description="Regex that will be used to decide what build variants are analyzed."
         "Compares to the build variant's display name.",
     )
+    priority: str = Field(
+        default="normal",
+        regex="^(high|normal|low)$",
+        description="Priority class of the work item, one of 'high', 'normal' or 'low'.",
+    )
 
 
 class TaskMappingsResponse(BaseModel):
@@ -54,12 +63,15 @@ class TaskMappingsResponse(BaseModel):
         404: {"description": "Evergreen project not found"},
     },
 )
+@timed_endpoint
 def get(
     changed_files: str,
     project: str,
     threshold: Decimal = Decimal(0),
+    lookback_months: Optional[int] = Query(default=None, gt=0),
     evg_api: EvergreenApi = Depends(get_evg),
     db: MongoWrapper = Depends(get_db),
+    mapping_index: Optional[MappingIndex] = Depends(get_mapping_index),
 ) -> TaskMappingsResponse:
     """
     Get a list of correlated task mappings for an input list of changed source files.
@@ -69,13 +81,30 @@ def get(
     :param project: The evergreen project.
     :param changed_files: List of source files to calculate correlated tasks for.
     :param threshold: Minimum threshold desired for flip_count / source_file_seen_count ratio
+    :param lookback_months: Only count the changes seen in this many most recent months.
+    :param mapping_index: In-memory index of the mappings, if the application keeps one.
     """
     LOGGER.info("Starting fetching task_mappings for project", project=project)
     evg_project = try_retrieve_evergreen_project(project, evg_api)
     LOGGER.info("Retrieved evergreen project information", evergreen_project=evg_project.identifier)
-    task_mappings = get_correlated_task_mappings(
-        db.task_mappings(), parse_changed_files(changed_files), evg_project.identifier, threshold
-    )
+    changed_source_files = parse_changed_files(changed_files)
+    task_mappings = None
+    # The index only holds the total counts, so windowed counts come from the database.
+    if mapping_index is not None and lookback_months is None:
+        with MAPPINGS_QUERY_SECONDS.labels(TASK_MAPPINGS, "index").time(), timed(INDEX_TIMING):
+            task_mappings = mapping_index.get_correlated_task_mappings(
+                changed_source_files, evg_project.identifier, threshold
+            )
+    if task_mappings is None:
+        with MAPPINGS_QUERY_SECONDS.labels(TASK_MAPPINGS, "mongo").time(), timed(MONGO_TIMING):
+            task_mappings = get_correlated_task_mappings(
+                db.task_mappings(),
+                changed_source_files,
+                evg_project.identifier,
+                threshold,
+                lookback_months,
+            )
+    MAPPINGS_RETURNED.labels(TASK_MAPPINGS).observe(len(task_mappings))
     return TaskMappingsResponse(task_mappings=task_mappings)
 
 
@@ -120,6 +149,7 @@ def post(
         module,
         module_source_file_regex,
         work_item_params.build_variant_regex,
+        Priority[work_item_params.priority.upper()],
     )
 
     if work_item.insert(db.task_mappings_queue()):
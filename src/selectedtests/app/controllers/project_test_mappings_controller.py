@@ -1,20 +1,24 @@
 """Controller for test mappings."""
 from decimal import Decimal
-from typing import List
+from typing import List, Optional
 
 import structlog
 
 from evergreen import EvergreenApi
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 
-from selectedtests.app.dependencies import get_db, get_evg
+from selectedtests.app.dependencies import get_db, get_evg, get_mapping_index
 from selectedtests.app.evergreen import try_retrieve_evergreen_project
+from selectedtests.app.mapping_index import MappingIndex
 from selectedtests.app.models import CustomResponse
 from selectedtests.app.parsers import parse_changed_files
+from selectedtests.app.server_timing import INDEX_TIMING, MONGO_TIMING, timed, timed_endpoint
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.metrics import MAPPINGS_QUERY_SECONDS, MAPPINGS_RETURNED, TEST_MAPPINGS
 from selectedtests.test_mappings.get_test_mappings import get_correlated_test_mappings
 from selectedtests.work_items.test_mapping_work_item import ProjectTestMappingWorkItem
+from selectedtests.work_items.work_item_priority import Priority
 
 LOGGER = structlog.get_logger(__name__)
 router = APIRouter()
@@ -40,6 +44,11 @@ class TestMappingsWorkItem(BaseModel):
         description="Regex describing folder containing test files in given module."
         "Required if module param is provided.",
     )
+    priority: str = Field(
+        default="normal",
+        regex="^(high|normal|low)$",
+        description="Priority class of the work item, one of 'high', 'normal' or 'low'.",
+    )
 
 
 class TestMappingsResponse(BaseModel):
@@ -57,12 +66,15 @@ class TestMappingsResponse(BaseModel):
         404: {"description": "Evergreen project not found"},
     },
 )
+@timed_endpoint
 def get(
     project: str,
     changed_files: str,
     threshold: Decimal = Decimal(0),
+    lookback_months: Optional[int] = Query(default=None, gt=0),
     evg_api: EvergreenApi = Depends(get_evg),
     db: MongoWrapper = Depends(get_db),
+    mapping_index: Optional[MappingIndex] = Depends(get_mapping_index),
 ) -> TestMappingsResponse:
     """
     Get a list of correlated test mappings for an input list of changed source files.
@@ -72,13 +84,30 @@ def get(
     :param project: The evergreen project.
     :param changed_files: List of source files to calculate correlated tasks for.
     :param threshold: Minimum threshold desired for flip_count / source_file_seen_count ratio
+    :param lookback_months: Only count the changes seen in this many most recent months.
+    :param mapping_index: In-memory index of the mappings, if the application keeps one.
     """
     LOGGER.info("Starting fetching test_mappings for project", project=project)
     evg_project = try_retrieve_evergreen_project(project, evg_api)
     LOGGER.info("Retrieved evergreen project information", evergreen_project=evg_project.identifier)
-    test_mappings = get_correlated_test_mappings(
-        db.test_mappings(), parse_changed_files(changed_files), evg_project.identifier, threshold
-    )
+    changed_source_files = parse_changed_files(changed_files)
+    test_mappings = None
+    # The index only holds the total counts, so windowed counts come from the database.
+    if mapping_index is not None and lookback_months is None:
+        with MAPPINGS_QUERY_SECONDS.labels(TEST_MAPPINGS, "index").time(), timed(INDEX_TIMING):
+            test_mappings = mapping_index.get_correlated_test_mappings(
+                changed_source_files, evg_project.identifier, threshold
+            )
+    if test_mappings is None:
+        with MAPPINGS_QUERY_SECONDS.labels(TEST_MAPPINGS, "mongo").time(), timed(MONGO_TIMING):
+            test_mappings = get_correlated_test_mappings(
+                db.test_mappings(),
+                changed_source_files,
+                evg_project.identifier,
+                threshold,
+                lookback_months,
+            )
+    MAPPINGS_RETURNED.labels(TEST_MAPPINGS).observe(len(test_mappings))
     return TestMappingsResponse(test_mappings=test_mappings)
 
 
@@ -125,6 +154,7 @@ def post(
         module,
         module_source_file_regex,
         module_test_file_regex,
+        Priority[work_item_params.priority.upper()],
     )
     if work_item.insert(db.test_mappings_queue()):
         return CustomResponse(custom=f"Work item added for project '{evg_project.identifier}'")
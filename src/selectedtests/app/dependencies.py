@@ -1,8 +1,10 @@
 """Parsers used in selected tests API."""
+from typing import Optional
 
 from evergreen import EvergreenApi
 from starlette.requests import Request
 
+from selectedtests.app.mapping_index import MappingIndex
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
 
 
@@ -24,3 +26,13 @@ def get_evg(request: Request) -> EvergreenApi:
     :return: The Evergreen API client.
     """
     return request.app.state.evg_api
+
+
+def get_mapping_index(request: Request) -> Optional[MappingIndex]:
+    """
+    Get the in-memory index of the mappings for the application.
+
+    :param request: The request needing the index.
+    :return: The index, None if the application does not keep one.
+    """
+    return request.app.state.mapping_index
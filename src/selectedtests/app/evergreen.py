@@ -3,7 +3,9 @@
 from evergreen import EvergreenApi, Project
 from fastapi import HTTPException
 
+from selectedtests.app.server_timing import EVERGREEN_TIMING, timed
 from selectedtests.evergreen_helper import get_evg_project
+from selectedtests.metrics import EVERGREEN_LOOKUP_SECONDS
 
 
 def try_retrieve_evergreen_project(project: str, api: EvergreenApi) -> Project:
@@ -14,7 +16,8 @@ def try_retrieve_evergreen_project(project: str, api: EvergreenApi) -> Project:
     :param api: The Evergreen API client.
     :return: The project.
     """
-    evergreen_project = get_evg_project(api, project)
+    with EVERGREEN_LOOKUP_SECONDS.time(), timed(EVERGREEN_TIMING):
+        evergreen_project = get_evg_project(api, project)
     if not evergreen_project:
         raise HTTPException(status_code=404, detail="Evergreen project not found")
     return evergreen_project
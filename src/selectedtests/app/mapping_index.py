@@ -0,0 +1,294 @@
+"""In-memory index of the test and task mappings served by the API."""
+from __future__ import annotations
+
+import os
+import threading
+
+from array import array
+from collections import namedtuple
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+import structlog
+
+from selectedtests.datasource.mappings_loader import (
+    TASK_MAPPING_SCHEMA,
+    TEST_MAPPING_SCHEMA,
+    MappingSchema,
+)
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.datasource.project_mappings import iter_project_mappings
+from selectedtests.metrics import MAPPING_INDEX_ENTRIES, MAPPING_INDEX_LOOKUPS
+
+LOGGER = structlog.get_logger(__name__)
+
+ENABLED_ENV_VAR = "SELECTED_TESTS_MAPPING_INDEX"
+# How long to wait before retrying the projects that failed to load.
+RETRY_SECONDS = 60.0
+SCHEMAS = {schema.collection: schema for schema in [TEST_MAPPING_SCHEMA, TASK_MAPPING_SCHEMA]}
+
+IndexedMapping = namedtuple("IndexedMapping", ["document", "child_ids", "counts"])
+
+
+class ProjectMappings(object):
+    """
+    Mappings of one type of one project, indexed by source file.
+
+    The children of each mapping are stored as an array of ids into a table of the distinct
+    children of the project and an array of their counts, sorted from the highest count down so
+    a threshold only needs to look at the children it returns.
+    """
+
+    def __init__(
+        self,
+        schema: MappingSchema,
+        children: List[Tuple[Tuple[str, Any], ...]],
+        mappings: Dict[str, List[IndexedMapping]],
+    ):
+        """
+        Create a ProjectMappings. Use ProjectMappings.load rather than this directly.
+
+        :param schema: Describes the collections the mappings are stored in.
+        :param children: Table of the fields of the distinct children, indexed by child id.
+        :param mappings: Map of source file to the mappings of that source file.
+        """
+        self.schema = schema
+        self._children = children
+        self._mappings = mappings
+
+    @classmethod
+    def load(cls, mongo: MongoWrapper, schema: MappingSchema, project: str) -> ProjectMappings:
+        """
+        Load the mappings of a project from the database.
+
+        The mappings are read from the primary, as a secondary may not have replicated the writes
+        that advanced the project_config yet.
+
+        :param mongo: An instance of MongoWrapper.
+        :param schema: Describes the collections the mappings are stored in.
+        :param project: The evergreen project.
+        :return: An instance of ProjectMappings.
+        """
+        excluded_child_keys = {"_id", schema.parent_id_key, schema.child_count_key}
+
+        child_ids: Dict[Tuple[Tuple[str, Any], ...], int] = {}
+        children: List[Tuple[Tuple[str, Any], ...]] = []
+        mappings: Dict[str, List[IndexedMapping]] = {}
+        for mapping, mapping_children in iter_project_mappings(
+            mongo, schema, project, read_from_primary=True
+        ):
+            ranked = []
+            for child in mapping_children:
+                key = tuple(
+                    (name, value)
+                    for name, value in child.items()
+                    if name not in excluded_child_keys
+                )
+                child_id = child_ids.get(key)
+                if child_id is None:
+                    child_id = child_ids[key] = len(children)
+                    children.append(key)
+                ranked.append((child[schema.child_count_key], child_id))
+
+            ranked.sort(key=lambda c: c[0], reverse=True)
+            del mapping["_id"]
+            mappings.setdefault(mapping["source_file"], []).append(
+                IndexedMapping(
+                    mapping,
+                    array("l", [child_id for _, child_id in ranked]),
+                    array("d", [count for count, _ in ranked]),
+                )
+            )
+
+        LOGGER.info(
+            "Loaded mapping index",
+            collection=schema.collection,
+            project=project,
+            source_files=len(mappings),
+            children=len(children),
+        )
+        return cls(schema, children, mappings)
+
+    def get_correlated(
+        self, changed_source_files: Iterable[str], threshold: Decimal
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the mappings of the given source files, as get_correlated_*_mappings would.
+
+        :param changed_source_files: Source files to get the mappings of.
+        :param threshold: Min threshold desired for the child count to source file count ratio.
+        :return: A list of mappings for the changed files.
+        """
+        min_ratio = float(threshold)
+        results = []
+        for source_file in set(changed_source_files):
+            for mapping in self._mappings.get(source_file, []):
+                seen_count = mapping.document[self.schema.seen_count_key]
+                children = []
+                for child_id, count in zip(mapping.child_ids, mapping.counts):
+                    if count / seen_count < min_ratio:
+                        break
+                    child = dict(self._children[child_id])
+                    child[self.schema.child_count_key] = int(count) if count.is_integer() else count
+                    children.append(child)
+                results.append(dict(mapping.document, **{self.schema.children_key: children}))
+        return results
+
+
+class MappingIndex(object):
+    """
+    Index of the mappings of the projects in project_config.
+
+    A project is dropped from the index as soon as its project_config advances and reloaded in the
+    background. Projects that are not loaded are left to the database.
+    """
+
+    def __init__(self, mongo: MongoWrapper):
+        """
+        Create a MappingIndex.
+
+        :param mongo: An instance of MongoWrapper.
+        """
+        self.mongo = mongo
+        self._projects: Dict[Tuple[str, str], ProjectMappings] = {}
+        self._generations: Dict[str, int] = {}
+        self._stale: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(
+        cls, mongo: MongoWrapper, environ: Optional[Mapping[str, str]] = None
+    ) -> Optional[MappingIndex]:
+        """
+        Create a MappingIndex if it is enabled by the environment.
+
+        :param mongo: An instance of MongoWrapper.
+        :param environ: The environment to read, os.environ if not given.
+        :return: An instance of MappingIndex, None if it is not enabled.
+        """
+        env: Mapping[str, str] = os.environ if environ is None else environ
+        if env.get(ENABLED_ENV_VAR, "").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(mongo)
+
+    def get_correlated_test_mappings(
+        self, changed_source_files: Iterable[str], project: str, threshold: Decimal
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the test mappings of the given source files from the index.
+
+        :param changed_source_files: Source files to get the test mappings of.
+        :param project: The evergreen project.
+        :param threshold: Min threshold desired for the test file to source file count ratio.
+        :return: A list of test mappings, None if the project is not indexed.
+        """
+        return self._get_correlated(TEST_MAPPING_SCHEMA, changed_source_files, project, threshold)
+
+    def get_correlated_task_mappings(
+        self, changed_source_files: Iterable[str], project: str, threshold: Decimal
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the task mappings of the given source files from the index.
+
+        :param changed_source_files: Source files to get the task mappings of.
+        :param project: The evergreen project.
+        :param threshold: Min threshold desired for the flip count to source file count ratio.
+        :return: A list of task mappings, None if the project is not indexed.
+        """
+        return self._get_correlated(TASK_MAPPING_SCHEMA, changed_source_files, project, threshold)
+
+    def _get_correlated(
+        self,
+        schema: MappingSchema,
+        changed_source_files: Iterable[str],
+        project: str,
+        threshold: Decimal,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Get the mappings of the given type and source files from the index."""
+        project_mappings = self._projects.get((schema.collection, project))
+        if project_mappings is None:
+            MAPPING_INDEX_LOOKUPS.labels(schema.collection, "miss").inc()
+            return None
+        MAPPING_INDEX_LOOKUPS.labels(schema.collection, "hit").inc()
+        return project_mappings.get_correlated(changed_source_files, threshold)
+
+    def invalidate(self, project: str, generation: int) -> None:
+        """
+        Drop the mappings of a project and reload them in the background.
+
+        :param project: The evergreen project.
+        :param generation: The new generation of the project_config of the project.
+        """
+        with self._lock:
+            self._generations[project] = generation
+            for collection in SCHEMAS:
+                self._projects.pop((collection, project), None)
+            self._stale.add(project)
+            MAPPING_INDEX_ENTRIES.set(len(self._projects))
+        self._wake_event.set()
+
+    def reload_stale(self) -> int:
+        """
+        Reload the mappings of the projects invalidated since they were last loaded.
+
+        A project is swapped in once all of its mappings are loaded, and only if it was not
+        invalidated again while they were loading, so requests never see partial or stale
+        mappings.
+
+        :return: The number of projects reloaded.
+        """
+        with self._lock:
+            stale, self._stale = self._stale, set()
+
+        reloaded = 0
+        for project in sorted(stale):
+            generation = self._generations[project]
+            try:
+                loaded = {
+                    collection: ProjectMappings.load(self.mongo, schema, project)
+                    for collection, schema in SCHEMAS.items()
+                }
+            except Exception:
+                LOGGER.exception("Failed to load mapping index", project=project)
+                with self._lock:
+                    self._stale.add(project)
+                continue
+
+            with self._lock:
+                if self._generations[project] != generation:
+                    continue
+                for collection, project_mappings in loaded.items():
+                    self._projects[(collection, project)] = project_mappings
+                MAPPING_INDEX_ENTRIES.set(len(self._projects))
+            reloaded += 1
+        return reloaded
+
+    def start(self) -> None:
+        """Start reloading the invalidated projects in the background."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="mapping-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop reloading the index."""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        """Reload the invalidated projects until stopped, retrying the ones that failed to load."""
+        while True:
+            self._wake_event.wait(RETRY_SECONDS)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            reloaded = self.reload_stale()
+            if reloaded:
+                LOGGER.info("Reloaded mapping index", projects_reloaded=reloaded)
@@ -0,0 +1,216 @@
+"""Break the time of single requests down in a Server-Timing header, and profile them on demand."""
+from __future__ import annotations
+
+import functools
+import os
+import sys
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Mapping, Optional, Set
+
+import structlog
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+LOGGER = structlog.get_logger(__name__)
+
+ENABLED_ENV_VAR = "SELECTED_TESTS_SERVER_TIMING"
+# Requests sending this header get a Server-Timing header back, and are profiled if its value is
+# PROFILE_HEADER_VALUE.
+TIMING_HEADER = "X-Selected-Tests-Timing"
+PROFILE_HEADER_VALUE = "profile"
+# How often the stacks of a profiled request are sampled.
+SAMPLE_INTERVAL_SECONDS = 0.005
+# The number of distinct stacks logged for a profiled request.
+PROFILE_STACKS = 20
+
+EVERGREEN_TIMING = "evergreen"
+MONGO_TIMING = "mongo"
+INDEX_TIMING = "index"
+ENDPOINT_TIMING = "endpoint"
+SERIALIZE_TIMING = "serialize"
+TOTAL_TIMING = "total"
+DESCRIPTIONS = {
+    EVERGREEN_TIMING: "Evergreen project lookup",
+    MONGO_TIMING: "Mongo aggregation",
+    INDEX_TIMING: "In-memory index lookup",
+    SERIALIZE_TIMING: "Validation and serialization around the endpoint",
+    TOTAL_TIMING: "Total",
+}
+
+
+class RequestTimings(object):
+    """The time spent in each part of a request, and the threads that worked on it."""
+
+    def __init__(self) -> None:
+        """Create a RequestTimings."""
+        self.seconds: Dict[str, float] = {}
+        self.thread_ids: Set[int] = {threading.get_ident()}
+
+    def record(self, name: str, seconds: float) -> None:
+        """
+        Add to the time spent in a part of the request.
+
+        :param name: The part of the request.
+        :param seconds: The time spent in it.
+        """
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        """
+        Get the Server-Timing header of the request.
+
+        The time spent in the endpoint is left out, it is broken down in the other parts.
+
+        :return: The value of the header, the durations in milliseconds.
+        """
+        return ", ".join(
+            f'{name};dur={seconds * 1000:.1f};desc="{DESCRIPTIONS[name]}"'
+            for name, seconds in self.seconds.items()
+            if name in DESCRIPTIONS
+        )
+
+
+# The timings of the request being handled, None unless it asked for them.
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def is_enabled(environ: Optional[Mapping[str, str]] = None) -> bool:
+    """
+    Check whether requests may ask for their timings.
+
+    :param environ: The environment to read, os.environ if not given.
+    :return: Whether the Server-Timing middleware should be added.
+    """
+    env: Mapping[str, str] = os.environ if environ is None else environ
+    return env.get(ENABLED_ENV_VAR, "").lower() in ("1", "true", "yes")
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """
+    Add the time spent in the block to a part of the request being handled, if it is timed.
+
+    :param name: The part of the request.
+    """
+    timings = _request_timings.get()
+    if timings is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.record(name, perf_counter() - start)
+
+
+def timed_endpoint(endpoint: Callable) -> Callable:
+    """
+    Time an endpoint, so the time taken to serialize its response is known.
+
+    The endpoint keeps its signature, which FastAPI reads its parameters from.
+
+    :param endpoint: The endpoint, a function run in the threadpool.
+    :return: The timed endpoint.
+    """
+
+    @functools.wraps(endpoint)
+    def timed_call(*args: Any, **kwargs: Any) -> Any:
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.thread_ids.add(threading.get_ident())
+        with timed(ENDPOINT_TIMING):
+            return endpoint(*args, **kwargs)
+
+    return timed_call
+
+
+class StackSampler(object):
+    """Samples the stacks of a set of threads from a thread of its own."""
+
+    def __init__(self, thread_ids: Set[int], interval: float = SAMPLE_INTERVAL_SECONDS):
+        """
+        Create a StackSampler.
+
+        :param thread_ids: The threads to sample, threads can be added while sampling.
+        :param interval: How often to sample, in seconds.
+        """
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling."""
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        """Sample the stacks until stopped."""
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    # Collapsed stacks, outermost frame first, as flame graph tools read them.
+                    self.stacks[";".join(reversed(stack))] += 1
+
+
+async def server_timing_middleware(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """
+    Add a Server-Timing header to the requests asking for it, and profile them on demand.
+
+    :param request: The request.
+    :param call_next: Handles the request.
+    :return: The response.
+    """
+    header = request.headers.get(TIMING_HEADER)
+    if header is None:
+        return await call_next(request)
+
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    sampler = None
+    if header.lower() == PROFILE_HEADER_VALUE:
+        sampler = StackSampler(timings.thread_ids)
+        sampler.start()
+    start = perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        total = perf_counter() - start
+        _request_timings.reset(token)
+        if sampler is not None:
+            sampler.stop()
+
+    if ENDPOINT_TIMING in timings.seconds:
+        timings.record(SERIALIZE_TIMING, total - timings.seconds[ENDPOINT_TIMING])
+    timings.record(TOTAL_TIMING, total)
+    response.headers["Server-Timing"] = timings.header()
+    if sampler is not None:
+        LOGGER.info(
+            "Profiled request",
+            path=request.url.path,
+            query=request.url.query,
+            timings=timings.seconds,
+            samples=sum(sampler.stacks.values()),
+            stacks=dict(sampler.stacks.most_common(PROFILE_STACKS)),
+        )
+    return response
@@ -0,0 +1,94 @@
+"""Baselines of benchmark results, and the check of new results against them."""
+import json
+
+from collections import namedtuple
+from typing import Any, Dict, Iterable, List, Optional
+
+from selectedtests.benchmarks.measure import BenchmarkResult
+
+# A metric of a benchmark that got worse than its baseline by more than the tolerance:
+# benchmark: The name of the benchmark.
+# metric: The name of the metric.
+# baseline: The value of the metric in the baseline.
+# measured: The value of the metric measured.
+Regression = namedtuple("Regression", ["benchmark", "metric", "baseline", "measured"])
+
+# The metrics checked against the baseline, and whether higher values are better. Times and the
+# resident set size are left out, the throughput already covers the time and the resident set size
+# is shared by all the benchmarks run by a process.
+CHECKED_METRICS = {"items_per_second": True, "peak_allocated_bytes": False}
+
+
+def save_baseline(
+    path: str, parameters: Dict[str, Any], results: Iterable[BenchmarkResult]
+) -> None:
+    """
+    Save benchmark results as the baseline to check future results against.
+
+    :param path: Path of the baseline file.
+    :param parameters: The parameters the benchmarks were run with.
+    :param results: The results of the benchmarks.
+    """
+    baseline = {
+        "parameters": parameters,
+        "results": {result.name: result._asdict() for result in results},
+    }
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    """
+    Load a baseline saved with save_baseline.
+
+    :param path: Path of the baseline file.
+    :return: The parameters the baseline was run with and its results by benchmark name.
+    """
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def find_regressions(
+    results: Iterable[BenchmarkResult],
+    baseline: Dict[str, Any],
+    parameters: Dict[str, Any],
+    tolerance: float,
+    checked_metrics: Optional[Dict[str, bool]] = None,
+) -> List[Regression]:
+    """
+    Find the metrics of the results that are worse than the baseline by more than the tolerance.
+
+    Benchmarks that are not in the baseline are not checked.
+
+    :param results: The results of the benchmarks.
+    :param baseline: The baseline, as loaded by load_baseline.
+    :param parameters: The parameters the results were run with.
+    :param tolerance: The fraction of the baseline a metric may get worse by.
+    :param checked_metrics: The metrics to check and whether higher values are better,
+     CHECKED_METRICS if not given.
+    :return: The regressions found.
+    """
+    if baseline["parameters"] != parameters:
+        raise ValueError(
+            f"Benchmarks run with {parameters} can not be compared to a baseline run with "
+            f"{baseline['parameters']}"
+        )
+
+    if checked_metrics is None:
+        checked_metrics = CHECKED_METRICS
+
+    regressions = []
+    for result in results:
+        expected = baseline["results"].get(result.name)
+        if expected is None:
+            continue
+        for metric, higher_is_better in checked_metrics.items():
+            measured = getattr(result, metric)
+            if higher_is_better:
+                regressed = measured < expected[metric] * (1 - tolerance)
+            else:
+                regressed = measured > expected[metric] * (1 + tolerance)
+            if regressed:
+                regressions.append(Regression(result.name, metric, expected[metric], measured))
+    return regressions
@@ -0,0 +1,502 @@
+"""Cli entry point for the performance benchmarks."""
+import os.path
+
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+from click import Context
+from miscutils.logging_config import Verbosity
+
+from selectedtests.benchmarks.baseline import find_regressions, load_baseline, save_baseline
+from selectedtests.benchmarks.fake_evergreen import EvergreenSpec, ServerBehavior
+from selectedtests.benchmarks.load_test import LOAD_TEST_CHECKED_METRICS, run_load_test
+from selectedtests.benchmarks.mapping_dataset import MappingDatasetSpec, dataset_parameters
+from selectedtests.benchmarks.mining_benchmark import run_mining_benchmarks, spec_parameters
+from selectedtests.benchmarks.synthetic_repo import FanOut, RepoSpec, create_synthetic_repo
+from selectedtests.benchmarks.task_mapping_benchmark import (
+    TASK_MAPPING_CHECKED_METRICS,
+    benchmark_parameters,
+    run_task_mapping_benchmark,
+)
+from selectedtests.config.logging_config import config_logging
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_LOAD_TEST_MONGO_URI = "mongodb://localhost:27017"
+
+
+def _report(
+    ctx: Context,
+    results: List[Any],
+    parameters: Dict[str, Any],
+    baseline: str,
+    save: bool,
+    tolerance: float,
+    checked_metrics: Optional[Dict[str, bool]] = None,
+) -> None:
+    """
+    Print the results of benchmarks, then save them as the baseline or check them against it.
+
+    Exits with a non-zero status if a benchmark regressed.
+
+    :param ctx: Command Context.
+    :param results: The results of the benchmarks, BenchmarkResults or results with their fields.
+    :param parameters: The parameters the benchmarks were run with.
+    :param baseline: Path of the baseline file.
+    :param save: Whether to save the results as the baseline rather than checking them.
+    :param tolerance: The fraction of the baseline a metric may get worse by.
+    :param checked_metrics: The metrics checked against the baseline, those of find_regressions
+     if not given.
+    """
+    click.echo(
+        f"{'benchmark':<28}{'items':>10}{'seconds':>12}{'items/sec':>14}"
+        f"{'peak rss kb':>14}{'peak alloc kb':>16}"
+    )
+    for result in results:
+        click.echo(
+            f"{result.name:<28}{result.items:>10}{result.seconds:>12.3f}"
+            f"{result.items_per_second:>14.1f}{result.peak_rss_kb:>14}"
+            f"{result.peak_allocated_bytes // 1024:>16}"
+        )
+
+    _check_baseline(ctx, results, parameters, baseline, save, tolerance, checked_metrics)
+
+
+def _check_baseline(
+    ctx: Context,
+    results: List[Any],
+    parameters: Dict[str, Any],
+    baseline: str,
+    save: bool,
+    tolerance: float,
+    checked_metrics: Optional[Dict[str, bool]] = None,
+) -> None:
+    """
+    Save the results of benchmarks as the baseline or check them against it.
+
+    Exits with a non-zero status if a benchmark regressed.
+
+    :param ctx: Command Context.
+    :param results: The results of the benchmarks, namedtuples with a name field.
+    :param parameters: The parameters the benchmarks were run with.
+    :param baseline: Path of the baseline file.
+    :param save: Whether to save the results as the baseline rather than checking them.
+    :param tolerance: The fraction of the baseline a metric may get worse by.
+    :param checked_metrics: The metrics checked against the baseline, those of find_regressions
+     if not given.
+    """
+    if save:
+        save_baseline(baseline, parameters, results)
+        click.echo(f"Saved baseline to {baseline}")
+        return
+    if not os.path.exists(baseline):
+        click.echo(f"No baseline at {baseline}, nothing to check against")
+        return
+
+    regressions = find_regressions(
+        results, load_baseline(baseline), parameters, tolerance, checked_metrics
+    )
+    for regression in regressions:
+        click.echo(
+            f"REGRESSION {regression.benchmark} {regression.metric}: "
+            f"{regression.measured:.1f} against a baseline of {regression.baseline:.1f}"
+        )
+    if regressions:
+        ctx.exit(1)
+    click.echo(f"No regressions against {baseline}")
+
+
+@click.group()
+@click.option("--verbose", is_flag=True, default=False, help="Enable verbose logging.")
+@click.option(
+    "--log-format",
+    default="text",
+    type=click.Choice(["text", "json"]),
+    help="Format to write logs with.",
+)
+@click.pass_context
+def cli(ctx: Context, verbose: bool, log_format: str) -> None:
+    """Run the performance benchmarks of selected-tests, see the commands help for details."""
+    ctx.ensure_object(dict)
+
+    verbosity = Verbosity.DEBUG if verbose else Verbosity.INFO
+    config_logging(verbosity, human_readable=log_format == "text")
+
+
+@cli.command()
+@click.option("--commits", type=click.IntRange(min=1), default=500, help="Number of commits.")
+@click.option(
+    "--files-per-commit",
+    type=click.IntRange(min=1),
+    default=5,
+    help="Mean number of files changed by a commit.",
+)
+@click.option(
+    "--fan-out",
+    type=click.Choice([fan_out.value for fan_out in FanOut]),
+    default=FanOut.PARETO.value,
+    help="Distribution of the number of files changed by a commit.",
+)
+@click.option(
+    "--rename-rate",
+    type=click.FloatRange(0, 1),
+    default=0.01,
+    help="Probability of a commit renaming a file.",
+)
+@click.option("--seed", type=int, default=1, help="Seed of the synthetic history.")
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    default=3,
+    help="Number of timed runs of each benchmark.",
+)
+@click.option(
+    "--baseline",
+    type=str,
+    default=os.path.join(BASELINES_DIR, "mining.json"),
+    help="Baseline file the results are checked against.",
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    default=False,
+    help="Save the results as the baseline rather than checking them against it.",
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_TOLERANCE,
+    help="Fraction of the baseline a metric may get worse by before it is a regression.",
+)
+@click.option(
+    "--repo-dir", type=str, help="Directory to generate the repo in, a temporary one if not given."
+)
+@click.pass_context
+def mining(
+    ctx: Context,
+    commits: int,
+    files_per_commit: int,
+    fan_out: str,
+    rename_rate: float,
+    seed: int,
+    repeat: int,
+    baseline: str,
+    save_baseline: bool,
+    tolerance: float,
+    repo_dir: Optional[str],
+) -> None:
+    """
+    Benchmark mining the test mappings of a synthetic git repo.
+
+    The repo is generated from the seed, so every run mines the same history. The throughput and
+    allocations are checked against the baseline, and the command fails if either regressed.
+    \f
+    :param ctx: Command Context.
+    :param commits: Number of commits of the synthetic repo.
+    :param files_per_commit: Mean number of files changed by a commit.
+    :param fan_out: Distribution of the number of files changed by a commit.
+    :param rename_rate: Probability of a commit renaming a file.
+    :param seed: Seed of the synthetic history.
+    :param repeat: Number of timed runs of each benchmark.
+    :param baseline: Baseline file the results are checked against.
+    :param save_baseline: Whether to save the results as the baseline.
+    :param tolerance: Fraction of the baseline a metric may get worse by.
+    :param repo_dir: Directory to generate the repo in.
+    """
+    spec = RepoSpec(commits, files_per_commit, FanOut(fan_out), rename_rate, seed=seed)
+    with TemporaryDirectory() as temp_dir:
+        repo_path = repo_dir or temp_dir
+        create_synthetic_repo(repo_path, spec)
+        results = run_mining_benchmarks(repo_path, repeat)
+
+    _report(ctx, results, spec_parameters(spec), baseline, save_baseline, tolerance)
+
+
+@cli.command()
+@click.option("--commits", type=click.IntRange(min=2), default=200, help="Number of versions.")
+@click.option(
+    "--files-per-commit",
+    type=click.IntRange(min=1),
+    default=5,
+    help="Mean number of files changed by the commit of a version.",
+)
+@click.option(
+    "--variants", type=click.IntRange(min=1), default=4, help="Build variants per version."
+)
+@click.option(
+    "--tasks-per-variant", type=click.IntRange(min=1), default=20, help="Tasks per build variant."
+)
+@click.option(
+    "--flip-rate",
+    type=click.FloatRange(0, 1),
+    default=0.05,
+    help="Probability of a task changing status from one version to the next.",
+)
+@click.option(
+    "--latency-ms",
+    type=click.FloatRange(min=0),
+    default=10.0,
+    help="Milliseconds every response of the fake Evergreen server is delayed by.",
+)
+@click.option(
+    "--error-rate",
+    type=click.FloatRange(0, 1),
+    default=0.0,
+    help="Probability of a call to the fake Evergreen server failing, failed calls are retried.",
+)
+@click.option(
+    "--page-size",
+    type=click.IntRange(min=1),
+    default=100,
+    help="Number of items of a page of the lists served by the fake Evergreen server.",
+)
+@click.option("--seed", type=int, default=1, help="Seed of the synthetic history and statuses.")
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    default=3,
+    help="Number of timed runs of the benchmark.",
+)
+@click.option(
+    "--baseline",
+    type=str,
+    default=os.path.join(BASELINES_DIR, "task_mappings.json"),
+    help="Baseline file the results are checked against.",
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    default=False,
+    help="Save the results as the baseline rather than checking them against it.",
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_TOLERANCE,
+    help="Fraction of the baseline a metric may get worse by before it is a regression.",
+)
+@click.option(
+    "--repo-dir", type=str, help="Directory to generate the repo in, a temporary one if not given."
+)
+@click.pass_context
+def task_mappings(
+    ctx: Context,
+    commits: int,
+    files_per_commit: int,
+    variants: int,
+    tasks_per_variant: int,
+    flip_rate: float,
+    latency_ms: float,
+    error_rate: float,
+    page_size: int,
+    seed: int,
+    repeat: int,
+    baseline: str,
+    save_baseline: bool,
+    tolerance: float,
+    repo_dir: Optional[str],
+) -> None:
+    """
+    Benchmark generating the task mappings of a project served by a fake Evergreen server.
+
+    The versions of the project are the commits of a synthetic repo, and their tasks change status
+    at random, both generated from the seed. The server is local, the latency and errors of the
+    real API are injected. Failed calls are retried by the Evergreen client after waiting for
+    seconds, so any error rate above zero dominates the time taken.
+
+    Along with the throughput and the allocations, the number of calls made per version is checked
+    against the baseline. The utilization of the executor is the share of its workers that had a
+    call in flight, on average.
+    \f
+    :param ctx: Command Context.
+    :param commits: Number of commits of the synthetic repo, and versions of the project.
+    :param files_per_commit: Mean number of files changed by a commit.
+    :param variants: Number of build variants of every version.
+    :param tasks_per_variant: Number of tasks of every build.
+    :param flip_rate: Probability of a task changing status from one version to the next.
+    :param latency_ms: Milliseconds every response of the fake server is delayed by.
+    :param error_rate: Probability of a call to the fake server failing.
+    :param page_size: Number of items of a page of the lists served by the fake server.
+    :param seed: Seed of the synthetic history and statuses.
+    :param repeat: Number of timed runs of the benchmark.
+    :param baseline: Baseline file the results are checked against.
+    :param save_baseline: Whether to save the results as the baseline.
+    :param tolerance: Fraction of the baseline a metric may get worse by.
+    :param repo_dir: Directory to generate the repo in.
+    """
+    repo_spec = RepoSpec(commits - 1, files_per_commit, seed=seed)
+    evergreen_spec = EvergreenSpec(variants, tasks_per_variant, flip_rate, seed)
+    behavior = ServerBehavior(latency_ms / 1000, error_rate, page_size, seed)
+    with TemporaryDirectory() as temp_dir:
+        repo_path = repo_dir or temp_dir
+        create_synthetic_repo(repo_path, repo_spec)
+        result = run_task_mapping_benchmark(repo_path, evergreen_spec, behavior, repeat)
+
+    click.echo(
+        f"{'benchmark':<28}{'calls/version':>14}{'errors':>10}{'concurrency':>14}"
+        f"{'utilization':>14}"
+    )
+    click.echo(
+        f"{result.name:<28}{result.api_calls_per_version:>14.2f}{result.api_errors:>10.1f}"
+        f"{result.mean_concurrency:>14.2f}{result.executor_utilization:>14.1%}"
+    )
+    _report(
+        ctx,
+        [result],
+        benchmark_parameters(repo_spec, evergreen_spec, behavior),
+        baseline,
+        save_baseline,
+        tolerance,
+        TASK_MAPPING_CHECKED_METRICS,
+    )
+
+
+@cli.command()
+@click.option(
+    "--mongo-uri",
+    type=str,
+    default=DEFAULT_LOAD_TEST_MONGO_URI,
+    help="Uri of the mongod to seed the dataset in, only the synthetic project is touched.",
+)
+@click.option(
+    "--source-files",
+    type=click.IntRange(min=1),
+    default=1000,
+    help="Number of source files with mappings.",
+)
+@click.option(
+    "--tests-per-file",
+    type=click.IntRange(min=1),
+    default=20,
+    help="Mean number of test files mapped to a source file.",
+)
+@click.option(
+    "--tasks-per-file",
+    type=click.IntRange(min=1),
+    default=20,
+    help="Mean number of tasks mapped to a source file.",
+)
+@click.option(
+    "--fan-out",
+    type=click.Choice([fan_out.value for fan_out in FanOut]),
+    default=FanOut.PARETO.value,
+    help="Distribution of the number of test files and tasks mapped to a source file.",
+)
+@click.option(
+    "--changed-files",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1, 10, 100],
+    help="Number of changed files per request, a scenario is run for each one given.",
+)
+@click.option(
+    "--requests",
+    type=click.IntRange(min=1),
+    default=1000,
+    help="Number of requests of each scenario.",
+)
+@click.option(
+    "--concurrency", type=click.IntRange(min=1), default=8, help="Number of concurrent clients."
+)
+@click.option(
+    "--mapping-index",
+    is_flag=True,
+    default=False,
+    help="Serve the mappings from the in-memory index rather than the database.",
+)
+@click.option("--seed", type=int, default=1, help="Seed of the dataset and of the requests.")
+@click.option(
+    "--baseline",
+    type=str,
+    default=os.path.join(BASELINES_DIR, "load_test.json"),
+    help="Baseline file the results are checked against.",
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    default=False,
+    help="Save the results as the baseline rather than checking them against it.",
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_TOLERANCE,
+    help="Fraction of the baseline a metric may get worse by before it is a regression.",
+)
+@click.pass_context
+def load_test(
+    ctx: Context,
+    mongo_uri: str,
+    source_files: int,
+    tests_per_file: int,
+    tasks_per_file: int,
+    fan_out: str,
+    changed_files: Tuple[int, ...],
+    requests: int,
+    concurrency: int,
+    mapping_index: bool,
+    seed: int,
+    baseline: str,
+    save_baseline: bool,
+    tolerance: float,
+) -> None:
+    """
+    Load test the GET endpoints of the test and task mapping controllers over HTTP.
+
+    A synthetic mapping dataset is seeded in a local mongod and the application is served by
+    uvicorn in this process, with Evergreen stubbed out. Concurrent clients each send their next
+    request once they got a response, for each controller and number of changed files per request.
+    The latency percentiles, the throughput and the number of commands sent to mongod per request
+    are reported. The throughput, the 95th percentile and the commands per request are checked
+    against the baseline.
+    \f
+    :param ctx: Command Context.
+    :param mongo_uri: Uri of the mongod to seed the dataset in.
+    :param source_files: Number of source files with mappings.
+    :param tests_per_file: Mean number of test files mapped to a source file.
+    :param tasks_per_file: Mean number of tasks mapped to a source file.
+    :param fan_out: Distribution of the number of test files and tasks mapped to a source file.
+    :param changed_files: Numbers of changed files per request.
+    :param requests: Number of requests of each scenario.
+    :param concurrency: Number of concurrent clients.
+    :param mapping_index: Whether to serve the mappings from the in-memory index.
+    :param seed: Seed of the dataset and of the requests.
+    :param baseline: Baseline file the results are checked against.
+    :param save_baseline: Whether to save the results as the baseline.
+    :param tolerance: Fraction of the baseline a metric may get worse by.
+    """
+    spec = MappingDatasetSpec(
+        source_files, tests_per_file, tasks_per_file, FanOut(fan_out), seed=seed
+    )
+    results = run_load_test(
+        mongo_uri, spec, list(changed_files), requests, concurrency, mapping_index, seed
+    )
+
+    click.echo(
+        f"{'scenario':<28}{'requests':>10}{'req/sec':>12}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'errors':>8}{'mongo ops/req':>15}"
+    )
+    for result in results:
+        click.echo(
+            f"{result.name:<28}{result.requests:>10}{result.requests_per_second:>12.1f}"
+            f"{result.p50_ms:>10.2f}{result.p95_ms:>10.2f}{result.p99_ms:>10.2f}"
+            f"{result.errors:>8}{result.mongo_ops_per_request:>15.2f}"
+        )
+
+    parameters = dataset_parameters(spec)
+    parameters.update(
+        changed_files=list(changed_files),
+        requests=requests,
+        concurrency=concurrency,
+        mapping_index=mapping_index,
+    )
+    _check_baseline(
+        ctx, results, parameters, baseline, save_baseline, tolerance, LOAD_TEST_CHECKED_METRICS
+    )
+
+
+def main() -> None:
+    """Entry point into commandline."""
+    return cli(obj={})
@@ -0,0 +1,407 @@
+"""A fake Evergreen API server, serving a generated project to benchmark task mapping against."""
+from __future__ import annotations
+
+import json
+import random
+import re
+import threading
+import time
+
+from collections import Counter, namedtuple
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import structlog
+
+LOGGER = structlog.get_logger(__name__)
+
+# The server only listens on the loopback interface, on a free port.
+HOST = "127.0.0.1"
+
+PROJECT = "synthetic-project"
+OWNER = "synthetic-owner"
+REPO = "synthetic-repo"
+BRANCH = "master"
+EVG_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+PROJECT_JSON = {
+    "identifier": PROJECT,
+    "display_name": PROJECT,
+    "owner_name": OWNER,
+    "repo_name": REPO,
+    "branch_name": BRANCH,
+    "enabled": True,
+}
+STATUSES = ["success", "failed"]
+# The query parameter of the offset into a paginated list, the real API pages by date or id.
+START_PARAM = "start"
+LIMIT_PARAM = "limit"
+
+# The shape of the project served by the fake server:
+# variants: The number of build variants of every version.
+# tasks_per_variant: The number of tasks of every build.
+# flip_rate: The probability of a task changing status from one version to the next.
+# seed: Seed of the task statuses, projects generated with the same spec are identical.
+EvergreenSpec = namedtuple(
+    "EvergreenSpec",
+    ["variants", "tasks_per_variant", "flip_rate", "seed"],
+    defaults=[4, 20, 0.05, 1],
+)
+
+# How the fake server misbehaves:
+# latency: The seconds every response is delayed by.
+# error_rate: The probability of a request failing with a 503.
+# page_size: The number of items of a page of a paginated list.
+# seed: Seed of the injected errors.
+ServerBehavior = namedtuple(
+    "ServerBehavior", ["latency", "error_rate", "page_size", "seed"], defaults=[0.0, 0.0, 100, 1]
+)
+
+# The calls made to the fake server since its statistics were last reset:
+# calls: The number of requests by endpoint.
+# errors: The number of requests failed on purpose.
+# mean_concurrency: The number of requests in flight at once, averaged over the time elapsed.
+# seconds: The time elapsed.
+ServerStatistics = namedtuple(
+    "ServerStatistics", ["calls", "errors", "mean_concurrency", "seconds"]
+)
+
+
+def _format_time(when: datetime) -> str:
+    """
+    Format a date the way the Evergreen API does.
+
+    :param when: The date.
+    :return: The formatted date.
+    """
+    return when.strftime(EVG_DATETIME_FORMAT)
+
+
+class FakeProject(object):
+    """The versions, builds and tasks of a generated Evergreen project."""
+
+    def __init__(self, revisions: List[Tuple[str, datetime]], spec: EvergreenSpec):
+        """
+        Generate a project with a version for each revision.
+
+        Every task starts off succeeding and then changes status from one version to the next with
+        a probability of flip_rate.
+
+        :param revisions: The revisions of the versions and their dates, oldest first.
+        :param spec: The shape of the project.
+        """
+        rng = random.Random(spec.seed)
+        variants = [f"variant_{i}" for i in range(spec.variants)]
+        task_names = [f"task_{i}" for i in range(spec.tasks_per_variant)]
+        statuses = {(variant, task): 0 for variant in variants for task in task_names}
+
+        self.versions: List[Dict[str, Any]] = []
+        self.builds: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, List[Dict[str, Any]]] = {}
+        self.manifests: Dict[str, Dict[str, Any]] = {}
+        for order, (revision, create_time) in enumerate(revisions):
+            version_id = f"{PROJECT}_{revision}"
+            build_variants_status = []
+            for variant in variants:
+                build_id = f"{version_id}_{variant}"
+                build_variants_status.append({"build_variant": variant, "build_id": build_id})
+                tasks = []
+                for task in task_names:
+                    if order and rng.random() < spec.flip_rate:
+                        statuses[(variant, task)] ^= 1
+                    tasks.append(
+                        {
+                            "task_id": f"{build_id}_{task}",
+                            "build_id": build_id,
+                            "build_variant": variant,
+                            "display_name": task,
+                            "version_id": version_id,
+                            "revision": revision,
+                            "activated": True,
+                            "status": STATUSES[statuses[(variant, task)]],
+                        }
+                    )
+                self.tasks[build_id] = tasks
+                self.builds[build_id] = {
+                    "_id": build_id,
+                    "project_id": PROJECT,
+                    "version": version_id,
+                    "git_hash": revision,
+                    "build_variant": variant,
+                    "display_name": variant,
+                    "order": order,
+                    "tasks": [task["task_id"] for task in tasks],
+                }
+            self.manifests[revision] = {
+                "id": version_id,
+                "revision": revision,
+                "project": PROJECT,
+                "branch": BRANCH,
+                "modules": {},
+            }
+            self.versions.append(
+                {
+                    "version_id": version_id,
+                    "create_time": _format_time(create_time),
+                    "revision": revision,
+                    "order": order,
+                    "project": PROJECT,
+                    "repo": REPO,
+                    "branch": BRANCH,
+                    "requester": "gitter_request",
+                    "build_variants_status": build_variants_status,
+                }
+            )
+        # The API lists the most recent versions first.
+        self.versions.reverse()
+        self.versions_by_id = {version["version_id"]: version for version in self.versions}
+        self.projects = [PROJECT_JSON]
+
+    def builds_of_version(self, version_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the builds of a version.
+
+        :param version_id: The id of the version.
+        :return: The builds or None if there is no such version.
+        """
+        version = self.versions_by_id.get(version_id)
+        if version is None:
+            return None
+        return [self.builds[status["build_id"]] for status in version["build_variants_status"]]
+
+
+class _Route(object):
+    """An endpoint of the fake server."""
+
+    def __init__(self, name: str, pattern: str, find: Callable[..., Any], paginated: bool = False):
+        """
+        Create a route.
+
+        :param name: The name the calls to the endpoint are counted under.
+        :param pattern: Regex matching the path of the endpoint, its groups are passed to find.
+        :param find: Function finding what to respond with, None if it does not exist.
+        :param paginated: Whether the response is a list served a page at a time.
+        """
+        self.name = name
+        self.pattern = re.compile(f"^{pattern}$")
+        self.find = find
+        self.paginated = paginated
+
+
+class FakeEvergreenServer(object):
+    """
+    A local HTTP server serving a fake project through the endpoints of the Evergreen API.
+
+    Only the endpoints used by the mapping generation are served. Use it as a context manager, the
+    server is started on entry on a free port of localhost and shut down on exit.
+    """
+
+    def __init__(self, project: FakeProject, behavior: Optional[ServerBehavior] = None):
+        """
+        Create a fake Evergreen server.
+
+        :param project: The project to serve.
+        :param behavior: How the server misbehaves, it is well behaved if not given.
+        """
+        self.project = project
+        self.behavior = behavior if behavior is not None else ServerBehavior()
+        self.routes = [
+            _Route("projects", "/rest/v2/projects", lambda: project.projects, True),
+            _Route("project", "/rest/v2/projects/([^/]+)", self._find_project),
+            _Route(
+                "versions",
+                "/rest/v2/projects/([^/]+)/versions",
+                lambda project_id: project.versions if project_id == PROJECT else None,
+                True,
+            ),
+            _Route("version", "/rest/v2/versions/([^/]+)", project.versions_by_id.get),
+            _Route("builds", "/rest/v2/versions/([^/]+)/builds", project.builds_of_version, True),
+            _Route("build", "/rest/v2/builds/([^/]+)", project.builds.get),
+            _Route("tasks", "/rest/v2/builds/([^/]+)/tasks", project.tasks.get, True),
+            _Route(
+                "manifest",
+                "/plugin/manifest/get/([^/]+)/([^/]+)",
+                lambda project_id, revision: project.manifests.get(revision)
+                if project_id == PROJECT
+                else None,
+            ),
+        ]
+        self._rng = random.Random(self.behavior.seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self.reset_statistics()
+
+    def _find_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a project by its identifier.
+
+        :param project_id: The identifier of the project.
+        :return: The project or None if there is no such project.
+        """
+        for project in self.project.projects:
+            if project["identifier"] == project_id:
+                return project
+        return None
+
+    @property
+    def url(self) -> str:
+        """Get the url of the server, to pass to get_evg_api."""
+        if self._server is None:
+            raise RuntimeError("The fake evergreen server is not running")
+        return f"http://{HOST}:{self._server.server_port}"
+
+    def __enter__(self) -> FakeEvergreenServer:
+        """Start the server in a thread of its own."""
+        server = self
+
+        class Handler(_FakeEvergreenHandler):
+            fake = server
+
+        self._server = ThreadingHTTPServer((HOST, 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        LOGGER.debug("Started fake evergreen server", url=self.url)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Shut the server down."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reset_statistics(self) -> None:
+        """Start counting the calls to the server afresh."""
+        with self._lock:
+            self._calls: Counter = Counter()
+            self._errors = 0
+            self._in_flight = 0
+            self._busy_seconds = 0.0
+            self._reset_at = self._changed_at = time.perf_counter()
+
+    def statistics(self) -> ServerStatistics:
+        """Get the statistics of the calls made since they were last reset."""
+        with self._lock:
+            self._account_in_flight()
+            seconds = self._changed_at - self._reset_at
+            return ServerStatistics(
+                dict(self._calls),
+                self._errors,
+                self._busy_seconds / seconds if seconds else 0.0,
+                seconds,
+            )
+
+    def _account_in_flight(self) -> None:
+        """Add the requests in flight since the last change to the busy time, under the lock."""
+        now = time.perf_counter()
+        self._busy_seconds += self._in_flight * (now - self._changed_at)
+        self._changed_at = now
+
+    def request_started(self, name: str) -> bool:
+        """
+        Count a request to an endpoint.
+
+        :param name: The name of the endpoint.
+        :return: Whether the request should fail.
+        """
+        with self._lock:
+            self._account_in_flight()
+            self._in_flight += 1
+            self._calls[name] += 1
+            fail = self._rng.random() < self.behavior.error_rate
+            if fail:
+                self._errors += 1
+            return fail
+
+    def request_finished(self) -> None:
+        """Count the end of a request."""
+        with self._lock:
+            self._account_in_flight()
+            self._in_flight -= 1
+
+
+class _FakeEvergreenHandler(BaseHTTPRequestHandler):
+    """Handler of the requests to a FakeEvergreenServer."""
+
+    # Keep connections alive, as the real API does, so connecting is not what is measured.
+    protocol_version = "HTTP/1.1"
+    fake: FakeEvergreenServer
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Respond to a GET request."""
+        url = urlparse(self.path)
+        for route in self.fake.routes:
+            match = route.pattern.match(url.path)
+            if match:
+                break
+        else:
+            self._respond(404, {"error": f"{url.path} not found"})
+            return
+
+        fail = self.fake.request_started(route.name)
+        try:
+            time.sleep(self.fake.behavior.latency)
+            if fail:
+                self._respond(503, {"error": "injected error"})
+                return
+            body = route.find(*match.groups())
+            if body is None:
+                self._respond(404, {"error": f"{url.path} not found"})
+            elif route.paginated:
+                self._respond_page(url.path, parse_qs(url.query), body)
+            else:
+                self._respond(200, body)
+        finally:
+            self.fake.request_finished()
+
+    def _respond_page(self, path: str, query: Dict[str, List[str]], items: List[Any]) -> None:
+        """
+        Respond with a page of a list, linking to the next page if there is one.
+
+        :param path: The path requested.
+        :param query: The query parameters of the request.
+        :param items: The whole list.
+        """
+        start = int(query.get(START_PARAM, ["0"])[0])
+        page_size = int(query.get(LIMIT_PARAM, [self.fake.behavior.page_size])[0])
+        end = start + page_size
+        headers = {}
+        if end < len(items):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query[START_PARAM] = str(end)
+            next_url = f"{self.fake.url}{path}?{urlencode(next_query)}"
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        self._respond(200, items[start:end], headers)
+
+    def _respond(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        """
+        Respond with a json body.
+
+        :param status: The status of the response.
+        :param body: The body to send as json.
+        :param headers: Additional headers.
+        """
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Log requests at debug level rather than to stderr."""
+        LOGGER.debug("Fake evergreen request", request=format % args)
@@ -0,0 +1,353 @@
+"""Load test the API over HTTP, against a synthetic mapping dataset seeded in a local mongod."""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import math
+import random
+import socket
+import threading
+import time
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor as Executor
+from types import TracebackType
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import requests
+import structlog
+import uvicorn
+
+from evergreen.api import EvergreenApi, Project
+from fastapi import FastAPI
+from pymongo import MongoClient, monitoring
+
+from selectedtests.app.app import create_app
+from selectedtests.app.mapping_index import MappingIndex
+from selectedtests.benchmarks.fake_evergreen import PROJECT, PROJECT_JSON
+from selectedtests.benchmarks.mapping_dataset import (
+    MappingDatasetSpec,
+    clear_mappings,
+    seed_mappings,
+    source_file_names,
+)
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+
+LOGGER = structlog.get_logger(__name__)
+
+CONTROLLERS = ["test-mappings", "task-mappings"]
+# How long to wait for the application to start serving.
+STARTUP_TIMEOUT_SECONDS = 30.0
+# The number of distinct queries of each scenario, requests cycle through them.
+QUERIES_PER_SCENARIO = 100
+# The metrics checked against the baseline, and whether higher values are better.
+LOAD_TEST_CHECKED_METRICS = {
+    "requests_per_second": True,
+    "p95_ms": False,
+    "mongo_ops_per_request": False,
+}
+
+# The result of a load test scenario:
+# name: The controller and the number of changed files of each request.
+# requests: The number of requests made.
+# seconds: The time taken by all the requests.
+# requests_per_second: The throughput of the application.
+# p50_ms: The median latency of the requests.
+# p95_ms: The 95th percentile of the latency of the requests.
+# p99_ms: The 99th percentile of the latency of the requests.
+# errors: The number of requests that did not succeed.
+# mongo_ops_per_request: The number of commands sent to mongod per request.
+LoadTestResult = namedtuple(
+    "LoadTestResult",
+    [
+        "name",
+        "requests",
+        "seconds",
+        "requests_per_second",
+        "p50_ms",
+        "p95_ms",
+        "p99_ms",
+        "errors",
+        "mongo_ops_per_request",
+    ],
+)
+
+
+class StubEvergreenApi(EvergreenApi):
+    """Evergreen API answering the project lookups of the application without calling Evergreen."""
+
+    def __init__(self, projects: List[Dict[str, Any]]):
+        """
+        Create a StubEvergreenApi.
+
+        :param projects: The json of the projects Evergreen knows about.
+        """
+        super().__init__()
+        self.projects = projects
+
+    def all_projects(self, project_filter_fn: Optional[Callable] = None) -> List[Project]:
+        """
+        Get all the projects.
+
+        :param project_filter_fn: Function to filter the projects with.
+        :return: The projects.
+        """
+        projects = [Project(project, self) for project in self.projects]
+        if project_filter_fn:
+            return [project for project in projects if project_filter_fn(project)]
+        return projects
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands a MongoClient sends to mongod."""
+
+    def __init__(self) -> None:
+        """Create a CommandCounter."""
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def reset(self) -> None:
+        """Start counting afresh."""
+        with self._lock:
+            self.count = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        """Count a command."""
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        """Ignore the end of a command."""
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        """Ignore the end of a command."""
+
+
+class _ThreadedServer(uvicorn.Server):
+    """A uvicorn server that can run in a thread other than the main one."""
+
+    def install_signal_handlers(self) -> None:
+        """Leave the signals to the main thread."""
+
+
+class AppServer(object):
+    """
+    Serves an application with uvicorn in a thread of its own, on a free port of localhost.
+
+    Use it as a context manager, the application is served on entry and shut down on exit.
+    """
+
+    def __init__(self, app: FastAPI):
+        """
+        Create an AppServer.
+
+        :param app: The application to serve.
+        """
+        self.app = app
+        self.url = ""
+        self._server: Optional[_ThreadedServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> AppServer:
+        """Serve the application, once it started up."""
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        host, port = sock.getsockname()
+        self.url = f"http://{host}:{port}"
+        # uvicorn's logging config would replace that of the application.
+        config = uvicorn.Config(self.app, log_config=None, access_log=False, loop="asyncio")
+        self._server = _ThreadedServer(config)
+        server = self._server
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(server.serve(sockets=[sock])), daemon=True
+        )
+        self._thread.start()
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("The application failed to start")
+            time.sleep(0.05)
+        LOGGER.info("Serving application", url=self.url)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Shut the application down."""
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Get a percentile of values, by the nearest rank method.
+
+    :param values: The values, sorted.
+    :param fraction: The percentile as a fraction, 0.95 for the 95th percentile.
+    :return: The percentile, 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def scenario_queries(
+    controller: str, changed_files: int, spec: MappingDatasetSpec, seed: int
+) -> List[str]:
+    """
+    Create the queries of a scenario, each asking for the mappings of random source files.
+
+    :param controller: The controller queried.
+    :param changed_files: The number of changed files of each query.
+    :param spec: The shape of the dataset queried.
+    :param seed: Seed of the source files chosen.
+    :return: The paths and query strings of the requests.
+    """
+    rng = random.Random(f"{seed}-{controller}-{changed_files}")
+    source_files = source_file_names(spec)
+    return [
+        f"/projects/{PROJECT}/{controller}?changed_files="
+        + ",".join(rng.sample(source_files, min(changed_files, len(source_files))))
+        for _ in range(QUERIES_PER_SCENARIO)
+    ]
+
+
+def drive_load(
+    url: str, queries: List[str], requests_count: int, concurrency: int
+) -> Tuple[List[float], int, float]:
+    """
+    Send requests from concurrent clients, each sending its next request once it got a response.
+
+    :param url: The url of the application.
+    :param queries: The paths and query strings to cycle through.
+    :param requests_count: The number of requests to send.
+    :param concurrency: The number of clients.
+    :return: The sorted latencies of the requests in seconds, the number of errors and the time
+     taken.
+    """
+    request_numbers = itertools.count()
+
+    def client() -> Tuple[List[float], int]:
+        session = requests.Session()
+        latencies = []
+        errors = 0
+        while True:
+            number = next(request_numbers)
+            if number >= requests_count:
+                break
+            start = time.perf_counter()
+            response = session.get(url + queries[number % len(queries)])
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+        return latencies, errors
+
+    start = time.perf_counter()
+    with Executor(max_workers=concurrency) as exe:
+        clients = [exe.submit(client) for _ in range(concurrency)]
+        results = [job.result() for job in clients]
+    seconds = time.perf_counter() - start
+
+    latencies = sorted(itertools.chain.from_iterable(latency for latency, _ in results))
+    return latencies, sum(errors for _, errors in results), seconds
+
+
+def run_scenario(
+    server: AppServer,
+    counter: CommandCounter,
+    name: str,
+    queries: List[str],
+    requests_count: int,
+    concurrency: int,
+) -> LoadTestResult:
+    """
+    Run a load test scenario, after warming the application up with a request per client.
+
+    :param server: The server of the application.
+    :param counter: Counts the commands the application sends to mongod.
+    :param name: The name of the scenario.
+    :param queries: The paths and query strings to cycle through.
+    :param requests_count: The number of requests to send.
+    :param concurrency: The number of clients.
+    :return: The result of the scenario.
+    """
+    LOGGER.info("Running load test scenario", scenario=name)
+    drive_load(server.url, queries, concurrency, concurrency)
+    counter.reset()
+    latencies, errors, seconds = drive_load(server.url, queries, requests_count, concurrency)
+    return LoadTestResult(
+        name,
+        requests_count,
+        seconds,
+        requests_count / seconds if seconds else 0.0,
+        percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.95) * 1000,
+        percentile(latencies, 0.99) * 1000,
+        errors,
+        counter.count / requests_count,
+    )
+
+
+def run_load_test(
+    mongo_uri: str,
+    spec: MappingDatasetSpec,
+    changed_files_counts: List[int],
+    requests_count: int,
+    concurrency: int,
+    mapping_index: bool = False,
+    seed: int = 1,
+) -> List[LoadTestResult]:
+    """
+    Load test the GET endpoints of both mapping controllers.
+
+    The mappings of the synthetic project are replaced with a generated dataset, and deleted
+    once the load test is over. The mappings of other projects are not touched. Evergreen is
+    stubbed out, only the application and mongod are measured.
+
+    :param mongo_uri: The uri of the mongod to seed the dataset in.
+    :param spec: The shape of the dataset.
+    :param changed_files_counts: The numbers of changed files per request to run a scenario for.
+    :param requests_count: The number of requests of each scenario.
+    :param concurrency: The number of concurrent clients.
+    :param mapping_index: Whether to serve the mappings from the in-memory index.
+    :param seed: Seed of the source files requested.
+    :return: The results of the scenarios.
+    """
+    counter = CommandCounter()
+    mongo = MongoWrapper(MongoClient(mongo_uri, event_listeners=[counter]))
+    LOGGER.info("Seeding the mapping dataset", spec=spec)
+    seed_mappings(mongo, spec)
+    try:
+        index = MappingIndex(mongo) if mapping_index else None
+        if index is not None:
+            index.invalidate(PROJECT, 0)
+            index.reload_stale()
+        # Only the synthetic project is indexed, watching project_config would load the real
+        # projects too while the scenarios are timed.
+        app = create_app(mongo, StubEvergreenApi([PROJECT_JSON]), index, watch_config=False)
+
+        results = []
+        with AppServer(app) as server:
+            for controller in CONTROLLERS:
+                for changed_files in changed_files_counts:
+                    results.append(
+                        run_scenario(
+                            server,
+                            counter,
+                            f"{controller}/{changed_files}",
+                            scenario_queries(controller, changed_files, spec, seed),
+                            requests_count,
+                            concurrency,
+                        )
+                    )
+        return results
+    finally:
+        clear_mappings(mongo)
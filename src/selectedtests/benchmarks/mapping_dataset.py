@@ -0,0 +1,158 @@
+"""Generate a synthetic dataset of test and task mappings to load test the API against."""
+import random
+
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from selectedtests.benchmarks.fake_evergreen import BRANCH, PROJECT, REPO
+from selectedtests.benchmarks.synthetic_repo import FanOut, count_sampler
+from selectedtests.datasource.mappings_loader import TASK_MAPPING_SCHEMA, TEST_MAPPING_SCHEMA
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.task_mappings.update_task_mappings import update_task_mappings
+from selectedtests.test_mappings.update_test_mappings import update_test_mappings
+
+# The highest number of times a source file of the dataset was seen changing.
+MAX_SEEN_COUNT = 100
+
+# The shape of a synthetic mapping dataset:
+# source_files: The number of source files with test and task mappings.
+# tests_per_file: The mean number of test files mapped to a source file.
+# tasks_per_file: The mean number of tasks mapped to a source file.
+# fan_out: The distribution of the number of test files and tasks mapped to a source file.
+# test_files: The number of distinct test files.
+# tasks: The number of distinct tasks, spread over the variants.
+# variants: The number of build variants.
+# seed: Seed of the random choices, datasets generated with the same spec are identical.
+MappingDatasetSpec = namedtuple(
+    "MappingDatasetSpec",
+    [
+        "source_files",
+        "tests_per_file",
+        "tasks_per_file",
+        "fan_out",
+        "test_files",
+        "tasks",
+        "variants",
+        "seed",
+    ],
+    defaults=[1000, 20, 20, FanOut.PARETO, 2000, 200, 4, 1],
+)
+
+
+def dataset_parameters(spec: MappingDatasetSpec) -> Dict[str, Any]:
+    """
+    Get the shape of a dataset as it is stored with the baselines of the load test.
+
+    :param spec: The shape of the dataset.
+    :return: The parameters.
+    """
+    parameters = spec._asdict()
+    parameters["fan_out"] = spec.fan_out.value
+    return parameters
+
+
+def source_file_names(spec: MappingDatasetSpec) -> List[str]:
+    """
+    Get the names of the source files of a dataset, to query the mappings of.
+
+    :param spec: The shape of the dataset.
+    :return: The names of the source files.
+    """
+    return [f"src/dir_{i // 20}/source_{i}.cpp" for i in range(spec.source_files)]
+
+
+def _children(
+    rng: random.Random, sample_count: Callable[[], int], names: List[str], seen_count: int
+) -> Iterator[Tuple[str, int]]:
+    """
+    Sample the names and counts of the children of a mapping.
+
+    :param rng: The random number generator to sample with.
+    :param sample_count: Function sampling the number of children.
+    :param names: The names to choose the children from.
+    :param seen_count: The count of the mapping, the children's counts are at most as high.
+    :return: Iterator over the names and counts of the children.
+    """
+    for name in rng.sample(names, min(len(names), sample_count())):
+        yield name, rng.randint(1, seen_count)
+
+
+def generate_test_mappings(spec: MappingDatasetSpec) -> Iterator[Dict[str, Any]]:
+    """
+    Generate the test mappings of a synthetic dataset.
+
+    :param spec: The shape of the dataset.
+    :return: Iterator over the test mappings, as the test-mappings create command writes them.
+    """
+    rng = random.Random(spec.seed)
+    sample_count = count_sampler(spec.tests_per_file, spec.fan_out, rng)
+    test_files = [f"jstests/dir_{i // 20}/test_{i}.js" for i in range(spec.test_files)]
+    for source_file in source_file_names(spec):
+        seen_count = rng.randint(1, MAX_SEEN_COUNT)
+        yield {
+            "source_file": source_file,
+            "project": PROJECT,
+            "repo": REPO,
+            "branch": BRANCH,
+            "source_file_seen_count": seen_count,
+            "test_files": [
+                {"name": name, "test_file_seen_count": count}
+                for name, count in _children(rng, sample_count, test_files, seen_count)
+            ],
+        }
+
+
+def generate_task_mappings(spec: MappingDatasetSpec) -> Iterator[Dict[str, Any]]:
+    """
+    Generate the task mappings of a synthetic dataset.
+
+    :param spec: The shape of the dataset.
+    :return: Iterator over the task mappings, as the task-mappings create command writes them.
+    """
+    # A different seed from the test mappings, so the two do not mirror each other.
+    rng = random.Random(spec.seed + 1)
+    sample_count = count_sampler(spec.tasks_per_file, spec.fan_out, rng)
+    tasks = [f"task_{i}" for i in range(spec.tasks)]
+    for source_file in source_file_names(spec):
+        seen_count = rng.randint(1, MAX_SEEN_COUNT)
+        yield {
+            "source_file": source_file,
+            "project": PROJECT,
+            "repo": REPO,
+            "branch": BRANCH,
+            "source_file_seen_count": seen_count,
+            "tasks": [
+                {"name": name, "variant": f"variant_{i % spec.variants}", "flip_count": count}
+                for i, (name, count) in enumerate(_children(rng, sample_count, tasks, seen_count))
+            ],
+        }
+
+
+def clear_mappings(mongo: MongoWrapper, project: str = PROJECT) -> None:
+    """
+    Delete the test and task mappings of a project, and their children.
+
+    :param mongo: An instance of MongoWrapper.
+    :param project: The project to delete the mappings of.
+    """
+    for schema in [TEST_MAPPING_SCHEMA, TASK_MAPPING_SCHEMA]:
+        collection = getattr(mongo, schema.collection)()
+        children_collection = getattr(mongo, schema.children_collection)()
+        mapping_ids = collection.distinct("_id", {"project": project})
+        children_collection.delete_many({schema.parent_id_key: {"$in": mapping_ids}})
+        collection.delete_many({"project": project})
+
+
+def seed_mappings(mongo: MongoWrapper, spec: MappingDatasetSpec) -> None:
+    """
+    Replace the mappings of the synthetic project with a generated dataset.
+
+    Only the mappings of the synthetic project are touched, through the same updates the
+    mapping generation makes.
+
+    :param mongo: An instance of MongoWrapper.
+    :param spec: The shape of the dataset.
+    """
+    clear_mappings(mongo)
+    update_test_mappings(generate_test_mappings(spec), mongo)
+    update_task_mappings(generate_task_mappings(spec), mongo)
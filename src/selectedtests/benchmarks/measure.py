@@ -0,0 +1,70 @@
+"""Time a benchmark and measure the memory it uses."""
+import gc
+import resource
+import time
+import tracemalloc
+
+from collections import namedtuple
+from typing import Callable
+
+# The result of a benchmark:
+# name: The name of the benchmark.
+# items: The number of items, commits or versions for example, processed by a run.
+# seconds: The time taken by the quickest run.
+# items_per_second: The throughput of the quickest run.
+# peak_rss_kb: The peak resident set size of the process once the benchmark ran.
+# peak_allocated_bytes: The peak size of the python allocations made by a run.
+BenchmarkResult = namedtuple(
+    "BenchmarkResult",
+    ["name", "items", "seconds", "items_per_second", "peak_rss_kb", "peak_allocated_bytes"],
+)
+
+# A function preparing a run of a benchmark, untimed, and returning the function doing the run,
+# which returns the number of items processed.
+Prepare = Callable[[], Callable[[], int]]
+
+
+def peak_rss_kb() -> int:
+    """Get the peak resident set size of this process in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_benchmark(name: str, prepare: Prepare, repeat: int = 3) -> BenchmarkResult:
+    """
+    Run a benchmark several times, keeping the quickest run.
+
+    The allocations are traced in a run of their own after the timed runs, as tracing slows the
+    run down. The peak resident set size is that of the whole process, it never goes down, so it
+    only tells the memory used by the first benchmark run by a process apart.
+
+    :param name: The name of the benchmark.
+    :param prepare: Function preparing a run of the benchmark.
+    :param repeat: The number of timed runs.
+    :return: The result of the benchmark.
+    """
+    items = 0
+    seconds = float("inf")
+    for _ in range(repeat):
+        run = prepare()
+        gc.collect()
+        start = time.perf_counter()
+        items = run()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    run = prepare()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_allocated_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(
+        name,
+        items,
+        seconds,
+        items / seconds if seconds else 0.0,
+        peak_rss_kb(),
+        peak_allocated_bytes,
+    )
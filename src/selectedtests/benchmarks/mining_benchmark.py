@@ -0,0 +1,163 @@
+"""Benchmarks of mining the test mappings from the history of a synthetic git repo."""
+import re
+
+from datetime import timedelta
+from typing import Any, Callable, Dict, List
+
+import structlog
+
+from git import Repo
+
+from selectedtests.benchmarks.measure import BenchmarkResult, Prepare, run_benchmark
+from selectedtests.benchmarks.synthetic_repo import (
+    BRANCH,
+    FIRST_COMMIT_DATE,
+    SOURCE_FILE_REGEX,
+    TEST_FILE_REGEX,
+    RepoSpec,
+)
+from selectedtests.git_helper import modified_files_for_commit
+from selectedtests.test_mappings.commit_limit import CommitLimit
+from selectedtests.test_mappings.create_test_mappings import TestMappings
+
+LOGGER = structlog.get_logger(__name__)
+
+PROJECT = "synthetic-project"
+REPO = "synthetic-repo"
+# Stops before the first commit of the synthetic repo, so the whole history is mined.
+COMMIT_LIMIT = CommitLimit(stop_at_date=FIRST_COMMIT_DATE - timedelta(days=1))
+# A single transform of the mappings takes around a millisecond, too little to time reliably.
+TRANSFORM_PASSES = 100
+SOURCE_RE = re.compile(SOURCE_FILE_REGEX)
+TEST_RE = re.compile(TEST_FILE_REGEX)
+
+
+def spec_parameters(spec: RepoSpec) -> Dict[str, Any]:
+    """
+    Get the parameters of the mining benchmarks as they are stored with their baselines.
+
+    :param spec: The shape of the synthetic repo the benchmarks are run against.
+    :return: The parameters.
+    """
+    parameters = spec._asdict()
+    parameters["fan_out"] = spec.fan_out.value
+    return parameters
+
+
+def _create_mappings(repo_path: str) -> TestMappings:
+    """
+    Mine the test mappings of the whole history of a synthetic repo.
+
+    :param repo_path: Path to the synthetic repo.
+    :return: The test mappings.
+    """
+    return TestMappings.create_mappings(
+        Repo(repo_path), SOURCE_RE, TEST_RE, COMMIT_LIMIT, PROJECT, REPO, BRANCH
+    )
+
+
+def modified_files_benchmark(repo_path: str) -> Prepare:
+    """
+    Benchmark diffing every commit of a repo with modified_files_for_commit.
+
+    :param repo_path: Path to the synthetic repo.
+    :return: Function preparing a run of the benchmark.
+    """
+
+    def prepare() -> Callable[[], int]:
+        repo = Repo(repo_path)
+
+        def run() -> int:
+            commits = 0
+            for commit in repo.iter_commits(repo.head.commit):
+                modified_files_for_commit(commit, LOGGER)
+                commits += 1
+            return commits
+
+        return run
+
+    return prepare
+
+
+def create_mappings_benchmark(repo_path: str) -> Prepare:
+    """
+    Benchmark mining the test mappings of a repo with TestMappings.create_mappings.
+
+    :param repo_path: Path to the synthetic repo.
+    :return: Function preparing a run of the benchmark.
+    """
+    commits = sum(1 for _ in Repo(repo_path).iter_commits())
+
+    def prepare() -> Callable[[], int]:
+        def run() -> int:
+            _create_mappings(repo_path)
+            return commits
+
+        return run
+
+    return prepare
+
+
+def transform_mappings_benchmark(repo_path: str) -> Prepare:
+    """
+    Benchmark transforming mined test mappings into documents with TestMappings.iter_mappings.
+
+    The mappings are mined once, the transform is what is timed. It is measured through
+    iter_mappings as get_mappings caches the documents after its first call.
+
+    :param repo_path: Path to the synthetic repo.
+    :return: Function preparing a run of the benchmark.
+    """
+    test_mappings = _create_mappings(repo_path)
+
+    def prepare() -> Callable[[], int]:
+        def run() -> int:
+            return sum(
+                sum(1 for _ in test_mappings.iter_mappings()) for _ in range(TRANSFORM_PASSES)
+            )
+
+        return run
+
+    return prepare
+
+
+def end_to_end_benchmark(repo_path: str) -> Prepare:
+    """
+    Benchmark mining the test mappings of a repo and transforming them into documents.
+
+    :param repo_path: Path to the synthetic repo.
+    :return: Function preparing a run of the benchmark.
+    """
+    commits = sum(1 for _ in Repo(repo_path).iter_commits())
+
+    def prepare() -> Callable[[], int]:
+        def run() -> int:
+            _create_mappings(repo_path).get_mappings()
+            return commits
+
+        return run
+
+    return prepare
+
+
+MINING_BENCHMARKS = {
+    "modified_files_for_commit": modified_files_benchmark,
+    "create_mappings": create_mappings_benchmark,
+    "transform_mappings": transform_mappings_benchmark,
+    "end_to_end": end_to_end_benchmark,
+}
+
+
+def run_mining_benchmarks(repo_path: str, repeat: int = 3) -> List[BenchmarkResult]:
+    """
+    Run the mining benchmarks against a synthetic repo.
+
+    :param repo_path: Path to the synthetic repo.
+    :param repeat: The number of timed runs of each benchmark.
+    :return: The results of the benchmarks.
+    """
+    results = []
+    for name, benchmark in MINING_BENCHMARKS.items():
+        LOGGER.info("Running benchmark", benchmark=name)
+        results.append(run_benchmark(name, benchmark(repo_path), repeat))
+    return results
@@ -0,0 +1,174 @@
+"""Generate deterministic git repos with a synthetic history to benchmark mining against."""
+from __future__ import annotations
+
+import os.path
+import random
+import subprocess
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Callable, Dict, List
+
+import pytz
+
+from git import Repo
+
+BRANCH = "master"
+SOURCE_DIR = "src"
+TEST_DIR = "jstests"
+SOURCE_FILE_REGEX = f"^{SOURCE_DIR}/"
+TEST_FILE_REGEX = f"^{TEST_DIR}/"
+# Every commit is an hour after the previous one, starting from a fixed date, so the generated
+# commits and their shas are the same on every run.
+FIRST_COMMIT_DATE = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+COMMIT_INTERVAL = timedelta(hours=1)
+COMMITTER = "Synthetic Committer <synthetic@example.com>"
+# Shape of the pareto distribution of the files changed per commit.
+PARETO_ALPHA = 1.5
+# Number of files per directory of the synthetic repo.
+FILES_PER_DIR = 20
+
+
+class FanOut(Enum):
+    """Distribution of the number of files changed by each commit."""
+
+    FIXED = "fixed"
+    UNIFORM = "uniform"
+    PARETO = "pareto"
+
+
+# The shape of a synthetic repo:
+# commits: The number of commits after the initial commit adding every file.
+# files_per_commit: The mean number of files changed by a commit.
+# fan_out: The distribution of the number of files changed by a commit.
+# rename_rate: The probability of a commit renaming one of the files it changes.
+# source_files: The number of source files in the repo.
+# test_files: The number of test files in the repo.
+# test_ratio: The probability of a changed file being a test file.
+# seed: Seed of the random choices, repos generated with the same spec are identical.
+RepoSpec = namedtuple(
+    "RepoSpec",
+    [
+        "commits",
+        "files_per_commit",
+        "fan_out",
+        "rename_rate",
+        "source_files",
+        "test_files",
+        "test_ratio",
+        "seed",
+    ],
+    defaults=[5, FanOut.PARETO, 0.01, 500, 200, 0.3, 1],
+)
+
+
+def count_sampler(mean: int, fan_out: FanOut, rng: random.Random) -> Callable[[], int]:
+    """
+    Create a function sampling counts of at least one from a distribution with the given mean.
+
+    :param mean: The mean of the counts.
+    :param fan_out: The distribution of the counts.
+    :param rng: The random number generator to sample with.
+    :return: Function returning the next count.
+    """
+    if fan_out == FanOut.FIXED:
+        return lambda: mean
+    if fan_out == FanOut.UNIFORM:
+        return lambda: rng.randint(1, max(1, 2 * mean - 1))
+    # The mean of a pareto distribution is scale * alpha / (alpha - 1).
+    scale = mean * (PARETO_ALPHA - 1) / PARETO_ALPHA
+    return lambda: max(1, round(scale * rng.paretovariate(PARETO_ALPHA)))
+
+
+def _data(content: str) -> str:
+    """
+    Format content as a fast-import data command.
+
+    :param content: The content.
+    :return: The data command.
+    """
+    return f"data {len(content.encode())}\n{content}\n"
+
+
+def _file_path(directory: str, kind: str, index: int) -> str:
+    """
+    Create the path of a file of the synthetic repo.
+
+    :param directory: The top level directory of the file.
+    :param kind: Prefix of the file's name.
+    :param index: Number of the file.
+    :return: The path.
+    """
+    return f"{directory}/dir_{index // FILES_PER_DIR}/{kind}_{index}.txt"
+
+
+def generate_fast_import_stream(spec: RepoSpec) -> str:
+    """
+    Generate the history of a synthetic repo as a git fast-import stream.
+
+    :param spec: The shape of the repo.
+    :return: The fast-import stream.
+    """
+    rng = random.Random(spec.seed)
+    sample_count = count_sampler(spec.files_per_commit, spec.fan_out, rng)
+    files: Dict[str, List[str]] = {
+        SOURCE_DIR: [_file_path(SOURCE_DIR, "source", i) for i in range(spec.source_files)],
+        TEST_DIR: [_file_path(TEST_DIR, "test", i) for i in range(spec.test_files)],
+    }
+    renames = 0
+    commands = []
+
+    for number in range(spec.commits + 1):
+        timestamp = int((FIRST_COMMIT_DATE + number * COMMIT_INTERVAL).timestamp())
+        commands.append(f"commit refs/heads/{BRANCH}\nmark :{number + 1}\n")
+        commands.append(f"committer {COMMITTER} {timestamp} +0000\n")
+        commands.append(_data(f"Synthetic commit {number}"))
+
+        if number == 0:
+            changed = files[SOURCE_DIR] + files[TEST_DIR]
+        else:
+            commands.append(f"from :{number}\n")
+            changed = []
+            for _ in range(sample_count()):
+                directory = TEST_DIR if rng.random() < spec.test_ratio else SOURCE_DIR
+                if files[directory]:
+                    changed.append(rng.choice(files[directory]))
+            changed = sorted(set(changed))
+
+            if changed and rng.random() < spec.rename_rate:
+                old_path = changed.pop(rng.randrange(len(changed)))
+                directory = old_path.split("/", 1)[0]
+                new_path = f"{os.path.dirname(old_path)}/renamed_{renames}.txt"
+                renames += 1
+                files[directory][files[directory].index(old_path)] = new_path
+                commands.append(f"R {old_path} {new_path}\n")
+
+        for path in changed:
+            commands.append(f"M 100644 inline {path}\n")
+            commands.append(_data(f"{path} changed by commit {number}"))
+        commands.append("\n")
+
+    return "".join(commands)
+
+
+def create_synthetic_repo(path: str, spec: RepoSpec) -> Repo:
+    """
+    Create a git repo with a synthetic history.
+
+    The history is written with git fast-import, which is much quicker than committing through the
+    index. Nothing is checked out, the mining only reads the commits.
+
+    :param path: Directory to create the repo in.
+    :param spec: The shape of the repo.
+    :return: The repo.
+    """
+    repo = Repo.init(path)
+    subprocess.run(
+        ["git", "fast-import", "--quiet"],
+        input=generate_fast_import_stream(spec).encode(),
+        cwd=path,
+        check=True,
+    )
+    repo.git.symbolic_ref("HEAD", f"refs/heads/{BRANCH}")
+    return repo
@@ -0,0 +1,203 @@
+"""Benchmarks of generating the task mappings of a project served by a fake Evergreen server."""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+from evergreen.api import EvergreenApi
+from git import Repo
+
+from selectedtests.benchmarks.baseline import CHECKED_METRICS
+from selectedtests.benchmarks.fake_evergreen import (
+    PROJECT,
+    EvergreenSpec,
+    FakeEvergreenServer,
+    FakeProject,
+    ServerBehavior,
+    ServerStatistics,
+)
+from selectedtests.benchmarks.measure import Prepare, run_benchmark
+from selectedtests.benchmarks.synthetic_repo import (
+    BRANCH,
+    FIRST_COMMIT_DATE,
+    SOURCE_FILE_REGEX,
+    RepoSpec,
+)
+from selectedtests.git_helper import CloneMode, RepoClones
+from selectedtests.helpers import get_evg_api
+from selectedtests.task_mappings.create_task_mappings import MAX_WORKERS, generate_task_mappings
+from selectedtests.task_mappings.version_limit import VersionLimit
+
+LOGGER = structlog.get_logger(__name__)
+
+# Stops before the first version of the fake project, so every version is analyzed.
+VERSION_LIMIT = VersionLimit(stop_at_date=FIRST_COMMIT_DATE - timedelta(days=1))
+# The number of calls an extra version may make is what matters, the throughput and allocations
+# are checked as for the mining benchmarks.
+TASK_MAPPING_CHECKED_METRICS = dict(CHECKED_METRICS, api_calls_per_version=False)
+
+# The result of a task mapping benchmark, a BenchmarkResult along with the calls it made:
+# api_calls_per_version: The number of calls to the Evergreen API per version analyzed.
+# api_errors: The number of calls that failed on purpose, and were retried, in a run.
+# mean_concurrency: The number of calls in flight at once, averaged over a run.
+# executor_utilization: The fraction of the workers of the executor kept busy calling the API.
+TaskMappingResult = namedtuple(
+    "TaskMappingResult",
+    [
+        "name",
+        "items",
+        "seconds",
+        "items_per_second",
+        "peak_rss_kb",
+        "peak_allocated_bytes",
+        "api_calls_per_version",
+        "api_errors",
+        "mean_concurrency",
+        "executor_utilization",
+    ],
+)
+
+
+class SyntheticClones(RepoClones):
+    """Hands out a synthetic repo as the clone of every repo asked for."""
+
+    def __init__(self, repo_path: str):
+        """
+        Create a SyntheticClones.
+
+        :param repo_path: Path to the synthetic repo.
+        """
+        super().__init__()
+        self.repo_path = repo_path
+
+    def clone(
+        self,
+        url: str,
+        repo_path: str,
+        org_name: str,
+        repo_name: str,
+        branch: str,
+        clone_mode: CloneMode = CloneMode.FULL,
+        shallow_since: Optional[datetime] = None,
+    ) -> Repo:
+        """
+        Get the synthetic repo, nothing is cloned.
+
+        :param url: Unused, the synthetic repo is local.
+        :param repo_path: Unused, the synthetic repo is used where it is.
+        :param org_name: Unused.
+        :param repo_name: Unused.
+        :param branch: Unused, the synthetic repo has a single branch.
+        :param clone_mode: Unused.
+        :param shallow_since: Unused.
+        :return: The synthetic repo.
+        """
+        return Repo(self.repo_path)
+
+
+def create_fake_project(repo_path: str, spec: EvergreenSpec) -> FakeProject:
+    """
+    Create a fake Evergreen project with a version for every commit of a synthetic repo.
+
+    :param repo_path: Path to the synthetic repo.
+    :param spec: The shape of the project.
+    :return: The project.
+    """
+    commits = list(Repo(repo_path).iter_commits(BRANCH))
+    commits.reverse()
+    return FakeProject([(commit.hexsha, commit.committed_datetime) for commit in commits], spec)
+
+
+def benchmark_parameters(
+    repo_spec: RepoSpec, evergreen_spec: EvergreenSpec, behavior: ServerBehavior
+) -> Dict[str, Any]:
+    """
+    Get the parameters of the task mapping benchmark as they are stored with its baseline.
+
+    :param repo_spec: The shape of the synthetic repo.
+    :param evergreen_spec: The shape of the fake Evergreen project.
+    :param behavior: How the fake Evergreen server misbehaves.
+    :return: The parameters.
+    """
+    parameters = {f"repo_{key}": value for key, value in repo_spec._asdict().items()}
+    parameters["repo_fan_out"] = repo_spec.fan_out.value
+    parameters.update(evergreen_spec._asdict())
+    parameters.update({f"server_{key}": value for key, value in behavior._asdict().items()})
+    return parameters
+
+
+def task_mappings_benchmark(
+    evg_api: EvergreenApi,
+    server: FakeEvergreenServer,
+    repo_path: str,
+    statistics: List[ServerStatistics],
+) -> Prepare:
+    """
+    Benchmark generating the task mappings of the project served by a fake Evergreen server.
+
+    :param evg_api: Evergreen API calling the fake server.
+    :param server: The fake server.
+    :param repo_path: Path to the synthetic repo the versions of the project are commits of.
+    :param statistics: List the statistics of the calls made by each run are appended to.
+    :return: Function preparing a run of the benchmark.
+    """
+    # The oldest and the most recent versions are only compared against.
+    versions = len(server.project.versions) - 2
+
+    def prepare() -> Callable[[], int]:
+        clones = SyntheticClones(repo_path)
+
+        def run() -> int:
+            server.reset_statistics()
+            generate_task_mappings(
+                evg_api, PROJECT, VERSION_LIMIT, SOURCE_FILE_REGEX, clones=clones
+            )
+            statistics.append(server.statistics())
+            return versions
+
+        return run
+
+    return prepare
+
+
+def run_task_mapping_benchmark(
+    repo_path: str,
+    evergreen_spec: EvergreenSpec,
+    behavior: ServerBehavior,
+    repeat: int = 3,
+) -> TaskMappingResult:
+    """
+    Run the task mapping benchmark against a fake Evergreen server serving a synthetic repo.
+
+    The calls made are averaged over the timed runs, the run tracing the allocations is slower
+    and would skew the concurrency. The fake server runs in this process, so the allocations
+    include those of its responses.
+
+    :param repo_path: Path to the synthetic repo.
+    :param evergreen_spec: The shape of the fake Evergreen project.
+    :param behavior: How the fake Evergreen server misbehaves.
+    :param repeat: The number of timed runs.
+    :return: The result of the benchmark.
+    """
+    project = create_fake_project(repo_path, evergreen_spec)
+    statistics: List[ServerStatistics] = []
+    with FakeEvergreenServer(project, behavior) as server:
+        evg_api = get_evg_api(server.url)
+        LOGGER.info("Running benchmark", benchmark="generate_task_mappings", url=server.url)
+        result = run_benchmark(
+            "generate_task_mappings",
+            task_mappings_benchmark(evg_api, server, repo_path, statistics),
+            repeat,
+        )
+
+    timed = statistics[:repeat]
+    calls = sum(sum(run.calls.values()) for run in timed) / len(timed)
+    mean_concurrency = sum(run.mean_concurrency for run in timed) / len(timed)
+    return TaskMappingResult(
+        *result,
+        api_calls_per_version=calls / result.items if result.items else 0.0,
+        api_errors=sum(run.errors for run in timed) / len(timed),
+        mean_concurrency=mean_concurrency,
+        executor_utilization=mean_concurrency / MAX_WORKERS,
+    )
@@ -0,0 +1,229 @@
+"""Persistent index of the files changed by each commit analyzed."""
+from __future__ import annotations
+
+import fcntl
+import sys
+import threading
+
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import structlog
+
+LOGGER = structlog.get_logger(__name__)
+
+# Every field of a record is terminated by a NUL byte. NUL can not appear in a git path, so the
+# paths do not need to be escaped.
+FIELD_TERMINATOR = b"\0"
+# Every record is terminated by an empty field. No field of a record is empty, so a corrupt record
+# can be skipped by moving on to the next record terminator.
+RECORD_TERMINATOR = FIELD_TERMINATOR
+ENCODING = "utf-8"
+# Git paths are not guaranteed to be valid utf-8, keep any undecodable bytes as they were.
+ENCODING_ERRORS = "surrogateescape"
+ChangedFilesEntry = namedtuple("ChangedFilesEntry", ["parent_sha", "changed_files"])
+
+
+class ChangedFilesIndex(object):
+    """
+    An append-only file mapping commit shas to the files changed since the commit's first parent.
+
+    Each record is made up of the commit sha, the parent sha, the number of changed files and the
+    changed files themselves. Records are only ever appended, so the index can be shared by
+    the test and task mappings jobs and grows with the history that has been analyzed. Each record
+    is appended in a single write while holding an exclusive lock on the file, so the records of
+    processes sharing the index are not interleaved.
+    """
+
+    def __init__(
+        self, entries: Dict[str, ChangedFilesEntry], index_file: Optional[BinaryIO] = None
+    ):
+        """
+        Create a ChangedFilesIndex. Use ChangedFilesIndex.load rather than this directly.
+
+        :param entries: Map of commit shas to the files changed by the commit.
+        :param index_file: Open file new entries are appended to.
+        """
+        self._entries = entries
+        self._index_file = index_file
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> ChangedFilesIndex:
+        """
+        Load the index stored at the given path, creating it if it does not exist.
+
+        A partially written record left at the end of the file by an interrupted run is dropped and
+        corrupt records are skipped.
+
+        :param path: Path to the index file.
+        :return: An instance of ChangedFilesIndex.
+        """
+        # Unbuffered, so that every record is appended in a single write.
+        index_file = open(path, "a+b", buffering=0)
+        with _locked(index_file):
+            index_file.seek(0)
+            entries, valid_length = _parse_records(index_file.read())
+            index_file.truncate(valid_length)
+        LOGGER.info("Loaded changed files index", path=path, commits=len(entries))
+        return cls(entries, index_file)
+
+    def __len__(self) -> int:
+        """Return the number of commits in the index."""
+        return len(self._entries)
+
+    def __contains__(self, commit_sha: object) -> bool:
+        """Return whether the given commit is in the index."""
+        return commit_sha in self._entries
+
+    def get(self, commit_sha: str) -> Optional[ChangedFilesEntry]:
+        """
+        Get the files changed by the given commit.
+
+        :param commit_sha: Sha of the commit to look up.
+        :return: The parent the commit was compared against and the changed files, or None.
+        """
+        return self._entries.get(commit_sha)
+
+    def add(self, commit_sha: str, parent_sha: str, changed_files: Iterable[str]) -> None:
+        """
+        Add the files changed by a commit to the index.
+
+        :param commit_sha: Sha of the commit.
+        :param parent_sha: Sha of the commit's first parent that the changes are relative to.
+        :param changed_files: The files changed between the parent and the commit.
+        """
+        entry = ChangedFilesEntry(parent_sha, frozenset(sys.intern(f) for f in changed_files))
+        with self._lock:
+            if commit_sha in self._entries:
+                return
+            self._entries[commit_sha] = entry
+            if self._index_file is not None:
+                record = _format_record(commit_sha, entry)
+                with _locked(self._index_file):
+                    written = 0
+                    # A write to a regular file is only ever partial if the disk fills up.
+                    while written < len(record):
+                        written += self._index_file.write(record[written:])
+
+    def close(self) -> None:
+        """Close the index file, every entry added has already been written to it."""
+        with self._lock:
+            if self._index_file is not None:
+                self._index_file.close()
+                self._index_file = None
+
+
+@contextmanager
+def open_changed_files_index(path: Optional[str]) -> Iterator[Optional[ChangedFilesIndex]]:
+    """
+    Open the changed files index at the given path for the duration of the context.
+
+    :param path: Path to the index file or None if no index should be used.
+    :return: The opened index or None if no path was given.
+    """
+    if not path:
+        yield None
+        return
+
+    changed_files_index = ChangedFilesIndex.load(path)
+    try:
+        yield changed_files_index
+    finally:
+        changed_files_index.close()
+
+
+@contextmanager
+def _locked(index_file: BinaryIO) -> Iterator[None]:
+    """
+    Hold an exclusive lock on the index file for the duration of the context.
+
+    :param index_file: The open index file.
+    """
+    fcntl.flock(index_file.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(index_file.fileno(), fcntl.LOCK_UN)
+
+
+def _format_record(commit_sha: str, entry: ChangedFilesEntry) -> bytes:
+    """
+    Format an index entry as it is stored on disk.
+
+    :param commit_sha: Sha of the commit.
+    :param entry: Files changed by the commit.
+    :return: The encoded record.
+    """
+    fields = [commit_sha, entry.parent_sha, str(len(entry.changed_files))]
+    fields.extend(entry.changed_files)
+    record = b"".join(
+        field.encode(ENCODING, ENCODING_ERRORS) + FIELD_TERMINATOR for field in fields
+    )
+    return record + RECORD_TERMINATOR
+
+
+def _parse_records(data: bytes) -> Tuple[Dict[str, ChangedFilesEntry], int]:
+    """
+    Parse the records of an index file.
+
+    Records that are corrupt are skipped. Anything after the last record terminator is either a
+    record left partially written by an interrupted run or records written before the records
+    were terminated, so its complete records are kept and the rest is dropped.
+
+    :param data: Contents of the index file.
+    :return: The parsed entries and the length of the data up to the end of its last record.
+    """
+    entries: Dict[str, ChangedFilesEntry] = {}
+    chunks = data.split(FIELD_TERMINATOR + RECORD_TERMINATOR)
+    remainder = chunks.pop()
+    for chunk in chunks:
+        fields = chunk.split(FIELD_TERMINATOR)
+        chunk_entries, fields_parsed = _parse_fields(fields)
+        if fields_parsed != len(fields):
+            LOGGER.warning("Skipping corrupt changed files index record", length=len(chunk))
+            continue
+        entries.update(chunk_entries)
+
+    fields = remainder.split(FIELD_TERMINATOR)
+    # Anything after the last terminator is a partially written field.
+    fields.pop()
+    remainder_entries, fields_parsed = _parse_fields(fields)
+    entries.update(remainder_entries)
+    valid_length = len(data) - len(remainder)
+    valid_length += sum(len(field) + len(FIELD_TERMINATOR) for field in fields[:fields_parsed])
+
+    if valid_length != len(data):
+        LOGGER.warning("Dropping incomplete changed files index record", length=len(data))
+    return entries, valid_length
+
+
+def _parse_fields(fields: List[bytes]) -> Tuple[Dict[str, ChangedFilesEntry], int]:
+    """
+    Parse consecutive records from the fields of an index file.
+
+    :param fields: The fields of the records, without their terminators.
+    :return: The parsed entries and the number of fields that made up complete records.
+    """
+    entries: Dict[str, ChangedFilesEntry] = {}
+    position = 0
+    while position + 3 <= len(fields):
+        try:
+            n_changed_files = int(fields[position + 2])
+            commit_sha = fields[position].decode(ENCODING)
+            parent_sha = fields[position + 1].decode(ENCODING)
+        except ValueError:
+            break
+        end = position + 3 + n_changed_files
+        if n_changed_files < 0 or end > len(fields):
+            break
+
+        changed_files = frozenset(
+            sys.intern(field.decode(ENCODING, ENCODING_ERRORS))
+            for field in fields[position + 3 : end]
+        )
+        entries[commit_sha] = ChangedFilesEntry(parent_sha, changed_files)
+        position = end
+
+    return entries, position
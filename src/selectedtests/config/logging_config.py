@@ -1,4 +1,6 @@
 """Logging utilities."""
+import logging
+
 from enum import IntEnum
 
 from miscutils.logging_config import LogFormat, default_logging
@@ -29,3 +31,16 @@ def config_logging(verbosity: int, human_readable: bool = True) -> None:
     """
     log_format = LogFormat.TEXT if human_readable else LogFormat.JSON
     default_logging(verbosity, log_format, EXTERNAL_LOGGERS)
+
+
+def is_debug_enabled(name: str) -> bool:
+    """
+    Check whether a logger logs debug messages.
+
+    The structlog loggers filter by level only after their event dict is built, check this first
+    where debug messages are logged for every commit or file.
+
+    :param name: Name of the logger.
+    :return: Whether debug messages of the logger are logged.
+    """
+    return logging.getLogger(name).isEnabledFor(logging.DEBUG)
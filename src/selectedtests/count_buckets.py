@@ -0,0 +1,159 @@
+"""Helpers to store the counts of the mappings per month, so they can be windowed and aged."""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+
+# Map of the month, as 'YYYY-MM', to the count added in that month. The months sort as strings.
+MONTHLY_COUNTS_KEY = "monthly_counts"
+
+
+def get_bucket(when: Optional[datetime] = None) -> str:
+    """
+    Get the bucket that counts added at the given time are stored in.
+
+    :param when: The time the counts are added, now if not given.
+    :return: The month of the time in UTC as 'YYYY-MM'.
+    """
+    if when is None:
+        when = datetime.now(timezone.utc)
+    elif when.tzinfo is not None:
+        when = when.astimezone(timezone.utc)
+    return f"{when.year:04d}-{when.month:02d}"
+
+
+def get_oldest_bucket(months: int, now: Optional[datetime] = None) -> str:
+    """
+    Get the oldest bucket within a window of the given number of months.
+
+    A window of 1 month only includes the current month.
+
+    :param months: The number of months in the window.
+    :param now: The time the window ends at, now if not given.
+    :return: The oldest bucket in the window.
+    """
+    if months < 1:
+        raise ValueError(f"A window must include at least 1 month, not {months}")
+    if now is None:
+        now = datetime.now(timezone.utc)
+    month_index = now.year * 12 + now.month - 1 - (months - 1)
+    return f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+
+
+def bucketed_increment(
+    count_key: str, count: Union[int, float], bucket: str
+) -> Dict[str, Union[int, float]]:
+    """
+    Get the $inc document that adds a count to both the total and its bucket.
+
+    :param count_key: The field the total count is stored in.
+    :param count: The count to add.
+    :param bucket: The bucket to add the count to.
+    :return: The $inc update document.
+    """
+    return {count_key: count, f"{MONTHLY_COUNTS_KEY}.{bucket}": count}
+
+
+def monthly_increment(
+    document: Dict[str, Any], count_key: str, bucket: str
+) -> Dict[str, Union[int, float]]:
+    """
+    Get the $inc document that adds the counts of a generated mapping or child to their buckets.
+
+    Mappings are generated with their counts split by the month of the commit or version they
+    come from. The counts of mappings generated without them, e.g. by an older version, are added
+    to the given bucket.
+
+    :param document: The generated mapping or child.
+    :param count_key: The field the total count is stored in.
+    :param bucket: The bucket to add the count to if the document is not split by month.
+    :return: The $inc update document.
+    """
+    monthly_counts = document.get(MONTHLY_COUNTS_KEY)
+    if not monthly_counts:
+        return bucketed_increment(count_key, document[count_key], bucket)
+    increment = {count_key: document[count_key]}
+    for month, count in monthly_counts.items():
+        increment[f"{MONTHLY_COUNTS_KEY}.{month}"] = count
+    return increment
+
+
+def windowed_count(document: str, oldest_bucket: str) -> Dict[str, Any]:
+    """
+    Get an aggregation expression for the sum of the buckets of a document within a window.
+
+    Counts added before the counts were bucketed are not in any bucket, so are not included.
+
+    :param document: The document to sum the buckets of, e.g. '$' or '$$test_file.'.
+    :param oldest_bucket: The oldest bucket to include.
+    :return: The aggregation expression.
+    """
+    return {
+        "$sum": {
+            "$map": {
+                "input": {
+                    "$filter": {
+                        "input": {
+                            "$objectToArray": {"$ifNull": [f"{document}{MONTHLY_COUNTS_KEY}", {}]}
+                        },
+                        "as": "bucket",
+                        "cond": {"$gte": ["$$bucket.k", oldest_bucket]},
+                    }
+                },
+                "as": "bucket",
+                "in": "$$bucket.v",
+            }
+        }
+    }
+
+
+def windowed_parent_stages(count_key: str, oldest_bucket: str) -> List[Dict[str, Any]]:
+    """
+    Get the aggregation stages that replace the count of a mapping with its count in a window.
+
+    Mappings that were not seen within the window are dropped.
+
+    :param count_key: The field the count of the mapping is stored in.
+    :param oldest_bucket: The oldest bucket to include.
+    :return: The aggregation stages.
+    """
+    return [
+        {"$addFields": {count_key: windowed_count("$", oldest_bucket)}},
+        {"$match": {count_key: {"$gt": 0}}},
+    ]
+
+
+def windowed_children_stage(
+    children_key: str, count_key: str, oldest_bucket: str
+) -> Dict[str, Any]:
+    """
+    Get the aggregation stage that replaces the counts of the children of a mapping.
+
+    The count of each child is replaced with its count within a window and children that were not
+    seen within the window are dropped.
+
+    :param children_key: The field the looked up children of the mapping are in.
+    :param count_key: The field the count of each child is stored in.
+    :param oldest_bucket: The oldest bucket to include.
+    :return: The aggregation stage.
+    """
+    return {
+        "$addFields": {
+            children_key: {
+                "$filter": {
+                    "input": {
+                        "$map": {
+                            "input": f"${children_key}",
+                            "as": "child",
+                            "in": {
+                                "$mergeObjects": [
+                                    "$$child",
+                                    {count_key: windowed_count("$$child.", oldest_bucket)},
+                                ]
+                            },
+                        }
+                    },
+                    "as": "child",
+                    "cond": {"$gt": [f"$$child.{count_key}", 0]},
+                }
+            }
+        }
+    }
@@ -0,0 +1,151 @@
+"""Drop the monthly buckets of the mapping counts that have fallen out of the retention window."""
+from collections import namedtuple
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import structlog
+
+from boltons.iterutils import chunked_iter
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+
+from selectedtests.count_buckets import MONTHLY_COUNTS_KEY, get_oldest_bucket
+from selectedtests.datasource.mappings_loader import (
+    TASK_MAPPING_SCHEMA,
+    TEST_MAPPING_SCHEMA,
+    MappingSchema,
+)
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+
+LOGGER = structlog.get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+# Weighted counts are floats, so subtracting the expired buckets can leave a rounding error
+# rather than 0 behind.
+MIN_COUNT = 1e-9
+
+ExpiryResult = namedtuple("ExpiryResult", ["documents_updated", "documents_deleted"])
+
+
+def expire_buckets(
+    mongo: MongoWrapper,
+    retain_months: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> ExpiryResult:
+    """
+    Drop the buckets older than the retention window from the test and task mappings.
+
+    The counts in the dropped buckets are subtracted from the totals, so the totals only count
+    what was seen in the retention window and the counts added before they were bucketed. The
+    mappings and their children with nothing left to count are deleted.
+
+    :param mongo: An instance of MongoWrapper.
+    :param retain_months: The number of most recent months to keep, including the current one.
+    :param batch_size: The number of documents updated in each bulk write.
+    :param now: The time the retention window ends at, now if not given.
+    :return: The number of documents updated and deleted.
+    """
+    oldest_bucket = get_oldest_bucket(retain_months, now)
+    LOGGER.info("Expiring buckets", oldest_bucket=oldest_bucket)
+
+    documents_updated = 0
+    documents_deleted = 0
+    for schema in [TEST_MAPPING_SCHEMA, TASK_MAPPING_SCHEMA]:
+        result = _expire_mapping_buckets(mongo, schema, oldest_bucket, batch_size)
+        documents_updated += result.documents_updated
+        documents_deleted += result.documents_deleted
+    return ExpiryResult(documents_updated, documents_deleted)
+
+
+def _expire_mapping_buckets(
+    mongo: MongoWrapper, schema: MappingSchema, oldest_bucket: str, batch_size: int
+) -> ExpiryResult:
+    """
+    Drop the buckets older than the given one from a type of mappings and their children.
+
+    :param mongo: An instance of MongoWrapper.
+    :param schema: Describes the collections the mappings are stored in.
+    :param oldest_bucket: The oldest bucket to keep.
+    :param batch_size: The number of documents updated in each bulk write.
+    :return: The number of documents updated and deleted.
+    """
+    documents_updated = 0
+    documents_deleted = 0
+    # Children first, so a mapping is not deleted before the children emptied along with it.
+    for collection, count_key in [
+        (getattr(mongo, schema.children_collection)(), schema.child_count_key),
+        (getattr(mongo, schema.collection)(), schema.seen_count_key),
+    ]:
+        updated = _expire_collection_buckets(collection, count_key, oldest_bucket, batch_size)
+        deleted = collection.delete_many({count_key: {"$lt": MIN_COUNT}}).deleted_count
+        LOGGER.info(
+            "Expired buckets",
+            collection=collection.name,
+            documents_updated=updated,
+            documents_deleted=deleted,
+        )
+        documents_updated += updated
+        documents_deleted += deleted
+    return ExpiryResult(documents_updated, documents_deleted)
+
+
+def _expire_collection_buckets(
+    collection: Collection, count_key: str, oldest_bucket: str, batch_size: int
+) -> int:
+    """
+    Drop the buckets older than the given one from the documents of a collection.
+
+    :param collection: The collection to update.
+    :param count_key: The field the total count of each document is stored in.
+    :param oldest_bucket: The oldest bucket to keep.
+    :param batch_size: The number of documents updated in each bulk write.
+    :return: The number of documents updated.
+    """
+    has_expired_buckets = {
+        "$gt": [
+            {
+                "$size": {
+                    "$filter": {
+                        "input": {"$objectToArray": {"$ifNull": [f"${MONTHLY_COUNTS_KEY}", {}]}},
+                        "as": "bucket",
+                        "cond": {"$lt": ["$$bucket.k", oldest_bucket]},
+                    }
+                }
+            },
+            0,
+        ]
+    }
+    cursor = collection.find({"$expr": has_expired_buckets}, projection={MONTHLY_COUNTS_KEY: 1})
+
+    documents_updated = 0
+    for batch in chunked_iter(cursor, batch_size):
+        operations = [_expire_document_buckets(doc, count_key, oldest_bucket) for doc in batch]
+        result = collection.bulk_write(operations, ordered=False)
+        documents_updated += result.modified_count
+    return documents_updated
+
+
+def _expire_document_buckets(
+    document: Dict[str, Any], count_key: str, oldest_bucket: str
+) -> UpdateOne:
+    """
+    Create the operation that drops the buckets older than the given one from a document.
+
+    The operation only applies if the dropped buckets are unchanged, so it does not subtract them
+    twice if the document is seen twice.
+
+    :param document: The document with its buckets.
+    :param count_key: The field the total count of the document is stored in.
+    :param oldest_bucket: The oldest bucket to keep.
+    :return: The update operation.
+    """
+    expired = {
+        f"{MONTHLY_COUNTS_KEY}.{bucket}": count
+        for bucket, count in document[MONTHLY_COUNTS_KEY].items()
+        if bucket < oldest_bucket
+    }
+    return UpdateOne(
+        dict(_id=document["_id"], **expired),
+        {"$inc": {count_key: -sum(expired.values())}, "$unset": {key: "" for key in expired}},
+    )
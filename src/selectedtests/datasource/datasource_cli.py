@@ -1,4 +1,6 @@
 """Cli entry point to setup db indexes."""
+from typing import Optional, Tuple
+
 import click
 import structlog
 
@@ -8,9 +10,37 @@ from pymongo import ASCENDING, IndexModel
 from pymongo.collection import Collection
 
 from selectedtests.config.logging_config import config_logging
+from selectedtests.datasource.bucket_expiry import DEFAULT_BATCH_SIZE as DEFAULT_EXPIRY_BATCH_SIZE
+from selectedtests.datasource.bucket_expiry import expire_buckets as expire_mapping_buckets
+from selectedtests.datasource.mapping_compaction import (
+    DEFAULT_BATCH_SIZE as DEFAULT_COMPACTION_BATCH_SIZE,
+)
+from selectedtests.datasource.mapping_compaction import (
+    DEFAULT_PAUSE_SECONDS,
+    CompactionCheckpoint,
+    CompactionCutoffs,
+    compact_mappings,
+)
+from selectedtests.datasource.mapping_id_migration import (
+    DEFAULT_BATCH_SIZE as DEFAULT_MIGRATION_BATCH_SIZE,
+)
+from selectedtests.datasource.mapping_id_migration import migrate_mapping_ids as migrate_ids
+from selectedtests.datasource.mappings_loader import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_WORKERS,
+    TASK_MAPPING_SCHEMA,
+    TEST_MAPPING_SCHEMA,
+    LoadCheckpoint,
+)
+from selectedtests.datasource.mappings_loader import load_mappings as load_mappings_into_db
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.mapping_snapshot import export_snapshot as export_mapping_snapshot
+from selectedtests.mappings_output import read_mappings
+from selectedtests.project_config import advance_generations
+from selectedtests.work_items.work_item_priority import ELAPSED_SECONDS_KEY, PRIORITY_KEY
 
 LOGGER = structlog.get_logger()
+MAPPING_SCHEMAS = {"test": TEST_MAPPING_SCHEMA, "task": TASK_MAPPING_SCHEMA}
 
 
 def setup_queue_indexes(collection: Collection) -> None:
@@ -20,7 +50,16 @@ def setup_queue_indexes(collection: Collection) -> None:
     :param collection: Collection to add indexes to.
     """
     index = IndexModel([("project", ASCENDING)], unique=True)
-    collection.create_indexes([index])
+    # Supports claiming the next work item, in the order of CLAIM_ORDER.
+    claim_index = IndexModel(
+        [
+            ("end_time", ASCENDING),
+            (PRIORITY_KEY, ASCENDING),
+            (ELAPSED_SECONDS_KEY, ASCENDING),
+            ("created_on", ASCENDING),
+        ]
+    )
+    collection.create_indexes([index, claim_index])
     LOGGER.info("Adding indexes for collection", collection=collection.name)
 
 
@@ -86,6 +125,232 @@ def cli(ctx: Context, verbose: bool, mongo_uri: str) -> None:
     config_logging(verbosity, human_readable=False)
 
 
+@cli.command()
+@click.argument("mappings_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--mapping-type",
+    type=click.Choice(list(MAPPING_SCHEMAS)),
+    required=True,
+    help="Whether the file contains test or task mappings.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_BATCH_SIZE,
+    help="Number of mappings written in each batch.",
+)
+@click.option(
+    "--workers", type=int, default=DEFAULT_WORKERS, help="Number of threads writing batches."
+)
+@click.option(
+    "--checkpoint-file",
+    type=str,
+    help="File recording the batches loaded, used to resume a load that was interrupted.",
+)
+@click.pass_context
+def load_mappings(
+    ctx: Context,
+    mappings_file: str,
+    mapping_type: str,
+    batch_size: int,
+    workers: int,
+    checkpoint_file: Optional[str],
+) -> None:
+    """
+    Load the mappings written by the test-mappings or task-mappings create commands.
+
+    The mappings are merged into the mappings already in the database, the same way the update
+    commands do. Loading the same mappings twice counts them twice. The web service reloads the
+    mappings of the projects loaded once they are all loaded.
+    \f
+    :param ctx: Command Context.
+    :param mappings_file: The json or jsonl file to load, optionally gzip or zstd compressed.
+    :param mapping_type: Whether the file contains test or task mappings.
+    :param batch_size: Number of mappings written in each batch.
+    :param workers: Number of threads writing batches.
+    :param checkpoint_file: File recording the batches loaded.
+    """
+    try:
+        checkpoint = LoadCheckpoint.load(checkpoint_file, batch_size)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+    result = load_mappings_into_db(
+        ctx.obj["mongo"],
+        read_mappings(mappings_file),
+        MAPPING_SCHEMAS[mapping_type],
+        batch_size,
+        workers,
+        checkpoint,
+    )
+    advance_generations(ctx.obj["mongo"].project_config(), result.projects)
+
+
+@cli.command()
+@click.option(
+    "--retain-months",
+    type=click.IntRange(min=1),
+    required=True,
+    help="Number of most recent months of counts to keep, including the current one.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_EXPIRY_BATCH_SIZE,
+    help="Number of documents updated in each batch.",
+)
+@click.pass_context
+def expire_buckets(ctx: Context, retain_months: int, batch_size: int) -> None:
+    """
+    Drop the monthly counts of the mappings that are older than the retention window.
+
+    The dropped counts are subtracted from the totals of the mappings and the mappings left with
+    nothing to count are deleted.
+    \f
+    :param ctx: Command Context.
+    :param retain_months: Number of most recent months of counts to keep.
+    :param batch_size: Number of documents updated in each batch.
+    """
+    expire_mapping_buckets(ctx.obj["mongo"], retain_months, batch_size)
+    advance_generations(ctx.obj["mongo"].project_config())
+
+
+@cli.command()
+@click.option(
+    "--mapping-type",
+    "mapping_types",
+    type=click.Choice(list(MAPPING_SCHEMAS)),
+    multiple=True,
+    help="Type of mappings to compact, can be repeated. Defaults to both.",
+)
+@click.option(
+    "--project",
+    "projects",
+    type=str,
+    multiple=True,
+    help="Evergreen project to compact, can be repeated. Defaults to all the projects.",
+)
+@click.option(
+    "--min-count",
+    type=click.FloatRange(min=0),
+    default=0,
+    help="Delete the test files and tasks seen fewer times than this.",
+)
+@click.option(
+    "--min-ratio",
+    type=click.FloatRange(min=0),
+    default=0,
+    help="Delete the test files and tasks whose count divided by the count of their source file "
+    "is below this.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_COMPACTION_BATCH_SIZE,
+    help="Number of source files whose test files or tasks are pruned in each batch.",
+)
+@click.option(
+    "--pause-seconds",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_PAUSE_SECONDS,
+    help="Time to pause for after each batch that deleted anything.",
+)
+@click.option(
+    "--checkpoint-file",
+    type=str,
+    help="File recording the progress made, used to resume a compaction that was interrupted.",
+)
+@click.pass_context
+def compact(
+    ctx: Context,
+    mapping_types: Tuple[str, ...],
+    projects: Tuple[str, ...],
+    min_count: float,
+    min_ratio: float,
+    batch_size: int,
+    pause_seconds: float,
+    checkpoint_file: Optional[str],
+) -> None:
+    """
+    Delete the test files and tasks of the mappings that are below the cutoffs.
+
+    Nearly all the test files and tasks are only seen once or twice, so will never be selected,
+    but are still looked up with their source file and are in the indexes.
+    \f
+    :param ctx: Command Context.
+    :param mapping_types: Types of mappings to compact.
+    :param projects: Evergreen projects to compact.
+    :param min_count: Absolute cutoff below which test files and tasks are deleted.
+    :param min_ratio: Ratio cutoff below which test files and tasks are deleted.
+    :param batch_size: Number of source files whose test files or tasks are pruned in each batch.
+    :param pause_seconds: Time to pause for after each batch.
+    :param checkpoint_file: File recording the progress made.
+    """
+    if not min_count and not min_ratio:
+        raise click.UsageError("At least one of --min-count or --min-ratio must be given.")
+
+    checkpoint = CompactionCheckpoint.load(checkpoint_file)
+    cutoffs = CompactionCutoffs(min_count, min_ratio)
+    documents_deleted = 0
+    bytes_reclaimed = 0
+    for mapping_type in mapping_types or MAPPING_SCHEMAS:
+        result = compact_mappings(
+            ctx.obj["mongo"],
+            MAPPING_SCHEMAS[mapping_type],
+            cutoffs,
+            list(projects) or None,
+            batch_size,
+            pause_seconds,
+            checkpoint,
+        )
+        documents_deleted += result.documents_deleted
+        bytes_reclaimed += result.bytes_reclaimed
+    advance_generations(ctx.obj["mongo"].project_config(), list(projects) or None)
+    LOGGER.info(
+        "Finished compaction", documents_deleted=documents_deleted, bytes_reclaimed=bytes_reclaimed
+    )
+
+
+@cli.command()
+@click.option(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_MIGRATION_BATCH_SIZE,
+    help="Number of mappings migrated in each batch.",
+)
+@click.pass_context
+def migrate_mapping_ids(ctx: Context, batch_size: int) -> None:
+    """
+    Replace the generated ids of the test and task mappings with ids derived from their fields.
+
+    The test-mappings and task-mappings update and the work-items commands must not be run until
+    the migration has finished. A migration that was interrupted can be run again to finish it.
+    \f
+    :param ctx: Command Context.
+    :param batch_size: Number of mappings migrated in each batch.
+    """
+    for schema in MAPPING_SCHEMAS.values():
+        migrate_ids(ctx.obj["mongo"], schema, batch_size)
+    advance_generations(ctx.obj["mongo"].project_config())
+
+
+@cli.command()
+@click.argument("project")
+@click.argument("output_file", type=click.Path(dir_okay=False, writable=True))
+@click.pass_context
+def export_snapshot(ctx: Context, project: str, output_file: str) -> None:
+    """
+    Write the test and task mappings of a project to a memory-mappable snapshot file.
+
+    The snapshot can be queried with the query-snapshot command of test-mappings and task-mappings.
+    \f
+    :param ctx: Command Context.
+    :param project: The evergreen project to export.
+    :param output_file: The file to write the snapshot to.
+    """
+    export_mapping_snapshot(ctx.obj["mongo"], project, output_file)
+
+
 @cli.command()
 @click.pass_context
 def create_indexes(ctx: Context) -> None:
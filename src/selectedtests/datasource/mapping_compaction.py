@@ -0,0 +1,209 @@
+"""Prune the children of the mappings that are too rarely seen to ever be selected."""
+from __future__ import annotations
+
+import os
+import time
+
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from bson import BSON, json_util
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+from pymongo.write_concern import WriteConcern
+
+from selectedtests.datasource.mappings_loader import MappingSchema
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+
+LOGGER = structlog.get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAUSE_SECONDS = 0.1
+
+CompactionCutoffs = namedtuple("CompactionCutoffs", ["min_count", "min_ratio"])
+CompactionResult = namedtuple("CompactionResult", ["documents_deleted", "bytes_reclaimed"])
+
+
+class CompactionCheckpoint(object):
+    """
+    Record of the last mapping whose children were pruned, for each type of mapping and project.
+
+    The mappings are pruned in order of their ids, so an interrupted compaction can be resumed from
+    the mapping after the last one recorded. A compaction with different cutoffs should start
+    from a new checkpoint.
+    """
+
+    def __init__(self, path: Optional[str], last_mapping_ids: Optional[Dict[str, Any]] = None):
+        """
+        Create a CompactionCheckpoint. Use CompactionCheckpoint.load rather than this directly.
+
+        :param path: The file the checkpoint is saved to, None to not save it.
+        :param last_mapping_ids: Map of collection and project to the id of the last mapping pruned.
+        """
+        self.path = path
+        self._last_mapping_ids = last_mapping_ids if last_mapping_ids is not None else {}
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> CompactionCheckpoint:
+        """
+        Load the checkpoint saved at the given path, starting a new one if it does not exist.
+
+        :param path: The file the checkpoint is saved to, None to not save it.
+        :return: An instance of CompactionCheckpoint.
+        """
+        if not path or not os.path.exists(path):
+            return cls(path)
+
+        with open(path) as checkpoint_file:
+            last_mapping_ids = json_util.loads(checkpoint_file.read())
+        LOGGER.info("Resuming compaction from checkpoint", path=path)
+        return cls(path, last_mapping_ids)
+
+    @staticmethod
+    def _key(collection: str, project: str) -> str:
+        """Return the key of the mappings of the given collection and project."""
+        return f"{collection}:{project}"
+
+    def last_mapping_id(self, collection: str, project: str) -> Any:
+        """
+        Get the id of the last mapping of a project whose children were pruned.
+
+        :param collection: The name of the mappings collection.
+        :param project: The evergreen project.
+        :return: The id of the mapping, None if no mappings were pruned.
+        """
+        return self._last_mapping_ids.get(self._key(collection, project))
+
+    def complete(self, collection: str, project: str, mapping_id: Any) -> None:
+        """
+        Record that the children of the mappings of a project up to the given one were pruned.
+
+        :param collection: The name of the mappings collection.
+        :param project: The evergreen project.
+        :param mapping_id: The id of the last mapping pruned.
+        """
+        self._last_mapping_ids[self._key(collection, project)] = mapping_id
+        if self.path:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as checkpoint_file:
+                checkpoint_file.write(json_util.dumps(self._last_mapping_ids))
+            os.replace(temp_path, self.path)
+
+
+def compact_mappings(
+    mongo: MongoWrapper,
+    schema: MappingSchema,
+    cutoffs: CompactionCutoffs,
+    projects: Optional[List[str]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause_seconds: float = DEFAULT_PAUSE_SECONDS,
+    checkpoint: Optional[CompactionCheckpoint] = None,
+) -> CompactionResult:
+    """
+    Delete the children of the mappings whose counts are below the cutoffs.
+
+    A child is deleted if its count is below the absolute cutoff or its count divided by the count
+    of its mapping is below the ratio cutoff, so it would not be returned for any threshold at
+    or above the ratio cutoff. The children are deleted in batches, each acknowledged by a majority
+    of the replica set and followed by a pause, so the secondaries can keep up.
+
+    :param mongo: An instance of MongoWrapper.
+    :param schema: Describes the collections the mappings are stored in.
+    :param cutoffs: The absolute and ratio cutoffs below which children are deleted.
+    :param projects: The projects to compact, all the projects if not given.
+    :param batch_size: The number of mappings whose children are pruned in each batch.
+    :param pause_seconds: The time to pause for after each batch.
+    :param checkpoint: Record of the mappings already pruned, which are skipped.
+    :return: The number of children deleted and the number of bytes they took.
+    """
+    if checkpoint is None:
+        checkpoint = CompactionCheckpoint(None)
+    collection = getattr(mongo, schema.collection)()
+    children_collection = getattr(mongo, schema.children_collection)().with_options(
+        write_concern=WriteConcern(w="majority")
+    )
+    if projects is None:
+        projects = sorted(collection.distinct("project"))
+
+    documents_deleted = 0
+    bytes_reclaimed = 0
+    for project in projects:
+        project_documents_deleted = 0
+        project_bytes_reclaimed = 0
+        while True:
+            query: Dict[str, Any] = {"project": project}
+            last_mapping_id = checkpoint.last_mapping_id(collection.name, project)
+            if last_mapping_id is not None:
+                query["_id"] = {"$gt": last_mapping_id}
+            mappings = list(
+                collection.find(query, projection={schema.seen_count_key: 1})
+                .sort("_id", ASCENDING)
+                .limit(batch_size)
+            )
+            if not mappings:
+                break
+
+            result = _prune_children(children_collection, schema, cutoffs, mappings)
+            project_documents_deleted += result.documents_deleted
+            project_bytes_reclaimed += result.bytes_reclaimed
+            checkpoint.complete(collection.name, project, mappings[-1]["_id"])
+            if result.documents_deleted and pause_seconds:
+                time.sleep(pause_seconds)
+
+        LOGGER.info(
+            "Compacted mappings",
+            collection=children_collection.name,
+            project=project,
+            documents_deleted=project_documents_deleted,
+            bytes_reclaimed=project_bytes_reclaimed,
+        )
+        documents_deleted += project_documents_deleted
+        bytes_reclaimed += project_bytes_reclaimed
+
+    return CompactionResult(documents_deleted, bytes_reclaimed)
+
+
+def _prune_children(
+    children_collection: Collection,
+    schema: MappingSchema,
+    cutoffs: CompactionCutoffs,
+    mappings: List[Dict[str, Any]],
+) -> CompactionResult:
+    """
+    Delete the children of the given mappings whose counts are below the cutoffs.
+
+    :param children_collection: The collection containing the children.
+    :param schema: Describes the collections the mappings are stored in.
+    :param cutoffs: The absolute and ratio cutoffs below which children are deleted.
+    :param mappings: The mappings with their ids and counts.
+    :return: The number of children deleted and the number of bytes they took.
+    """
+    mapping_counts = {mapping["_id"]: mapping[schema.seen_count_key] for mapping in mappings}
+    # Only the children below the highest cutoff of any of the mappings are candidates.
+    highest_cutoff = max(
+        cutoffs.min_count, cutoffs.min_ratio * max(mapping_counts.values(), default=0)
+    )
+    candidates = children_collection.find(
+        {
+            schema.parent_id_key: {"$in": list(mapping_counts)},
+            schema.child_count_key: {"$lt": highest_cutoff},
+        }
+    )
+
+    child_ids = []
+    bytes_reclaimed = 0
+    for child in candidates:
+        count = child[schema.child_count_key]
+        mapping_count = mapping_counts[child[schema.parent_id_key]]
+        if count < cutoffs.min_count or (
+            mapping_count and count / mapping_count < cutoffs.min_ratio
+        ):
+            child_ids.append(child["_id"])
+            bytes_reclaimed += len(BSON.encode(child))
+
+    if not child_ids:
+        return CompactionResult(0, 0)
+    result = children_collection.delete_many({"_id": {"$in": child_ids}})
+    return CompactionResult(result.deleted_count, bytes_reclaimed)
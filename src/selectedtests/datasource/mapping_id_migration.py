@@ -0,0 +1,123 @@
+"""Migrate test and task mappings to ids derived from the fields that identify them."""
+from typing import Any, Dict, List
+
+import structlog
+
+from pymongo import ReplaceOne, UpdateMany
+from pymongo.collection import Collection
+
+from selectedtests.datasource.mappings_loader import MappingSchema
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.helpers import create_mapping_id
+
+LOGGER = structlog.get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+# The copies of the mappings with their new ids are staged in a collection with this suffix.
+STAGING_SUFFIX = "_id_migration"
+# The field of a staged copy holding the old id of its mapping.
+OLD_ID_KEY = "old_id"
+
+
+def migrate_mapping_ids(
+    mongo: MongoWrapper, schema: MappingSchema, batch_size: int = DEFAULT_BATCH_SIZE
+) -> int:
+    """
+    Replace the generated ObjectIds of the mappings with the ids from create_mapping_id.
+
+    A mapping cannot be inserted with its new id while it still exists with its old id, as they
+    would conflict on the unique index of the fields that identify them. So each batch first
+    copies the mappings with their new ids into a staging collection, and only once the copies
+    exist moves the children over, deletes the mappings with their old ids and inserts the copies.
+    A migration that is interrupted can be run again to finish it, starting with the copies left
+    in the staging collection. The update commands should not be run until the migration has
+    finished, as they would fail to insert mappings that still have their old ids.
+
+    :param mongo: An instance of MongoWrapper.
+    :param schema: Describes the collections the mappings are stored in.
+    :param batch_size: The number of mappings migrated in each batch.
+    :return: The number of mappings migrated.
+    """
+    collection = getattr(mongo, schema.collection)()
+    children_collection = getattr(mongo, schema.children_collection)()
+    staging_collection = collection.database[f"{collection.name}{STAGING_SUFFIX}"]
+
+    mappings_migrated = 0
+    while True:
+        staged = list(staging_collection.find().limit(batch_size))
+        if not staged:
+            break
+        LOGGER.info("Finishing staged mappings of an interrupted migration", count=len(staged))
+        _replace_mappings(collection, children_collection, staging_collection, schema, staged)
+        mappings_migrated += len(staged)
+
+    while True:
+        mappings = list(collection.find({"_id": {"$type": "objectId"}}).limit(batch_size))
+        if not mappings:
+            break
+
+        staged = [
+            dict(mapping, _id=create_mapping_id(mapping), **{OLD_ID_KEY: mapping["_id"]})
+            for mapping in mappings
+        ]
+        staging_collection.bulk_write(
+            [ReplaceOne({"_id": copy["_id"]}, copy, upsert=True) for copy in staged],
+            ordered=False,
+        )
+        _replace_mappings(collection, children_collection, staging_collection, schema, staged)
+
+        mappings_migrated += len(mappings)
+        LOGGER.info("Migrated mapping ids", collection=collection.name, count=mappings_migrated)
+
+    return mappings_migrated
+
+
+def _replace_mappings(
+    collection: Collection,
+    children_collection: Collection,
+    staging_collection: Collection,
+    schema: MappingSchema,
+    staged: List[Dict[str, Any]],
+) -> None:
+    """
+    Replace the mappings with their staged copies and remove the copies from the staging area.
+
+    Every step can be repeated, so the copies can be staged again and replaced again if the
+    migration is interrupted at any point.
+
+    :param collection: The collection containing the mappings.
+    :param children_collection: The collection containing the children.
+    :param staging_collection: The collection containing the copies.
+    :param schema: Describes the collections the mappings are stored in.
+    :param staged: The copies of the mappings with their new ids and their old ids.
+    """
+    _move_children(children_collection, schema, staged)
+    collection.delete_many({"_id": {"$in": [copy[OLD_ID_KEY] for copy in staged]}})
+    operations = []
+    for copy in staged:
+        mapping = {key: value for key, value in copy.items() if key != OLD_ID_KEY}
+        operations.append(ReplaceOne({"_id": mapping["_id"]}, mapping, upsert=True))
+    collection.bulk_write(operations, ordered=False)
+    staging_collection.delete_many({"_id": {"$in": [copy["_id"] for copy in staged]}})
+
+
+def _move_children(
+    children_collection: Collection, schema: MappingSchema, mappings: List[Dict[str, Any]]
+) -> None:
+    """
+    Point the children of the given mappings at the new ids of the mappings.
+
+    :param children_collection: The collection containing the children.
+    :param schema: Describes the collections the mappings are stored in.
+    :param mappings: The copies of the mappings with their new ids and their old ids.
+    """
+    children_collection.bulk_write(
+        [
+            UpdateMany(
+                {schema.parent_id_key: mapping[OLD_ID_KEY]},
+                {"$set": {schema.parent_id_key: mapping["_id"]}},
+            )
+            for mapping in mappings
+        ],
+        ordered=False,
+    )
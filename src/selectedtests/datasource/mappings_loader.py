@@ -0,0 +1,296 @@
+"""Bulk load test and task mappings written by the create commands into the database."""
+from __future__ import annotations
+
+import json
+import os
+import threading
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future
+from concurrent.futures import ThreadPoolExecutor as Executor
+from concurrent.futures import wait
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import structlog
+
+from boltons.iterutils import chunked_iter
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from selectedtests.count_buckets import MONTHLY_COUNTS_KEY, get_bucket, monthly_increment
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.helpers import create_mapping_id, create_query
+
+LOGGER = structlog.get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_WORKERS = 4
+DUPLICATE_KEY_ERROR = 11000
+
+MappingSchema = namedtuple(
+    "MappingSchema",
+    [
+        "collection",
+        "children_collection",
+        "children_key",
+        "seen_count_key",
+        "child_count_key",
+        "parent_id_key",
+    ],
+)
+TEST_MAPPING_SCHEMA = MappingSchema(
+    collection="test_mappings",
+    children_collection="test_mappings_test_files",
+    children_key="test_files",
+    seen_count_key="source_file_seen_count",
+    child_count_key="test_file_seen_count",
+    parent_id_key="test_mapping_id",
+)
+TASK_MAPPING_SCHEMA = MappingSchema(
+    collection="task_mappings",
+    children_collection="task_mappings_tasks",
+    children_key="tasks",
+    seen_count_key="source_file_seen_count",
+    child_count_key="flip_count",
+    parent_id_key="task_mapping_id",
+)
+LoadResult = namedtuple(
+    "LoadResult", ["batches_loaded", "batches_skipped", "mappings_loaded", "projects"]
+)
+
+
+class LoadCheckpoint(object):
+    """
+    Record of the batches of a mappings file that have been loaded.
+
+    The counts of the mappings are incremented when they are loaded, so loading a batch twice
+    would count it twice. A load that is interrupted can be resumed with the same checkpoint file
+    and batch size to only load the batches that were not completed. A batch that was interrupted
+    part way through may have been partially applied.
+    """
+
+    def __init__(
+        self, path: Optional[str], batch_size: int, completed_batches: Optional[Set[int]] = None
+    ):
+        """
+        Create a LoadCheckpoint. Use LoadCheckpoint.load rather than this directly.
+
+        :param path: The file the checkpoint is saved to, None to not save it.
+        :param batch_size: The number of mappings in each batch.
+        :param completed_batches: The numbers of the batches that have been loaded.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._completed_batches = completed_batches if completed_batches is not None else set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Optional[str], batch_size: int) -> LoadCheckpoint:
+        """
+        Load the checkpoint saved at the given path, starting a new one if it does not exist.
+
+        :param path: The file the checkpoint is saved to, None to not save it.
+        :param batch_size: The number of mappings in each batch.
+        :return: An instance of LoadCheckpoint.
+        """
+        if not path or not os.path.exists(path):
+            return cls(path, batch_size)
+
+        with open(path) as checkpoint_file:
+            data = json.load(checkpoint_file)
+        if data["batch_size"] != batch_size:
+            raise ValueError(
+                f"The checkpoint {path} was written with a batch size of {data['batch_size']}"
+            )
+        completed_batches = set(range(data["loaded_up_to_batch"]))
+        completed_batches.update(data["loaded_batches"])
+        LOGGER.info("Resuming load from checkpoint", path=path, batches=len(completed_batches))
+        return cls(path, batch_size, completed_batches)
+
+    def is_completed(self, batch_number: int) -> bool:
+        """
+        Check whether the given batch has been loaded.
+
+        :param batch_number: The number of the batch.
+        :return: Whether the batch has been loaded.
+        """
+        with self._lock:
+            return batch_number in self._completed_batches
+
+    def complete(self, batch_number: int) -> None:
+        """
+        Record that the given batch was loaded and save the checkpoint.
+
+        :param batch_number: The number of the batch.
+        """
+        with self._lock:
+            self._completed_batches.add(batch_number)
+            if self.path:
+                self._save()
+
+    def _save(self) -> None:
+        """Atomically replace the saved checkpoint with the current one."""
+        loaded_up_to_batch = 0
+        while loaded_up_to_batch in self._completed_batches:
+            loaded_up_to_batch += 1
+        data = {
+            "batch_size": self.batch_size,
+            "loaded_up_to_batch": loaded_up_to_batch,
+            "loaded_batches": sorted(b for b in self._completed_batches if b > loaded_up_to_batch),
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as checkpoint_file:
+            json.dump(data, checkpoint_file)
+        os.replace(temp_path, self.path)  # type: ignore
+
+
+def load_mappings(
+    mongo: MongoWrapper,
+    mappings: Iterable[Dict[str, Any]],
+    schema: MappingSchema,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    checkpoint: Optional[LoadCheckpoint] = None,
+) -> LoadResult:
+    """
+    Load mappings into the database, merging them into any existing mappings.
+
+    The counts of existing mappings are incremented in the same way as update_test_mappings and
+    update_task_mappings do, including adding them to the months they come from, or the current
+    month if they are not split by month. The mappings are written in unordered batches by several
+    threads.
+
+    :param mongo: An instance of MongoWrapper.
+    :param mappings: The mappings to load.
+    :param schema: Describes the collections the mappings are stored in.
+    :param batch_size: The number of mappings written in each batch.
+    :param workers: The number of threads writing batches.
+    :param checkpoint: Record of the batches already loaded, which are skipped.
+    :return: The number of batches loaded and skipped, the number of mappings loaded and the
+     projects they are mappings of.
+    """
+    if checkpoint is None:
+        checkpoint = LoadCheckpoint(None, batch_size)
+    bucket = get_bucket()
+
+    batches_loaded = 0
+    batches_skipped = 0
+    mappings_loaded = 0
+    # The projects of the skipped batches too, they may have been loaded by a run that failed.
+    projects: Set[str] = set()
+    pending: Set[Future] = set()
+    with Executor(max_workers=workers) as exe:
+        for batch_number, batch in enumerate(chunked_iter(mappings, batch_size)):
+            projects.update(mapping["project"] for mapping in batch)
+            if checkpoint.is_completed(batch_number):
+                batches_skipped += 1
+                continue
+
+            # Only read ahead of the writers by a few batches to keep memory bounded.
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                mappings_loaded += sum(future.result() for future in done)
+                batches_loaded += len(done)
+            pending.add(
+                exe.submit(_load_batch, mongo, schema, bucket, batch_number, batch, checkpoint)
+            )
+
+        for future in pending:
+            mappings_loaded += future.result()
+            batches_loaded += 1
+
+    LOGGER.info(
+        "Loaded mappings",
+        collection=schema.collection,
+        batches_loaded=batches_loaded,
+        batches_skipped=batches_skipped,
+        mappings_loaded=mappings_loaded,
+    )
+    return LoadResult(batches_loaded, batches_skipped, mappings_loaded, projects)
+
+
+def _load_batch(
+    mongo: MongoWrapper,
+    schema: MappingSchema,
+    bucket: str,
+    batch_number: int,
+    batch: List[Dict[str, Any]],
+    checkpoint: LoadCheckpoint,
+) -> int:
+    """
+    Load a batch of mappings and record it in the checkpoint.
+
+    :param mongo: An instance of MongoWrapper.
+    :param schema: Describes the collections the mappings are stored in.
+    :param bucket: The monthly bucket the counts not split by month are added to.
+    :param batch_number: The number of the batch.
+    :param batch: The mappings to load.
+    :param checkpoint: Record of the batches loaded.
+    :return: The number of mappings loaded.
+    """
+    collection = getattr(mongo, schema.collection)()
+    children_collection = getattr(mongo, schema.children_collection)()
+
+    operations = []
+    child_operations = []
+    for mapping in batch:
+        query = create_query(
+            mapping,
+            joined=[schema.children_key],
+            mutable=[schema.seen_count_key, MONTHLY_COUNTS_KEY],
+        )
+        mapping_id = create_mapping_id(query)
+        operations.append(
+            UpdateOne(
+                {"_id": mapping_id},
+                {
+                    "$inc": monthly_increment(mapping, schema.seen_count_key, bucket),
+                    "$setOnInsert": query,
+                },
+                upsert=True,
+            )
+        )
+        for child in mapping.get(schema.children_key, []):
+            child_query = dict(
+                **create_query(child, mutable=[schema.child_count_key, MONTHLY_COUNTS_KEY]),
+                **{schema.parent_id_key: mapping_id},
+            )
+            child_operations.append(
+                UpdateOne(
+                    child_query,
+                    {"$inc": monthly_increment(child, schema.child_count_key, bucket)},
+                    upsert=True,
+                )
+            )
+
+    _bulk_write(collection, operations)
+    if child_operations:
+        _bulk_write(children_collection, child_operations)
+
+    checkpoint.complete(batch_number)
+    LOGGER.debug("Loaded batch", batch_number=batch_number, mappings=len(batch))
+    return len(batch)
+
+
+def _bulk_write(collection: Collection, operations: List[UpdateOne]) -> None:
+    """
+    Write the operations to the collection in an unordered bulk write.
+
+    Two writers can race to upsert the same document, in which case the loser fails with a
+    duplicate key error. The operations that failed this way are retried once, when they will
+    update the document inserted by the other writer.
+
+    :param collection: The collection to write to.
+    :param operations: The operations to write.
+    """
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as bwe:
+        errors = bwe.details.get("writeErrors", [])
+        if not errors or any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+            # bulk write error default message is not always that helpful, so dump the details.
+            LOGGER.exception("bulk_write error", collection=collection.name, details=bwe.details)
+            raise
+        LOGGER.debug("Retrying upserts that raced", collection=collection.name, count=len(errors))
+        collection.bulk_write([operations[error["index"]] for error in errors], ordered=False)
@@ -1,31 +1,188 @@
 """Classes for accessing mongo collections."""
 from __future__ import annotations
 
+import os
+
+from typing import Any, Dict, Mapping, Optional, Union
+
 from pymongo import MongoClient
 from pymongo.collection import Collection
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from pymongo.write_concern import WriteConcern
+
+ENV_PREFIX = "SELECTED_TESTS_MONGO_"
+# Losing an update of the most recent commit or version analyzed would count them again.
+DEFAULT_CONFIG_WRITE_CONCERN = "majority"
+
+
+class MongoConfig(object):
+    """
+    Represents the connection settings of a MongoWrapper.
+
+    Settings left as None use the defaults of the driver or the mongo URI. The read preference
+    and bulk write concern only apply to the collections of the test and task mappings, the
+    config write concern applies to the project config and work item collections, which are
+    always read from the primary.
+    """
+
+    def __init__(
+        self,
+        max_pool_size: Optional[int] = None,
+        min_pool_size: Optional[int] = None,
+        read_preference: Optional[str] = None,
+        bulk_write_concern: Optional[Union[int, str]] = None,
+        config_write_concern: Optional[Union[int, str]] = None,
+        compressors: Optional[str] = None,
+        connect_timeout_ms: Optional[int] = None,
+        server_selection_timeout_ms: Optional[int] = None,
+        socket_timeout_ms: Optional[int] = None,
+    ):
+        """
+        Create a MongoConfig.
+
+        :param max_pool_size: The maximum number of connections in the pool of each server.
+        :param min_pool_size: The number of connections kept open in the pool of each server.
+        :param read_preference: The read preference of the mappings, e.g. 'secondaryPreferred'.
+        :param bulk_write_concern: The write concern of the mappings, e.g. 1.
+        :param config_write_concern: The write concern of the project config and work items, e.g.
+         'majority'.
+        :param compressors: Comma separated list of wire compressors, e.g. 'zstd,snappy,zlib'.
+        :param connect_timeout_ms: Milliseconds to wait for a connection to be made.
+        :param server_selection_timeout_ms: Milliseconds to wait to find a suitable server.
+        :param socket_timeout_ms: Milliseconds to wait for the response to a request.
+        """
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.read_preference = read_preference
+        self.bulk_write_concern = bulk_write_concern
+        self.config_write_concern = config_write_concern
+        self.compressors = compressors
+        self.connect_timeout_ms = connect_timeout_ms
+        self.server_selection_timeout_ms = server_selection_timeout_ms
+        self.socket_timeout_ms = socket_timeout_ms
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> MongoConfig:
+        """
+        Instantiate an instance of MongoConfig from SELECTED_TESTS_MONGO_* environment variables.
+
+        For example SELECTED_TESTS_MONGO_MAX_POOL_SIZE sets max_pool_size.
+
+        :param environ: The environment variables, os.environ if not given.
+        :return: An instance of MongoConfig.
+        """
+        env: Mapping[str, str] = os.environ if environ is None else environ
+
+        def get(name: str) -> Optional[str]:
+            return env.get(f"{ENV_PREFIX}{name.upper()}") or None
+
+        def get_int(name: str) -> Optional[int]:
+            value = get(name)
+            if value is None:
+                return None
+            try:
+                return int(value)
+            except ValueError:
+                raise ValueError(f"{ENV_PREFIX}{name.upper()} must be an integer, not '{value}'")
+
+        return cls(
+            max_pool_size=get_int("max_pool_size"),
+            min_pool_size=get_int("min_pool_size"),
+            read_preference=get("read_preference"),
+            bulk_write_concern=_parse_write_concern(get("bulk_write_concern")),
+            config_write_concern=_parse_write_concern(
+                get("config_write_concern") or DEFAULT_CONFIG_WRITE_CONCERN
+            ),
+            compressors=get("compressors"),
+            connect_timeout_ms=get_int("connect_timeout_ms"),
+            server_selection_timeout_ms=get_int("server_selection_timeout_ms"),
+            socket_timeout_ms=get_int("socket_timeout_ms"),
+        )
+
+    def client_options(self) -> Dict[str, Any]:
+        """Return the keyword arguments of the MongoClient for these settings."""
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "compressors": self.compressors,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+        }
+        return {key: value for key, value in options.items() if value is not None}
+
+    def mappings_options(self) -> Dict[str, Any]:
+        """Return the options of the collections of the test and task mappings."""
+        options: Dict[str, Any] = {}
+        if self.read_preference:
+            try:
+                mode = read_pref_mode_from_name(self.read_preference)
+            except ValueError:
+                raise ValueError(f"Unknown read preference '{self.read_preference}'")
+            options["read_preference"] = make_read_preference(mode, None)
+        if self.bulk_write_concern is not None:
+            options["write_concern"] = WriteConcern(w=self.bulk_write_concern)
+        return options
+
+    def config_options(self) -> Dict[str, Any]:
+        """Return the options of the project config and work item collections."""
+        if self.config_write_concern is None:
+            return {}
+        return {"write_concern": WriteConcern(w=self.config_write_concern)}
+
+
+def _parse_write_concern(value: Optional[str]) -> Optional[Union[int, str]]:
+    """
+    Parse the w value of a write concern, which is either a number of nodes or a mode.
+
+    :param value: The value to parse.
+    :return: The number of nodes, the name of the mode or None.
+    """
+    if value is None:
+        return None
+    return int(value) if value.isdigit() else value
 
 
 class MongoWrapper(object):
     """Wrapper for MongoClient."""
 
-    def __init__(self, mongo_client: MongoClient):
+    def __init__(self, mongo_client: MongoClient, config: Optional[MongoConfig] = None):
         """
         Create wrapper for given client.
 
         :param mongo_client: Client to wrap.
+        :param config: The settings of the collections, the client's settings if not given.
         """
         self.client = mongo_client
+        self.config = config or MongoConfig()
+        self._mappings_options = self.config.mappings_options()
+        self._config_options = self.config.config_options()
 
     @classmethod
-    def connect(cls, mongo_uri: str) -> MongoWrapper:
+    def connect(cls, mongo_uri: str, config: Optional[MongoConfig] = None) -> MongoWrapper:
         """
         Create wrapper for mongo client to given mongo URI.
 
         :param mongo_uri: Mongo URI to connect to.
+        :param config: The connection settings, read from the environment if not given.
         :return: MongoWrapper for given URI.
         """
-        client = MongoClient(mongo_uri)
-        return cls(client)
+        if config is None:
+            config = MongoConfig.from_env()
+        client = MongoClient(mongo_uri, **config.client_options())
+        return cls(client, config)
+
+    def _mappings_collection(self, collection: Collection) -> Collection:
+        """Apply the settings of the test and task mappings to the given collection."""
+        if not self._mappings_options:
+            return collection
+        return collection.with_options(**self._mappings_options)
+
+    def _config_collection(self, collection: Collection) -> Collection:
+        """Apply the settings of the project config and work items to the given collection."""
+        if not self._config_options:
+            return collection
+        return collection.with_options(**self._config_options)
 
     def test_mappings_queue(self) -> Collection:
         """
@@ -33,7 +190,7 @@ class MongoWrapper(object):
 
         :return: test_mappings_queue collection.
         """
-        return self.client.selected_tests.test_mappings_queue
+        return self._config_collection(self.client.selected_tests.test_mappings_queue)
 
     def task_mappings_queue(self) -> Collection:
         """
@@ -41,7 +198,7 @@ class MongoWrapper(object):
 
         :return: task_mappings_queue collection.
         """
-        return self.client.selected_tests.task_mappings_queue
+        return self._config_collection(self.client.selected_tests.task_mappings_queue)
 
     def test_mappings(self) -> Collection:
         """
@@ -49,7 +206,7 @@ class MongoWrapper(object):
 
         :return: test_mappings collection.
         """
-        return self.client.selected_tests.test_mappings
+        return self._mappings_collection(self.client.selected_tests.test_mappings)
 
     def test_mappings_test_files(self) -> Collection:
         """
@@ -57,7 +214,7 @@ class MongoWrapper(object):
 
         :return: test_mappings_test_files collection.
         """
-        return self.client.selected_tests.test_mappings_test_files
+        return self._mappings_collection(self.client.selected_tests.test_mappings_test_files)
 
     def task_mappings(self) -> Collection:
         """
@@ -65,7 +222,7 @@ class MongoWrapper(object):
 
         :return: task_mappings collection.
         """
-        return self.client.selected_tests.task_mappings
+        return self._mappings_collection(self.client.selected_tests.task_mappings)
 
     def task_mappings_tasks(self) -> Collection:
         """
@@ -73,7 +230,7 @@ class MongoWrapper(object):
 
         :return: task_mappings_tasks collection.
         """
-        return self.client.selected_tests.task_mappings_tasks
+        return self._mappings_collection(self.client.selected_tests.task_mappings_tasks)
 
     def project_config(self) -> Collection:
         """
@@ -81,4 +238,4 @@ class MongoWrapper(object):
 
         :return: project_config collection.
         """
-        return self.client.selected_tests.project_config
+        return self._config_collection(self.client.selected_tests.project_config)
@@ -0,0 +1,54 @@
+"""Read all the mappings of a project along with their children."""
+from typing import Any, Dict, Iterator, List, Tuple
+
+from boltons.iterutils import chunked_iter
+from pymongo import ReadPreference
+
+from selectedtests.count_buckets import MONTHLY_COUNTS_KEY
+from selectedtests.datasource.mappings_loader import MappingSchema
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def iter_project_mappings(
+    mongo: MongoWrapper,
+    schema: MappingSchema,
+    project: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    read_from_primary: bool = False,
+) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Read the mappings of a project, with the children of each mapping.
+
+    The children of each batch of mappings are read with a single query. The monthly buckets are
+    left out of both, and the children are left with their ids and the ids of their mappings.
+
+    :param mongo: An instance of MongoWrapper.
+    :param schema: Describes the collections the mappings are stored in.
+    :param project: The evergreen project.
+    :param batch_size: The number of mappings whose children are read in each query.
+    :param read_from_primary: Whether to read from the primary rather than with the read
+     preference of the mappings, to see every write acknowledged so far.
+    :return: Iterator of each mapping and its children.
+    """
+    collection = getattr(mongo, schema.collection)()
+    children_collection = getattr(mongo, schema.children_collection)()
+    if read_from_primary:
+        collection = collection.with_options(read_preference=ReadPreference.PRIMARY)
+        children_collection = children_collection.with_options(
+            read_preference=ReadPreference.PRIMARY
+        )
+
+    mappings = collection.find({"project": project}, projection={MONTHLY_COUNTS_KEY: False})
+    for batch in chunked_iter(mappings, batch_size):
+        children: Dict[Any, List[Dict[str, Any]]] = {mapping["_id"]: [] for mapping in batch}
+        cursor = children_collection.find(
+            {schema.parent_id_key: {"$in": list(children)}},
+            projection={MONTHLY_COUNTS_KEY: False},
+        )
+        for child in cursor:
+            children[child[schema.parent_id_key]].append(child)
+
+        for mapping in batch:
+            yield mapping, children[mapping["_id"]]
@@ -0,0 +1,68 @@
+"""FanOutLimit class used to guard the mappings against changes touching a huge number of files."""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Union
+
+
+class FanOutLimit(object):
+    """
+    Represents the number of changed files above which a change is skipped or downweighted.
+
+    Every change adds a count for each pair of files it touches, so a single mass reformat or
+    vendored import can dominate both the time taken to create the mappings and their contents.
+    """
+
+    def __init__(self, max_changed_files: Optional[int] = None, weighted: bool = False):
+        """
+        Create a FanOutLimit object.
+
+        :param max_changed_files: The number of changed files above which a change is limited.
+        :param weighted: Whether changes above the limit should be downweighted rather than
+         skipped.
+        """
+        self.max_changed_files = max_changed_files
+        self.weighted = weighted
+
+    def __repr__(self) -> str:
+        """Return the object representation of FanOutLimit."""
+        return f"FanOutLimit({self.max_changed_files}, {self.weighted})"
+
+    def __eq__(self, other: object) -> bool:
+        """Return whether the other object is a FanOutLimit with the same settings."""
+        if not isinstance(other, FanOutLimit):
+            return NotImplemented
+        return (self.max_changed_files, self.weighted) == (other.max_changed_files, other.weighted)
+
+    @classmethod
+    def from_json(cls, json: Dict[str, Any]) -> FanOutLimit:
+        """
+        Instantiate an instance of FanOutLimit from the json of a project config.
+
+        :param json: Json representing the project test or task config in the database.
+        :return: An instance of FanOutLimit.
+        """
+        return cls(json.get("max_changed_files"), bool(json.get("weight_large_changes")))
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return fields to be stored in database."""
+        return {
+            "max_changed_files": self.max_changed_files,
+            "weight_large_changes": self.weighted,
+        }
+
+    def weight(self, n_changed_files: int) -> Union[int, float]:
+        """
+        Get the weight that the counts of a change touching the given number of files should get.
+
+        Changes within the limit count once. Changes above it count for max_changed_files /
+        n_changed_files when weighted, so their total contribution stays about the same as that
+        of a change at the limit, and are skipped otherwise.
+
+        :param n_changed_files: The number of files touched by the change.
+        :return: The weight of the change, 0 if it should be skipped.
+        """
+        if self.max_changed_files is None or n_changed_files <= self.max_changed_files:
+            return 1
+        if self.weighted:
+            return self.max_changed_files / n_changed_files
+        return 0
@@ -1,27 +1,294 @@
 """Git helper for mappings commands."""
 import os.path
+import threading
 
-from typing import Any, Set
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, Iterator, Optional, Set
+
+import structlog
 
 from git import Commit, Diff, DiffIndex, Repo
 
+from selectedtests.changed_files_index import ChangedFilesIndex
+from selectedtests.config.logging_config import is_debug_enabled
+
+LOGGER = structlog.get_logger(__name__)
+
 GITHUB_BASE_URL = "git@github.com"
+# Commits are not strictly ordered by date and the oldest commit analyzed still needs its parent to
+# be diffed against, so shallow clones reach this far past the date being analyzed.
+SHALLOW_CLONE_MARGIN = timedelta(days=7)
+
+
+class CloneMode(Enum):
+    """How much of a repo should be fetched when it is cloned."""
+
+    # Clone and checkout everything.
+    FULL = "full"
+    # Only fetch commits and trees, blobs are fetched lazily if git needs them.
+    BLOBLESS = "blobless"
+    # Blobless clone of the given branch that only goes back as far as the history analyzed.
+    SHALLOW = "shallow"
+
+
+def get_shallow_since(stop_at_date: Optional[datetime]) -> Optional[datetime]:
+    """
+    Get the date a shallow clone needs to reach back to in order to analyze history to a date.
+
+    :param stop_at_date: The date at which history is analyzed from.
+    :return: The date to clone from or None if the analysis is not limited by date.
+    """
+    if stop_at_date is None:
+        return None
+    return stop_at_date - SHALLOW_CLONE_MARGIN
+
+
+def _clone_options(
+    branch: str, clone_mode: CloneMode, shallow_since: Optional[datetime]
+) -> Dict[str, Any]:
+    """
+    Get the options to pass to 'git clone' for the given clone mode.
+
+    :param branch: The branch to checkout in the repo.
+    :param clone_mode: How much of the repo should be fetched.
+    :param shallow_since: The date the history should be fetched from in shallow mode.
+    :return: Dictionary of git clone options.
+    """
+    options: Dict[str, Any] = {"branch": branch}
+    if clone_mode == CloneMode.FULL:
+        return options
 
+    options["filter"] = "blob:none"
+    options["no_checkout"] = True
+    if clone_mode == CloneMode.SHALLOW:
+        options["single_branch"] = True
+        if shallow_since:
+            options["shallow_since"] = shallow_since.isoformat()
+    return options
 
-def init_repo(temp_dir: str, repo_name: str, branch: str, org_name: str) -> Repo:
+
+def _mirror_clone_options(branch: str, clone_mode: CloneMode) -> Dict[str, Any]:
+    """
+    Get the options to pass to 'git clone' when cloning from a local mirror.
+
+    Local clones hardlink the objects of the mirror, so there is nothing to gain from filtering
+    or shallowing them. Only the checkout is skipped in the modes that do not need it.
+
+    :param branch: The branch to checkout in the repo.
+    :param clone_mode: How much of the repo should be fetched.
+    :return: Dictionary of git clone options.
+    """
+    options: Dict[str, Any] = {"branch": branch}
+    if clone_mode != CloneMode.FULL:
+        options["no_checkout"] = True
+    return options
+
+
+class RepoClones(object):
+    """How repos are cloned, straight from github unless a subclass says otherwise."""
+
+    def __init__(self) -> None:
+        """Create a RepoClones."""
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, path: str) -> threading.Lock:
+        """Get the lock serializing the clones and updates of a path."""
+        with self._locks_lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def clone(
+        self,
+        url: str,
+        repo_path: str,
+        org_name: str,
+        repo_name: str,
+        branch: str,
+        clone_mode: CloneMode = CloneMode.FULL,
+        shallow_since: Optional[datetime] = None,
+    ) -> Repo:
+        """
+        Clone a repo.
+
+        :param url: The url of the repo.
+        :param repo_path: The place where to clone the repo to.
+        :param org_name: The org name in github that owns the repo.
+        :param repo_name: The name of the repo.
+        :param branch: The branch to checkout in the repo.
+        :param clone_mode: How much of the repo should be fetched.
+        :param shallow_since: The date the history should be fetched from in shallow mode.
+        :return: An Repo instance that further git operations can be done on.
+        """
+        return Repo.clone_from(url, repo_path, **_clone_options(branch, clone_mode, shallow_since))
+
+
+class RepoMirrors(RepoClones):
+    """
+    Bare mirrors of the repos cloned, kept on disk between clones.
+
+    Each clone first brings the mirror of its repo up to date, which only fetches what changed
+    since the mirror was last used, and then clones the mirror locally.
+    """
+
+    def __init__(self, mirror_dir: str):
+        """
+        Create a RepoMirrors.
+
+        :param mirror_dir: The directory the mirrors are kept in.
+        """
+        super().__init__()
+        self.mirror_dir = mirror_dir
+
+    @contextmanager
+    def update(self, url: str, org_name: str, repo_name: str) -> Iterator[str]:
+        """
+        Bring the mirror of a repo up to date, creating it if needed.
+
+        The mirror is not updated again until the context exits, so it can be cloned meanwhile.
+
+        :param url: The url of the repo.
+        :param org_name: The org name in github that owns the repo.
+        :param repo_name: The name of the repo.
+        :return: The path of the mirror.
+        """
+        mirror_path = os.path.join(self.mirror_dir, org_name, f"{repo_name}.git")
+        with self._lock(mirror_path):
+            if os.path.isdir(mirror_path):
+                LOGGER.info("Updating repo mirror", mirror_path=mirror_path)
+                Repo(mirror_path).git.remote("update", "--prune")
+            else:
+                LOGGER.info("Creating repo mirror", mirror_path=mirror_path)
+                Repo.clone_from(url, mirror_path, mirror=True)
+            yield mirror_path
+
+    def clone(
+        self,
+        url: str,
+        repo_path: str,
+        org_name: str,
+        repo_name: str,
+        branch: str,
+        clone_mode: CloneMode = CloneMode.FULL,
+        shallow_since: Optional[datetime] = None,
+    ) -> Repo:
+        """
+        Clone a repo from its up to date mirror.
+
+        :param url: The url of the repo.
+        :param repo_path: The place where to clone the repo to.
+        :param org_name: The org name in github that owns the repo.
+        :param repo_name: The name of the repo.
+        :param branch: The branch to checkout in the repo.
+        :param clone_mode: How much of the repo should be fetched.
+        :param shallow_since: Unused, the mirror holds the whole history.
+        :return: An Repo instance that further git operations can be done on.
+        """
+        with self.update(url, org_name, repo_name) as mirror_path:
+            return Repo.clone_from(
+                mirror_path, repo_path, **_mirror_clone_options(branch, clone_mode)
+            )
+
+
+class SharedClones(RepoClones):
+    """
+    Clones shared by the analyses of a project that run at the same time.
+
+    Each repo is cloned once, the analyses that ask for it afterwards are handed the same clone.
+    The analyses only read the history of the repos, so they do not get in each other's way.
+    """
+
+    def __init__(
+        self,
+        clone_dir: str,
+        clone_mode: CloneMode = CloneMode.FULL,
+        shallow_since: Optional[datetime] = None,
+        clones: Optional[RepoClones] = None,
+    ):
+        """
+        Create a SharedClones.
+
+        :param clone_dir: The directory the shared clones are made in.
+        :param clone_mode: How much of the repos should be fetched, whatever the analyses ask for.
+        :param shallow_since: The date the history should be fetched from in shallow mode, the
+         earliest date any of the analyses needs.
+        :param clones: How the shared clones are cloned, from github if not given.
+        """
+        super().__init__()
+        self.clone_dir = clone_dir
+        self.clone_mode = clone_mode
+        self.shallow_since = shallow_since
+        self.clones = clones if clones is not None else RepoClones()
+
+    def clone(
+        self,
+        url: str,
+        repo_path: str,
+        org_name: str,
+        repo_name: str,
+        branch: str,
+        clone_mode: CloneMode = CloneMode.FULL,
+        shallow_since: Optional[datetime] = None,
+    ) -> Repo:
+        """
+        Get the shared clone of a repo, cloning it the first time it is asked for.
+
+        :param url: The url of the repo.
+        :param repo_path: Unused, the repo is cloned in the directory of the shared clones.
+        :param org_name: The org name in github that owns the repo.
+        :param repo_name: The name of the repo.
+        :param branch: The branch to checkout in the repo.
+        :param clone_mode: Unused, the shared clones are all cloned with the same mode.
+        :param shallow_since: Unused, the shared clones all reach back to the same date.
+        :return: An Repo instance that further git operations can be done on.
+        """
+        shared_path = os.path.join(self.clone_dir, org_name, repo_name, branch)
+        with self._lock(shared_path):
+            if not os.path.isdir(shared_path):
+                LOGGER.info("Creating shared clone", shared_path=shared_path)
+                return self.clones.clone(
+                    url,
+                    shared_path,
+                    org_name,
+                    repo_name,
+                    branch,
+                    self.clone_mode,
+                    self.shallow_since,
+                )
+        # Every analysis gets its own Repo instance, they are not safe to share between threads.
+        return Repo(shared_path)
+
+
+def init_repo(
+    temp_dir: str,
+    repo_name: str,
+    branch: str,
+    org_name: str,
+    clone_mode: CloneMode = CloneMode.FULL,
+    shallow_since: Optional[datetime] = None,
+    clones: Optional[RepoClones] = None,
+) -> Repo:
     """
     Create the given repo in the given directory and checkout the given branch.
 
+    Blobless and shallow clones do not checkout a working tree, only the commit history is
+    available in them.
+
     :param temp_dir: The place where to clone the repo to.
     :param repo_name: The name of the repo to clone.
     :param branch: The branch to checkout in the repo.
     :param org_name: The org name in github that owns the repo.
+    :param clone_mode: How much of the repo should be fetched.
+    :param shallow_since: The date the history should be fetched from in shallow mode.
+    :param clones: How the repo is cloned, from github if not given.
     :return: An Repo instance that further git operations can be done on.
     """
     repo_path = os.path.join(temp_dir, repo_name)
     url = f"{GITHUB_BASE_URL}:{org_name}/{repo_name}.git"
-    repo = Repo.clone_from(url, repo_path, branch=branch)
-    return repo
+    if clones is None:
+        clones = RepoClones()
+    return clones.clone(url, repo_path, org_name, repo_name, branch, clone_mode, shallow_since)
 
 
 def _paths_for_iter(diff: Diff, iter_type: str) -> Set[str]:
@@ -37,20 +304,65 @@ def _paths_for_iter(diff: Diff, iter_type: str) -> Set[str]:
     return a_path_changes.union(b_path_changes)
 
 
-def modified_files_for_commit(commit: Commit, log: Any) -> Set:
+def modified_files_for_commit(
+    commit: Commit, log: Any, changed_files_index: Optional[ChangedFilesIndex] = None
+) -> Set:
     """
     Return modified, added, renamed, and removed files for a given commit and its parent.
 
     :param commit: The commit to query.
     :param log: A logger.
+    :param changed_files_index: Index to look up changed files in before diffing the commit.
     :return: The set of changed files.
     """
+    if changed_files_index is not None:
+        entry = changed_files_index.get(commit.hexsha)
+        if entry is not None:
+            return set(entry.changed_files)
+
     if not commit.parents:
         return set()
 
     parent = commit.parents[0]
     diff = commit.diff(parent)
-    return get_changed_files(diff, log)
+    changed_files = get_changed_files(diff, log)
+    if changed_files_index is not None:
+        changed_files_index.add(commit.hexsha, parent.hexsha, changed_files)
+    return changed_files
+
+
+def changed_files_between_revisions(
+    repo: Repo,
+    cur_revision: str,
+    prev_revision: str,
+    log: Any,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+) -> Set:
+    """
+    Return modified, added, renamed, and removed files between two revisions.
+
+    When the previous revision is the first parent of the current one the changes are those of a
+    single commit and can be served by the changed files index. Longer ranges are always diffed,
+    the union of the commits' changes would include files that were changed and then reverted.
+
+    :param repo: The repo that contains the two given revisions.
+    :param cur_revision: The child revision.
+    :param prev_revision: The parent revision.
+    :param log: A logger.
+    :param changed_files_index: Index to look up changed files in before diffing the revisions.
+    :return: The set of changed files.
+    """
+    if changed_files_index is not None:
+        entry = changed_files_index.get(cur_revision)
+        if entry is not None and entry.parent_sha == prev_revision:
+            return set(entry.changed_files)
+
+    cur_commit = repo.commit(cur_revision)
+    prev_commit = repo.commit(prev_revision)
+    if cur_commit.parents and cur_commit.parents[0] == prev_commit:
+        return modified_files_for_commit(cur_commit, log, changed_files_index)
+
+    return get_changed_files(cur_commit.diff(prev_commit), log)
 
 
 def get_changed_files(diff: DiffIndex, log: Any) -> Set:
@@ -62,15 +374,13 @@ def get_changed_files(diff: DiffIndex, log: Any) -> Set:
     :return: The set of changed files.
     """
     modified_files = _paths_for_iter(diff, "M")
-    log.debug("modified files", files=modified_files)
-
     added_files = _paths_for_iter(diff, "A")
-    log.debug("added files", files=added_files)
-
     renamed_files = _paths_for_iter(diff, "R")
-    log.debug("renamed files", files=renamed_files)
-
     deleted_files = _paths_for_iter(diff, "D")
-    log.debug("deleted files", files=deleted_files)
+    if is_debug_enabled(__name__):
+        log.debug("modified files", files=modified_files)
+        log.debug("added files", files=added_files)
+        log.debug("renamed files", files=renamed_files)
+        log.debug("deleted files", files=deleted_files)
 
     return modified_files.union(added_files).union(renamed_files).union(deleted_files)
@@ -1,35 +1,57 @@
 """Helper functions for Cli entry points."""
+import hashlib
 import os
 
 from typing import Any, Dict, List, Optional
 
 from evergreen.api import EvergreenApi, RetryingEvergreenApi
-from evergreen.config import EvgAuth
+from evergreen.config import DEFAULT_NETWORK_TIMEOUT_SEC, EvgAuth
 
-from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.datasource.mongo_wrapper import MongoConfig, MongoWrapper
+from selectedtests.metrics import count_evergreen_api_call
 
+# The fields that identify a test or task mapping.
+MAPPING_ID_FIELDS = ["project", "repo", "branch", "source_file"]
 
-def get_evg_api() -> EvergreenApi:
+
+def get_evg_api(api_server: Optional[str] = None) -> EvergreenApi:
     """
     Create an instance of the evergreen API based on environment variables.
 
+    The responses of the API are counted in the metrics.
+
+    :param api_server: The url of the evergreen server to call, EVG_API_SERVER if not given, and
+     evergreen.mongodb.com if that is not set either. Benchmarks and load tests point it at
+     a fake server.
     :return: Evergreen API instance.
     """
     evg_user = os.environ.get("EVG_API_USER")
     evg_api_key = os.environ.get("EVG_API_KEY")
-    return RetryingEvergreenApi.get_api(auth=EvgAuth(evg_user, evg_api_key))
+    auth = EvgAuth(evg_user, evg_api_key)
+    api_server = api_server or os.environ.get("EVG_API_SERVER")
+    if api_server:
+        evg_api = RetryingEvergreenApi(api_server, auth, DEFAULT_NETWORK_TIMEOUT_SEC)
+    else:
+        evg_api = RetryingEvergreenApi.get_api(auth=auth)
+    evg_api.session.hooks["response"].append(count_evergreen_api_call)
+    return evg_api
 
 
-def get_mongo_wrapper() -> MongoWrapper:
+def get_mongo_wrapper(default_read_preference: Optional[str] = None) -> MongoWrapper:
     """
     Get an instance of the mongo wrapper based on environment variables.
 
+    :param default_read_preference: The read preference of the mappings if it is not set by
+     SELECTED_TESTS_MONGO_READ_PREFERENCE.
     :return: MongoWrapper instance.
     """
     mongo_uri = os.environ.get("SELECTED_TESTS_MONGO_URI")
     if mongo_uri is None:
         raise RuntimeError("Cannot connect to mongodb, SELECTED_TESTS_MONGO_URI is not set")
-    return MongoWrapper.connect(mongo_uri)
+    config = MongoConfig.from_env()
+    if config.read_preference is None:
+        config.read_preference = default_read_preference
+    return MongoWrapper.connect(mongo_uri, config)
 
 
 def create_query(
@@ -48,3 +70,16 @@ def create_query(
     """
     excluded = (mutable if mutable else []) + (joined if joined else [])
     return {k: v for k, v in document.items() if k not in excluded}
+
+
+def create_mapping_id(document: Dict[str, Any]) -> str:
+    """
+    Create the id of a test or task mapping from the fields that identify it.
+
+    The id is a stable hash, so the id of a mapping is known before it is written.
+
+    :param document: The mapping or a query for it.
+    :return: The id of the mapping.
+    """
+    key = "\0".join(document[field] for field in MAPPING_ID_FIELDS)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
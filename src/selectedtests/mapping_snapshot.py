@@ -0,0 +1,405 @@
+"""Memory-mappable binary snapshots of the test and task mappings of a project."""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+
+from collections import namedtuple
+from decimal import Decimal
+from types import TracebackType
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple, Type
+
+import structlog
+
+from selectedtests.datasource.mappings_loader import (
+    TASK_MAPPING_SCHEMA,
+    TEST_MAPPING_SCHEMA,
+    MappingSchema,
+)
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.datasource.project_mappings import iter_project_mappings
+
+LOGGER = structlog.get_logger(__name__)
+
+MAGIC = b"STMSNAP\0"
+VERSION = 1
+ENCODING = "utf-8"
+# The sections of a snapshot in the order they are written, with the fields naming each child.
+SECTIONS = [(TEST_MAPPING_SCHEMA, ("name",)), (TASK_MAPPING_SCHEMA, ("name", "variant"))]
+
+# Everything is little-endian. The header is followed by the section headers, the offsets of the
+# strings, the strings and then the child, mapping and entry tables of each section.
+# magic, version, project string id, number of strings, offset of the string offsets.
+HEADER = struct.Struct("<8sIIQQ")
+# number of fields per child, number of children, offset of the children, number of mappings,
+# offset of the mappings, offset of the entries.
+SECTION = struct.Struct("<IIQQQQ")
+# source file, repo and branch string ids, padding, source file seen count, index of the first
+# entry, number of entries. Mappings are sorted by source file.
+MAPPING = struct.Struct("<IIIIdQQ")
+# child id, count. The entries of each mapping are sorted from the highest count down.
+ENTRY = struct.Struct("<Id")
+STRING_ID = struct.Struct("<I")
+STRING_OFFSET = struct.Struct("<Q")
+ALIGNMENT = 8
+
+MappingWithChildren = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+_SectionHeader = namedtuple(
+    "_SectionHeader",
+    [
+        "field_count",
+        "child_count",
+        "children_offset",
+        "mapping_count",
+        "mappings_offset",
+        "entries_offset",
+    ],
+)
+
+
+class _StringTable(object):
+    """Table of the distinct strings written to a snapshot."""
+
+    def __init__(self) -> None:
+        """Create an empty _StringTable."""
+        self._ids: Dict[str, int] = {}
+        self.strings: List[bytes] = []
+
+    def add(self, value: str) -> int:
+        """
+        Add a string to the table.
+
+        :param value: The string to add.
+        :return: The id of the string.
+        """
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self.strings)
+            self.strings.append(value.encode(ENCODING))
+        return string_id
+
+
+class _SectionTables(object):
+    """The child, mapping and entry tables of a section, before they are written."""
+
+    def __init__(
+        self,
+        strings: _StringTable,
+        schema: MappingSchema,
+        child_fields: Tuple[str, ...],
+        mappings: Iterable[MappingWithChildren],
+    ):
+        """
+        Build the tables of a section.
+
+        :param strings: The string table of the snapshot.
+        :param schema: Describes the collections the mappings are stored in.
+        :param child_fields: The fields naming each child.
+        :param mappings: The mappings of the section with their children.
+        """
+        self.field_count = len(child_fields)
+        child_ids: Dict[Tuple[str, ...], int] = {}
+        self.children = bytearray()
+        self.entries = bytearray()
+        rows = []
+        entry_count = 0
+        for mapping, children in mappings:
+            ranked = sorted(children, key=lambda c: c[schema.child_count_key], reverse=True)
+            for child in ranked:
+                key = tuple(child[field] for field in child_fields)
+                child_id = child_ids.get(key)
+                if child_id is None:
+                    child_id = child_ids[key] = len(child_ids)
+                    for value in key:
+                        self.children += STRING_ID.pack(strings.add(value))
+                self.entries += ENTRY.pack(child_id, child[schema.child_count_key])
+
+            source_file_id = strings.add(mapping["source_file"])
+            rows.append(
+                (
+                    strings.strings[source_file_id],
+                    MAPPING.pack(
+                        source_file_id,
+                        strings.add(mapping["repo"]),
+                        strings.add(mapping["branch"]),
+                        0,
+                        mapping[schema.seen_count_key],
+                        entry_count,
+                        len(ranked),
+                    ),
+                )
+            )
+            entry_count += len(ranked)
+
+        rows.sort(key=lambda row: row[0])
+        self.child_count = len(child_ids)
+        self.mapping_count = len(rows)
+        self.mappings = b"".join(row for _, row in rows)
+
+
+def _pad(length: int) -> bytes:
+    """Return the padding that aligns the given length."""
+    return b"\0" * (-length % ALIGNMENT)
+
+
+def write_snapshot(
+    path: str,
+    project: str,
+    test_mappings: Iterable[MappingWithChildren],
+    task_mappings: Iterable[MappingWithChildren],
+) -> None:
+    """
+    Write the test and task mappings of a project to a snapshot.
+
+    The snapshot is written to a temporary file that then replaces the given path, so readers
+    never see a partially written snapshot.
+
+    :param path: The file to write the snapshot to.
+    :param project: The evergreen project.
+    :param test_mappings: The test mappings with their test files.
+    :param task_mappings: The task mappings with their tasks.
+    """
+    strings = _StringTable()
+    project_id = strings.add(project)
+    sections = [
+        _SectionTables(strings, schema, child_fields, mappings)
+        for (schema, child_fields), mappings in zip(SECTIONS, [test_mappings, task_mappings])
+    ]
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    strings_offset = offset
+    string_offsets = bytearray()
+    string_position = 0
+    for value in strings.strings:
+        string_offsets += STRING_OFFSET.pack(string_position)
+        string_position += len(value)
+    string_offsets += STRING_OFFSET.pack(string_position)
+    offset += len(string_offsets) + string_position
+
+    blocks: List[bytes] = [bytes(string_offsets), *strings.strings, _pad(offset)]
+    offset += len(blocks[-1])
+    section_headers = []
+    for section in sections:
+        table_offsets = []
+        for table in [section.children, section.mappings, section.entries]:
+            table_offsets.append(offset)
+            blocks.extend([table, _pad(len(table))])
+            offset += len(table) + len(blocks[-1])
+        children_offset, mappings_offset, entries_offset = table_offsets
+        section_headers.append(
+            SECTION.pack(
+                section.field_count,
+                section.child_count,
+                children_offset,
+                section.mapping_count,
+                mappings_offset,
+                entries_offset,
+            )
+        )
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(
+            HEADER.pack(MAGIC, VERSION, project_id, len(strings.strings), strings_offset)
+        )
+        for block in section_headers + blocks:
+            snapshot_file.write(block)
+    os.replace(temp_path, path)
+
+
+def export_snapshot(mongo: MongoWrapper, project: str, path: str) -> None:
+    """
+    Write the test and task mappings of a project in the database to a snapshot.
+
+    :param mongo: An instance of MongoWrapper.
+    :param project: The evergreen project.
+    :param path: The file to write the snapshot to.
+    """
+    write_snapshot(
+        path,
+        project,
+        iter_project_mappings(mongo, TEST_MAPPING_SCHEMA, project),
+        iter_project_mappings(mongo, TASK_MAPPING_SCHEMA, project),
+    )
+    LOGGER.info("Exported mapping snapshot", project=project, path=path, size=os.path.getsize(path))
+
+
+class MappingSnapshot(object):
+    """
+    Read-only view of a snapshot written by write_snapshot.
+
+    The snapshot is memory mapped rather than read, so the processes reading the same snapshot
+    share a single copy of it in the page cache.
+    """
+
+    def __init__(self, snapshot_file: BinaryIO, buffer: mmap.mmap):
+        """
+        Create a MappingSnapshot. Use MappingSnapshot.open rather than this directly.
+
+        :param snapshot_file: The open snapshot file.
+        :param buffer: The memory mapped contents of the file.
+        """
+        self._file = snapshot_file
+        self._buffer = buffer
+        if len(buffer) < HEADER.size:
+            raise ValueError("The file is too short to be a mapping snapshot")
+        magic, version, project_id, string_count, strings_offset = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("The file is not a mapping snapshot")
+        if version != VERSION:
+            raise ValueError(f"Unsupported mapping snapshot version {version}, expected {VERSION}")
+
+        self._strings_offset = strings_offset
+        self._string_data_offset = strings_offset + STRING_OFFSET.size * (string_count + 1)
+        self._sections = {
+            schema.collection: _SectionHeader(
+                *SECTION.unpack_from(buffer, HEADER.size + SECTION.size * index)
+            )
+            for index, (schema, _) in enumerate(SECTIONS)
+        }
+        self._child_fields = {schema.collection: fields for schema, fields in SECTIONS}
+        self.project = self._string(project_id)
+
+    @classmethod
+    def open(cls, path: str) -> MappingSnapshot:
+        """
+        Open the snapshot at the given path.
+
+        :param path: The file the snapshot was written to.
+        :return: An instance of MappingSnapshot.
+        """
+        snapshot_file = open(path, "rb")
+        try:
+            buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            snapshot_file.close()
+            raise
+
+        try:
+            return cls(snapshot_file, buffer)
+        except ValueError:
+            buffer.close()
+            snapshot_file.close()
+            raise
+
+    def close(self) -> None:
+        """Unmap and close the snapshot."""
+        self._buffer.close()
+        self._file.close()
+
+    def __enter__(self) -> MappingSnapshot:
+        """Return the snapshot."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Close the snapshot."""
+        self.close()
+
+    def get_correlated_test_mappings(
+        self, changed_source_files: Iterable[str], threshold: Decimal
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the test mappings of the given source files, as get_correlated_test_mappings would.
+
+        :param changed_source_files: Source files to get the test mappings of.
+        :param threshold: Min threshold desired for the test file to source file count ratio.
+        :return: A list of test mappings for the changed files.
+        """
+        return self._get_correlated(TEST_MAPPING_SCHEMA, changed_source_files, threshold)
+
+    def get_correlated_task_mappings(
+        self, changed_source_files: Iterable[str], threshold: Decimal
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the task mappings of the given source files, as get_correlated_task_mappings would.
+
+        :param changed_source_files: Source files to get the task mappings of.
+        :param threshold: Min threshold desired for the flip count to source file count ratio.
+        :return: A list of task mappings for the changed files.
+        """
+        return self._get_correlated(TASK_MAPPING_SCHEMA, changed_source_files, threshold)
+
+    def _string_bytes(self, string_id: int) -> bytes:
+        """Get the encoded string with the given id."""
+        start, end = struct.unpack_from(
+            "<QQ", self._buffer, self._strings_offset + STRING_OFFSET.size * string_id
+        )
+        return self._buffer[self._string_data_offset + start : self._string_data_offset + end]
+
+    def _string(self, string_id: int) -> str:
+        """Get the string with the given id."""
+        return self._string_bytes(string_id).decode(ENCODING)
+
+    def _find_mappings(self, section: _SectionHeader, source_file: bytes) -> List[Tuple]:
+        """Find the mapping rows of a source file with a binary search of the sorted mappings."""
+        low, high = 0, section.mapping_count
+        while low < high:
+            middle = (low + high) // 2
+            row = MAPPING.unpack_from(self._buffer, section.mappings_offset + MAPPING.size * middle)
+            if self._string_bytes(row[0]) < source_file:
+                low = middle + 1
+            else:
+                high = middle
+
+        rows = []
+        for index in range(low, section.mapping_count):
+            row = MAPPING.unpack_from(self._buffer, section.mappings_offset + MAPPING.size * index)
+            if self._string_bytes(row[0]) != source_file:
+                break
+            rows.append(row)
+        return rows
+
+    def _get_correlated(
+        self, schema: MappingSchema, changed_source_files: Iterable[str], threshold: Decimal
+    ) -> List[Dict[str, Any]]:
+        """Get the mappings of the given type and source files."""
+        section = self._sections[schema.collection]
+        child_fields = self._child_fields[schema.collection]
+        child_size = STRING_ID.size * section.field_count
+        min_ratio = float(threshold)
+
+        results = []
+        for source_file in set(changed_source_files):
+            rows = self._find_mappings(section, source_file.encode(ENCODING))
+            for _, repo_id, branch_id, _, seen_count, first_entry, entry_count in rows:
+                children = []
+                for index in range(first_entry, first_entry + entry_count):
+                    child_id, count = ENTRY.unpack_from(
+                        self._buffer, section.entries_offset + ENTRY.size * index
+                    )
+                    if count / seen_count < min_ratio:
+                        break
+                    string_ids = struct.unpack_from(
+                        f"<{section.field_count}I",
+                        self._buffer,
+                        section.children_offset + child_size * child_id,
+                    )
+                    child: Dict[str, Any] = {
+                        field: self._string(string_id)
+                        for field, string_id in zip(child_fields, string_ids)
+                    }
+                    child[schema.child_count_key] = _as_count(count)
+                    children.append(child)
+
+                results.append(
+                    {
+                        "project": self.project,
+                        "repo": self._string(repo_id),
+                        "branch": self._string(branch_id),
+                        "source_file": source_file,
+                        schema.seen_count_key: _as_count(seen_count),
+                        schema.children_key: children,
+                    }
+                )
+        return results
+
+
+def _as_count(count: float) -> Any:
+    """Return a count as an int if it is a whole number, as the database would have stored it."""
+    return int(count) if count.is_integer() else count
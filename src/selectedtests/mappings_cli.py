@@ -0,0 +1,106 @@
+"""Cli entry point for the commands working on both the test and task mappings."""
+import os
+
+from typing import Optional
+
+import click
+
+from click import Context
+from miscutils.logging_config import Verbosity
+
+from selectedtests.changed_files_index import open_changed_files_index
+from selectedtests.config.logging_config import config_logging
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.git_helper import CloneMode, RepoMirrors
+from selectedtests.helpers import get_evg_api
+from selectedtests.metrics import export_metrics_on_close
+from selectedtests.update_all_mappings import update_all_mappings_since_last_analyzed
+
+
+@click.group()
+@click.option("--verbose", is_flag=True, default=False, help="Enable verbose logging.")
+@click.option(
+    "--log-format",
+    default="text",
+    type=click.Choice(["text", "json"]),
+    help="Format to write logs with.",
+)
+@click.option(
+    "--metrics-textfile",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_METRICS_TEXTFILE"),
+    help="Path of a file to write Prometheus metrics to when the command is done.",
+)
+@click.option(
+    "--metrics-pushgateway",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_METRICS_PUSHGATEWAY"),
+    help="Address of a Prometheus Pushgateway to push metrics to when the command is done.",
+)
+@click.pass_context
+def cli(
+    ctx: Context,
+    verbose: bool,
+    log_format: str,
+    metrics_textfile: Optional[str],
+    metrics_pushgateway: Optional[str],
+) -> None:
+    """Suite of commands working on both the test and task mappings."""
+    ctx.ensure_object(dict)
+    ctx.obj["evg_api"] = get_evg_api()
+
+    verbosity = Verbosity.DEBUG if verbose else Verbosity.INFO
+    config_logging(verbosity, human_readable=log_format == "text")
+    export_metrics_on_close(ctx, "mappings", metrics_textfile, metrics_pushgateway)
+
+
+@cli.command()
+@click.option(
+    "--mongo-uri",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_MONGO_URI"),
+    help="Mongo URI to connect to.",
+)
+@click.option(
+    "--clone-mode",
+    type=click.Choice([mode.value for mode in CloneMode]),
+    default=CloneMode.FULL.value,
+    help="How much of the git repos to clone. 'blobless' and 'shallow' only fetch the history.",
+)
+@click.option(
+    "--changed-files-index",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_CHANGED_FILES_INDEX"),
+    help="Path to a file caching the files changed by each commit analyzed across runs.",
+)
+@click.option(
+    "--mirror-dir",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_REPO_MIRROR_DIR"),
+    help="Directory to keep mirrors of the git repos in, so they are not cloned for every run.",
+)
+@click.pass_context
+def update_all(
+    ctx: Context, mongo_uri: str, clone_mode: str, changed_files_index: str, mirror_dir: str
+) -> None:
+    """
+    Process test and task mappings since they were last processed, cloning each project once.
+
+    :param mongo_uri: Mongo URI to connect to.
+    :param clone_mode: How much of the git repos to clone.
+    :param changed_files_index: Path to a file caching the files changed by each commit.
+    :param mirror_dir: Directory to keep mirrors of the git repos in.
+    """
+    with open_changed_files_index(changed_files_index) as index:
+        update_all_mappings_since_last_analyzed(
+            ctx.obj["evg_api"],
+            MongoWrapper.connect(mongo_uri),
+            CloneMode(clone_mode),
+            index,
+            RepoMirrors(mirror_dir) if mirror_dir else None,
+        )
+
+
+def main() -> None:
+    """Entry point into commandline."""
+    return cli(obj={})
@@ -0,0 +1,214 @@
+"""Write generated mappings to a file or stdout and read them back."""
+import gzip
+import io
+import json
+import sys
+
+from contextlib import ExitStack, contextmanager
+from enum import Enum
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, TextIO
+
+import structlog
+
+LOGGER = structlog.get_logger(__name__)
+
+JSON_INDENT = 4
+ENCODING = "utf-8"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class OutputFormat(Enum):
+    """How the mappings are written."""
+
+    # A single indented json list, only written once all mappings are generated.
+    JSON = "json"
+    # One json document per mapping and line, written as the mappings are generated.
+    JSONL = "jsonl"
+
+
+class Compression(Enum):
+    """How the written mappings are compressed."""
+
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+def check_compression_available(compression: Compression) -> None:
+    """
+    Check that the libraries needed for the given compression are installed.
+
+    :param compression: The compression to check.
+    """
+    if compression == Compression.ZSTD:
+        _import_zstandard()
+
+
+def write_mappings(
+    mappings: Iterable[Dict[str, Any]],
+    output_format: OutputFormat = OutputFormat.JSON,
+    output_file: Optional[str] = None,
+    compression: Compression = Compression.NONE,
+) -> int:
+    """
+    Write the mappings to the given file or stdout.
+
+    In the jsonl format the mappings are consumed one at a time, so a generator of mappings is
+    never held in memory as a whole.
+
+    :param mappings: The mappings to write.
+    :param output_format: The format to write the mappings in.
+    :param output_file: The file to append the mappings to, stdout if not given.
+    :param compression: The compression to use.
+    :return: The number of mappings written.
+    """
+    n_mappings = 0
+    with _open_output(output_file, compression) as output:
+        if output_format == OutputFormat.JSONL:
+            for mapping in mappings:
+                output.write(json.dumps(mapping))
+                output.write("\n")
+                n_mappings += 1
+        else:
+            mappings_list = list(mappings)
+            n_mappings = len(mappings_list)
+            output.write(json.dumps(mappings_list, indent=JSON_INDENT))
+            if output_file is None:
+                output.write("\n")
+
+    LOGGER.info(
+        "Wrote mappings",
+        mappings=n_mappings,
+        output_file=output_file,
+        output_format=output_format.value,
+        compression=compression.value,
+    )
+    return n_mappings
+
+
+@contextmanager
+def _open_output(output_file: Optional[str], compression: Compression) -> Iterator[TextIO]:
+    """
+    Open the text stream the mappings are written to.
+
+    :param output_file: The file to append to, stdout if not given.
+    :param compression: The compression to use.
+    :return: The text stream.
+    """
+    with ExitStack() as stack:
+        if compression == Compression.NONE:
+            if output_file:
+                yield stack.enter_context(open(output_file, "a", encoding=ENCODING))
+            else:
+                yield sys.stdout
+            return
+
+        raw: BinaryIO
+        if output_file:
+            raw = stack.enter_context(open(output_file, "ab"))
+        else:
+            sys.stdout.flush()
+            raw = sys.stdout.buffer
+
+        # Neither of the compressed streams closes the stream it writes to, so stdout stays open.
+        if compression == Compression.GZIP:
+            compressed = stack.enter_context(gzip.GzipFile(fileobj=raw, mode="ab"))
+        else:
+            zstandard = _import_zstandard()
+            compressed = stack.enter_context(
+                zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+            )
+
+        text = io.TextIOWrapper(compressed, encoding=ENCODING)  # type: ignore
+        # Detaching flushes the text stream without closing the compressed stream under it, which
+        # is closed by the exit stack so that the compressed data is completed.
+        stack.callback(text.detach)
+        yield text
+
+
+def read_mappings(input_file: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read the mappings written to a file by write_mappings.
+
+    The format and compression are detected from the contents of the file. Files the json format
+    was appended to several times contain several lists, the mappings of all of them are read.
+    Mappings in the jsonl format are read one line at a time.
+
+    :param input_file: The file to read.
+    :return: Iterator over the mappings in the file.
+    """
+    with _open_input(input_file) as text:
+        first_line = text.readline()
+        while first_line and not first_line.strip():
+            first_line = text.readline()
+
+        if first_line.lstrip().startswith("{"):
+            yield json.loads(first_line)
+            for line in text:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        data = first_line + text.read()
+        decoder = json.JSONDecoder()
+        position = _skip_whitespace(data, 0)
+        while position < len(data):
+            mappings_list, position = decoder.raw_decode(data, position)
+            yield from mappings_list
+            position = _skip_whitespace(data, position)
+
+
+def _skip_whitespace(data: str, position: int) -> int:
+    """
+    Get the position of the first non whitespace character at or after the given position.
+
+    :param data: The string to search.
+    :param position: The position to start at.
+    :return: The position of the next non whitespace character or the length of the string.
+    """
+    while position < len(data) and data[position].isspace():
+        position += 1
+    return position
+
+
+@contextmanager
+def _open_input(input_file: str) -> Iterator[TextIO]:
+    """
+    Open a mappings file as text, decompressing it if it is compressed.
+
+    :param input_file: The file to open.
+    :return: The text stream.
+    """
+    with ExitStack() as stack:
+        raw = stack.enter_context(open(input_file, "rb"))
+        magic = raw.read(len(ZSTD_MAGIC))
+        raw.seek(0)
+
+        decompressed: Any = raw
+        if magic.startswith(GZIP_MAGIC):
+            decompressed = stack.enter_context(gzip.GzipFile(fileobj=raw, mode="rb"))
+        elif magic == ZSTD_MAGIC:
+            zstandard = _import_zstandard()
+            decompressed = io.BufferedReader(
+                stack.enter_context(
+                    zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                )
+            )
+
+        yield stack.enter_context(io.TextIOWrapper(decompressed, encoding=ENCODING))
+
+
+def _import_zstandard() -> Any:
+    """
+    Import the zstandard module, which is only needed for zstd compression.
+
+    :return: The zstandard module.
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(
+            "zstd compression requires the 'zstandard' package, installed by the 'zstd' extra"
+        )
+    return zstandard
@@ -0,0 +1,361 @@
+"""Prometheus metrics of the API and of the mapping generation."""
+from __future__ import annotations
+
+import threading
+
+from contextlib import contextmanager
+from time import perf_counter
+from types import TracebackType
+from typing import Any, Dict, Iterable, Iterator, Optional, Type, TypeVar
+from urllib.error import URLError
+
+import structlog
+
+from click import Context
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.exposition import push_to_gateway, write_to_textfile
+
+from selectedtests import profiling
+from selectedtests.config.logging_config import is_debug_enabled
+
+LOGGER = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+TEST_MAPPINGS = "test_mappings"
+TASK_MAPPINGS = "task_mappings"
+
+# The phases of generating and storing the mappings of a project.
+CLONE_PHASE = "clone"
+WALK_PHASE = "walk"
+# Diffing the commits or versions is part of the walk, the time of both includes it.
+DIFF_PHASE = "diff"
+FLIP_DETECTION_PHASE = "flip_detection"
+TRANSFORM_PHASE = "transform"
+WRITE_PHASE = "write"
+PHASES = [CLONE_PHASE, WALK_PHASE, DIFF_PHASE, FLIP_DETECTION_PHASE, TRANSFORM_PHASE, WRITE_PHASE]
+
+# How often the throughput of the mapping generation is logged.
+THROUGHPUT_LOG_INTERVAL_SECONDS = 30.0
+
+# The number of mappings a request returns is spread over orders of magnitude.
+RESULT_SIZE_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+REQUEST_SECONDS = Histogram(
+    "selected_tests_request_seconds",
+    "Time taken to answer a request to the API.",
+    ["method", "route", "status"],
+)
+MAPPINGS_QUERY_SECONDS = Histogram(
+    "selected_tests_mappings_query_seconds",
+    "Time taken to get the mappings of the changed files of a request.",
+    ["mapping_type", "source"],
+)
+EVERGREEN_LOOKUP_SECONDS = Histogram(
+    "selected_tests_evergreen_lookup_seconds",
+    "Time taken to look the project of a request up in Evergreen.",
+)
+MAPPINGS_RETURNED = Histogram(
+    "selected_tests_mappings_returned",
+    "The number of mappings returned by a request.",
+    ["mapping_type"],
+    buckets=RESULT_SIZE_BUCKETS,
+)
+MAPPING_INDEX_LOOKUPS = Counter(
+    "selected_tests_mapping_index_lookups",
+    "Lookups of the mappings of a project in the in-memory index, by whether it was loaded.",
+    ["mapping_type", "result"],
+)
+MAPPING_INDEX_ENTRIES = Gauge(
+    "selected_tests_mapping_index_entries",
+    "The number of mapping types of projects loaded in the in-memory index.",
+)
+
+# Phases run concurrently, the flip detection of many versions at once, so the time of a phase
+# may add up to more than the time of the run.
+PHASE_SECONDS = Counter(
+    "selected_tests_phase_seconds",
+    "Time spent in each phase of generating and storing the mappings of a project.",
+    ["mapping_type", "project", "phase"],
+)
+ITEMS_PROCESSED = Counter(
+    "selected_tests_items_processed",
+    "The commits or versions of a project analyzed to generate its mappings.",
+    ["mapping_type", "project", "item"],
+)
+EVERGREEN_API_CALLS = Counter(
+    "selected_tests_evergreen_api_calls",
+    "Responses received from the Evergreen API.",
+)
+VERSIONS_IN_FLIGHT = Gauge(
+    "selected_tests_versions_in_flight",
+    "Versions of a project submitted for flip detection and not done yet.",
+    ["project"],
+)
+DOCUMENTS_WRITTEN = Counter(
+    "selected_tests_documents_written",
+    "The documents upserted while storing the mappings of a project.",
+    ["collection", "project"],
+)
+
+
+@contextmanager
+def timed_phase(mapping_type: str, project: str, phase: str) -> Iterator[None]:
+    """
+    Add the time spent in the block to the time of a phase.
+
+    The block is logged as a span at debug level, and the allocations of the phase are recorded
+    if the command is profiled.
+
+    :param mapping_type: The type of the mappings generated.
+    :param project: The project the mappings are generated for.
+    :param phase: The phase the block is part of.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        seconds = perf_counter() - start
+        PHASE_SECONDS.labels(mapping_type, project, phase).inc(seconds)
+        if is_debug_enabled(__name__):
+            LOGGER.debug(
+                "Phase ended",
+                mapping_type=mapping_type,
+                project=project,
+                phase=phase,
+                seconds=seconds,
+            )
+        if profiling.active_profiler is not None:
+            profiling.active_profiler.phase_ended(mapping_type, project, phase)
+
+
+def timed_iter(iterable: Iterable[T], mapping_type: str, project: str, phase: str) -> Iterator[T]:
+    """
+    Add the time spent generating the items of an iterable to the time of a phase.
+
+    The time spent by the consumer between items is not counted, so a phase streaming into
+    another is timed on its own.
+
+    :param iterable: The iterable to time.
+    :param mapping_type: The type of the mappings generated.
+    :param project: The project the mappings are generated for.
+    :param phase: The phase generating the items.
+    :return: Iterator over the items of the iterable.
+    """
+    seconds = PHASE_SECONDS.labels(mapping_type, project, phase)
+    iterator = iter(iterable)
+    while True:
+        start = perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            seconds.inc(perf_counter() - start)
+            if profiling.active_profiler is not None:
+                profiling.active_profiler.phase_ended(mapping_type, project, phase)
+            return
+        seconds.inc(perf_counter() - start)
+        yield item
+
+
+def count_evergreen_api_call(response: Any, *args: Any, **kwargs: Any) -> None:
+    """
+    Count a response of the Evergreen API, a response hook of the session of the client.
+
+    :param response: The response.
+    :param args: Other arguments of the hook.
+    :param kwargs: Other keyword arguments of the hook.
+    """
+    EVERGREEN_API_CALLS.inc()
+
+
+def _sample(name: str, labels: Optional[Dict[str, str]] = None) -> float:
+    """
+    Get the current value of a metric.
+
+    :param name: The name of the sample.
+    :param labels: The labels of the sample.
+    :return: The value, 0 if the metric was not recorded yet.
+    """
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class ThroughputLogger(object):
+    """
+    Logs the throughput of generating the mappings of a project, and a summary once it is done.
+
+    The throughput is read from the metrics, so it costs the analysis of the commits or versions
+    nothing but the increments of counters it already makes.
+    """
+
+    def __init__(
+        self,
+        mapping_type: str,
+        project: str,
+        item: str,
+        interval: float = THROUGHPUT_LOG_INTERVAL_SECONDS,
+    ):
+        """
+        Create a ThroughputLogger.
+
+        :param mapping_type: The type of the mappings generated.
+        :param project: The project the mappings are generated for.
+        :param item: What is analyzed, commits or versions.
+        :param interval: How often to log the throughput, in seconds.
+        """
+        self.mapping_type = mapping_type
+        self.project = project
+        self.item = item
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._start: Dict[str, float] = {}
+        self._last: Dict[str, float] = {}
+
+    def __enter__(self) -> ThroughputLogger:
+        """
+        Start logging the throughput.
+
+        :return: The ThroughputLogger.
+        """
+        self._start = self._last = self._read()
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """
+        Stop logging the throughput and log the summary.
+
+        :param exc_type: The type of the exception raised in the block, if any.
+        :param exc_value: The exception raised in the block, if any.
+        :param traceback: The traceback of the exception raised in the block, if any.
+        """
+        self._stop_event.set()
+        self._thread.join()
+        self.log_summary()
+
+    def log_throughput(self) -> None:
+        """Log the throughput since it was last logged."""
+        current = self._read()
+        seconds = current["time"] - self._last["time"]
+        LOGGER.info(
+            "Mapping generation throughput",
+            mapping_type=self.mapping_type,
+            project=self.project,
+            **{
+                f"{self.item}_per_second": _rate(current, self._last, self.item, seconds),
+                "api_calls_per_second": _rate(current, self._last, "api_calls", seconds),
+                "versions_in_flight": current["versions_in_flight"],
+            },
+        )
+        self._last = current
+
+    def log_summary(self) -> None:
+        """Log the time spent in each phase and the throughput since logging started."""
+        current = self._read()
+        seconds = current["time"] - self._start["time"]
+        LOGGER.info(
+            "Mapping generation summary",
+            mapping_type=self.mapping_type,
+            project=self.project,
+            seconds=seconds,
+            phase_seconds={
+                phase: current[phase] - self._start[phase]
+                for phase in PHASES
+                if current[phase] > self._start[phase]
+            },
+            **{
+                self.item: current[self.item] - self._start[self.item],
+                f"{self.item}_per_second": _rate(current, self._start, self.item, seconds),
+                "api_calls": current["api_calls"] - self._start["api_calls"],
+                "api_calls_per_second": _rate(current, self._start, "api_calls", seconds),
+            },
+        )
+
+    def _read(self) -> Dict[str, float]:
+        """
+        Read the metrics the throughput is computed from.
+
+        :return: The values of the metrics, and the time they were read at.
+        """
+        labels = {"mapping_type": self.mapping_type, "project": self.project}
+        values = {
+            "time": perf_counter(),
+            self.item: _sample(
+                "selected_tests_items_processed_total", dict(labels, item=self.item)
+            ),
+            "api_calls": _sample("selected_tests_evergreen_api_calls_total"),
+            "versions_in_flight": _sample(
+                "selected_tests_versions_in_flight", {"project": self.project}
+            ),
+        }
+        for phase in PHASES:
+            values[phase] = _sample("selected_tests_phase_seconds_total", dict(labels, phase=phase))
+        return values
+
+    def _run(self) -> None:
+        """Log the throughput every interval until stopped."""
+        while not self._stop_event.wait(self.interval):
+            self.log_throughput()
+
+
+def _rate(current: Dict[str, float], previous: Dict[str, float], key: str, seconds: float) -> float:
+    """
+    Get the rate a metric grew at between two reads.
+
+    :param current: The later read of the metrics.
+    :param previous: The earlier read of the metrics.
+    :param key: The metric.
+    :param seconds: The time between the two reads.
+    :return: The growth of the metric per second.
+    """
+    if seconds <= 0:
+        return 0.0
+    return (current[key] - previous[key]) / seconds
+
+
+def export_metrics(
+    job: str,
+    textfile: Optional[str] = None,
+    pushgateway: Optional[str] = None,
+    registry: CollectorRegistry = REGISTRY,
+) -> None:
+    """
+    Export the metrics of a command once it is done.
+
+    Failing to push the metrics is logged rather than failing the command.
+
+    :param job: The name of the command, the job the metrics are pushed under.
+    :param textfile: Path of a file to write the metrics to, for the textfile collector of the
+     node exporter.
+    :param pushgateway: Address of a Prometheus Pushgateway to push the metrics to.
+    :param registry: The metrics to export.
+    """
+    if textfile:
+        write_to_textfile(textfile, registry)
+        LOGGER.info("Wrote metrics", path=textfile)
+    if pushgateway:
+        try:
+            push_to_gateway(pushgateway, job=job, registry=registry)
+            LOGGER.info("Pushed metrics", pushgateway=pushgateway, job=job)
+        except (OSError, URLError):
+            LOGGER.warning("Failed to push metrics", pushgateway=pushgateway, exc_info=True)
+
+
+def export_metrics_on_close(
+    ctx: Context, job: str, textfile: Optional[str], pushgateway: Optional[str]
+) -> None:
+    """
+    Export the metrics of a command when its click context closes, whether it failed or not.
+
+    :param ctx: The click context of the command.
+    :param job: The name of the command, the job the metrics are pushed under.
+    :param textfile: Path of a file to write the metrics to.
+    :param pushgateway: Address of a Prometheus Pushgateway to push the metrics to.
+    """
+    if textfile or pushgateway:
+        ctx.call_on_close(lambda: export_metrics(job, textfile, pushgateway))
@@ -0,0 +1,138 @@
+"""Classify changed file paths against the source and test file patterns of a project."""
+import re
+import sre_constants
+import sre_parse
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Pattern, Sequence, Tuple
+
+SOURCE_FILE = "source"
+TEST_FILE = "test"
+# The same few thousand paths are changed over and over again in the history of a project.
+MAX_CACHED_PATHS = 100_000
+
+
+class _PrefixTrie(object):
+    """A trie of the literal prefixes a path must start with to be able to match a pattern."""
+
+    def __init__(self, prefixes: Sequence[str]):
+        """
+        Create a trie of the given prefixes.
+
+        :param prefixes: The literal prefixes, an empty prefix matches any path.
+        """
+        self._root: Dict[str, Any] = {}
+        self._matches_all = "" in prefixes
+        for prefix in prefixes:
+            node = self._root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[""] = True
+
+    def starts_any(self, path: str) -> bool:
+        """
+        Check whether the path starts with one of the prefixes in the trie.
+
+        :param path: The path to check.
+        :return: Whether the path starts with a prefix.
+        """
+        if self._matches_all:
+            return True
+
+        node: Optional[Dict[str, Any]] = self._root
+        for char in path:
+            node = node.get(char)  # type: ignore
+            if node is None:
+                return False
+            if "" in node:
+                return True
+        return False
+
+
+class PathClassifier(object):
+    """
+    Classify paths by the first of an ordered list of patterns they match.
+
+    Paths that can not start with the literal prefix of a pattern are rejected without running
+    the regex and the classification of each path is remembered for the paths seen most recently.
+    """
+
+    def __init__(
+        self,
+        patterns: Sequence[Tuple[str, Pattern]],
+        max_cached_paths: Optional[int] = MAX_CACHED_PATHS,
+    ):
+        """
+        Create a PathClassifier.
+
+        :param patterns: The classifications and the patterns a path needs to match for them, in
+         order of precedence.
+        :param max_cached_paths: The number of path classifications to remember.
+        """
+        self._patterns = [
+            (classification, pattern, _PrefixTrie(get_literal_prefixes(pattern)))
+            for classification, pattern in patterns
+        ]
+        self.classify = lru_cache(maxsize=max_cached_paths)(self._classify)
+
+    def _classify(self, path: str) -> Optional[str]:
+        """
+        Classify the given path.
+
+        :param path: The path to classify.
+        :return: The classification of the first pattern the path matches or None.
+        """
+        for classification, pattern, prefixes in self._patterns:
+            if prefixes.starts_any(path) and pattern.match(path):
+                return classification
+        return None
+
+    def matches(self, path: str) -> bool:
+        """
+        Check whether the given path matches any of the patterns.
+
+        :param path: The path to check.
+        :return: Whether the path matches.
+        """
+        return self.classify(path) is not None
+
+
+def get_literal_prefixes(pattern: Pattern) -> List[str]:
+    """
+    Get the literal prefixes that any string matched by the pattern from its start begins with.
+
+    For example 'src/mongo/.*' gives ['src/mongo/'] and '(jstests|src)/.*' gives ['jstests', 'src'].
+
+    :param pattern: The compiled pattern.
+    :return: The literal prefixes, [''] if a string matched can start with anything.
+    """
+    if pattern.flags & re.IGNORECASE or not isinstance(pattern.pattern, str):
+        return [""]
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except sre_constants.error:
+        return [""]
+    return _get_prefixes_of_items(list(parsed))  # type: ignore
+
+
+def _get_prefixes_of_items(items: List[Tuple[Any, Any]]) -> List[str]:
+    """
+    Get the literal prefixes of a parsed sequence of regex items.
+
+    :param items: The parsed items.
+    :return: The literal prefixes.
+    """
+    prefix = ""
+    for index, (op, av) in enumerate(items):
+        if op is sre_constants.LITERAL:
+            prefix += chr(av)
+        elif op is sre_constants.AT and av is sre_constants.AT_BEGINNING and index == 0:
+            continue
+        elif op is sre_constants.BRANCH:
+            _, branches = av
+            return [prefix + p for branch in branches for p in _get_prefixes_of_items(list(branch))]
+        elif op is sre_constants.SUBPATTERN and not av[1] and not av[2]:
+            return [prefix + p for p in _get_prefixes_of_items(list(av[-1]))]
+        else:
+            break
+    return [prefix]
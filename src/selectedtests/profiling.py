@@ -0,0 +1,152 @@
+"""Profile the commands generating the mappings, to see where the time and memory of a run went."""
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+
+from datetime import datetime
+from types import FrameType
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from click import Context
+
+LOGGER = structlog.get_logger(__name__)
+
+# The number of frames kept for each traced allocation.
+TRACEBACK_FRAMES = 10
+# The number of functions and allocation sites listed in the summaries.
+SUMMARY_LINES = 50
+
+# The profiler of the running command, None if it is not profiled. The phases only check it, so
+# profiling costs nothing when it is disabled.
+active_profiler: Optional[Profiler] = None
+
+
+class Profiler(object):
+    """
+    Profiles the calls of every thread with cProfile and traces the allocations with tracemalloc.
+
+    The threads started while profiling get a profile of their own, and the profiles are merged
+    once profiling stops. The allocations are looked at as each phase of the mapping generation
+    ends: the peak traced since the previous phase ended is recorded, and a snapshot is kept of
+    the end of the first run of each phase.
+
+    tracemalloc only traces the allocations of the whole process. When phases run at the same
+    time, e.g. the work items of several workers or the test and task mappings of update-all, the
+    peak of a phase includes the allocations of the others since whichever phase ended last.
+    """
+
+    def __init__(self, output_dir: str):
+        """
+        Create a Profiler.
+
+        :param output_dir: Directory to write the profiles to.
+        """
+        self.output_dir = output_dir
+        self._profiles: List[cProfile.Profile] = []
+        self._phases: Dict[str, Dict[str, int]] = {}
+        self._snapshots: Dict[str, tracemalloc.Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start profiling this thread and the threads started from now on."""
+        global active_profiler
+        tracemalloc.start(TRACEBACK_FRAMES)
+        threading.setprofile(self._profile_thread)
+        self._enable_profile()
+        active_profiler = self
+        LOGGER.info("Started profiling", output_dir=self.output_dir)
+
+    def stop(self) -> None:
+        """Stop profiling and write the profiles."""
+        global active_profiler
+        active_profiler = None
+        threading.setprofile(None)
+        # Disables the profile of this thread, the other threads are done with theirs.
+        stats = pstats.Stats()
+        for profile in self._profiles:
+            profile.create_stats()
+            if profile.stats:  # type: ignore
+                stats.add(profile)
+        tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stats.dump_stats(os.path.join(self.output_dir, "profile.prof"))
+        with open(os.path.join(self.output_dir, "profile.txt"), "w") as summary:
+            stats.stream = summary  # type: ignore
+            stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+        with open(os.path.join(self.output_dir, "phases.json"), "w") as phases:
+            json.dump(self._phases, phases, indent=2, sort_keys=True)
+        for phase, snapshot in self._snapshots.items():
+            snapshot.dump(os.path.join(self.output_dir, f"{phase}.tracemalloc"))
+            with open(os.path.join(self.output_dir, f"{phase}.txt"), "w") as summary:
+                for statistic in snapshot.statistics("lineno")[:SUMMARY_LINES]:
+                    summary.write(f"{statistic}\n")
+        LOGGER.info("Wrote profiles", output_dir=self.output_dir, phases=len(self._phases))
+
+    def phase_ended(self, mapping_type: str, project: str, phase: str) -> None:
+        """
+        Record the allocations of a phase that just ended.
+
+        The peak is reset for the next phase where python supports it, before 3.9 it is the peak
+        since profiling started. Either way it is the peak of the whole process.
+
+        :param mapping_type: The type of the mappings generated.
+        :param project: The project the mappings are generated for.
+        :param phase: The phase that ended.
+        """
+        name = f"{mapping_type}-{project}-{phase}"
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            record = self._phases.setdefault(
+                name, {"calls": 0, "peak_bytes": 0, "snapshot_bytes": 0}
+            )
+            first_call = record["calls"] == 0
+            record["calls"] += 1
+            record["peak_bytes"] = max(record["peak_bytes"], peak)
+            if first_call:
+                record["snapshot_bytes"] = current
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()  # type: ignore
+
+        # A snapshot copies every traced allocation, so only one is taken for each phase, and
+        # without holding up the other threads ending their phases.
+        if first_call:
+            snapshot = tracemalloc.take_snapshot()
+            with self._lock:
+                self._snapshots[name] = snapshot
+
+    def _enable_profile(self) -> None:
+        """Profile the calls of this thread."""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _profile_thread(self, frame: FrameType, event: str, arg: Any) -> None:
+        """Replace this hook with a profile of its own on the first call of a new thread."""
+        sys.setprofile(None)
+        self._enable_profile()
+
+
+def profile_until_close(ctx: Context, job: str, profile: bool, profile_output: str) -> None:
+    """
+    Profile a command until its click context closes, whether it failed or not.
+
+    :param ctx: The click context of the command.
+    :param job: The name of the command, the profiles are written to a directory named after it.
+    :param profile: Whether to profile the command.
+    :param profile_output: Directory to write the profiles of each run to.
+    """
+    if profile:
+        run = f"{job}-{datetime.utcnow():%Y%m%dT%H%M%S}"
+        profiler = Profiler(os.path.join(profile_output, run))
+        profiler.start()
+        ctx.call_on_close(profiler.stop)
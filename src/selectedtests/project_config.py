@@ -1,10 +1,40 @@
 """Domain object representing project config."""
 from __future__ import annotations
 
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+import structlog
 
 from pymongo.collection import Collection
 
+from selectedtests.fan_out_limit import FanOutLimit
+
+LOGGER = structlog.get_logger(__name__)
+
+# Counter advanced every time a project config is saved.
+GENERATION_KEY = "generation"
+# When the test and task mappings of the project were last generated together, the history after
+# the most recent commits and version analyzed is not older than this.
+ANALYZED_AT_KEY = "analyzed_at"
+
+
+def advance_generations(collection: Collection, projects: Optional[Iterable[str]] = None) -> None:
+    """
+    Advance the generation of project configs whose mappings were changed without saving them.
+
+    The web service reloads the mappings of these projects, as it does when the mappings are
+    updated. Projects without a config are not created.
+
+    :param collection: The collection containing project config documents.
+    :param projects: The projects whose mappings changed, all the projects if not given.
+    """
+    query: Dict[str, Any] = {}
+    if projects is not None:
+        query = {"project": {"$in": list(projects)}}
+    result = collection.update_many(query, {"$inc": {GENERATION_KEY: 1}})
+    LOGGER.info("Advanced project config generations", projects=result.modified_count)
+
 
 class TaskConfig:
     """Represents the task mappings config for a project config."""
@@ -16,6 +46,7 @@ class TaskConfig:
         build_variant_regex: Optional[str] = None,
         module: Optional[str] = None,
         module_source_file_regex: Optional[str] = None,
+        fan_out_limit: Optional[FanOutLimit] = None,
     ):
         """Init a TaskConfig instance. Use ProjectConfig.get rather than this directly."""
         self.most_recent_version_analyzed = most_recent_version_analyzed
@@ -23,9 +54,10 @@ class TaskConfig:
         self.build_variant_regex = build_variant_regex
         self.module = module
         self.module_source_file_regex = module_source_file_regex
+        self.fan_out_limit = fan_out_limit or FanOutLimit()
 
     @classmethod
-    def from_json(cls, json: Dict[str, Optional[str]]) -> TaskConfig:
+    def from_json(cls, json: Dict[str, Any]) -> TaskConfig:
         """
         Instantiate an instance of TaskConfig from json. Use ProjectConfig.get instead.
 
@@ -38,6 +70,7 @@ class TaskConfig:
             json.get("build_variant_regex"),
             json.get("module"),
             json.get("module_source_file_regex"),
+            FanOutLimit.from_json(json),
         )
 
     def update(
@@ -47,6 +80,7 @@ class TaskConfig:
         build_variant_regex: str,
         module: str,
         module_source_file_regex: str,
+        fan_out_limit: Optional[FanOutLimit] = None,
     ) -> None:
         """
         Update fields on an instance of TaskConfig.
@@ -56,12 +90,15 @@ class TaskConfig:
         :param build_variant_regex: The build_variant_regex of the project task config.
         :param module: The module of the project task config.
         :param module_source_file_regex: The module_source_file_regex of the project task config.
+        :param fan_out_limit: The fan out limit of the project task config, if it should change.
         """
         self.most_recent_version_analyzed = most_recent_version_analyzed
         self.source_file_regex = source_file_regex
         self.build_variant_regex = build_variant_regex
         self.module = module
         self.module_source_file_regex = module_source_file_regex
+        if fan_out_limit is not None:
+            self.fan_out_limit = fan_out_limit
 
     def update_most_recent_version_analyzed(self, most_recent_version_analyzed: str) -> None:
         """
@@ -71,7 +108,7 @@ class TaskConfig:
         """
         self.most_recent_version_analyzed = most_recent_version_analyzed
 
-    def as_dict(self) -> Dict[str, Optional[str]]:
+    def as_dict(self) -> Dict[str, Any]:
         """Return fields to be stored in database."""
         return {
             "most_recent_version_analyzed": self.most_recent_version_analyzed,
@@ -79,6 +116,7 @@ class TaskConfig:
             "build_variant_regex": self.build_variant_regex,
             "module": self.module,
             "module_source_file_regex": self.module_source_file_regex,
+            **self.fan_out_limit.as_dict(),
         }
 
 
@@ -94,6 +132,7 @@ class TestConfig:
         most_recent_module_commit_analyzed: str = None,
         module_source_file_regex: str = None,
         module_test_file_regex: str = None,
+        fan_out_limit: Optional[FanOutLimit] = None,
     ):
         """Init a TestConfig instance. Use ProjectConfig.get rather than this directly."""
         self.most_recent_project_commit_analyzed = most_recent_project_commit_analyzed
@@ -103,9 +142,10 @@ class TestConfig:
         self.most_recent_module_commit_analyzed = most_recent_module_commit_analyzed
         self.module_source_file_regex = module_source_file_regex
         self.module_test_file_regex = module_test_file_regex
+        self.fan_out_limit = fan_out_limit or FanOutLimit()
 
     @classmethod
-    def from_json(cls, json: Dict[str, Optional[str]]) -> TestConfig:
+    def from_json(cls, json: Dict[str, Any]) -> TestConfig:
         """
         Instantiate an instance of TestConfig from json. Use ProjectConfig.get instead.
 
@@ -120,6 +160,7 @@ class TestConfig:
             json.get("most_recent_module_commit_analyzed"),
             json.get("module_source_file_regex"),
             json.get("module_test_file_regex"),
+            FanOutLimit.from_json(json),
         )
 
     def update(
@@ -131,6 +172,7 @@ class TestConfig:
         most_recent_module_commit_analyzed: str,
         module_source_file_regex: str,
         module_test_file_regex: str,
+        fan_out_limit: Optional[FanOutLimit] = None,
     ) -> None:
         """
         Update fields on an instance of TestConfig.
@@ -142,6 +184,7 @@ class TestConfig:
         :param most_recent_module_commit_analyzed: Most_recent_module_commit_analyzed of the config.
         :param module_source_file_regex: The module_source_file_regex of the project task config.
         :param module_test_file_regex: The module_test_file_regex of the project task config.
+        :param fan_out_limit: The fan out limit of the project test config, if it should change.
         """
         self.most_recent_project_commit_analyzed = most_recent_project_commit_analyzed
         self.source_file_regex = source_file_regex
@@ -150,6 +193,8 @@ class TestConfig:
         self.most_recent_module_commit_analyzed = most_recent_module_commit_analyzed
         self.module_source_file_regex = module_source_file_regex
         self.module_test_file_regex = module_test_file_regex
+        if fan_out_limit is not None:
+            self.fan_out_limit = fan_out_limit
 
     def update_most_recent_commits_analyzed(
         self, most_recent_project_commit_analyzed: str, most_recent_module_commit_analyzed: str
@@ -163,7 +208,7 @@ class TestConfig:
         self.most_recent_project_commit_analyzed = most_recent_project_commit_analyzed
         self.most_recent_module_commit_analyzed = most_recent_module_commit_analyzed
 
-    def as_dict(self) -> Dict[str, Optional[str]]:
+    def as_dict(self) -> Dict[str, Any]:
         """Return fields to be stored in database."""
         return {
             "most_recent_project_commit_analyzed": self.most_recent_project_commit_analyzed,
@@ -173,17 +218,25 @@ class TestConfig:
             "most_recent_module_commit_analyzed": self.most_recent_module_commit_analyzed,
             "module_source_file_regex": self.module_source_file_regex,
             "module_test_file_regex": self.module_test_file_regex,
+            **self.fan_out_limit.as_dict(),
         }
 
 
 class ProjectConfig:
     """Represents a project config for an Evergreen project."""
 
-    def __init__(self, project: str, task_config: TaskConfig, test_config: TestConfig):
+    def __init__(
+        self,
+        project: str,
+        task_config: TaskConfig,
+        test_config: TestConfig,
+        analyzed_at: Optional[datetime] = None,
+    ):
         """Init a ProjectConfig instance. Use ProjectConfig.get rather than this directly."""
         self.project = project
         self.task_config = task_config
         self.test_config = test_config
+        self.analyzed_at = analyzed_at
 
     @classmethod
     def get(cls, collection: Collection, project: str) -> ProjectConfig:
@@ -200,22 +253,35 @@ class ProjectConfig:
                 project,
                 TaskConfig.from_json(data.get("task_config")),
                 TestConfig.from_json(data.get("test_config")),
+                data.get(ANALYZED_AT_KEY),
             )
         return cls(project, TaskConfig(), TestConfig())
 
+    def update_analyzed_at(self, analyzed_at: datetime) -> None:
+        """
+        Update when the test and task mappings of the project were last generated together.
+
+        :param analyzed_at: When the most recent commits and version analyzed were looked up.
+        """
+        self.analyzed_at = analyzed_at
+
     def save(self, collection: Collection) -> None:
         """
         Save a ProjectConfig instance to the db collection.
 
+        Every save advances the generation of the project, which the web service watches to know
+        when the mappings of the project were updated.
+
         :param collection: The collection containing project config documents.
         """
+        fields: Dict[str, Any] = {
+            "task_config": self.task_config.as_dict(),
+            "test_config": self.test_config.as_dict(),
+        }
+        if self.analyzed_at is not None:
+            fields[ANALYZED_AT_KEY] = self.analyzed_at
         collection.update(
             {"project": self.project},
-            {
-                "$set": {
-                    "task_config": self.task_config.as_dict(),
-                    "test_config": self.test_config.as_dict(),
-                }
-            },
+            {"$set": fields, "$inc": {GENERATION_KEY: 1}},
             upsert=True,
         )
@@ -6,19 +6,45 @@ import re
 
 from collections import namedtuple
 from concurrent.futures import ThreadPoolExecutor as Executor
+from datetime import datetime
 from re import match
 from tempfile import TemporaryDirectory
-from typing import Dict, List, Optional, Pattern, Set, Tuple
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Set, Tuple, Union
 
 from boltons.iterutils import windowed_iter
 from evergreen.api import Build, EvergreenApi, Task, Version
 from evergreen.manifest import ManifestModule
-from git import DiffIndex, Repo
+from git import Repo
 from structlog import get_logger
 from tenacity import RetryError
 
+from selectedtests.changed_files_index import ChangedFilesIndex
+from selectedtests.count_buckets import MONTHLY_COUNTS_KEY, get_bucket
 from selectedtests.evergreen_helper import get_evg_project
-from selectedtests.git_helper import get_changed_files, init_repo
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import (
+    CloneMode,
+    RepoClones,
+    changed_files_between_revisions,
+    get_shallow_since,
+    init_repo,
+)
+from selectedtests.metrics import (
+    CLONE_PHASE,
+    DIFF_PHASE,
+    FLIP_DETECTION_PHASE,
+    ITEMS_PROCESSED,
+    PHASE_SECONDS,
+    TASK_MAPPINGS,
+    TRANSFORM_PHASE,
+    VERSIONS_IN_FLIGHT,
+    WALK_PHASE,
+    ThroughputLogger,
+    timed_iter,
+    timed_phase,
+)
+from selectedtests.path_classifier import SOURCE_FILE, PathClassifier
 from selectedtests.task_mappings.version_limit import VersionLimit
 
 LOGGER = get_logger(__name__)
@@ -26,6 +52,8 @@ LOGGER = get_logger(__name__)
 MAX_WORKERS = 32
 SEEN_COUNT_KEY = "seen_count"
 TASK_BUILDS_KEY = "builds"
+# The counts of the tasks of each build split by the month of the versions they flipped in.
+TASK_MONTHLY_BUILDS_KEY = "monthly_builds"
 ChangedFile = namedtuple("ChangedFile", ["file_name", "repo_name"])
 
 
@@ -37,7 +65,13 @@ def generate_task_mappings(
     module_name: Optional[str] = None,
     module_source_file_pattern: Optional[str] = None,
     build_variant_pattern: Optional[str] = None,
-) -> Tuple[List[Dict], Optional[str]]:
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    stream: bool = False,
+    clones: Optional[RepoClones] = None,
+    versions: Optional[Iterable[Version]] = None,
+) -> Tuple[Iterable[Dict], Optional[str]]:
     """
     Generate task mappings for an evergreen project and its associated module if module is provided.
 
@@ -48,7 +82,14 @@ def generate_task_mappings(
     :param module_name: The name of the module to analyze.
     :param module_source_file_pattern: Pattern to match changed module source files against.
     :param build_variant_pattern: Pattern to match build variant names against.
-    :return: An instance of TestMappingsResult and the most recent version analyzed during analysis.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the versions counted.
+    :param stream: Whether to return an iterator generating the task mappings rather than a list.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param versions: The versions of the project, most recent first, listed from the API if not
+     given.
+    :return: The task mappings and the most recent version analyzed during analysis.
     """
     source_re = re.compile(source_file_pattern)
     module_source_re = None
@@ -67,19 +108,38 @@ def generate_task_mappings(
         module_name=module_name,
         module_file_regex=module_source_re,
         build_regex=build_regex,
+        clone_mode=clone_mode,
+        changed_files_index=changed_files_index,
+        fan_out_limit=fan_out_limit,
+        clones=clones,
+        versions=versions,
     )
-    transformed_mappings = mappings.transform()
-    return transformed_mappings, most_recent_version_analyzed
+    if stream:
+        return (
+            timed_iter(
+                mappings.iter_transform(), TASK_MAPPINGS, evergreen_project, TRANSFORM_PHASE
+            ),
+            most_recent_version_analyzed,
+        )
+    with timed_phase(TASK_MAPPINGS, evergreen_project, TRANSFORM_PHASE):
+        return mappings.transform(), most_recent_version_analyzed
 
 
 class TaskMappings:
     """Represents and creates the task mappings for an evergreen project."""
 
-    def __init__(self, mappings: Dict, evergreen_project: str, branch: Optional[str]):
+    def __init__(
+        self,
+        mappings: Dict,
+        evergreen_project: str,
+        branch: Optional[str],
+        versions_skipped: int = 0,
+    ):
         """Init a taskmapping instance. Use create_task_mappings rather than this directly."""
         self.mappings = mappings
         self.evergreen_project = evergreen_project
         self.branch = branch
+        self.versions_skipped = versions_skipped
 
     @classmethod
     def create_task_mappings(
@@ -91,6 +151,11 @@ class TaskMappings:
         module_name: Optional[str] = None,
         module_file_regex: Optional[Pattern] = None,
         build_regex: Optional[Pattern] = None,
+        clone_mode: CloneMode = CloneMode.FULL,
+        changed_files_index: Optional[ChangedFilesIndex] = None,
+        fan_out_limit: Optional[FanOutLimit] = None,
+        clones: Optional[RepoClones] = None,
+        versions: Optional[Iterable[Version]] = None,
     ) -> Tuple[TaskMappings, Optional[str]]:
         """
         Create the task mappings for an evergreen project. Optionally looks at an associated module.
@@ -102,27 +167,54 @@ class TaskMappings:
         :param module_name: Name of the module associated with the evergreen project to also analyze
         :param module_file_regex: Regex pattern to match changed files of the module against.
         :param build_regex: Regex pattern to match build variant names against.
+        :param clone_mode: How much of the project and module repos should be cloned.
+        :param changed_files_index: Index of the files changed by previously analyzed commits.
+        :param fan_out_limit: The limit on the number of files changed by the versions counted.
+        :param clones: How the project and module repos are cloned, from github if not given.
+        :param versions: The versions of the project, most recent first, listed from the API if
+         not given.
         :return: An instance of TaskMappings and version_id of the most recent version analyzed.
         """
         LOGGER.info("Starting to generate task mappings", version_limit=version_limit)
-        project_versions = evg_api.versions_by_project(evergreen_project)
+        project_versions = versions
+        if project_versions is None:
+            project_versions = evg_api.versions_by_project(evergreen_project)
 
         task_mappings: Dict = {}
+        if fan_out_limit is None:
+            fan_out_limit = FanOutLimit()
+        versions_skipped = 0
+        versions_analyzed = ITEMS_PROCESSED.labels(TASK_MAPPINGS, evergreen_project, "versions")
+        # Diffing is timed without a span of its own, logging or profiling every version would
+        # cost more than diffing most of them.
+        diff_seconds = PHASE_SECONDS.labels(TASK_MAPPINGS, evergreen_project, DIFF_PHASE)
+        versions_in_flight = VERSIONS_IN_FLIGHT.labels(evergreen_project)
 
         module_repo = None
         branch = None
         repo_name = None
         most_recent_version_analyzed = None
-
-        with TemporaryDirectory() as temp_dir:
+        shallow_since = get_shallow_since(version_limit.stop_at_date)
+        file_classifier = PathClassifier([(SOURCE_FILE, file_regex)])
+        module_file_classifier = None
+        if module_file_regex is not None:
+            module_file_classifier = PathClassifier([(SOURCE_FILE, module_file_regex)])
+
+        throughput = ThroughputLogger(TASK_MAPPINGS, evergreen_project, "versions")
+        with throughput, TemporaryDirectory() as temp_dir:
             try:
-                base_repo = _get_evg_project_and_init_repo(evg_api, evergreen_project, temp_dir)
+                with timed_phase(TASK_MAPPINGS, evergreen_project, CLONE_PHASE):
+                    base_repo = _get_evg_project_and_init_repo(
+                        evg_api, evergreen_project, temp_dir, clone_mode, shallow_since, clones
+                    )
             except ValueError:
                 LOGGER.warning("Unexpected exception", exc_info=True)
                 raise
 
             jobs = []
-            with Executor(max_workers=MAX_WORKERS) as exe:
+            # The walk is over once every version is submitted, the flip detection goes on.
+            walk = timed_phase(TASK_MAPPINGS, evergreen_project, WALK_PHASE)
+            with Executor(max_workers=MAX_WORKERS) as exe, walk:
                 for next_version, version, prev_version in windowed_iter(project_versions, 3):
                     if not most_recent_version_analyzed:
                         most_recent_version_analyzed = version.version_id
@@ -138,19 +230,28 @@ class TaskMappings:
                         branch = version.branch
                         repo_name = version.repo
 
+                    if version_limit.check_version_after_until_date(version):
+                        continue
+                    versions_analyzed.inc()
+
                     LOGGER.info(
                         "Processing mappings for version",
                         version=version.version_id,
                         create_time=version.create_time,
                     )
 
+                    start = perf_counter()
                     try:
-                        diff = _get_diff(base_repo, version.revision, prev_version.revision)
+                        changed_paths = _get_changed_files(
+                            base_repo, version.revision, prev_version.revision, changed_files_index
+                        )
                     except ValueError:
                         LOGGER.warning("Unexpected exception", exc_info=True)
                         continue
+                    finally:
+                        diff_seconds.inc(perf_counter() - start)
 
-                    changed_files = _get_filtered_files(diff, file_regex, repo_name)
+                    changed_files = _get_filtered_files(changed_paths, file_classifier, repo_name)
 
                     if module_name:
                         try:
@@ -170,32 +271,59 @@ class TaskMappings:
                             )
                             continue
                         if cur_module is not None and module_repo is None:
-                            module_repo = init_repo(
-                                temp_dir, cur_module.repo, cur_module.branch, cur_module.owner
-                            )
-
+                            with timed_phase(TASK_MAPPINGS, evergreen_project, CLONE_PHASE):
+                                module_repo = init_repo(
+                                    temp_dir,
+                                    cur_module.repo,
+                                    cur_module.branch,
+                                    cur_module.owner,
+                                    clone_mode,
+                                    shallow_since,
+                                    clones,
+                                )
+
+                        start = perf_counter()
                         module_changed_files = _get_module_changed_files(
-                            module_repo, cur_module, prev_module, module_file_regex  # type: ignore
+                            module_repo,  # type: ignore
+                            cur_module,
+                            prev_module,
+                            module_file_classifier,  # type: ignore
+                            changed_files_index,
                         )
+                        diff_seconds.inc(perf_counter() - start)
                         changed_files = changed_files.union(module_changed_files)
 
-                    jobs.append(
-                        exe.submit(
-                            _process_evg_version,
-                            prev_version,
-                            version,
-                            next_version,
-                            build_regex,
-                            changed_files,
+                    weight = fan_out_limit.weight(len(changed_files))
+                    if not weight:
+                        LOGGER.info(
+                            "Skipping version that changed too many files",
+                            version=version.version_id,
+                            changed_files=len(changed_files),
                         )
+                        versions_skipped += 1
+                        continue
+
+                    job = exe.submit(
+                        _process_evg_version,
+                        prev_version,
+                        version,
+                        next_version,
+                        build_regex,
+                        changed_files,
+                        evergreen_project,
                     )
+                    versions_in_flight.inc()
+                    job.add_done_callback(lambda _: versions_in_flight.dec())
+                    # The counts go in the month of the version, not the month they are written in.
+                    jobs.append((job, weight, get_bucket(version.create_time)))
 
-            for job in jobs:
+            for job, weight, bucket in jobs:
                 changed_files, flipped_tasks = job.result()
-                _map_tasks_to_files(changed_files, flipped_tasks, task_mappings)
+                _map_tasks_to_files(changed_files, flipped_tasks, task_mappings, weight, bucket)
 
+        LOGGER.info("Finished generating task mappings", versions_skipped=versions_skipped)
         return (
-            TaskMappings(task_mappings, evergreen_project, branch),
+            TaskMappings(task_mappings, evergreen_project, branch, versions_skipped),
             most_recent_version_analyzed,
         )
 
@@ -206,7 +334,16 @@ class TaskMappings:
         :return: An array of dictionaries. Becomes an array of changed files that have in them the
          builds and the tasks in those that changed when that file did.
         """
-        task_mappings = []
+        task_mappings = list(self.iter_transform())
+        LOGGER.info("Generated task mappings list", task_mappings_length=len(task_mappings))
+        return task_mappings
+
+    def iter_transform(self) -> Iterator[Dict]:
+        """
+        Generate the task mappings as they will get stored in the database one file at a time.
+
+        :return: Iterator over the transformed task mappings of the files with flipped tasks.
+        """
         for changed_file, cur_mappings in self.mappings.items():
             builds = cur_mappings.get(TASK_BUILDS_KEY)
             if builds:
@@ -217,48 +354,63 @@ class TaskMappings:
                     "branch": self.branch,
                     "source_file_seen_count": cur_mappings.get(SEEN_COUNT_KEY),
                 }
+                if MONTHLY_COUNTS_KEY in cur_mappings:
+                    new_mapping[MONTHLY_COUNTS_KEY] = cur_mappings[MONTHLY_COUNTS_KEY]
+                monthly_builds = cur_mappings.get(TASK_MONTHLY_BUILDS_KEY, {})
                 new_tasks = []
                 for build, tasks in builds.items():
+                    monthly_tasks = monthly_builds.get(build, {})
                     for task, flip_count in tasks.items():
-                        new_tasks.append({"name": task, "variant": build, "flip_count": flip_count})
+                        new_task = {"name": task, "variant": build, "flip_count": flip_count}
+                        if task in monthly_tasks:
+                            new_task[MONTHLY_COUNTS_KEY] = monthly_tasks[task]
+                        new_tasks.append(new_task)
                 new_mapping["tasks"] = new_tasks
-                task_mappings.append(new_mapping)
-        LOGGER.info("Generated task mappings list", task_mappings_length=len(task_mappings))
-        return task_mappings
+                yield new_mapping
 
 
 def _get_evg_project_and_init_repo(
-    evg_api: EvergreenApi, evergreen_project: str, temp_dir: str
+    evg_api: EvergreenApi,
+    evergreen_project: str,
+    temp_dir: str,
+    clone_mode: CloneMode = CloneMode.FULL,
+    shallow_since: Optional[datetime] = None,
+    clones: Optional[RepoClones] = None,
 ) -> Repo:
     project_info = get_evg_project(evg_api, evergreen_project)
     if project_info is None:
         raise ValueError(f"The evergreen project {evergreen_project} does not exist")
     return init_repo(
-        temp_dir, project_info.repo_name, project_info.branch_name, project_info.owner_name
+        temp_dir,
+        project_info.repo_name,
+        project_info.branch_name,
+        project_info.owner_name,
+        clone_mode,
+        shallow_since,
+        clones,
     )
 
 
-def _get_filtered_files(diff: DiffIndex, regex: Pattern, repo_name: str) -> Set[ChangedFile]:
+def _get_filtered_files(
+    changed_paths: Iterable[str], classifier: PathClassifier, repo_name: str
+) -> Set[ChangedFile]:
     """
     Get the list of changed files.
 
-    :param diff: The diff between two commits.
-    :param regex: The regex pattern to match the files found in the diff against.
+    :param changed_paths: The paths changed between two commits.
+    :param classifier: Classifier of the changed paths that should be mapped.
     :param repo_name: The repo the files belong to.
-    :return: A set of the changed files that matched the given regex pattern.
+    :return: A set of the changed files that matched the classifier's pattern.
     """
-    return {
-        ChangedFile(file, repo_name)
-        for file in get_changed_files(diff, LOGGER)
-        if match(regex, file)
-    }
+    return {ChangedFile(file, repo_name) for file in changed_paths if classifier.matches(file)}
 
 
 def _get_module_changed_files(
     module_repo: Repo,
     cur_module: ManifestModule,
     prev_module: ManifestModule,
-    module_file_regex: Pattern,
+    module_file_classifier: PathClassifier,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
 ) -> Set[ChangedFile]:
     """
     Get the files that changed in the associated module.
@@ -266,7 +418,8 @@ def _get_module_changed_files(
     :param module_repo: The repo that contains the source code for the associated module.
     :param cur_module: The module version associated with the version being analyzed.
     :param prev_module: The module associated with the parent of the current version.
-    :param module_file_regex: Regex pattern to match any files found in the diff against.
+    :param module_file_classifier: Classifier of the module files that should be mapped.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
     :return: Set of changed files from the diff between the two module versions
      that match the given pattern.
     """
@@ -275,11 +428,13 @@ def _get_module_changed_files(
 
     if cur_module.revision != prev_module.revision:
         try:
-            module_diff = _get_diff(module_repo, cur_module.revision, prev_module.revision)
+            module_changed_paths = _get_changed_files(
+                module_repo, cur_module.revision, prev_module.revision, changed_files_index
+            )
         except ValueError:
             LOGGER.warning("Unexpected exception", exc_info=True)
             return set()
-        return _get_filtered_files(module_diff, module_file_regex, cur_module.repo)
+        return _get_filtered_files(module_changed_paths, module_file_classifier, cur_module.repo)
 
     return set()
 
@@ -296,23 +451,32 @@ def _get_associated_module(version: Version, module_name: str) -> ManifestModule
     return modules.get(module_name)
 
 
-def _get_diff(repo: Repo, cur_revision: str, prev_revision: str) -> DiffIndex:
+def _get_changed_files(
+    repo: Repo,
+    cur_revision: str,
+    prev_revision: str,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+) -> Set[str]:
     """
-    Create a diff between two revisions.
+    Get the files changed between two revisions.
 
     :param repo: The repo that contains the two given revisions.
     :param cur_revision: The child revision.
     :param prev_revision: The parent revision.
-    :return: The diff between the two given revisions.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :return: The files changed between the two given revisions.
     """
-    cur_commit = repo.commit(cur_revision)
-    parent = repo.commit(prev_revision)
-
-    return cur_commit.diff(parent)
+    return changed_files_between_revisions(
+        repo, cur_revision, prev_revision, LOGGER, changed_files_index
+    )
 
 
 def _map_tasks_to_files(
-    changed_files: Set[ChangedFile], flipped_tasks: Dict, task_mappings: Dict
+    changed_files: Set[ChangedFile],
+    flipped_tasks: Dict,
+    task_mappings: Dict,
+    weight: Union[int, float] = 1,
+    bucket: Optional[str] = None,
 ) -> None:
     """
     Map the flipped tasks to the changed files found in this version. Mapping will be done in \
@@ -323,19 +487,33 @@ def _map_tasks_to_files(
      that changed in that variant as the value.
     :param task_mappings: Where the mappings will be stored. New mappings will be added to this
      dictionary in place.
+    :param weight: The amount each count of this version should be increased by.
+    :param bucket: The month of this version, the counts are not split by month if not given.
     """
     for file_name in changed_files:
         task_mappings_for_file = task_mappings.setdefault(
             file_name, {TASK_BUILDS_KEY: {}, SEEN_COUNT_KEY: 0}
         )
-        task_mappings_for_file[SEEN_COUNT_KEY] = task_mappings_for_file[SEEN_COUNT_KEY] + 1
+        task_mappings_for_file[SEEN_COUNT_KEY] = task_mappings_for_file[SEEN_COUNT_KEY] + weight
+        if bucket is not None:
+            monthly_counts = task_mappings_for_file.setdefault(MONTHLY_COUNTS_KEY, {})
+            monthly_counts[bucket] = monthly_counts.get(bucket, 0) + weight
         if len(flipped_tasks) > 0:
             build_mappings = task_mappings_for_file[TASK_BUILDS_KEY]
             for build_name, cur_tasks in flipped_tasks.items():
-                builds_to_task_mappings: Dict[str, int] = build_mappings.setdefault(build_name, {})
+                builds_to_task_mappings: Dict[str, Union[int, float]] = build_mappings.setdefault(
+                    build_name, {}
+                )
                 for cur_task in cur_tasks:
                     cur_flips_for_task = builds_to_task_mappings.setdefault(cur_task, 0)
-                    builds_to_task_mappings[cur_task] = cur_flips_for_task + 1
+                    builds_to_task_mappings[cur_task] = cur_flips_for_task + weight
+                    if bucket is not None:
+                        monthly_flips = (
+                            task_mappings_for_file.setdefault(TASK_MONTHLY_BUILDS_KEY, {})
+                            .setdefault(build_name, {})
+                            .setdefault(cur_task, {})
+                        )
+                        monthly_flips[bucket] = monthly_flips.get(bucket, 0) + weight
 
 
 def _filter_non_matching_distros(builds: List[Build], build_regex: Pattern) -> List[Build]:
@@ -357,6 +535,7 @@ def _process_evg_version(
     next_version: Version,
     build_regex: Pattern,
     changed_files: Set[ChangedFile],
+    evergreen_project: str,
 ) -> Tuple[Set[ChangedFile], Dict]:
     """
     Find flipped tasks for this evergreen version.
@@ -368,9 +547,11 @@ def _process_evg_version(
     :param next_version: Next evergreen version.
     :param build_regex: Regex of builds to look at.
     :param changed_files: Set of files that have changed.
+    :param evergreen_project: The evergreen project the version belongs to.
     :return: Tuple with changed files and flipped tasks.
     """
-    flipped_tasks = _get_flipped_tasks(prev_version, version, next_version, build_regex)
+    with timed_phase(TASK_MAPPINGS, evergreen_project, FLIP_DETECTION_PHASE):
+        flipped_tasks = _get_flipped_tasks(prev_version, version, next_version, build_regex)
     return changed_files, flipped_tasks
 
 
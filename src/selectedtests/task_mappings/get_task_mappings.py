@@ -1,12 +1,23 @@
 """Script to get task mappings."""
 from decimal import Decimal
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from pymongo.collection import Collection
 
+from selectedtests.count_buckets import (
+    MONTHLY_COUNTS_KEY,
+    get_oldest_bucket,
+    windowed_children_stage,
+    windowed_parent_stages,
+)
+
 
 def get_correlated_task_mappings(
-    collection: Collection, changed_source_files: List[str], project: str, threshold: Decimal
+    collection: Collection,
+    changed_source_files: List[str],
+    project: str,
+    threshold: Decimal,
+    lookback_months: Optional[int] = None,
 ) -> List[dict]:
     """
     Retrieve task mappings associated with a given evergreen project and list of source files.
@@ -15,43 +26,56 @@ def get_correlated_task_mappings(
     :param collection: Collection to act on.
     :param changed_source_files: List of source files for which task mappings should be retrieved.
     :param threshold: Min threshold desired for flip_count/source_file_seen_count ratio.
+    :param lookback_months: Only count the changes seen in this many most recent months, including
+     the current one. All changes are counted if not given.
     :return: A list of task mappings for the changed files.
     """
-    return list(
-        collection.aggregate(
-            [
-                {"$match": {"project": project, "source_file": {"$in": changed_source_files}}},
-                {
-                    "$lookup": {
-                        "from": f"{collection.name}_tasks",
-                        "localField": "_id",
-                        "foreignField": "task_mapping_id",
-                        "as": "tasks",
-                    }
-                },
-                # filter out the array elements below threshold.
-                {
-                    "$addFields": {
-                        "tasks": {
-                            "$filter": {
-                                "input": "$tasks",
-                                "as": "task",
-                                "cond": {
-                                    "$gte": [
-                                        {
-                                            "$divide": [
-                                                "$$task.flip_count",
-                                                "$source_file_seen_count",
-                                            ]
-                                        },
-                                        float(threshold),
-                                    ]
-                                },
-                            }
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": {"project": project, "source_file": {"$in": changed_source_files}}}
+    ]
+    if lookback_months is not None:
+        oldest_bucket = get_oldest_bucket(lookback_months)
+        pipeline.extend(windowed_parent_stages("source_file_seen_count", oldest_bucket))
+    pipeline.append(
+        {
+            "$lookup": {
+                "from": f"{collection.name}_tasks",
+                "localField": "_id",
+                "foreignField": "task_mapping_id",
+                "as": "tasks",
+            }
+        }
+    )
+    if lookback_months is not None:
+        pipeline.append(windowed_children_stage("tasks", "flip_count", oldest_bucket))
+    pipeline.extend(
+        [
+            # filter out the array elements below threshold.
+            {
+                "$addFields": {
+                    "tasks": {
+                        "$filter": {
+                            "input": "$tasks",
+                            "as": "task",
+                            "cond": {
+                                "$gte": [
+                                    {"$divide": ["$$task.flip_count", "$source_file_seen_count"]},
+                                    float(threshold),
+                                ]
+                            },
                         }
                     }
-                },
-                {"$project": {"_id": False, "tasks._id": False, "tasks.task_mapping_id": False}},
-            ]
-        )
+                }
+            },
+            {
+                "$project": {
+                    "_id": False,
+                    MONTHLY_COUNTS_KEY: False,
+                    "tasks._id": False,
+                    "tasks.task_mapping_id": False,
+                    f"tasks.{MONTHLY_COUNTS_KEY}": False,
+                }
+            },
+        ]
     )
+    return list(collection.aggregate(pipeline))
@@ -0,0 +1,47 @@
+"""SharedVersions class used to walk the versions of an evergreen project more than once."""
+from __future__ import annotations
+
+from typing import Iterator, List
+
+from evergreen.api import EvergreenApi, Version
+
+
+class SharedVersions(object):
+    """
+    Versions of an evergreen project listed once for the analyses that walk them in turn.
+
+    The versions are listed most recent first, as the API does, and only as far back as a walk has
+    reached, so a walk that goes no further than the previous ones makes no requests.
+    """
+
+    def __init__(self, versions: Iterator[Version]):
+        """
+        Create a SharedVersions.
+
+        :param versions: Iterator of the versions listed from the API, most recent first.
+        """
+        self._versions = versions
+        self._listed: List[Version] = []
+
+    @classmethod
+    def of_project(cls, evg_api: EvergreenApi, evergreen_project: str) -> SharedVersions:
+        """
+        Share the versions of an evergreen project.
+
+        :param evg_api: An instance of the evg_api client.
+        :param evergreen_project: The name of the evergreen project.
+        :return: An instance of SharedVersions.
+        """
+        return cls(evg_api.versions_by_project(evergreen_project))
+
+    def __iter__(self) -> Iterator[Version]:
+        """Walk the versions from the most recent, listing the ones not reached before."""
+        index = 0
+        while True:
+            if index == len(self._listed):
+                version = next(self._versions, None)
+                if version is None:
+                    return
+                self._listed.append(version)
+            yield self._listed[index]
+            index += 1
@@ -3,6 +3,8 @@ import json
 import os.path
 
 from datetime import datetime
+from decimal import Decimal
+from typing import Optional
 
 import click
 import structlog
@@ -10,9 +12,22 @@ import structlog
 from click import Context
 from miscutils.logging_config import Verbosity
 
+from selectedtests.app.parsers import parse_changed_files
+from selectedtests.changed_files_index import open_changed_files_index
 from selectedtests.config.logging_config import config_logging
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode
 from selectedtests.helpers import get_evg_api
+from selectedtests.mapping_snapshot import MappingSnapshot
+from selectedtests.mappings_output import (
+    Compression,
+    OutputFormat,
+    check_compression_available,
+    write_mappings,
+)
+from selectedtests.metrics import export_metrics_on_close
+from selectedtests.profiling import profile_until_close
 from selectedtests.task_mappings.create_task_mappings import generate_task_mappings
 from selectedtests.task_mappings.update_task_mappings import update_task_mappings_since_last_commit
 from selectedtests.task_mappings.version_limit import VersionLimit
@@ -31,14 +46,48 @@ CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
     type=click.Choice(["text", "json"]),
     help="Format to write logs with.",
 )
+@click.option(
+    "--metrics-textfile",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_METRICS_TEXTFILE"),
+    help="Path of a file to write Prometheus metrics to when the command is done.",
+)
+@click.option(
+    "--metrics-pushgateway",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_METRICS_PUSHGATEWAY"),
+    help="Address of a Prometheus Pushgateway to push metrics to when the command is done.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Profile the calls and allocations of the command.",
+)
+@click.option(
+    "--profile-output",
+    type=str,
+    default="profiles",
+    help="Directory to write the profiles of each run to, with --profile.",
+)
 @click.pass_context
-def cli(ctx: Context, verbose: bool, log_format: str) -> None:
+def cli(
+    ctx: Context,
+    verbose: bool,
+    log_format: str,
+    metrics_textfile: Optional[str],
+    metrics_pushgateway: Optional[str],
+    profile: bool,
+    profile_output: str,
+) -> None:
     """Suite of task mapping related commands, see the commands help for more details."""
     ctx.ensure_object(dict)
     ctx.obj["evg_api"] = get_evg_api()
 
     verbosity = Verbosity.DEBUG if verbose else Verbosity.INFO
     config_logging(verbosity, human_readable=log_format == "text")
+    export_metrics_on_close(ctx, "task-mappings", metrics_textfile, metrics_pushgateway)
+    profile_until_close(ctx, "task-mappings", profile, profile_output)
 
 
 @cli.command()
@@ -79,6 +128,42 @@ def cli(ctx: Context, verbose: bool, log_format: str) -> None:
     type=str,
     help="Path to a file where the task mappings should be written to. Example: 'output.txt'",
 )
+@click.option(
+    "--clone-mode",
+    type=click.Choice([mode.value for mode in CloneMode]),
+    default=CloneMode.FULL.value,
+    help="How much of the git repos to clone. 'blobless' and 'shallow' only fetch the history.",
+)
+@click.option(
+    "--changed-files-index",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_CHANGED_FILES_INDEX"),
+    help="Path to a file caching the files changed by each commit analyzed across runs.",
+)
+@click.option(
+    "--max-changed-files",
+    type=int,
+    help="Skip changes that touch more than this many mapped files.",
+)
+@click.option(
+    "--weight-large-changes",
+    is_flag=True,
+    default=False,
+    help="Downweight changes above --max-changed-files rather than skipping them.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice([output_format.value for output_format in OutputFormat]),
+    default=OutputFormat.JSON.value,
+    help="Format to write the mappings in. 'jsonl' streams one mapping per line.",
+)
+@click.option(
+    "--compression",
+    type=click.Choice([compression.value for compression in Compression]),
+    default=Compression.NONE.value,
+    help="How to compress the written mappings.",
+)
 def create(
     ctx: Context,
     evergreen_project: str,
@@ -88,6 +173,12 @@ def create(
     module_source_file_regex: str,
     build_variant_regex: str,
     output_file: str,
+    clone_mode: str,
+    changed_files_index: str,
+    max_changed_files: int,
+    weight_large_changes: bool,
+    output_format: str,
+    compression: str,
 ) -> None:
     """Create the task mappings for a given evergreen project."""
     evg_api = ctx.obj["evg_api"]
@@ -105,23 +196,27 @@ def create(
                 "A module source file regex is required when a module is being analyzed"
             )
 
+    try:
+        check_compression_available(Compression(compression))
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
     LOGGER.info(f"Creating task mappings for {evergreen_project}")
-    mappings, _ = generate_task_mappings(
-        evg_api,
-        evergreen_project,
-        VersionLimit(stop_at_date=after_date),
-        source_file_regex,
-        module_name,
-        module_source_file_regex,
-        build_variant_regex,
-    )
-    json_dump = json.dumps(mappings, indent=4)
-
-    if output_file:
-        with open(output_file, "a") as f:
-            f.write(json_dump)
-    else:
-        print(json_dump)
+    with open_changed_files_index(changed_files_index) as index:
+        mappings, _ = generate_task_mappings(
+            evg_api,
+            evergreen_project,
+            VersionLimit(stop_at_date=after_date),
+            source_file_regex,
+            module_name,
+            module_source_file_regex,
+            build_variant_regex,
+            CloneMode(clone_mode),
+            index,
+            FanOutLimit(max_changed_files, weight_large_changes),
+            stream=OutputFormat(output_format) == OutputFormat.JSONL,
+        )
+    write_mappings(mappings, OutputFormat(output_format), output_file, Compression(compression))
 
     LOGGER.info("Finished processing task mappings")
 
@@ -133,10 +228,59 @@ def create(
     default=lambda: os.environ.get("SELECTED_TESTS_MONGO_URI"),
     help="Mongo URI to connect to.",
 )
+@click.option(
+    "--clone-mode",
+    type=click.Choice([mode.value for mode in CloneMode]),
+    default=CloneMode.FULL.value,
+    help="How much of the git repos to clone. 'blobless' and 'shallow' only fetch the history.",
+)
+@click.option(
+    "--changed-files-index",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_CHANGED_FILES_INDEX"),
+    help="Path to a file caching the files changed by each commit analyzed across runs.",
+)
 @click.pass_context
-def update(ctx: Context, mongo_uri: str) -> None:
+def update(ctx: Context, mongo_uri: str, clone_mode: str, changed_files_index: str) -> None:
     """Process task mappings since they were last processed."""
-    update_task_mappings_since_last_commit(ctx.obj["evg_api"], MongoWrapper.connect(mongo_uri))
+    with open_changed_files_index(changed_files_index) as index:
+        update_task_mappings_since_last_commit(
+            ctx.obj["evg_api"], MongoWrapper.connect(mongo_uri), CloneMode(clone_mode), index
+        )
+
+
+@cli.command()
+@click.argument("snapshot_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--changed-files",
+    type=str,
+    required=True,
+    help="Comma separated list of the source files to get the task mappings of.",
+)
+@click.option(
+    "--threshold",
+    type=float,
+    default=0,
+    help="Minimum threshold desired for the flip_count / source_file_seen_count ratio.",
+)
+def query_snapshot(snapshot_file: str, changed_files: str, threshold: float) -> None:
+    """
+    Print the task mappings of the changed files from a snapshot written by init-mongo.
+    \f
+    :param snapshot_file: The snapshot to query.
+    :param changed_files: Comma separated list of the source files to get the task mappings of.
+    :param threshold: Minimum threshold desired for the ratio of the counts.
+    """
+    try:
+        snapshot = MappingSnapshot.open(snapshot_file)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+    with snapshot:
+        task_mappings = snapshot.get_correlated_task_mappings(
+            parse_changed_files(changed_files), Decimal(str(threshold))
+        )
+    click.echo(json.dumps({"task_mappings": task_mappings}))
 
 
 def main() -> None:
@@ -1,113 +1,181 @@
 """Methods to update task mappings for a project."""
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import structlog
 
+from boltons.iterutils import chunked_iter
 from evergreen.api import EvergreenApi
-from pymongo import ReturnDocument, UpdateOne
+from pymongo import UpdateOne
 from pymongo.errors import BulkWriteError
 
+from selectedtests.changed_files_index import ChangedFilesIndex
+from selectedtests.count_buckets import MONTHLY_COUNTS_KEY, get_bucket, monthly_increment
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
-from selectedtests.helpers import create_query
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode, RepoClones
+from selectedtests.helpers import create_mapping_id, create_query
+from selectedtests.metrics import DOCUMENTS_WRITTEN, TASK_MAPPINGS, WRITE_PHASE, timed_phase
 from selectedtests.project_config import ProjectConfig
 from selectedtests.task_mappings.create_task_mappings import generate_task_mappings
 from selectedtests.task_mappings.version_limit import VersionLimit
 
 LOGGER = structlog.get_logger()
 
+DEFAULT_BATCH_SIZE = 1000
+
 
 def update_task_mappings_tasks(
-    tasks: List[Dict[str, Any]], task_mapping_id: Dict[str, Any], mongo: MongoWrapper
+    tasks: List[Dict[str, Any]], mongo: MongoWrapper, bucket: Optional[str] = None
 ) -> None:
     """
     Update task in the task mappings tasks collection.
 
-    :param tasks: A list of tasks.
-    :param task_mapping_id: The containing task_mapping identifier.
+    :param tasks: A list of tasks, each with the id of its task mapping.
     :param mongo: An instance of MongoWrapper.
+    :param bucket: The monthly bucket the counts of tasks not split by month are added to, the
+     current month if not given.
     """
+    if bucket is None:
+        bucket = get_bucket()
     operations = []
     for task in tasks:
-        query = create_query(task, mutable=["flip_count"])
-        query = dict(**query, **task_mapping_id)
+        query = create_query(task, mutable=["flip_count", MONTHLY_COUNTS_KEY])
 
         update_test_file = UpdateOne(
-            query, {"$inc": {"flip_count": task["flip_count"]}}, upsert=True
+            query,
+            {"$inc": monthly_increment(task, "flip_count", bucket)},
+            upsert=True,
         )
         operations.append(update_test_file)
 
     try:
-        result = mongo.task_mappings_tasks().bulk_write(operations)
-        LOGGER.debug("bulk_write", result=result.bulk_api_result, parent=task_mapping_id)
+        result = mongo.task_mappings_tasks().bulk_write(operations, ordered=False)
+        LOGGER.debug("bulk_write task_mappings_tasks", result=result.bulk_api_result)
     except BulkWriteError as bwe:
         # bulk write error default message is not always that helpful, so dump the details here.
-        LOGGER.exception(
-            "bulk_write error", parent=task_mapping_id, operations=operations, details=bwe.details
-        )
+        LOGGER.exception("bulk_write error", operations=operations, details=bwe.details)
         raise
 
 
-def update_task_mappings(mappings: List[Dict], mongo: MongoWrapper) -> None:
+def update_task_mappings(
+    mappings: Iterable[Dict], mongo: MongoWrapper, batch_size: int = DEFAULT_BATCH_SIZE
+) -> None:
     """
     Update task mappings in the task mappings collection.
 
-    :param mappings: A list of test mappings.
+    The ids of the task mappings are derived from their project, repo, branch and source file, so
+    the task mappings and their tasks are written in a bulk write per batch without reading back
+    the ids of the task mappings.
+
+    :param mappings: The task mappings.
     :param mongo: An instance of MongoWrapper.
+    :param batch_size: The number of task mappings written in each batch.
     """
-    for mapping in mappings:
-        source_file_seen_count = mapping["source_file_seen_count"]
-
-        query = create_query(mapping, joined=["tasks"], mutable=["source_file_seen_count"])
-
-        task_mapping = mongo.task_mappings().find_one_and_update(
-            query,
-            {"$inc": {"source_file_seen_count": source_file_seen_count}},
-            projection={"_id": 1},
-            upsert=True,
-            return_document=ReturnDocument.AFTER,
-        )
-        LOGGER.debug(
-            "update_one task_mappings",
-            task_mapping=task_mapping,
-            query=query,
-            inc=source_file_seen_count,
-        )
-
-        tasks = mapping.get("tasks", [])
-        if tasks:
-            task_mapping_id = {"task_mapping_id": task_mapping["_id"]}
-            update_task_mappings_tasks(tasks, task_mapping_id, mongo)
-
+    # The counts are added to the months of the versions they come from. Only the counts of task
+    # mappings not split by month go in the current month.
+    bucket = get_bucket()
+    for batch in chunked_iter(mappings, batch_size):
+        project = batch[0]["project"]
+        with timed_phase(TASK_MAPPINGS, project, WRITE_PHASE):
+            operations = []
+            tasks: List[Dict[str, Any]] = []
+            for mapping in batch:
+                query = create_query(
+                    mapping,
+                    joined=["tasks"],
+                    mutable=["source_file_seen_count", MONTHLY_COUNTS_KEY],
+                )
+                task_mapping_id = create_mapping_id(query)
+                operations.append(
+                    UpdateOne(
+                        {"_id": task_mapping_id},
+                        {
+                            "$inc": monthly_increment(mapping, "source_file_seen_count", bucket),
+                            "$setOnInsert": query,
+                        },
+                        upsert=True,
+                    )
+                )
+                tasks.extend(
+                    dict(**task, task_mapping_id=task_mapping_id)
+                    for task in mapping.get("tasks", [])
+                )
+
+            try:
+                result = mongo.task_mappings().bulk_write(operations, ordered=False)
+                LOGGER.debug("bulk_write task_mappings", result=result.bulk_api_result)
+            except BulkWriteError as bwe:
+                LOGGER.exception("bulk_write error", operations=operations, details=bwe.details)
+                raise
+
+            if tasks:
+                update_task_mappings_tasks(tasks, mongo, bucket)
+        DOCUMENTS_WRITTEN.labels(TASK_MAPPINGS, project).inc(len(operations))
+        DOCUMENTS_WRITTEN.labels("task_mappings_tasks", project).inc(len(tasks))
+
+
+def generate_task_mappings_since_last_version(
+    evg_api: EvergreenApi,
+    project_config: Dict[str, Any],
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    clones: Optional[RepoClones] = None,
+) -> Tuple[Iterable[Dict], Optional[str]]:
+    """
+    Generate the task mappings of the versions of a project created since it was last analyzed.
 
-def update_task_mappings_since_last_commit(evg_api: EvergreenApi, mongo: MongoWrapper) -> None:
+    :param evg_api: An instance of the evg_api client
+    :param project_config: The project config document of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :return: The task mappings and the most recent version analyzed.
+    """
+    task_config = project_config["task_config"]
+    return generate_task_mappings(
+        evg_api,
+        project_config["project"],
+        VersionLimit(stop_at_version_id=task_config["most_recent_version_analyzed"]),
+        task_config["source_file_regex"],
+        module_name=task_config["module"],
+        module_source_file_pattern=task_config["module_source_file_regex"],
+        build_variant_pattern=task_config["build_variant_regex"],
+        clone_mode=clone_mode,
+        changed_files_index=changed_files_index,
+        fan_out_limit=FanOutLimit.from_json(task_config),
+        clones=clones,
+    )
+
+
+def update_task_mappings_since_last_commit(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+) -> None:
     """
     Update task mappings that are being tracked in the task mappings project config collection.
 
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
     """
     LOGGER.info("Updating task mappings")
     project_cursor = mongo.project_config().find({})
     for project_config in project_cursor:
         LOGGER.info("Updating task mappings for project", project_config=project_config)
-        task_config = project_config["task_config"]
-
-        mappings, most_recent_version_analyzed = generate_task_mappings(
-            evg_api,
-            project_config["project"],
-            VersionLimit(stop_at_version_id=task_config["most_recent_version_analyzed"]),
-            task_config["source_file_regex"],
-            module_name=task_config["module"],
-            module_source_file_pattern=task_config["module_source_file_regex"],
-            build_variant_pattern=task_config["build_variant_regex"],
+        mappings, most_recent_version_analyzed = generate_task_mappings_since_last_version(
+            evg_api, project_config, clone_mode, changed_files_index
         )
 
-        project_config = ProjectConfig.get(mongo.project_config(), project_config["project"])
-        project_config.task_config.update_most_recent_version_analyzed(most_recent_version_analyzed)
-        project_config.save(mongo.project_config())
-
         if mappings:
             update_task_mappings(mappings, mongo)
         else:
             LOGGER.info("No task mappings generated")
+
+        # Saving the config advances its generation, so only once the mappings are written.
+        project_config = ProjectConfig.get(mongo.project_config(), project_config["project"])
+        project_config.task_config.update_most_recent_version_analyzed(most_recent_version_analyzed)
+        project_config.save(mongo.project_config())
     LOGGER.info("Finished task mapping updating")
@@ -9,20 +9,26 @@ class VersionLimit(object):
     """Represents the point in time at which to start analyzing versions of an evergreen project."""
 
     def __init__(
-        self, stop_at_date: Optional[datetime] = None, stop_at_version_id: Optional[str] = None
+        self,
+        stop_at_date: Optional[datetime] = None,
+        stop_at_version_id: Optional[str] = None,
+        until_date: Optional[datetime] = None,
     ):
         """
         Create a VersionLimit object.
 
         :param stop_at_date: The date at which to start analyzing versions of the repo.
         :param stop_at_version_id: The id of the version at which to start analyzing versions.
+        :param until_date: The date after which versions are not analyzed, none are skipped if not
+         given.
         """
         self.stop_at_date = stop_at_date
         self.stop_at_version_id = stop_at_version_id
+        self.until_date = until_date
 
     def __repr__(self) -> str:
         """Return the object representation of VersionLimit."""
-        return f"VersionLimit({self.stop_at_date}, {self.stop_at_version_id})"
+        return f"VersionLimit({self.stop_at_date}, {self.stop_at_version_id}, {self.until_date})"
 
     def check_version_before_limit(self, version: Version) -> bool:
         """
@@ -38,3 +44,12 @@ class VersionLimit(object):
             if version.version_id == self.stop_at_version_id:
                 return True
         return False
+
+    def check_version_after_until_date(self, version: Version) -> bool:
+        """
+        Check whether a version comes after the until_date, so it should not be analyzed.
+
+        :param version: The version to compare against.
+        :return: Whether or not the version comes after the until_date.
+        """
+        return self.until_date is not None and version.create_time >= self.until_date
@@ -9,20 +9,26 @@ class CommitLimit(object):
     """Represents the point in time at which to start analyzing commits of an evergreen project."""
 
     def __init__(
-        self, stop_at_date: Optional[datetime] = None, stop_at_commit_sha: Optional[str] = None
+        self,
+        stop_at_date: Optional[datetime] = None,
+        stop_at_commit_sha: Optional[str] = None,
+        until_date: Optional[datetime] = None,
     ):
         """
         Create a CommitLimit object.
 
         :param stop_at_date: The date at which to start analyzing commits of the repo.
         :param stop_at_commit_sha: The commit at which to start analyzing commits of the repo.
+        :param until_date: The date after which commits are not analyzed, none are skipped if not
+         given.
         """
         self.stop_at_date = stop_at_date
         self.stop_at_commit_sha = stop_at_commit_sha
+        self.until_date = until_date
 
     def __repr__(self) -> str:
         """Return the object representation of CommitLimit."""
-        return f"CommitLimit({self.stop_at_date}, {self.stop_at_commit_sha})"
+        return f"CommitLimit({self.stop_at_date}, {self.stop_at_commit_sha}, {self.until_date})"
 
     def check_commit_before_limit(self, commit: Commit) -> bool:
         """
@@ -38,3 +44,12 @@ class CommitLimit(object):
             if commit.hexsha == self.stop_at_commit_sha:
                 return True
         return False
+
+    def check_commit_after_until_date(self, commit: Commit) -> bool:
+        """
+        Check whether a commit comes after the until_date, so it should not be analyzed.
+
+        :param commit: The commit to compare against.
+        :return: Whether or not the commit comes after the until_date.
+        """
+        return self.until_date is not None and commit.committed_datetime >= self.until_date
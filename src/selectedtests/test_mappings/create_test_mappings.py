@@ -1,20 +1,45 @@
 """Test Mappings class to create test mappings."""
 from __future__ import annotations
 
-import os.path
+import itertools
 import re
 
 from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor as Executor
 from tempfile import TemporaryDirectory
-from typing import Dict, List, Pattern, Tuple
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
 
 import structlog
 
 from evergreen.api import EvergreenApi
 from git import Repo
 
+from selectedtests.changed_files_index import ChangedFilesIndex
+from selectedtests.config.logging_config import is_debug_enabled
+from selectedtests.count_buckets import MONTHLY_COUNTS_KEY, get_bucket
 from selectedtests.evergreen_helper import get_evg_module_for_project, get_evg_project
-from selectedtests.git_helper import init_repo, modified_files_for_commit
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import (
+    CloneMode,
+    RepoClones,
+    get_shallow_since,
+    init_repo,
+    modified_files_for_commit,
+)
+from selectedtests.metrics import (
+    CLONE_PHASE,
+    DIFF_PHASE,
+    ITEMS_PROCESSED,
+    PHASE_SECONDS,
+    TEST_MAPPINGS,
+    TRANSFORM_PHASE,
+    WALK_PHASE,
+    ThroughputLogger,
+    timed_iter,
+    timed_phase,
+)
+from selectedtests.path_classifier import SOURCE_FILE, TEST_FILE, PathClassifier
 from selectedtests.test_mappings.commit_limit import CommitLimit
 
 LOGGER = structlog.get_logger(__name__)
@@ -24,7 +49,9 @@ TestMappingsResult = namedtuple(
         "test_mappings_list",
         "most_recent_project_commit_analyzed",
         "most_recent_module_commit_analyzed",
+        "commits_skipped",
     ],
+    defaults=[0],
 )
 
 
@@ -38,6 +65,11 @@ def generate_test_mappings(
     module_commit_limit: CommitLimit = None,
     module_source_file_pattern: str = None,
     module_test_file_pattern: str = None,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    stream: bool = False,
+    clones: Optional[RepoClones] = None,
 ) -> TestMappingsResult:
     """
     Generate test mappings for an evergreen project and its associated module if module is provided.
@@ -51,6 +83,12 @@ def generate_test_mappings(
     :param module_commit_limit: The point at which to start analyzing commits of the module.
     :param module_source_file_pattern: Pattern to match changed module source files against.
     :param module_test_file_pattern: Pattern to match changed module test files against.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param stream: Whether test_mappings_list should be an iterator generating the test mappings
+     as they are consumed rather than a list.
+    :param clones: How the project and module repos are cloned, from github if not given.
     :return: An instance of TestMappingsResult.
     """
     LOGGER.info(
@@ -62,29 +100,72 @@ def generate_test_mappings(
     source_re = re.compile(source_file_pattern)
     test_re = re.compile(test_file_pattern)
     most_recent_module_commit = None
-    with TemporaryDirectory() as temp_dir:
-        test_mappings_list, most_recent_project_commit = generate_project_test_mappings(
-            evg_api, evergreen_project, temp_dir, source_re, test_re, project_commit_limit
+    # The project and module repos are independent until their mappings are joined, so clone and
+    # mine them at the same time. Most of the work happens in git subprocesses.
+    throughput = ThroughputLogger(TEST_MAPPINGS, evergreen_project, "commits")
+    with throughput, TemporaryDirectory() as temp_dir, Executor(max_workers=2) as exe:
+        project_job = exe.submit(
+            generate_project_test_mappings,
+            evg_api,
+            evergreen_project,
+            temp_dir,
+            source_re,
+            test_re,
+            project_commit_limit,
+            clone_mode,
+            changed_files_index,
+            fan_out_limit,
+            stream,
+            clones,
         )
 
+        module_job = None
         if module_name and module_source_file_pattern and module_test_file_pattern:
             module_source_re = re.compile(module_source_file_pattern)
             module_test_re = re.compile(module_test_file_pattern)
-            module_test_mappings_list, most_recent_module_commit = generate_module_test_mappings(
+            module_job = exe.submit(
+                generate_module_test_mappings,
                 evg_api,
                 evergreen_project,
                 module_name,
                 temp_dir,
                 module_source_re,
                 module_test_re,
-                module_commit_limit,  # type: ignore
+                module_commit_limit,
+                clone_mode,
+                changed_files_index,
+                fan_out_limit,
+                stream,
+                clones,
             )
-            test_mappings_list.extend(module_test_mappings_list)
-    LOGGER.info("Generated test mappings list", test_mappings_length=len(test_mappings_list))
+
+        project_test_mappings, most_recent_project_commit, commits_skipped = project_job.result()
+        module_test_mappings: Iterable[Dict] = []
+        if module_job is not None:
+            (
+                module_test_mappings,
+                most_recent_module_commit,
+                module_commits_skipped,
+            ) = module_job.result()
+            commits_skipped += module_commits_skipped
+
+    test_mappings_list: Iterable[Dict] = itertools.chain(
+        project_test_mappings, module_test_mappings
+    )
+    if stream:
+        LOGGER.info("Generated test mappings", commits_skipped=commits_skipped)
+    else:
+        test_mappings_list = list(test_mappings_list)
+        LOGGER.info(
+            "Generated test mappings list",
+            test_mappings_length=len(test_mappings_list),
+            commits_skipped=commits_skipped,
+        )
     return TestMappingsResult(
         test_mappings_list=test_mappings_list,
         most_recent_project_commit_analyzed=most_recent_project_commit,
         most_recent_module_commit_analyzed=most_recent_module_commit,
+        commits_skipped=commits_skipped,
     )
 
 
@@ -95,7 +176,12 @@ def generate_project_test_mappings(
     source_re: Pattern,
     test_re: Pattern,
     commit_limit: CommitLimit,
-) -> Tuple[list, str]:
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    stream: bool = False,
+    clones: Optional[RepoClones] = None,
+) -> Tuple[Iterable[Dict], str, int]:
     """
     Generate test mappings for an evergreen project.
 
@@ -105,23 +191,63 @@ def generate_project_test_mappings(
     :param source_re: Regex pattern to match changed source files against.
     :param test_re: Regex pattern to match changed test files against.
     :param commit_limit: The point at which to start analyzing project commits's repo.
-    :return: A list of test mappings for the project and the most recent commit sha analyzed.
+    :param clone_mode: How much of the project's repo should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param stream: Whether to return an iterator generating the test mappings rather than a list.
+    :param clones: How the repo is cloned, from github if not given.
+    :return: The test mappings for the project, the most recent commit sha analyzed and the
+     number of commits skipped for changing too many files.
     """
+    start_time = perf_counter()
     evg_project = get_evg_project(evg_api, evergreen_project)
     if evg_project is None:
         raise ValueError(f"There is no evergreen project named {evergreen_project}")
-    project_repo = init_repo(
-        temp_dir, evg_project.repo_name, evg_project.branch_name, evg_project.owner_name
-    )
+    with timed_phase(TEST_MAPPINGS, evergreen_project, CLONE_PHASE):
+        project_repo = init_repo(
+            temp_dir,
+            evg_project.repo_name,
+            evg_project.branch_name,
+            evg_project.owner_name,
+            clone_mode,
+            get_shallow_since(commit_limit.stop_at_date),
+            clones,
+        )
     most_recent_project_commit_analyzed = project_repo.head.commit.hexsha
     LOGGER.info(
         "Calculated most_recent_project_commit_analyzed",
         most_recent_project_commit_analyzed=most_recent_project_commit_analyzed,
     )
     project_test_mappings = TestMappings.create_mappings(
-        project_repo, source_re, test_re, commit_limit, evergreen_project, evg_project.branch_name
+        project_repo,
+        source_re,
+        test_re,
+        commit_limit,
+        evergreen_project,
+        evg_project.repo_name,
+        evg_project.branch_name,
+        changed_files_index,
+        fan_out_limit,
+    )
+    project_mappings: Iterable[Dict]
+    if stream:
+        project_mappings = timed_iter(
+            project_test_mappings.iter_mappings(), TEST_MAPPINGS, evergreen_project, TRANSFORM_PHASE
+        )
+    else:
+        with timed_phase(TEST_MAPPINGS, evergreen_project, TRANSFORM_PHASE):
+            project_mappings = project_test_mappings.get_mappings()
+    LOGGER.info(
+        "Generated project test mappings",
+        repo=evg_project.repo_name,
+        test_mappings_length=len(project_test_mappings),
+        duration_seconds=perf_counter() - start_time,
+    )
+    return (
+        project_mappings,
+        most_recent_project_commit_analyzed,
+        project_test_mappings.commits_skipped,
     )
-    return project_test_mappings.get_mappings(), most_recent_project_commit_analyzed
 
 
 def generate_module_test_mappings(
@@ -132,7 +258,12 @@ def generate_module_test_mappings(
     module_source_re: Pattern,
     module_test_re: Pattern,
     commit_limit: CommitLimit,
-) -> Tuple[list, str]:
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    stream: bool = False,
+    clones: Optional[RepoClones] = None,
+) -> Tuple[Iterable[Dict], str, int]:
     """
     Generate test mappings for an evergreen module.
 
@@ -143,10 +274,26 @@ def generate_module_test_mappings(
     :param module_source_re: Regex pattern to match changed module source files against.
     :param module_test_re: Regex pattern to match changed module test files against.
     :param commit_limit: The point at which to start analyzing commits of the module's repo.
-    :return: A list of test mappings for the project and the most recent commit sha analyzed.
+    :param clone_mode: How much of the module's repo should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param stream: Whether to return an iterator generating the test mappings rather than a list.
+    :param clones: How the repo is cloned, from github if not given.
+    :return: The test mappings for the project, the most recent commit sha analyzed and the
+     number of commits skipped for changing too many files.
     """
+    start_time = perf_counter()
     module = get_evg_module_for_project(evg_api, evergreen_project, module_name)
-    module_repo = init_repo(temp_dir, module.repo, module.branch, module.owner)
+    with timed_phase(TEST_MAPPINGS, evergreen_project, CLONE_PHASE):
+        module_repo = init_repo(
+            temp_dir,
+            module.repo,
+            module.branch,
+            module.owner,
+            clone_mode,
+            get_shallow_since(commit_limit.stop_at_date),
+            clones,
+        )
     most_recent_module_commit_analyzed = module_repo.head.commit.hexsha
     LOGGER.info(
         "Calculated most_recent_module_commit_analyzed",
@@ -158,9 +305,30 @@ def generate_module_test_mappings(
         module_test_re,
         commit_limit,
         evergreen_project,
+        module.repo,
         module.branch,
+        changed_files_index,
+        fan_out_limit,
+    )
+    module_mappings: Iterable[Dict]
+    if stream:
+        module_mappings = timed_iter(
+            module_test_mappings.iter_mappings(), TEST_MAPPINGS, evergreen_project, TRANSFORM_PHASE
+        )
+    else:
+        with timed_phase(TEST_MAPPINGS, evergreen_project, TRANSFORM_PHASE):
+            module_mappings = module_test_mappings.get_mappings()
+    LOGGER.info(
+        "Generated module test mappings",
+        repo=module.repo,
+        test_mappings_length=len(module_test_mappings),
+        duration_seconds=perf_counter() - start_time,
+    )
+    return (
+        module_mappings,
+        most_recent_module_commit_analyzed,
+        module_test_mappings.commits_skipped,
     )
-    return module_test_mappings.get_mappings(), most_recent_module_commit_analyzed
 
 
 class TestMappings(object):
@@ -173,21 +341,26 @@ class TestMappings(object):
         project: str,
         repo_name: str,
         branch: str,
+        commits_skipped: int = 0,
     ):
         """
         Create a TestMappings object.
 
-        :param file_intersection: Map of how files intersect.
-        :param file_count_map: Map of how many times files where seen.
+        :param file_intersection: Map of the source files to how many times each test file changed
+         with them, keyed by the test file and the month of the commits.
+        :param file_count_map: Map of the source files to how many times they were seen in each
+         month.
         :param project: The name of the evergreen project to analyze.
         :param repo_name: The name of the git repo used for the evergreen project.
         :param branch: The branch of the git repo used for the evergreen project.
+        :param commits_skipped: The number of commits skipped for changing too many files.
         """
         self._file_intersection = file_intersection
         self._file_count_map = file_count_map
         self._project = project
         self._repo_name = repo_name
         self._branch = branch
+        self.commits_skipped = commits_skipped
         self._test_mappings: List[Dict] = []
 
     @classmethod
@@ -198,7 +371,10 @@ class TestMappings(object):
         test_re: Pattern,
         commit_limit: CommitLimit,
         project: str,
+        repo_name: str,
         branch: str,
+        changed_files_index: Optional[ChangedFilesIndex] = None,
+        fan_out_limit: Optional[FanOutLimit] = None,
     ) -> TestMappings:
         """
         Create the test mappings for a git repo.
@@ -208,40 +384,84 @@ class TestMappings(object):
         :param test_re: Regex pattern to match changed test files against.
         :param commit_limit: The point at which to start analyzing commits of the repo.
         :param project: The name of the evergreen project to analyze.
+        :param repo_name: The name of the git repo, as evergreen knows it. The directory the repo
+         is cloned in is not named after it when the clone is shared.
         :param branch: The branch of the git repo used for the evergreen project.
+        :param changed_files_index: Index of the files changed by previously analyzed commits.
+        :param fan_out_limit: The limit on the number of source and test files changed by the
+         commits counted.
         :return: An instance of the test mappings class
         """
         file_intersection: defaultdict = defaultdict(lambda: defaultdict(int))
-        file_count: defaultdict = defaultdict(int)
-
-        for commit in repo.iter_commits(repo.head.commit):
-            if commit_limit.check_commit_before_limit(commit):
-                break
-
-            LOGGER.debug(
-                "Investigating commit",
-                summary=commit.message.splitlines()[0],
-                ts=commit.committed_datetime,
-                id=commit.hexsha,
-            )
-
-            tests_changed = set()
-            src_changed = set()
-            for path in modified_files_for_commit(commit, LOGGER):
-                LOGGER.debug("found change", path=path)
-
-                if test_re.match(path):
-                    tests_changed.add(path)
-                elif source_re.match(path):
-                    src_changed.add(path)
-
-            for src in src_changed:
-                file_count[src] += 1
-                for test in tests_changed:
-                    file_intersection[src][test] += 1
+        file_count: defaultdict = defaultdict(lambda: defaultdict(int))
+        # Test files take precedence over source files.
+        classifier = PathClassifier([(TEST_FILE, test_re), (SOURCE_FILE, source_re)])
+        if fan_out_limit is None:
+            fan_out_limit = FanOutLimit()
+        commits_skipped = 0
+        commits_analyzed = ITEMS_PROCESSED.labels(TEST_MAPPINGS, project, "commits")
+        # Diffing is timed without a span of its own, logging or profiling every commit would
+        # cost more than diffing most of them.
+        diff_seconds = PHASE_SECONDS.labels(TEST_MAPPINGS, project, DIFF_PHASE)
+        debug = is_debug_enabled(__name__)
+
+        with timed_phase(TEST_MAPPINGS, project, WALK_PHASE):
+            for commit in repo.iter_commits(repo.head.commit):
+                if commit_limit.check_commit_before_limit(commit):
+                    break
+                if commit_limit.check_commit_after_until_date(commit):
+                    continue
+                commits_analyzed.inc()
+
+                if debug:
+                    LOGGER.debug(
+                        "Investigating commit",
+                        summary=commit.message.splitlines()[0],
+                        ts=commit.committed_datetime,
+                        id=commit.hexsha,
+                    )
+
+                start = perf_counter()
+                changed_paths = modified_files_for_commit(commit, LOGGER, changed_files_index)
+                diff_seconds.inc(perf_counter() - start)
+
+                tests_changed = set()
+                src_changed = set()
+                for path in changed_paths:
+                    if debug:
+                        LOGGER.debug("found change", path=path)
+
+                    classification = classifier.classify(path)
+                    if classification == TEST_FILE:
+                        tests_changed.add(path)
+                    elif classification == SOURCE_FILE:
+                        src_changed.add(path)
+
+                weight = fan_out_limit.weight(len(src_changed) + len(tests_changed))
+                if not weight:
+                    LOGGER.info(
+                        "Skipping commit that changed too many files",
+                        id=commit.hexsha,
+                        source_files=len(src_changed),
+                        test_files=len(tests_changed),
+                    )
+                    commits_skipped += 1
+                    continue
+
+                # The counts go in the month of the commit, not the month they are written in.
+                bucket = get_bucket(commit.committed_datetime)
+                for src in src_changed:
+                    file_count[src][bucket] += weight
+                    for test in tests_changed:
+                        file_intersection[src][(test, bucket)] += weight
+
+        return TestMappings(
+            file_intersection, file_count, project, repo_name, branch, commits_skipped
+        )
 
-        repo_name = os.path.basename(repo.working_dir)
-        return TestMappings(file_intersection, file_count, project, repo_name, branch)
+    def __len__(self) -> int:
+        """Return the number of source files with test mappings."""
+        return len(self._file_intersection)
 
     def get_mappings(self) -> List[Dict]:
         """
@@ -250,23 +470,32 @@ class TestMappings(object):
         :return: Transformed test mappings
         """
         if not self._test_mappings:
-            self._test_mappings = self._transform_mappings()
+            self._test_mappings = list(self.iter_mappings())
         return self._test_mappings
 
-    def _transform_mappings(self) -> List[Dict]:
-        test_mappings = []
+    def iter_mappings(self) -> Iterator[Dict]:
+        """
+        Generate the transformed test mappings one source file at a time.
+
+        :return: Iterator over the transformed test mappings.
+        """
         for source_file, test_file_count_dict in self._file_intersection.items():
-            test_files = [
-                {"name": test_file, "test_file_seen_count": test_file_seen_count}
-                for test_file, test_file_seen_count in test_file_count_dict.items()
-            ]
+            test_files: Dict[str, Dict] = {}
+            for (test_file, bucket), test_file_seen_count in test_file_count_dict.items():
+                test_file_entry = test_files.setdefault(
+                    test_file,
+                    {"name": test_file, "test_file_seen_count": 0, MONTHLY_COUNTS_KEY: {}},
+                )
+                test_file_entry["test_file_seen_count"] += test_file_seen_count
+                test_file_entry[MONTHLY_COUNTS_KEY][bucket] = test_file_seen_count
+            monthly_counts = self._file_count_map[source_file]
             test_mapping = {
                 "source_file": source_file,
                 "project": self._project,
                 "repo": self._repo_name,
                 "branch": self._branch,
-                "source_file_seen_count": self._file_count_map[source_file],
-                "test_files": test_files,
+                "source_file_seen_count": sum(monthly_counts.values()),
+                MONTHLY_COUNTS_KEY: dict(monthly_counts),
+                "test_files": list(test_files.values()),
             }
-            test_mappings.append(test_mapping)
-        return test_mappings
+            yield test_mapping
@@ -1,12 +1,23 @@
 """Script to get test mappings."""
 from decimal import Decimal
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from pymongo.collection import Collection
 
+from selectedtests.count_buckets import (
+    MONTHLY_COUNTS_KEY,
+    get_oldest_bucket,
+    windowed_children_stage,
+    windowed_parent_stages,
+)
+
 
 def get_correlated_test_mappings(
-    collection: Collection, changed_source_files: List[str], project: str, threshold: Decimal
+    collection: Collection,
+    changed_source_files: List[str],
+    project: str,
+    threshold: Decimal,
+    lookback_months: Optional[int] = None,
 ) -> List[dict]:
     """
     Retrieve test mappings associated with a given evergreen project and list of source files.
@@ -15,50 +26,64 @@ def get_correlated_test_mappings(
     :param changed_source_files: List of source files for which test mappings should be retrieved.
     :param project: The name of the evergreen project to analyze.
     :param threshold: Min threshold desired for test_file_seen_count/source_file_seen_count ratio.
+    :param lookback_months: Only count the changes seen in this many most recent months, including
+     the current one. All changes are counted if not given.
     :return: A list of test mappings for the changed files.
     """
-    return list(
-        collection.aggregate(
-            [
-                {"$match": {"project": project, "source_file": {"$in": changed_source_files}}},
-                {
-                    "$lookup": {
-                        "from": f"{collection.name}_test_files",
-                        "localField": "_id",
-                        "foreignField": "test_mapping_id",
-                        "as": "test_files",
-                    }
-                },
-                # filter out the array elements below threshold.
-                {
-                    "$addFields": {
-                        "test_files": {
-                            "$filter": {
-                                "input": "$test_files",
-                                "as": "test_file",
-                                "cond": {
-                                    "$gte": [
-                                        {
-                                            "$divide": [
-                                                "$$test_file.test_file_seen_count",
-                                                "$source_file_seen_count",
-                                            ]
-                                        },
-                                        float(threshold),
-                                    ]
-                                },
-                            }
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": {"project": project, "source_file": {"$in": changed_source_files}}}
+    ]
+    if lookback_months is not None:
+        oldest_bucket = get_oldest_bucket(lookback_months)
+        pipeline.extend(windowed_parent_stages("source_file_seen_count", oldest_bucket))
+    pipeline.append(
+        {
+            "$lookup": {
+                "from": f"{collection.name}_test_files",
+                "localField": "_id",
+                "foreignField": "test_mapping_id",
+                "as": "test_files",
+            }
+        }
+    )
+    if lookback_months is not None:
+        pipeline.append(
+            windowed_children_stage("test_files", "test_file_seen_count", oldest_bucket)
+        )
+    pipeline.extend(
+        [
+            # filter out the array elements below threshold.
+            {
+                "$addFields": {
+                    "test_files": {
+                        "$filter": {
+                            "input": "$test_files",
+                            "as": "test_file",
+                            "cond": {
+                                "$gte": [
+                                    {
+                                        "$divide": [
+                                            "$$test_file.test_file_seen_count",
+                                            "$source_file_seen_count",
+                                        ]
+                                    },
+                                    float(threshold),
+                                ]
+                            },
                         }
                     }
-                },
-                # clean up the output before returning.
-                {
-                    "$project": {
-                        "_id": False,
-                        "test_files._id": False,
-                        "test_files.test_mapping_id": False,
-                    }
-                },
-            ]
-        )
+                }
+            },
+            # clean up the output before returning.
+            {
+                "$project": {
+                    "_id": False,
+                    MONTHLY_COUNTS_KEY: False,
+                    "test_files._id": False,
+                    "test_files.test_mapping_id": False,
+                    f"test_files.{MONTHLY_COUNTS_KEY}": False,
+                }
+            },
+        ]
     )
+    return list(collection.aggregate(pipeline))
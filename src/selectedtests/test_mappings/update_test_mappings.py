@@ -1,122 +1,193 @@
 """Methods to update test mappings for a project."""
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional
 
 import structlog
 
+from boltons.iterutils import chunked_iter
 from evergreen.api import EvergreenApi
-from pymongo import ReturnDocument, UpdateOne
+from pymongo import UpdateOne
 from pymongo.errors import BulkWriteError
 
+from selectedtests.changed_files_index import ChangedFilesIndex
+from selectedtests.count_buckets import MONTHLY_COUNTS_KEY, get_bucket, monthly_increment
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
-from selectedtests.helpers import create_query
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode, RepoClones
+from selectedtests.helpers import create_mapping_id, create_query
+from selectedtests.metrics import DOCUMENTS_WRITTEN, TEST_MAPPINGS, WRITE_PHASE, timed_phase
 from selectedtests.project_config import ProjectConfig
 from selectedtests.test_mappings.commit_limit import CommitLimit
-from selectedtests.test_mappings.create_test_mappings import generate_test_mappings
+from selectedtests.test_mappings.create_test_mappings import (
+    TestMappingsResult,
+    generate_test_mappings,
+)
 
 LOGGER = structlog.get_logger()
 
+DEFAULT_BATCH_SIZE = 1000
+
 
 def update_test_mappings_test_files(
-    test_files: List[Dict[str, Any]], test_mapping_id: Dict[str, Any], mongo: MongoWrapper
+    test_files: List[Dict[str, Any]], mongo: MongoWrapper, bucket: Optional[str] = None
 ) -> None:
     """
     Update test_files in the test mappings test_files project config collection.
 
-    :param test_files: A list of test mappings.
-    :param test_mapping_id: The containing test_mappings identifier.
+    :param test_files: A list of test files, each with the id of its test mapping.
     :param mongo: An instance of MongoWrapper.
+    :param bucket: The monthly bucket the counts of test files not split by month are added to,
+     the current month if not given.
     """
+    if bucket is None:
+        bucket = get_bucket()
     operations = []
     for test_file in test_files:
-        query = create_query(test_file, mutable=["test_file_seen_count"])
-        query = dict(**query, **test_mapping_id)
+        query = create_query(test_file, mutable=["test_file_seen_count", MONTHLY_COUNTS_KEY])
 
         update_test_file = UpdateOne(
             query,
-            {"$inc": {"test_file_seen_count": test_file["test_file_seen_count"]}},
+            {"$inc": monthly_increment(test_file, "test_file_seen_count", bucket)},
             upsert=True,
         )
         operations.append(update_test_file)
 
     try:
-        result = mongo.test_mappings_test_files().bulk_write(operations)
-        LOGGER.debug("bulk_write", result=result.bulk_api_result, parent=test_mapping_id)
+        result = mongo.test_mappings_test_files().bulk_write(operations, ordered=False)
+        LOGGER.debug("bulk_write test_mappings_test_files", result=result.bulk_api_result)
     except BulkWriteError as bwe:
         # bulk write error default message is not always that helpful, so dump the details here.
-        LOGGER.exception(
-            "bulk_write error", parent=test_mapping_id, operations=operations, details=bwe.details
-        )
+        LOGGER.exception("bulk_write error", operations=operations, details=bwe.details)
         raise
 
 
-def update_test_mappings(test_mappings: List[Dict[str, Any]], mongo: MongoWrapper) -> None:
+def update_test_mappings(
+    test_mappings: Iterable[Dict[str, Any]],
+    mongo: MongoWrapper,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> None:
     """
     Update test mappings in the test mappings collection.
 
-    :param test_mappings: A list of test mappings.
+    The ids of the test mappings are derived from their project, repo, branch and source file, so
+    the test mappings and their test files are written in a bulk write per batch without reading
+    back the ids of the test mappings.
+
+    :param test_mappings: The test mappings.
     :param mongo: An instance of MongoWrapper.
+    :param batch_size: The number of test mappings written in each batch.
     """
-    for mapping in test_mappings:
-        source_file_seen_count = mapping["source_file_seen_count"]
-
-        query = create_query(mapping, joined=["test_files"], mutable=["source_file_seen_count"])
-
-        test_mapping = mongo.test_mappings().find_one_and_update(
-            query,
-            {"$inc": {"source_file_seen_count": source_file_seen_count}},
-            projection={"_id": 1},
-            upsert=True,
-            return_document=ReturnDocument.AFTER,
-        )
-        LOGGER.debug(
-            "update_one test_mappings",
-            test_mapping=test_mapping,
-            query=query,
-            inc=source_file_seen_count,
-        )
-
-        test_files = mapping.get("test_files", [])
-        if test_files:
-            test_mapping_id = {"test_mapping_id": test_mapping["_id"]}
-            update_test_mappings_test_files(test_files, test_mapping_id, mongo)
-
+    # The counts are added to the months of the commits they come from. Only the counts of test
+    # mappings not split by month go in the current month.
+    bucket = get_bucket()
+    for batch in chunked_iter(test_mappings, batch_size):
+        project = batch[0]["project"]
+        with timed_phase(TEST_MAPPINGS, project, WRITE_PHASE):
+            operations = []
+            test_files: List[Dict[str, Any]] = []
+            for mapping in batch:
+                query = create_query(
+                    mapping,
+                    joined=["test_files"],
+                    mutable=["source_file_seen_count", MONTHLY_COUNTS_KEY],
+                )
+                test_mapping_id = create_mapping_id(query)
+                operations.append(
+                    UpdateOne(
+                        {"_id": test_mapping_id},
+                        {
+                            "$inc": monthly_increment(mapping, "source_file_seen_count", bucket),
+                            "$setOnInsert": query,
+                        },
+                        upsert=True,
+                    )
+                )
+                test_files.extend(
+                    dict(**test_file, test_mapping_id=test_mapping_id)
+                    for test_file in mapping.get("test_files", [])
+                )
+
+            try:
+                result = mongo.test_mappings().bulk_write(operations, ordered=False)
+                LOGGER.debug("bulk_write test_mappings", result=result.bulk_api_result)
+            except BulkWriteError as bwe:
+                LOGGER.exception("bulk_write error", operations=operations, details=bwe.details)
+                raise
+
+            if test_files:
+                update_test_mappings_test_files(test_files, mongo, bucket)
+        DOCUMENTS_WRITTEN.labels(TEST_MAPPINGS, project).inc(len(operations))
+        DOCUMENTS_WRITTEN.labels("test_mappings_test_files", project).inc(len(test_files))
+
+
+def generate_test_mappings_since_last_commit(
+    evg_api: EvergreenApi,
+    project_config: Dict[str, Any],
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    clones: Optional[RepoClones] = None,
+) -> TestMappingsResult:
+    """
+    Generate the test mappings of the commits made to a project since it was last analyzed.
 
-def update_test_mappings_since_last_commit(evg_api: EvergreenApi, mongo: MongoWrapper) -> None:
+    :param evg_api: An instance of the evg_api client
+    :param project_config: The project config document of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :return: An instance of TestMappingsResult.
+    """
+    test_config = project_config["test_config"]
+    return generate_test_mappings(
+        evg_api,
+        project_config["project"],
+        CommitLimit(stop_at_commit_sha=test_config["most_recent_project_commit_analyzed"]),
+        test_config["source_file_regex"],
+        test_config["test_file_regex"],
+        module_name=test_config["module"],
+        module_commit_limit=CommitLimit(
+            stop_at_commit_sha=test_config["most_recent_module_commit_analyzed"]
+        ),
+        module_source_file_pattern=test_config["module_source_file_regex"],
+        module_test_file_pattern=test_config["module_source_file_regex"],
+        clone_mode=clone_mode,
+        changed_files_index=changed_files_index,
+        fan_out_limit=FanOutLimit.from_json(test_config),
+        clones=clones,
+    )
+
+
+def update_test_mappings_since_last_commit(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+) -> None:
     """
     Update test mappings that are being tracked in the test mappings project config collection.
 
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
     """
     LOGGER.info("Updating test mappings")
     project_cursor = mongo.project_config().find({})
     for project_config in project_cursor:
         LOGGER.info("Updating test mappings for project", project_config=project_config)
-        test_config = project_config["test_config"]
-
-        test_mappings_result = generate_test_mappings(
-            evg_api,
-            project_config["project"],
-            CommitLimit(stop_at_commit_sha=test_config["most_recent_project_commit_analyzed"]),
-            test_config["source_file_regex"],
-            test_config["test_file_regex"],
-            module_name=test_config["module"],
-            module_commit_limit=CommitLimit(
-                stop_at_commit_sha=test_config["most_recent_module_commit_analyzed"]
-            ),
-            module_source_file_pattern=test_config["module_source_file_regex"],
-            module_test_file_pattern=test_config["module_source_file_regex"],
+        test_mappings_result = generate_test_mappings_since_last_commit(
+            evg_api, project_config, clone_mode, changed_files_index
         )
 
+        if test_mappings_result.test_mappings_list:
+            update_test_mappings(test_mappings_result.test_mappings_list, mongo)
+        else:
+            LOGGER.info("No test mappings generated")
+
+        # Saving the config advances its generation, so only once the mappings are written.
         project_config = ProjectConfig.get(mongo.project_config(), project_config["project"])
         project_config.test_config.update_most_recent_commits_analyzed(
             test_mappings_result.most_recent_project_commit_analyzed,
             test_mappings_result.most_recent_module_commit_analyzed,
         )
         project_config.save(mongo.project_config())
-
-        if test_mappings_result.test_mappings_list:
-            update_test_mappings(test_mappings_result.test_mappings_list, mongo)
-        else:
-            LOGGER.info("No test mappings generated")
     LOGGER.info("Finished test mapping updating")
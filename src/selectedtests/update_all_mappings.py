@@ -0,0 +1,139 @@
+"""Methods to update the test and task mappings of a project together."""
+from concurrent.futures import ThreadPoolExecutor as Executor
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Optional
+
+import pytz
+import structlog
+
+from evergreen.api import EvergreenApi
+
+from selectedtests.changed_files_index import ChangedFilesIndex
+from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.git_helper import CloneMode, RepoClones, SharedClones, get_shallow_since
+from selectedtests.project_config import ANALYZED_AT_KEY, ProjectConfig
+from selectedtests.task_mappings.update_task_mappings import (
+    generate_task_mappings_since_last_version,
+    update_task_mappings,
+)
+from selectedtests.test_mappings.update_test_mappings import (
+    generate_test_mappings_since_last_commit,
+    update_test_mappings,
+)
+
+LOGGER = structlog.get_logger()
+
+
+def _get_shallow_since(project_config: Dict[str, Any]) -> Optional[datetime]:
+    """
+    Get the date the shared clones of a project need to reach back to in shallow mode.
+
+    The commits and versions analyzed are the ones made since the mappings of the project were
+    last generated together. Before that, the whole history may need to be analyzed.
+
+    :param project_config: The project config document of the project.
+    :return: The date to clone from or None if the history analyzed is not limited by date.
+    """
+    analyzed_at = project_config.get(ANALYZED_AT_KEY)
+    if analyzed_at is None:
+        return None
+    # MongoDB returns the dates it stores in UTC, without their timezone.
+    return get_shallow_since(analyzed_at.replace(tzinfo=pytz.UTC))
+
+
+def update_project_mappings_since_last_analyzed(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    project_config: Dict[str, Any],
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    clones: Optional[RepoClones] = None,
+) -> None:
+    """
+    Update the test and task mappings of a project since they were last analyzed.
+
+    The test mappings are mined from the commits and the task mappings from the versions at the
+    same time, over a single clone of the project and module repos. The diffs of the commits are
+    shared between them through the changed files index, which is kept in memory if not given.
+    The most recent commits and version analyzed are saved together once both are written, with
+    the time the analysis started. Shallow clones of the next update reach back to that time.
+
+    :param evg_api: An instance of the evg_api client
+    :param mongo: An instance of MongoWrapper.
+    :param project_config: The project config document of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param clones: How the shared clones are cloned, from github if not given.
+    """
+    if changed_files_index is None:
+        changed_files_index = ChangedFilesIndex({})
+
+    analyzed_at = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    with TemporaryDirectory() as clone_dir, Executor(max_workers=2) as exe:
+        shared_clones = SharedClones(
+            clone_dir, clone_mode, _get_shallow_since(project_config), clones
+        )
+        test_job = exe.submit(
+            generate_test_mappings_since_last_commit,
+            evg_api,
+            project_config,
+            clone_mode,
+            changed_files_index,
+            shared_clones,
+        )
+        task_job = exe.submit(
+            generate_task_mappings_since_last_version,
+            evg_api,
+            project_config,
+            clone_mode,
+            changed_files_index,
+            shared_clones,
+        )
+        test_mappings_result = test_job.result()
+        task_mappings, most_recent_version_analyzed = task_job.result()
+
+    if test_mappings_result.test_mappings_list:
+        update_test_mappings(test_mappings_result.test_mappings_list, mongo)
+    else:
+        LOGGER.info("No test mappings generated")
+    if task_mappings:
+        update_task_mappings(task_mappings, mongo)
+    else:
+        LOGGER.info("No task mappings generated")
+
+    # Saving the config advances its generation, so only once the mappings are written.
+    config = ProjectConfig.get(mongo.project_config(), project_config["project"])
+    config.test_config.update_most_recent_commits_analyzed(
+        test_mappings_result.most_recent_project_commit_analyzed,
+        test_mappings_result.most_recent_module_commit_analyzed,
+    )
+    if most_recent_version_analyzed is not None:
+        config.task_config.update_most_recent_version_analyzed(most_recent_version_analyzed)
+    config.update_analyzed_at(analyzed_at)
+    config.save(mongo.project_config())
+
+
+def update_all_mappings_since_last_analyzed(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    clones: Optional[RepoClones] = None,
+) -> None:
+    """
+    Update the test and task mappings of every project in the project config collection.
+
+    :param evg_api: An instance of the evg_api client
+    :param mongo: An instance of MongoWrapper.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param clones: How the repos of each project are cloned, from github if not given.
+    """
+    LOGGER.info("Updating test and task mappings")
+    for project_config in mongo.project_config().find({}):
+        LOGGER.info("Updating test and task mappings for project", project_config=project_config)
+        update_project_mappings_since_last_analyzed(
+            evg_api, mongo, project_config, clone_mode, changed_files_index, clones
+        )
+    LOGGER.info("Finished test and task mapping updating")
@@ -1,52 +1,177 @@
 """Functions for processing project task mapping work items."""
+import time
+
+from concurrent.futures import ThreadPoolExecutor as Executor
 from datetime import datetime
-from typing import Any, Iterable
+from functools import partial
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Iterable, Optional
 
+import pytz
 import structlog
 
 from evergreen.api import EvergreenApi
 from structlog.threadlocal import tmp_bind
 
+from selectedtests.changed_files_index import ChangedFilesIndex
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode, RepoClones, SharedClones, get_shallow_since
 from selectedtests.project_config import ProjectConfig
 from selectedtests.task_mappings.create_task_mappings import generate_task_mappings
+from selectedtests.task_mappings.shared_versions import SharedVersions
 from selectedtests.task_mappings.update_task_mappings import update_task_mappings
 from selectedtests.task_mappings.version_limit import VersionLimit
-from selectedtests.work_items.process_test_mapping_work_items import clear_in_progress_work
 from selectedtests.work_items.task_mapping_work_item import ProjectTaskMappingWorkItem
+from selectedtests.work_items.work_item_lease import LeaseHeartbeat, create_owner_id, lease_lost
+from selectedtests.work_items.work_item_priority import next_window
+from selectedtests.work_items.work_item_scheduler import WorkItemSource
 
 LOGGER = structlog.get_logger()
 
 
 def process_queued_task_mapping_work_items(
-    evg_api: EvergreenApi, mongo: MongoWrapper, after_date: datetime
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    after_date: datetime,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    workers: int = 1,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
 ) -> None:
     """
     Process task mapping work items that have not yet been processed.
 
+    Each worker claims a lease on the work items it processes, so several workers, on this host or
+    any other, can process the queue at the same time. The work items of workers that died are
+    processed again once their leases expire.
+
+    :param evg_api: An instance of the evg_api client
+    :param mongo: An instance of MongoWrapper.
+    :param after_date: The date at which to start analyzing commits of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param workers: The number of work items processed at the same time.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
+    """
+    with Executor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(
+                _process_task_mapping_work_items,
+                evg_api,
+                mongo,
+                after_date,
+                create_owner_id(),
+                clone_mode,
+                changed_files_index,
+                fan_out_limit,
+                clones,
+                time_budget,
+            )
+
+
+def task_mapping_work_item_source(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    get_after_date: Callable[[], datetime],
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
+) -> WorkItemSource:
+    """
+    Create the source a WorkItemScheduler processes the task mapping work items from.
+
+    :param evg_api: An instance of the evg_api client
+    :param mongo: An instance of MongoWrapper.
+    :param get_after_date: Function returning the date at which to start analyzing commits of the
+     project, called for each work item.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
+    :return: The task mapping work item source.
+    """
+
+    def process(work_item: ProjectTaskMappingWorkItem) -> None:
+        _process_one_task_mapping_work_item(
+            work_item,
+            evg_api,
+            mongo,
+            get_after_date(),
+            clone_mode,
+            changed_files_index,
+            fan_out_limit,
+            clones,
+            time_budget,
+        )
+
+    return WorkItemSource(
+        "task_mappings", mongo.task_mappings_queue, ProjectTaskMappingWorkItem.next, process
+    )
+
+
+def _process_task_mapping_work_items(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    after_date: datetime,
+    owner: str,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
+) -> None:
+    """
+    Process task mapping work items until there are none left to claim.
+
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
     :param after_date: The date at which to start analyzing commits of the project.
+    :param owner: The id of the worker claiming the work items.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
     """
-    clear_in_progress_work(mongo.task_mappings_queue())
     try:
-        for work_item in _generate_task_mapping_work_items(mongo):
-            _process_one_task_mapping_work_item(work_item, evg_api, mongo, after_date)
+        for work_item in _generate_task_mapping_work_items(mongo, owner):
+            _process_one_task_mapping_work_item(
+                work_item,
+                evg_api,
+                mongo,
+                after_date,
+                clone_mode,
+                changed_files_index,
+                fan_out_limit,
+                clones,
+                time_budget,
+            )
     except:  # noqa: E722
         LOGGER.warning("Unexpected exception processing task mapping work item", exc_info=1)
 
 
-def _generate_task_mapping_work_items(mongo: MongoWrapper) -> Iterable[ProjectTaskMappingWorkItem]:
+def _generate_task_mapping_work_items(
+    mongo: MongoWrapper, owner: Optional[str] = None
+) -> Iterable[ProjectTaskMappingWorkItem]:
     """
     Generate task mapping work items that need to be processed.
 
     :param mongo: Mongo db containing work item queue.
+    :param owner: The id of the worker claiming the work items.
     :return: Iterator over task mapping work items.
     """
-    work_item = ProjectTaskMappingWorkItem.next(mongo.task_mappings_queue())
+    work_item = ProjectTaskMappingWorkItem.next(mongo.task_mappings_queue(), owner)
     while work_item:
         yield work_item
-        work_item = ProjectTaskMappingWorkItem.next(mongo.task_mappings_queue())
+        work_item = ProjectTaskMappingWorkItem.next(mongo.task_mappings_queue(), owner)
 
 
 def _process_one_task_mapping_work_item(
@@ -54,6 +179,11 @@ def _process_one_task_mapping_work_item(
     evg_api: EvergreenApi,
     mongo: MongoWrapper,
     after_date: datetime,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
 ) -> None:
     """
     Process a task mapping work item.
@@ -62,11 +192,36 @@ def _process_one_task_mapping_work_item(
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
     :param after_date: The date at which to start analyzing commits of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
     """
     with tmp_bind(LOGGER, project=work_item.project, evergreen_module=work_item.module) as log:
         log.info("Starting task mapping work item processing for work_item")
-        if _seed_task_mappings_for_project(evg_api, mongo, work_item, after_date, log):
-            work_item.complete(mongo.task_mappings_queue())
+        queue = mongo.task_mappings_queue()
+        with LeaseHeartbeat(partial(work_item.extend_lease, queue)) as lease:
+            seeded = _seed_task_mappings_for_project(
+                evg_api,
+                mongo,
+                work_item,
+                after_date,
+                log,
+                clone_mode,
+                changed_files_index,
+                fan_out_limit,
+                clones,
+                time_budget,
+                lease,
+            )
+        if lease.lost:
+            # The worker that claimed the work item since is processing it.
+            return
+        if seeded:
+            work_item.complete(queue)
+        else:
+            work_item.requeue(queue)
 
 
 def _seed_task_mappings_for_project(
@@ -75,25 +230,91 @@ def _seed_task_mappings_for_project(
     work_item: ProjectTaskMappingWorkItem,
     after_date: datetime,
     log: Any,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
+    lease: Optional[LeaseHeartbeat] = None,
 ) -> bool:
     """
     Generate task mappings for a given work item.
 
+    With a time budget, the history is analyzed a slice at a time, oldest first, with a checkpoint
+    on the work item after each slice. Once the budget is spent the work item yields, and is
+    resumed from its checkpoint the next time it is claimed.
+
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
-    :param work_item: An instance of ProjectTestMappingWorkItem.
+    :param work_item: An instance of ProjectTaskMappingWorkItem.
     :param after_date: The date at which to start analyzing commits of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which the work item yields to be resumed later, if given.
+    :param lease: The heartbeat extending the lease on the work item. Nothing more is written once
+     the lease is lost.
+    :return: Whether the work item is finished, False if it yielded or lost its lease.
     """
-    mappings, most_recent_version_analyzed = generate_task_mappings(
-        evg_api,
-        work_item.project,
-        VersionLimit(stop_at_date=after_date),
-        work_item.source_file_regex,
-        module_name=work_item.module,
-        module_source_file_pattern=work_item.module_source_file_regex,
-        build_variant_pattern=work_item.build_variant_regex,
-    )
+    queue = mongo.task_mappings_queue()
+    run_start = time.monotonic()
+    window_start = work_item.analyzed_until or after_date
+    # Every slice walks the versions from the most recent one, so they are listed once for the
+    # whole work item rather than paged through again by each slice.
+    versions = SharedVersions.of_project(evg_api, work_item.project)
+    # Every slice analyzes the same repos, so they are cloned once for the whole work item,
+    # reaching back to the start of its first slice.
+    with TemporaryDirectory() as clone_dir:
+        if not isinstance(clones, SharedClones):
+            clones = SharedClones(clone_dir, clone_mode, get_shallow_since(window_start), clones)
+        while True:
+            if lease_lost(lease, log):
+                return False
+            slice_start = time.monotonic()
+            window_start, window_end = next_window(
+                window_start, datetime.utcnow().replace(tzinfo=pytz.UTC), time_budget is not None
+            )
+            mappings, most_recent_version_analyzed = generate_task_mappings(
+                evg_api,
+                work_item.project,
+                VersionLimit(stop_at_date=window_start, until_date=window_end),
+                work_item.source_file_regex,
+                module_name=work_item.module,
+                module_source_file_pattern=work_item.module_source_file_regex,
+                build_variant_pattern=work_item.build_variant_regex,
+                clone_mode=clone_mode,
+                changed_files_index=changed_files_index,
+                fan_out_limit=fan_out_limit,
+                clones=clones,
+                versions=versions,
+            )
+            # The lease may have been lost while the slice was generated.
+            if lease_lost(lease, log):
+                return False
+            if window_end is None:
+                break
 
+            # The most recent version analyzed is only saved by the last slice, so the project is
+            # not updated from it until it is fully seeded.
+            if mappings:
+                update_task_mappings(mappings, mongo)
+            if not work_item.checkpoint(queue, window_end, time.monotonic() - slice_start):
+                log.warning("Stopped processing the work item, the lease on it was lost")
+                return False
+            if time_budget is not None and time.monotonic() - run_start >= time_budget:
+                log.info(
+                    "Task mapping work item yielded at the end of its budget", until=window_end
+                )
+                return False
+            window_start = window_end
+
+        if mappings:
+            update_task_mappings(mappings, mongo)
+        else:
+            LOGGER.info("No task mappings generated")
+
+    # Saving the config advances its generation, so only once the mappings are written.
     project_config = ProjectConfig.get(mongo.project_config(), work_item.project)
     project_config.task_config.update(
         most_recent_version_analyzed,
@@ -101,14 +322,10 @@ def _seed_task_mappings_for_project(
         work_item.build_variant_regex,
         work_item.module,
         work_item.module_source_file_regex,
+        fan_out_limit,
     )
-
     project_config.save(mongo.project_config())
-
-    if mappings:
-        update_task_mappings(mappings, mongo)
-    else:
-        LOGGER.info("No task mappings generated")
+    work_item.checkpoint(queue, None, time.monotonic() - slice_start)
     log.info("Finished task mapping work item processing")
 
     return True
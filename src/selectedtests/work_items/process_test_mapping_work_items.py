@@ -1,64 +1,176 @@
 """Functions for processing project test mapping work items."""
+import time
+
+from concurrent.futures import ThreadPoolExecutor as Executor
 from datetime import datetime
-from typing import Any, Iterable
+from functools import partial
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Iterable, Optional
 
+import pytz
 import structlog
 
 from evergreen.api import EvergreenApi
-from pymongo.collection import Collection
 from structlog.threadlocal import tmp_bind
 
+from selectedtests.changed_files_index import ChangedFilesIndex
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode, RepoClones, SharedClones, get_shallow_since
 from selectedtests.project_config import ProjectConfig
 from selectedtests.test_mappings.commit_limit import CommitLimit
 from selectedtests.test_mappings.create_test_mappings import generate_test_mappings
 from selectedtests.test_mappings.update_test_mappings import update_test_mappings
 from selectedtests.work_items.test_mapping_work_item import ProjectTestMappingWorkItem
+from selectedtests.work_items.work_item_lease import LeaseHeartbeat, create_owner_id, lease_lost
+from selectedtests.work_items.work_item_priority import next_window
+from selectedtests.work_items.work_item_scheduler import WorkItemSource
 
 LOGGER = structlog.get_logger()
 
 
-def clear_in_progress_work(collection: Collection) -> None:
+def process_queued_test_mapping_work_items(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    after_date: datetime,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    workers: int = 1,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
+) -> None:
     """
-    Clear the start time of all in progress work items.
+    Process test mapping work items that have not yet been processed.
 
-    This is done at the start of a run to retry any work items that may not have completed
-    during a previous run.
+    Each worker claims a lease on the work items it processes, so several workers, on this host or
+    any other, can process the queue at the same time. The work items of workers that died are
+    processed again once their leases expire.
 
-    :param collection: Collection to act on.
+    :param evg_api: An instance of the evg_api client
+    :param mongo: An instance of MongoWrapper.
+    :param after_date: The date at which to start analyzing commits of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param workers: The number of work items processed at the same time.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
     """
-    collection.update_many({"end_time": None}, {"$set": {"start_time": None}})
+    with Executor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(
+                _process_test_mapping_work_items,
+                evg_api,
+                mongo,
+                after_date,
+                create_owner_id(),
+                clone_mode,
+                changed_files_index,
+                fan_out_limit,
+                clones,
+                time_budget,
+            )
 
 
-def process_queued_test_mapping_work_items(
-    evg_api: EvergreenApi, mongo: MongoWrapper, after_date: datetime
+def test_mapping_work_item_source(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    get_after_date: Callable[[], datetime],
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
+) -> WorkItemSource:
+    """
+    Create the source a WorkItemScheduler processes the test mapping work items from.
+
+    :param evg_api: An instance of the evg_api client
+    :param mongo: An instance of MongoWrapper.
+    :param get_after_date: Function returning the date at which to start analyzing commits of the
+     project, called for each work item.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
+    :return: The test mapping work item source.
+    """
+
+    def process(work_item: ProjectTestMappingWorkItem) -> None:
+        _process_one_test_mapping_work_item(
+            work_item,
+            evg_api,
+            mongo,
+            get_after_date(),
+            clone_mode,
+            changed_files_index,
+            fan_out_limit,
+            clones,
+            time_budget,
+        )
+
+    return WorkItemSource(
+        "test_mappings", mongo.test_mappings_queue, ProjectTestMappingWorkItem.next, process
+    )
+
+
+def _process_test_mapping_work_items(
+    evg_api: EvergreenApi,
+    mongo: MongoWrapper,
+    after_date: datetime,
+    owner: str,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
 ) -> None:
     """
-    Process test mapping work items that have not yet been processed.
+    Process test mapping work items until there are none left to claim.
 
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
     :param after_date: The date at which to start analyzing commits of the project.
+    :param owner: The id of the worker claiming the work items.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
     """
-    clear_in_progress_work(mongo.test_mappings_queue())
     try:
-        for work_item in _generate_test_mapping_work_items(mongo):
-            _process_one_test_mapping_work_item(work_item, evg_api, mongo, after_date)
+        for work_item in _generate_test_mapping_work_items(mongo, owner):
+            _process_one_test_mapping_work_item(
+                work_item,
+                evg_api,
+                mongo,
+                after_date,
+                clone_mode,
+                changed_files_index,
+                fan_out_limit,
+                clones,
+                time_budget,
+            )
     except:  # noqa: E722
         LOGGER.warning("Unexpected exception processing test mapping work item", exc_info=1)
 
 
-def _generate_test_mapping_work_items(mongo: MongoWrapper) -> Iterable[ProjectTestMappingWorkItem]:
+def _generate_test_mapping_work_items(
+    mongo: MongoWrapper, owner: Optional[str] = None
+) -> Iterable[ProjectTestMappingWorkItem]:
     """
     Generate test mapping work items that need to be processed.
 
     :param mongo: Mongo db containing work item queue.
+    :param owner: The id of the worker claiming the work items.
     :return: Iterator over test mapping work items.
     """
-    work_item = ProjectTestMappingWorkItem.next(mongo.test_mappings_queue())
+    work_item = ProjectTestMappingWorkItem.next(mongo.test_mappings_queue(), owner)
     while work_item:
         yield work_item
-        work_item = ProjectTestMappingWorkItem.next(mongo.test_mappings_queue())
+        work_item = ProjectTestMappingWorkItem.next(mongo.test_mappings_queue(), owner)
 
 
 def _process_one_test_mapping_work_item(
@@ -66,6 +178,11 @@ def _process_one_test_mapping_work_item(
     evg_api: EvergreenApi,
     mongo: MongoWrapper,
     after_date: datetime,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
 ) -> None:
     """
     Process a test mapping work item.
@@ -74,12 +191,36 @@ def _process_one_test_mapping_work_item(
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
     :param after_date: The date at which to start analyzing commits of the project.
-    :return: Whether all work items have been processed.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which a work item yields to be resumed later, if given.
     """
     with tmp_bind(LOGGER, project=work_item.project, evergreen_module=work_item.module) as log:
         log.info("Starting test mapping work item processing for work_item")
-        if _seed_test_mappings_for_project(evg_api, mongo, work_item, after_date, log):
-            work_item.complete(mongo.test_mappings_queue())
+        queue = mongo.test_mappings_queue()
+        with LeaseHeartbeat(partial(work_item.extend_lease, queue)) as lease:
+            seeded = _seed_test_mappings_for_project(
+                evg_api,
+                mongo,
+                work_item,
+                after_date,
+                log,
+                clone_mode,
+                changed_files_index,
+                fan_out_limit,
+                clones,
+                time_budget,
+                lease,
+            )
+        if lease.lost:
+            # The worker that claimed the work item since is processing it.
+            return
+        if seeded:
+            work_item.complete(queue)
+        else:
+            work_item.requeue(queue)
 
 
 def _seed_test_mappings_for_project(
@@ -88,27 +229,89 @@ def _seed_test_mappings_for_project(
     work_item: ProjectTestMappingWorkItem,
     after_date: datetime,
     log: Any,
+    clone_mode: CloneMode = CloneMode.FULL,
+    changed_files_index: Optional[ChangedFilesIndex] = None,
+    fan_out_limit: Optional[FanOutLimit] = None,
+    clones: Optional[RepoClones] = None,
+    time_budget: Optional[float] = None,
+    lease: Optional[LeaseHeartbeat] = None,
 ) -> bool:
     """
     Generate test mappings for a given work item.
 
+    With a time budget, the history is analyzed a slice at a time, oldest first, with a checkpoint
+    on the work item after each slice. Once the budget is spent the work item yields, and is
+    resumed from its checkpoint the next time it is claimed.
+
     :param evg_api: An instance of the evg_api client
     :param mongo: An instance of MongoWrapper.
     :param work_item: An instance of ProjectTestMappingWorkItem.
     :param after_date: The date at which to start analyzing commits of the project.
+    :param clone_mode: How much of the project and module repos should be cloned.
+    :param changed_files_index: Index of the files changed by previously analyzed commits.
+    :param fan_out_limit: The limit on the number of files changed by the commits counted.
+    :param clones: How the project and module repos are cloned, from github if not given.
+    :param time_budget: Seconds after which the work item yields to be resumed later, if given.
+    :param lease: The heartbeat extending the lease on the work item. Nothing more is written once
+     the lease is lost.
+    :return: Whether the work item is finished, False if it yielded or lost its lease.
     """
-    test_mappings_result = generate_test_mappings(
-        evg_api,
-        work_item.project,
-        CommitLimit(stop_at_date=after_date),
-        work_item.source_file_regex,
-        work_item.test_file_regex,
-        module_name=work_item.module,
-        module_commit_limit=CommitLimit(stop_at_date=after_date),
-        module_source_file_pattern=work_item.module_source_file_regex,
-        module_test_file_pattern=work_item.module_test_file_regex,
-    )
+    queue = mongo.test_mappings_queue()
+    run_start = time.monotonic()
+    window_start = work_item.analyzed_until or after_date
+    # Every slice analyzes the same repos, so they are cloned once for the whole work item,
+    # reaching back to the start of its first slice.
+    with TemporaryDirectory() as clone_dir:
+        if not isinstance(clones, SharedClones):
+            clones = SharedClones(clone_dir, clone_mode, get_shallow_since(window_start), clones)
+        while True:
+            if lease_lost(lease, log):
+                return False
+            slice_start = time.monotonic()
+            window_start, window_end = next_window(
+                window_start, datetime.utcnow().replace(tzinfo=pytz.UTC), time_budget is not None
+            )
+            test_mappings_result = generate_test_mappings(
+                evg_api,
+                work_item.project,
+                CommitLimit(stop_at_date=window_start, until_date=window_end),
+                work_item.source_file_regex,
+                work_item.test_file_regex,
+                module_name=work_item.module,
+                module_commit_limit=CommitLimit(stop_at_date=window_start, until_date=window_end),
+                module_source_file_pattern=work_item.module_source_file_regex,
+                module_test_file_pattern=work_item.module_test_file_regex,
+                clone_mode=clone_mode,
+                changed_files_index=changed_files_index,
+                fan_out_limit=fan_out_limit,
+                clones=clones,
+            )
+            # The lease may have been lost while the slice was generated.
+            if lease_lost(lease, log):
+                return False
+            if window_end is None:
+                break
 
+            # The most recent commits analyzed are only saved by the last slice, so the project is
+            # not updated from them until it is fully seeded.
+            if test_mappings_result.test_mappings_list:
+                update_test_mappings(test_mappings_result.test_mappings_list, mongo)
+            if not work_item.checkpoint(queue, window_end, time.monotonic() - slice_start):
+                log.warning("Stopped processing the work item, the lease on it was lost")
+                return False
+            if time_budget is not None and time.monotonic() - run_start >= time_budget:
+                log.info(
+                    "Test mapping work item yielded at the end of its budget", until=window_end
+                )
+                return False
+            window_start = window_end
+
+        if test_mappings_result.test_mappings_list:
+            update_test_mappings(test_mappings_result.test_mappings_list, mongo)
+        else:
+            log.info("No test mappings generated")
+
+    # Saving the config advances its generation, so only once the mappings are written.
     project_config = ProjectConfig.get(mongo.project_config(), work_item.project)
     project_config.test_config.update(
         test_mappings_result.most_recent_project_commit_analyzed,
@@ -118,14 +321,10 @@ def _seed_test_mappings_for_project(
         test_mappings_result.most_recent_module_commit_analyzed,
         work_item.module_source_file_regex,
         work_item.module_test_file_regex,
+        fan_out_limit,
     )
-
     project_config.save(mongo.project_config())
-
-    if test_mappings_result.test_mappings_list:
-        update_test_mappings(test_mappings_result.test_mappings_list, mongo)
-    else:
-        log.info("No test mappings generated")
+    work_item.checkpoint(queue, None, time.monotonic() - slice_start)
     log.info("Finished test mapping work item processing")
 
     return True
@@ -9,6 +9,25 @@ import structlog
 from pymongo.collection import Collection, ReturnDocument
 from pymongo.errors import DuplicateKeyError
 
+from selectedtests.work_items.work_item_lease import (
+    DEFAULT_LEASE_SECONDS,
+    LEASE_OWNER_KEY,
+    claim_update,
+    claimable_query,
+    complete,
+    create_owner_id,
+    extend_lease,
+)
+from selectedtests.work_items.work_item_priority import (
+    CLAIM_ORDER,
+    ELAPSED_SECONDS_KEY,
+    PRIORITY_KEY,
+    Priority,
+    checkpoint,
+    read_analyzed_until,
+    requeue,
+)
+
 LOGGER = structlog.get_logger()
 WORK_ITEM_TTL = timedelta(weeks=2).total_seconds()
 
@@ -26,6 +45,10 @@ class ProjectTaskMappingWorkItem(object):
         module: str,
         module_source_file_regex: str,
         build_variant_regex: str,
+        lease_owner: Optional[str] = None,
+        priority: Priority = Priority.NORMAL,
+        elapsed_seconds: float = 0.0,
+        analyzed_until: Optional[datetime] = None,
     ):
         """
         Create a task_mapping work item.
@@ -38,6 +61,10 @@ class ProjectTaskMappingWorkItem(object):
         :param module: The name of the module to analyze.
         :param module_source_file_regex: Regex pattern to match changed module source files against.
         :param build_variant_regex:  Regex pattern to match build variants' display name against.
+        :param lease_owner: The id of the worker holding the lease on the work item.
+        :param priority: The priority class of the work item.
+        :param elapsed_seconds: The time spent processing the work item so far.
+        :param analyzed_until: The date history was analyzed until when the work item last yielded.
         """
         self.start_time = start_time
         self.end_time = end_time
@@ -47,6 +74,10 @@ class ProjectTaskMappingWorkItem(object):
         self.module = module
         self.module_source_file_regex = module_source_file_regex
         self.build_variant_regex = build_variant_regex
+        self.lease_owner = lease_owner
+        self.priority = priority
+        self.elapsed_seconds = elapsed_seconds
+        self.analyzed_until = analyzed_until
 
     @classmethod
     def new_task_mappings(
@@ -56,6 +87,7 @@ class ProjectTaskMappingWorkItem(object):
         module: str = "",
         module_source_file_regex: str = "",
         build_variant_regex: str = "",
+        priority: Priority = Priority.NORMAL,
     ) -> ProjectTaskMappingWorkItem:
         """
         Create a new work item.
@@ -65,6 +97,7 @@ class ProjectTaskMappingWorkItem(object):
         :param module: The name of the module to analyze.
         :param module_source_file_regex: Regex pattern to match changed module source files against.
         :param build_variant_regex: Regex pattern to match build variants' display name against.
+        :param priority: The priority class of the work item.
         :return: ProjectTaskMappingWorkItem instance for work item.
         """
         return cls(
@@ -76,20 +109,32 @@ class ProjectTaskMappingWorkItem(object):
             module,
             module_source_file_regex,
             build_variant_regex,
+            priority=priority,
         )
 
     @classmethod
-    def next(cls, collection: Collection) -> Optional[ProjectTaskMappingWorkItem]:
+    def next(
+        cls,
+        collection: Collection,
+        owner: Optional[str] = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    ) -> Optional[ProjectTaskMappingWorkItem]:
         """
-        Find a Work Item on the queue ready for work, or None if nothing is ready.
+        Claim a Work Item on the queue ready for work, or None if nothing is ready.
+
+        A work item is ready if it is unfinished and no worker holds an unexpired lease on it.
+        Work items of higher priority are claimed first, then the ones processed the least so far.
 
         :param collection: Mongo collection where queue is found.
+        :param owner: The id of the worker claiming the work item, a new id if not given.
+        :param lease_seconds: How long the lease on the work item lasts unless it is extended.
         :return: Work item ready for work, or None.
         """
+        now = datetime.utcnow()
         data = collection.find_one_and_update(
-            {"start_time": None},
-            {"$currentDate": {"start_time": True}},
-            sort=[("created_on", 1)],
+            claimable_query(now),
+            claim_update(owner or create_owner_id(), now, lease_seconds),
+            sort=CLAIM_ORDER,
             return_document=ReturnDocument.AFTER,
         )
         if data:
@@ -102,6 +147,10 @@ class ProjectTaskMappingWorkItem(object):
                 data["module"],
                 data["module_source_file_regex"],
                 data["build_variant_regex"],
+                data.get(LEASE_OWNER_KEY),
+                Priority(data.get(PRIORITY_KEY, Priority.NORMAL)),
+                data.get(ELAPSED_SECONDS_KEY, 0.0),
+                read_analyzed_until(data),
             )
         return None
 
@@ -120,6 +169,8 @@ class ProjectTaskMappingWorkItem(object):
             "module": self.module,
             "module_source_file_regex": self.module_source_file_regex,
             "build_variant_regex": self.build_variant_regex,
+            PRIORITY_KEY: int(self.priority),
+            ELAPSED_SECONDS_KEY: self.elapsed_seconds,
         }
         try:
             result = collection.insert_one(to_insert)
@@ -127,10 +178,53 @@ class ProjectTaskMappingWorkItem(object):
         except DuplicateKeyError:
             return False
 
-    def complete(self, collection: Collection) -> None:
+    def complete(self, collection: Collection) -> bool:
+        """
+        Mark this work item as complete, if this work item's worker still holds the lease on it.
+
+        :param collection: Mongo collection containing queue.
+        :return: Whether this work item's worker still held the lease.
+        """
+        return complete(collection, self.project, self.lease_owner)
+
+    def extend_lease(
+        self, collection: Collection, lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ) -> bool:
+        """
+        Extend the lease on this work item.
+
+        :param collection: Mongo collection containing queue.
+        :param lease_seconds: How long the lease lasts from now unless it is extended again.
+        :return: Whether this work item's worker still held the lease.
+        """
+        if not self.lease_owner:
+            return False
+        return extend_lease(collection, self.project, self.lease_owner, lease_seconds)
+
+    def checkpoint(
+        self, collection: Collection, analyzed_until: Optional[datetime], elapsed_seconds: float
+    ) -> bool:
+        """
+        Record the progress made on this work item.
+
+        :param collection: Mongo collection containing queue.
+        :param analyzed_until: The date history has been analyzed until, None if it all was.
+        :param elapsed_seconds: The time spent on this work item since the last checkpoint.
+        :return: Whether this work item's worker still held the lease.
+        """
+        if not checkpoint(
+            collection, self.project, self.lease_owner, analyzed_until, elapsed_seconds
+        ):
+            return False
+        self.analyzed_until = analyzed_until
+        self.elapsed_seconds += elapsed_seconds
+        return True
+
+    def requeue(self, collection: Collection) -> bool:
         """
-        Mark this work item as complete.
+        Release the lease on this work item so it is claimed again from its last checkpoint.
 
         :param collection: Mongo collection containing queue.
+        :return: Whether this work item's worker still held the lease.
         """
-        collection.update_one({"project": self.project}, {"$currentDate": {"end_time": True}})
+        return requeue(collection, self.project, self.lease_owner)
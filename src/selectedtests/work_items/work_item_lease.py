@@ -0,0 +1,169 @@
+"""Leases held on work items by the workers processing them."""
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import uuid
+
+from datetime import datetime, timedelta
+from types import TracebackType
+from typing import Any, Callable, Dict, Optional, Type
+
+import structlog
+
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+LOGGER = structlog.get_logger(__name__)
+
+LEASE_OWNER_KEY = "lease_owner"
+LEASE_EXPIRES_KEY = "lease_expires"
+DEFAULT_LEASE_SECONDS = 600.0
+DEFAULT_HEARTBEAT_SECONDS = 60.0
+
+
+def create_owner_id() -> str:
+    """Create an id identifying a worker across all the hosts processing work items."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claimable_query(now: datetime) -> Dict[str, Any]:
+    """
+    Create a query matching the unfinished work items that no worker holds a lease on.
+
+    Work items claimed before leases were added have no lease, so they are claimable as well.
+
+    :param now: The current time.
+    :return: The query.
+    """
+    return {
+        "end_time": None,
+        "$or": [{LEASE_EXPIRES_KEY: None}, {LEASE_EXPIRES_KEY: {"$lt": now}}],
+    }
+
+
+def claim_update(owner: str, now: datetime, lease_seconds: float) -> Dict[str, Any]:
+    """
+    Create the update that claims a work item for a worker.
+
+    :param owner: The id of the worker.
+    :param now: The current time.
+    :param lease_seconds: How long the lease lasts unless it is extended.
+    :return: The update.
+    """
+    return {
+        "$set": {
+            LEASE_OWNER_KEY: owner,
+            LEASE_EXPIRES_KEY: now + timedelta(seconds=lease_seconds),
+        },
+        "$currentDate": {"start_time": True},
+    }
+
+
+def extend_lease(collection: Collection, project: str, owner: str, lease_seconds: float) -> bool:
+    """
+    Extend the lease of a worker on a work item.
+
+    :param collection: Mongo collection containing the queue.
+    :param project: The project of the work item.
+    :param owner: The id of the worker holding the lease.
+    :param lease_seconds: How long the lease lasts from now unless it is extended again.
+    :return: Whether the worker still held the lease.
+    """
+    result = collection.update_one(
+        {"project": project, LEASE_OWNER_KEY: owner, "end_time": None},
+        {"$set": {LEASE_EXPIRES_KEY: datetime.utcnow() + timedelta(seconds=lease_seconds)}},
+    )
+    return result.matched_count == 1
+
+
+def complete(collection: Collection, project: str, owner: Optional[str]) -> bool:
+    """
+    Mark a work item as complete and release the lease of a worker on it.
+
+    A worker that lost its lease leaves the work item to the worker that claimed it since.
+
+    :param collection: Mongo collection containing the queue.
+    :param project: The project of the work item.
+    :param owner: The id of the worker holding the lease.
+    :return: Whether the worker still held the lease and the work item was completed.
+    """
+    result = collection.update_one(
+        {"project": project, LEASE_OWNER_KEY: owner, "end_time": None},
+        {
+            "$currentDate": {"end_time": True},
+            "$unset": {LEASE_OWNER_KEY: "", LEASE_EXPIRES_KEY: ""},
+        },
+    )
+    if result.matched_count != 1:
+        LOGGER.warning(
+            "Did not complete the work item, the lease on it was lost", project=project, owner=owner
+        )
+        return False
+    return True
+
+
+class LeaseHeartbeat(object):
+    """
+    Extend a lease in the background for as long as the work it covers is in progress.
+
+    The work is not interrupted when the lease is lost, it has to check lost itself. Another worker
+    may have claimed the work item since, and the mappings are written by incrementing their
+    counts, so work that goes on writing after losing its lease counts the same history twice.
+    """
+
+    def __init__(
+        self, extend: Callable[[], bool], interval_seconds: float = DEFAULT_HEARTBEAT_SECONDS
+    ):
+        """
+        Create a LeaseHeartbeat.
+
+        :param extend: Function extending the lease, returning whether it was still held.
+        :param interval_seconds: The time between extensions, well below the length of the lease.
+        """
+        self.extend = extend
+        self.interval_seconds = interval_seconds
+        self.lost = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def __enter__(self) -> LeaseHeartbeat:
+        """Start extending the lease."""
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Stop extending the lease."""
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        """Extend the lease every interval until stopped or the lease is lost."""
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                if not self.extend():
+                    LOGGER.warning("Lost the lease on the work item being processed")
+                    self.lost = True
+                    return
+            except PyMongoError:
+                LOGGER.warning("Failed to extend the lease on the work item", exc_info=1)
+
+
+def lease_lost(lease: Optional[LeaseHeartbeat], log: Any) -> bool:
+    """
+    Check whether the lease on the work item being processed was lost, logging it if so.
+
+    :param lease: The heartbeat extending the lease, None if the work is not leased.
+    :param log: A logger bound to the work item.
+    :return: Whether the lease was lost, in which case nothing more should be written.
+    """
+    if lease is not None and lease.lost:
+        log.warning("Stopped processing the work item, the lease on it was lost")
+        return True
+    return False
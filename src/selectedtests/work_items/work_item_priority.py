@@ -0,0 +1,107 @@
+"""Order in which work items are claimed, and the checkpoints of work items that were yielded."""
+from datetime import datetime, timedelta
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+
+from pymongo.collection import Collection
+
+from selectedtests.work_items.work_item_lease import LEASE_EXPIRES_KEY, LEASE_OWNER_KEY
+
+PRIORITY_KEY = "priority"
+ELAPSED_SECONDS_KEY = "elapsed_seconds"
+ANALYZED_UNTIL_KEY = "analyzed_until"
+# The length of history analyzed between checks of the time budget of a run.
+SLICE_LENGTH = timedelta(days=90)
+
+
+class Priority(IntEnum):
+    """Priority class of a work item, lower values are claimed first."""
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+# Within a priority class, the work items that have been processed the least so far are claimed
+# first. Work items that yield at the end of their time budget fall behind the ones that were not
+# started, so a long seed does not hold up the short ones queued after it.
+CLAIM_ORDER: List[Tuple[str, int]] = [
+    (PRIORITY_KEY, 1),
+    (ELAPSED_SECONDS_KEY, 1),
+    ("created_on", 1),
+]
+
+
+def read_analyzed_until(data: Dict[str, Any]) -> Optional[datetime]:
+    """
+    Read the date history of a work item was analyzed until, in UTC offset-aware format.
+
+    :param data: The document of the work item.
+    :return: The date, None if the work item has no checkpoint.
+    """
+    analyzed_until = data.get(ANALYZED_UNTIL_KEY)
+    if analyzed_until is not None and analyzed_until.tzinfo is None:
+        # Mongo returns naive datetimes in UTC.
+        analyzed_until = analyzed_until.replace(tzinfo=pytz.UTC)
+    return analyzed_until
+
+
+def next_window(
+    start: datetime, now: datetime, sliced: bool
+) -> Tuple[datetime, Optional[datetime]]:
+    """
+    Get the window of history to analyze next, oldest history first.
+
+    :param start: The date history should be analyzed from.
+    :param now: The current time.
+    :param sliced: Whether the history is analyzed a slice at a time.
+    :return: The start of the window and its end, None if it reaches up to the most recent history.
+    """
+    if not sliced or start + SLICE_LENGTH >= now:
+        return start, None
+    return start, start + SLICE_LENGTH
+
+
+def checkpoint(
+    collection: Collection,
+    project: str,
+    owner: Optional[str],
+    analyzed_until: Optional[datetime],
+    elapsed_seconds: float,
+) -> bool:
+    """
+    Record the progress made on a work item by the worker holding the lease on it.
+
+    :param collection: Mongo collection containing the queue.
+    :param project: The project of the work item.
+    :param owner: The id of the worker holding the lease.
+    :param analyzed_until: The date history has been analyzed until, None if it all was.
+    :param elapsed_seconds: The time spent on the work item since the last checkpoint.
+    :return: Whether the worker still held the lease, nothing is recorded if not.
+    """
+    result = collection.update_one(
+        {"project": project, LEASE_OWNER_KEY: owner, "end_time": None},
+        {
+            "$set": {ANALYZED_UNTIL_KEY: analyzed_until},
+            "$inc": {ELAPSED_SECONDS_KEY: elapsed_seconds},
+        },
+    )
+    return result.matched_count == 1
+
+
+def requeue(collection: Collection, project: str, owner: Optional[str]) -> bool:
+    """
+    Release the lease of a worker on a work item so any worker can claim it again.
+
+    :param collection: Mongo collection containing the queue.
+    :param project: The project of the work item.
+    :param owner: The id of the worker holding the lease.
+    :return: Whether the worker still held the lease, the lease is left alone if not.
+    """
+    result = collection.update_one(
+        {"project": project, LEASE_OWNER_KEY: owner, "end_time": None},
+        {"$unset": {LEASE_OWNER_KEY: "", LEASE_EXPIRES_KEY: ""}},
+    )
+    return result.matched_count == 1
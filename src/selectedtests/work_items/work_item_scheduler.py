@@ -0,0 +1,173 @@
+"""Long-running scheduler processing the work items of every queue as they are added."""
+import threading
+
+from collections import namedtuple
+from typing import Any, List, Optional, Sequence
+
+import structlog
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from selectedtests.work_items.work_item_lease import create_owner_id
+
+LOGGER = structlog.get_logger(__name__)
+
+DEFAULT_POLL_SECONDS = 5.0
+DEFAULT_MAX_POLL_SECONDS = 300.0
+# How long the change streams wait for an insert before checking whether they were stopped.
+MAX_AWAIT_TIME_MS = 1000
+# Errors of servers that are not replica sets, or that are too old to support change streams.
+CHANGE_STREAMS_UNSUPPORTED_CODES = {40573, 40324}
+INSERTS_PIPELINE = [{"$match": {"operationType": "insert"}}]
+
+# A queue of work items the scheduler processes:
+# name: The name of the queue used in the logs.
+# queue: Function returning the collection containing the queue.
+# next: Function claiming the next work item of the queue for an owner, None if there is none.
+# process: Function processing a work item.
+WorkItemSource = namedtuple("WorkItemSource", ["name", "queue", "next", "process"])
+
+
+class WorkItemScheduler(object):
+    """
+    Process the work items of several queues with a shared pool of workers.
+
+    Workers take turns between the queues, so a long backlog on one queue does not starve the
+    other. Idle workers are woken by a change stream on the inserts into each queue. They also
+    poll the queues, backing off while the queues stay empty, which picks up the work items whose
+    leases expired and is all the waking there is when change streams are not available.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[WorkItemSource],
+        workers: int = 1,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+        max_poll_seconds: float = DEFAULT_MAX_POLL_SECONDS,
+    ):
+        """
+        Create a WorkItemScheduler.
+
+        :param sources: The queues to process.
+        :param workers: The number of work items processed at the same time.
+        :param poll_seconds: The time between polls of the queues once they become empty.
+        :param max_poll_seconds: The time between polls the back off stops at.
+        """
+        self.sources = list(sources)
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.max_poll_seconds = max(poll_seconds, max_poll_seconds)
+        self._turn = 0
+        self._turn_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def claim_and_process(self, owner: str) -> bool:
+        """
+        Claim the next work item of the queues and process it.
+
+        Each call starts with the queue after the one the previous call started with.
+
+        :param owner: The id of the worker claiming the work item.
+        :return: Whether a work item was processed.
+        """
+        with self._turn_lock:
+            first = self._turn
+            self._turn = (self._turn + 1) % len(self.sources)
+
+        for offset in range(len(self.sources)):
+            source = self.sources[(first + offset) % len(self.sources)]
+            work_item = source.next(source.queue(), owner)
+            if work_item is not None:
+                source.process(work_item)
+                return True
+        return False
+
+    def wake(self) -> None:
+        """Wake the idle workers so they check the queues."""
+        self._wake_event.set()
+
+    def start(self) -> None:
+        """Start the workers, and the change streams waking them, in the background."""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for index in range(self.workers):
+            self._start_thread(self._work, f"work-item-worker-{index}", create_owner_id())
+        for source in self.sources:
+            self._start_thread(self._watch, f"work-item-watcher-{source.name}", source)
+
+    def request_stop(self) -> None:
+        """
+        Ask the workers to stop once they finish the work items they are processing.
+
+        Unlike stop, this does not wait for them, so it is safe to call from a signal handler.
+        """
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def stop(self) -> None:
+        """Stop the workers once they finish the work items they are processing."""
+        self.request_stop()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the scheduler to be stopped.
+
+        :param timeout: The longest time to wait, forever if not given.
+        :return: Whether the scheduler was stopped.
+        """
+        return self._stop_event.wait(timeout)
+
+    def _start_thread(self, target: Any, name: str, *args: Any) -> None:
+        """Start a thread of the scheduler."""
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _work(self, owner: str) -> None:
+        """Process work items until stopped, waiting with back off while there are none."""
+        log = LOGGER.bind(owner=owner)
+        log.info("Starting work item worker")
+        wait_seconds = self.poll_seconds
+        while not self._stop_event.is_set():
+            # Clear the wake event before checking the queues, so inserts made after the check
+            # still wake the worker.
+            self._wake_event.clear()
+            try:
+                if self.claim_and_process(owner):
+                    wait_seconds = self.poll_seconds
+                    continue
+            except:  # noqa: E722
+                log.warning("Unexpected exception processing work item", exc_info=1)
+
+            if self._wake_event.wait(wait_seconds):
+                wait_seconds = self.poll_seconds
+            else:
+                wait_seconds = min(wait_seconds * 2, self.max_poll_seconds)
+
+    def _watch(self, source: WorkItemSource) -> None:
+        """Wake the workers on every insert into the queue of a source, until stopped."""
+        log = LOGGER.bind(queue=source.name)
+        while not self._stop_event.is_set():
+            try:
+                with source.queue().watch(
+                    INSERTS_PIPELINE, max_await_time_ms=MAX_AWAIT_TIME_MS
+                ) as stream:
+                    while not self._stop_event.is_set():
+                        if stream.try_next() is not None:
+                            log.info("Work item queued")
+                            self.wake()
+            except OperationFailure as err:
+                if err.code in CHANGE_STREAMS_UNSUPPORTED_CODES:
+                    log.warning("Change streams are unavailable, polling the queue instead")
+                    return
+                log.exception("Work item queue change stream failed")
+            except PyMongoError:
+                log.exception("Work item queue change stream failed")
+
+            self._stop_event.wait(self.max_poll_seconds)
@@ -1,5 +1,10 @@
 """Cli entry point to process work items."""
+import os
+import signal
+
 from datetime import datetime
+from functools import partial
+from typing import Any, Optional
 
 import click
 import pytz
@@ -8,18 +13,31 @@ from click import Context
 from dateutil.relativedelta import relativedelta
 from miscutils.logging_config import Verbosity
 
+from selectedtests.changed_files_index import open_changed_files_index
 from selectedtests.config.logging_config import config_logging
 from selectedtests.datasource.mongo_wrapper import MongoWrapper
 from selectedtests.evergreen_helper import get_evg_project
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode, RepoMirrors
 from selectedtests.helpers import get_evg_api
+from selectedtests.metrics import export_metrics_on_close
+from selectedtests.profiling import profile_until_close
 from selectedtests.work_items.process_task_mapping_work_items import (
     process_queued_task_mapping_work_items,
+    task_mapping_work_item_source,
 )
 from selectedtests.work_items.process_test_mapping_work_items import (
     process_queued_test_mapping_work_items,
+    test_mapping_work_item_source,
 )
 from selectedtests.work_items.task_mapping_work_item import ProjectTaskMappingWorkItem
 from selectedtests.work_items.test_mapping_work_item import ProjectTestMappingWorkItem
+from selectedtests.work_items.work_item_priority import Priority
+from selectedtests.work_items.work_item_scheduler import (
+    DEFAULT_MAX_POLL_SECONDS,
+    DEFAULT_POLL_SECONDS,
+    WorkItemScheduler,
+)
 
 DEFAULT_YEARS_BACK = 3
 
@@ -38,6 +56,16 @@ def _get_after_date(years_back: int) -> datetime:
     return now - relativedelta(years=years_back)
 
 
+def _minutes_to_seconds(minutes: Optional[float]) -> Optional[float]:
+    """
+    Convert a number of minutes given on the command line to seconds.
+
+    :param minutes: Number of minutes, None if not given.
+    :return: Number of seconds, None if not given.
+    """
+    return minutes * 60 if minutes is not None else None
+
+
 @click.group()
 @click.option("--verbose", is_flag=True, default=False, help="Enable verbose logging.")
 @click.option(
@@ -47,8 +75,41 @@ def _get_after_date(years_back: int) -> datetime:
     help="Format to write logs with.",
 )
 @click.option("--mongo-uri", required=True, type=str, help="Mongo URI to connect to.")
+@click.option(
+    "--metrics-textfile",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_METRICS_TEXTFILE"),
+    help="Path of a file to write Prometheus metrics to when the command is done.",
+)
+@click.option(
+    "--metrics-pushgateway",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_METRICS_PUSHGATEWAY"),
+    help="Address of a Prometheus Pushgateway to push metrics to when the command is done.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Profile the calls and allocations of the command.",
+)
+@click.option(
+    "--profile-output",
+    type=str,
+    default="profiles",
+    help="Directory to write the profiles of each run to, with --profile.",
+)
 @click.pass_context
-def cli(ctx: Context, verbose: str, log_format: str, mongo_uri: str) -> None:
+def cli(
+    ctx: Context,
+    verbose: str,
+    log_format: str,
+    mongo_uri: str,
+    metrics_textfile: Optional[str],
+    metrics_pushgateway: Optional[str],
+    profile: bool,
+    profile_output: str,
+) -> None:
     """Suite of selected-tests commands, see the commands help for more details."""
     ctx.ensure_object(dict)
     ctx.obj["mongo"] = MongoWrapper.connect(mongo_uri)
@@ -56,6 +117,8 @@ def cli(ctx: Context, verbose: str, log_format: str, mongo_uri: str) -> None:
 
     verbosity = Verbosity.DEBUG if verbose else Verbosity.INFO
     config_logging(verbosity, human_readable=log_format == "text")
+    export_metrics_on_close(ctx, "work-items", metrics_textfile, metrics_pushgateway)
+    profile_until_close(ctx, "work-items", profile, profile_output)
 
 
 @cli.command()
@@ -66,8 +129,16 @@ def cli(ctx: Context, verbose: str, log_format: str, mongo_uri: str) -> None:
 @click.option(
     "--test-file-regex", type=str, required=True, help="Regular expression for project test files."
 )
+@click.option(
+    "--priority",
+    type=click.Choice([priority.name.lower() for priority in Priority]),
+    default=Priority.NORMAL.name.lower(),
+    help="Priority class of the work item, higher priority work items are processed first.",
+)
 @click.pass_context
-def create_test_mapping(ctx: Context, project: str, src_regex: str, test_file_regex: str) -> None:
+def create_test_mapping(
+    ctx: Context, project: str, src_regex: str, test_file_regex: str, priority: str
+) -> None:
     """
     Add a project to the queue to be tracked for test mappings.
 
@@ -78,12 +149,15 @@ def create_test_mapping(ctx: Context, project: str, src_regex: str, test_file_re
     :param project: Evergreen project to add to queue.
     :param src_regex: Regular expression for project source files.
     :param test_file_regex: Regular expression for project test files.
+    :param priority: Priority class of the work item.
     """
     evergreen_project = get_evg_project(ctx.obj["evg_api"], project)
     if not evergreen_project:
         raise ValueError("Evergreen project not found")
 
-    work_item = ProjectTestMappingWorkItem.new_test_mappings(project, src_regex, test_file_regex)
+    work_item = ProjectTestMappingWorkItem.new_test_mappings(
+        project, src_regex, test_file_regex, priority=Priority[priority.upper()]
+    )
     work_item.insert(ctx.obj["mongo"].test_mappings_queue())
 
 
@@ -91,15 +165,74 @@ def create_test_mapping(ctx: Context, project: str, src_regex: str, test_file_re
 @click.option(
     "--years-back", type=int, default=DEFAULT_YEARS_BACK, help="Number of years back to process."
 )
+@click.option(
+    "--clone-mode",
+    type=click.Choice([mode.value for mode in CloneMode]),
+    default=CloneMode.FULL.value,
+    help="How much of the git repos to clone. 'blobless' and 'shallow' only fetch the history.",
+)
+@click.option(
+    "--changed-files-index",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_CHANGED_FILES_INDEX"),
+    help="Path to a file caching the files changed by each commit analyzed across runs.",
+)
+@click.option(
+    "--max-changed-files",
+    type=int,
+    help="Skip changes that touch more than this many mapped files.",
+)
+@click.option(
+    "--weight-large-changes",
+    is_flag=True,
+    default=False,
+    help="Downweight changes above --max-changed-files rather than skipping them.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of work items processed at the same time.",
+)
+@click.option(
+    "--time-budget-minutes",
+    type=click.FloatRange(min=0),
+    help="Minutes after which a work item yields to others, to be resumed from a checkpoint.",
+)
 @click.pass_context
-def process_test_mappings(ctx: Context, years_back: int) -> None:
+def process_test_mappings(
+    ctx: Context,
+    years_back: int,
+    clone_mode: str,
+    changed_files_index: str,
+    max_changed_files: int,
+    weight_large_changes: bool,
+    workers: int,
+    time_budget_minutes: Optional[float],
+) -> None:
     """
     Process test mapping work items that have not yet been processed.
 
     :param years_back: Number of years back to process.
+    :param clone_mode: How much of the git repos to clone.
+    :param changed_files_index: Path to a file caching the files changed by each commit.
+    :param max_changed_files: Number of mapped files above which changes are limited.
+    :param weight_large_changes: Whether changes above the limit are downweighted, not skipped.
+    :param workers: Number of work items processed at the same time.
+    :param time_budget_minutes: Minutes after which a work item yields to others.
     """
     after_date = _get_after_date(years_back)
-    process_queued_test_mapping_work_items(ctx.obj["evg_api"], ctx.obj["mongo"], after_date)
+    with open_changed_files_index(changed_files_index) as index:
+        process_queued_test_mapping_work_items(
+            ctx.obj["evg_api"],
+            ctx.obj["mongo"],
+            after_date,
+            CloneMode(clone_mode),
+            index,
+            FanOutLimit(max_changed_files, weight_large_changes),
+            workers,
+            time_budget=_minutes_to_seconds(time_budget_minutes),
+        )
 
 
 @cli.command()
@@ -108,8 +241,16 @@ def process_test_mappings(ctx: Context, years_back: int) -> None:
     "--src-regex", type=str, required=True, help="Regular expression for project source files."
 )
 @click.option("--build-regex", type=str, help="Regular expression for build variants.")
+@click.option(
+    "--priority",
+    type=click.Choice([priority.name.lower() for priority in Priority]),
+    default=Priority.NORMAL.name.lower(),
+    help="Priority class of the work item, higher priority work items are processed first.",
+)
 @click.pass_context
-def create_task_mapping(ctx: Context, project: str, src_regex: str, build_regex: str) -> None:
+def create_task_mapping(
+    ctx: Context, project: str, src_regex: str, build_regex: str, priority: str
+) -> None:
     """
     Add a project to the queue to be tracked for task mappings.
 
@@ -120,13 +261,14 @@ def create_task_mapping(ctx: Context, project: str, src_regex: str, build_regex:
     :param project: Evergreen project to add to queue.
     :param src_regex: Regular expression for project source files.
     :param build_regex: Regular expression for build variants.
+    :param priority: Priority class of the work item.
     """
     evergreen_project = get_evg_project(ctx.obj["evg_api"], project)
     if not evergreen_project:
         raise ValueError("Evergreen project not found")
 
     work_item = ProjectTaskMappingWorkItem.new_task_mappings(
-        project, src_regex, build_variant_regex=build_regex
+        project, src_regex, build_variant_regex=build_regex, priority=Priority[priority.upper()]
     )
     work_item.insert(ctx.obj["mongo"].task_mappings_queue())
 
@@ -135,15 +277,192 @@ def create_task_mapping(ctx: Context, project: str, src_regex: str, build_regex:
 @click.option(
     "--years-back", type=int, default=DEFAULT_YEARS_BACK, help="Number of years back to process."
 )
+@click.option(
+    "--clone-mode",
+    type=click.Choice([mode.value for mode in CloneMode]),
+    default=CloneMode.FULL.value,
+    help="How much of the git repos to clone. 'blobless' and 'shallow' only fetch the history.",
+)
+@click.option(
+    "--changed-files-index",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_CHANGED_FILES_INDEX"),
+    help="Path to a file caching the files changed by each commit analyzed across runs.",
+)
+@click.option(
+    "--max-changed-files",
+    type=int,
+    help="Skip changes that touch more than this many mapped files.",
+)
+@click.option(
+    "--weight-large-changes",
+    is_flag=True,
+    default=False,
+    help="Downweight changes above --max-changed-files rather than skipping them.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of work items processed at the same time.",
+)
+@click.option(
+    "--time-budget-minutes",
+    type=click.FloatRange(min=0),
+    help="Minutes after which a work item yields to others, to be resumed from a checkpoint.",
+)
 @click.pass_context
-def process_task_mappings(ctx: Context, years_back: int) -> None:
+def process_task_mappings(
+    ctx: Context,
+    years_back: int,
+    clone_mode: str,
+    changed_files_index: str,
+    max_changed_files: int,
+    weight_large_changes: bool,
+    workers: int,
+    time_budget_minutes: Optional[float],
+) -> None:
     """
     Process task mapping work items that have not yet been processed.
 
     :param years_back: Number of years back to process.
+    :param clone_mode: How much of the git repos to clone.
+    :param changed_files_index: Path to a file caching the files changed by each commit.
+    :param max_changed_files: Number of mapped files above which changes are limited.
+    :param weight_large_changes: Whether changes above the limit are downweighted, not skipped.
+    :param workers: Number of work items processed at the same time.
+    :param time_budget_minutes: Minutes after which a work item yields to others.
     """
     after_date = _get_after_date(years_back)
-    process_queued_task_mapping_work_items(ctx.obj["evg_api"], ctx.obj["mongo"], after_date)
+    with open_changed_files_index(changed_files_index) as index:
+        process_queued_task_mapping_work_items(
+            ctx.obj["evg_api"],
+            ctx.obj["mongo"],
+            after_date,
+            CloneMode(clone_mode),
+            index,
+            FanOutLimit(max_changed_files, weight_large_changes),
+            workers,
+            time_budget=_minutes_to_seconds(time_budget_minutes),
+        )
+
+
+@cli.command()
+@click.option(
+    "--years-back", type=int, default=DEFAULT_YEARS_BACK, help="Number of years back to process."
+)
+@click.option(
+    "--clone-mode",
+    type=click.Choice([mode.value for mode in CloneMode]),
+    default=CloneMode.FULL.value,
+    help="How much of the git repos to clone. 'blobless' and 'shallow' only fetch the history.",
+)
+@click.option(
+    "--changed-files-index",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_CHANGED_FILES_INDEX"),
+    help="Path to a file caching the files changed by each commit analyzed across runs.",
+)
+@click.option(
+    "--max-changed-files",
+    type=int,
+    help="Skip changes that touch more than this many mapped files.",
+)
+@click.option(
+    "--weight-large-changes",
+    is_flag=True,
+    default=False,
+    help="Downweight changes above --max-changed-files rather than skipping them.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of work items processed at the same time.",
+)
+@click.option(
+    "--time-budget-minutes",
+    type=click.FloatRange(min=0),
+    help="Minutes after which a work item yields to others, to be resumed from a checkpoint.",
+)
+@click.option(
+    "--mirror-dir",
+    type=str,
+    default=lambda: os.environ.get("SELECTED_TESTS_REPO_MIRROR_DIR"),
+    help="Directory to keep mirrors of the git repos in, so they are not cloned for every item.",
+)
+@click.option(
+    "--poll-seconds",
+    type=float,
+    default=DEFAULT_POLL_SECONDS,
+    help="Seconds between polls of the queues once they become empty.",
+)
+@click.option(
+    "--max-poll-seconds",
+    type=float,
+    default=DEFAULT_MAX_POLL_SECONDS,
+    help="Seconds between polls the back off stops at.",
+)
+@click.pass_context
+def daemon(
+    ctx: Context,
+    years_back: int,
+    clone_mode: str,
+    changed_files_index: str,
+    max_changed_files: int,
+    weight_large_changes: bool,
+    workers: int,
+    time_budget_minutes: Optional[float],
+    mirror_dir: str,
+    poll_seconds: float,
+    max_poll_seconds: float,
+) -> None:
+    """
+    Process test and task mapping work items as they are queued, until interrupted.
+
+    :param years_back: Number of years back to process.
+    :param clone_mode: How much of the git repos to clone.
+    :param changed_files_index: Path to a file caching the files changed by each commit.
+    :param max_changed_files: Number of mapped files above which changes are limited.
+    :param weight_large_changes: Whether changes above the limit are downweighted, not skipped.
+    :param workers: Number of work items processed at the same time.
+    :param time_budget_minutes: Minutes after which a work item yields to others.
+    :param mirror_dir: Directory to keep mirrors of the git repos in.
+    :param poll_seconds: Seconds between polls of the queues once they become empty.
+    :param max_poll_seconds: Seconds between polls the back off stops at.
+    """
+    get_after_date = partial(_get_after_date, years_back)
+    fan_out_limit = FanOutLimit(max_changed_files, weight_large_changes)
+    mirrors = RepoMirrors(mirror_dir) if mirror_dir else None
+    with open_changed_files_index(changed_files_index) as index:
+        sources = [
+            source(
+                ctx.obj["evg_api"],
+                ctx.obj["mongo"],
+                get_after_date,
+                CloneMode(clone_mode),
+                index,
+                fan_out_limit,
+                mirrors,
+                _minutes_to_seconds(time_budget_minutes),
+            )
+            for source in (test_mapping_work_item_source, task_mapping_work_item_source)
+        ]
+        scheduler = WorkItemScheduler(sources, workers, poll_seconds, max_poll_seconds)
+
+        def stop(signum: int, frame: Any) -> None:
+            # The handler interrupts the main loop, so it only asks the threads to stop and
+            # leaves joining them to the main loop.
+            scheduler.request_stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        scheduler.start()
+        try:
+            while not scheduler.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        scheduler.stop()
 
 
 def main() -> None:
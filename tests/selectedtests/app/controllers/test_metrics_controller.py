@@ -0,0 +1,23 @@
+from starlette.testclient import TestClient
+
+
+def test_metrics_endpoint(app_client: TestClient):
+    app_client.get("/health")
+
+    response = app_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert (
+        'selected_tests_request_seconds_count{method="GET",route="/health",status="200"}'
+        in response.text
+    )
+
+
+def test_unknown_routes_are_not_labelled_by_path(app_client: TestClient):
+    app_client.get("/no/such/path")
+
+    response = app_client.get("/metrics")
+
+    assert 'route="unmatched",status="404"' in response.text
+    assert "/no/such/path" not in response.text
@@ -30,6 +30,78 @@ def test_GET_test_mappings_found_with_threshold_param(
     assert response.json() == {"test_mappings": ["test_mapping_1", "test_mapping_2"]}
 
 
+@patch(ns("get_correlated_test_mappings"))
+@helpers_patch("get_evg_project")
+def test_GET_test_mappings_found_with_lookback_months_param(
+    get_evg_project_mock, get_correlated_test_mappings_mock, app_client: TestClient
+):
+    project = "valid-evergreen-project"
+    get_evg_project_mock.return_value = MagicMock(identifier=project)
+    get_correlated_test_mappings_mock.return_value = ["test_mapping_1"]
+
+    response = app_client.get(
+        f"/projects/{project}/test-mappings?changed_files=src/file1.js&lookback_months=6"
+    )
+    assert response.status_code == 200
+    assert response.json() == {"test_mappings": ["test_mapping_1"]}
+    assert get_correlated_test_mappings_mock.call_args[0][1:] == (
+        ["src/file1.js"],
+        project,
+        0,
+        6,
+    )
+
+
+@patch(ns("get_correlated_test_mappings"))
+@helpers_patch("get_evg_project")
+def test_GET_test_mappings_served_from_mapping_index(
+    get_evg_project_mock, get_correlated_test_mappings_mock, app_client: TestClient
+):
+    project = "valid-evergreen-project"
+    get_evg_project_mock.return_value = MagicMock(identifier=project)
+    mapping_index = MagicMock()
+    mapping_index.get_correlated_test_mappings.return_value = ["test_mapping_1"]
+    app_client.app.state.mapping_index = mapping_index
+
+    response = app_client.get(f"/projects/{project}/test-mappings?changed_files=src/file1.js")
+    assert response.status_code == 200
+    assert response.json() == {"test_mappings": ["test_mapping_1"]}
+    get_correlated_test_mappings_mock.assert_not_called()
+
+
+@patch(ns("get_correlated_test_mappings"))
+@helpers_patch("get_evg_project")
+def test_GET_test_mappings_falls_back_to_db_for_unindexed_project(
+    get_evg_project_mock, get_correlated_test_mappings_mock, app_client: TestClient
+):
+    project = "valid-evergreen-project"
+    get_evg_project_mock.return_value = MagicMock(identifier=project)
+    get_correlated_test_mappings_mock.return_value = ["test_mapping_1"]
+    mapping_index = MagicMock()
+    mapping_index.get_correlated_test_mappings.return_value = None
+    app_client.app.state.mapping_index = mapping_index
+
+    response = app_client.get(f"/projects/{project}/test-mappings?changed_files=src/file1.js")
+    assert response.status_code == 200
+    assert response.json() == {"test_mappings": ["test_mapping_1"]}
+    get_correlated_test_mappings_mock.assert_called_once()
+
+
+@patch(ns("get_correlated_test_mappings"))
+@helpers_patch("get_evg_project")
+def test_GET_test_mappings_with_invalid_lookback_months_param(
+    get_evg_project_mock, get_correlated_test_mappings_mock, app_client: TestClient
+):
+    project = "valid-evergreen-project"
+    get_evg_project_mock.return_value = MagicMock(identifier=project)
+
+    response = app_client.get(
+        f"/projects/{project}/test-mappings?changed_files=src/file1.js&lookback_months=0"
+    )
+    assert response.status_code == 422
+    get_correlated_test_mappings_mock.assert_not_called()
+
+
 @patch(ns("get_correlated_test_mappings"))
 @helpers_patch("get_evg_project")
 def test_GET_test_mappings_found_without_threshold_param(
@@ -1,5 +1,9 @@
+from unittest.mock import MagicMock, patch
+
 from starlette.testclient import TestClient
 
+from selectedtests.app import app as under_test
+
 
 def test_swagger_endpoint(app_client: TestClient):
     response = app_client.get("/swagger")
@@ -9,3 +13,28 @@ def test_swagger_endpoint(app_client: TestClient):
 def test_swagger_json_endpoint(app_client: TestClient):
     response = app_client.get("/swagger.json")
     assert response.status_code == 200
+
+
+@patch("selectedtests.app.app.ConfigWatcher")
+def test_mapping_index_is_invalidated_by_a_config_watcher(config_watcher_mock):
+    mapping_index = MagicMock()
+
+    with TestClient(under_test.create_app(MagicMock(), MagicMock(), mapping_index)):
+        config_watcher_mock.from_env.return_value.start.assert_called_once()
+        mapping_index.start.assert_called_once()
+
+    config_watcher_mock.from_env.return_value.stop.assert_called_once()
+    mapping_index.stop.assert_called_once()
+
+
+@patch("selectedtests.app.app.ConfigWatcher")
+def test_config_watcher_can_be_left_out(config_watcher_mock):
+    mapping_index = MagicMock()
+
+    with TestClient(
+        under_test.create_app(MagicMock(), MagicMock(), mapping_index, watch_config=False)
+    ):
+        mapping_index.start.assert_called_once()
+
+    config_watcher_mock.from_env.assert_not_called()
+    mapping_index.stop.assert_called_once()
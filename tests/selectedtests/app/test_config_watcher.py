@@ -0,0 +1,150 @@
+import queue
+import time
+
+from unittest.mock import MagicMock
+
+from pymongo.errors import OperationFailure
+
+import selectedtests.app.config_watcher as under_test
+
+from selectedtests.project_config import GENERATION_KEY
+
+
+class ChangeStreamStandIn(object):
+    """Stand-in for a change stream, returning the changes put on its queue."""
+
+    def __init__(self):
+        self.changes = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def try_next(self):
+        try:
+            return self.changes.get(timeout=0.01)
+        except queue.Empty:
+            return None
+
+
+class ProjectConfigStandIn(object):
+    """Stand-in for the project_config collection of a replica set, or of a standalone server."""
+
+    def __init__(self, replica_set=True):
+        self.documents = {}
+        self.replica_set = replica_set
+        self.streams = []
+
+    def find(self, query, projection):
+        return [
+            {"project": doc["project"], GENERATION_KEY: doc[GENERATION_KEY]}
+            for doc in self.documents.values()
+        ]
+
+    def watch(self, max_await_time_ms):
+        if not self.replica_set:
+            raise OperationFailure("only supported on replica sets", code=40573)
+        stream = ChangeStreamStandIn()
+        self.streams.append(stream)
+        return stream
+
+    def save(self, project):
+        doc = self.documents.setdefault(project, {"project": project, GENERATION_KEY: 0})
+        doc[GENERATION_KEY] += 1
+        for stream in self.streams:
+            stream.changes.put({"operationType": "update", "documentKey": {"_id": project}})
+
+
+def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestProjectGenerations:
+    def test_listeners_are_called_when_a_generation_changes(self):
+        generations = under_test.ProjectGenerations()
+        listener = MagicMock()
+        generations.subscribe(listener)
+
+        assert generations.publish("project-1", 1)
+        assert not generations.publish("project-1", 1)
+        assert generations.publish("project-1", 2)
+
+        assert generations.get("project-1") == 2
+        assert [call[0] for call in listener.call_args_list] == [("project-1", 1), ("project-1", 2)]
+
+    def test_failing_listener_does_not_stop_the_others(self):
+        generations = under_test.ProjectGenerations()
+        listener = MagicMock()
+        generations.subscribe(MagicMock(side_effect=ValueError("failed")))
+        generations.subscribe(listener)
+
+        generations.publish("project-1", 1)
+
+        listener.assert_called_once_with("project-1", 1)
+
+
+class TestConfigWatcher:
+    def test_poll_publishes_every_project(self):
+        collection = ProjectConfigStandIn()
+        collection.save("project-1")
+        collection.save("project-2")
+        collection.save("project-2")
+        mongo = MagicMock()
+        mongo.project_config.return_value = collection
+        generations = under_test.ProjectGenerations()
+
+        under_test.ConfigWatcher(mongo, generations).poll()
+
+        assert generations.get("project-1") == 1
+        assert generations.get("project-2") == 2
+
+    def test_changes_are_published_from_the_change_stream(self):
+        collection = ProjectConfigStandIn()
+        collection.save("project-1")
+        mongo = MagicMock()
+        mongo.project_config.return_value = collection
+        generations = under_test.ProjectGenerations()
+        watcher = under_test.ConfigWatcher(mongo, generations, poll_seconds=60)
+
+        watcher.start()
+        try:
+            assert wait_for(lambda: generations.get("project-1") == 1)
+            collection.save("project-1")
+            collection.save("project-2")
+            assert wait_for(lambda: generations.get("project-1") == 2)
+            assert wait_for(lambda: generations.get("project-2") == 1)
+        finally:
+            watcher.stop()
+
+        assert watcher.use_change_stream
+
+    def test_falls_back_to_polling_without_change_streams(self):
+        collection = ProjectConfigStandIn(replica_set=False)
+        collection.save("project-1")
+        mongo = MagicMock()
+        mongo.project_config.return_value = collection
+        generations = under_test.ProjectGenerations()
+        watcher = under_test.ConfigWatcher(mongo, generations, poll_seconds=0.01)
+
+        watcher.start()
+        try:
+            assert wait_for(lambda: generations.get("project-1") == 1)
+            collection.save("project-1")
+            assert wait_for(lambda: generations.get("project-1") == 2)
+        finally:
+            watcher.stop()
+
+        assert not watcher.use_change_stream
+
+    def test_from_env_reads_poll_seconds(self):
+        watcher = under_test.ConfigWatcher.from_env(
+            MagicMock(), under_test.ProjectGenerations(), {under_test.POLL_SECONDS_ENV_VAR: "5"}
+        )
+
+        assert watcher.poll_seconds == 5
@@ -0,0 +1,211 @@
+import time
+
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+from prometheus_client import REGISTRY
+from pymongo import ReadPreference
+
+import selectedtests.app.mapping_index as under_test
+
+from selectedtests.datasource.mappings_loader import TASK_MAPPING_SCHEMA, TEST_MAPPING_SCHEMA
+
+
+def mongo_with_mappings(task_mappings, tasks):
+    """Return a mongo mock with the given task mappings and their tasks."""
+    mongo = MagicMock()
+    for collection in [
+        mongo.task_mappings,
+        mongo.task_mappings_tasks,
+        mongo.test_mappings,
+        mongo.test_mappings_test_files,
+    ]:
+        collection.return_value.with_options.return_value = collection.return_value
+    mongo.task_mappings.return_value.find.side_effect = lambda query, projection: [
+        dict(mapping) for mapping in task_mappings if mapping["project"] == query["project"]
+    ]
+    mongo.task_mappings_tasks.return_value.find.side_effect = lambda query, projection: [
+        dict(task) for task in tasks if task["task_mapping_id"] in query["task_mapping_id"]["$in"]
+    ]
+    mongo.test_mappings.return_value.find.return_value = []
+    return mongo
+
+
+def task_mapping(mapping_id, source_file, seen_count, project="project-1"):
+    return {
+        "_id": mapping_id,
+        "project": project,
+        "repo": "repo",
+        "branch": "master",
+        "source_file": source_file,
+        "source_file_seen_count": seen_count,
+    }
+
+
+def task(mapping_id, name, flip_count):
+    return {
+        "_id": f"{mapping_id}-{name}",
+        "task_mapping_id": mapping_id,
+        "name": name,
+        "variant": "variant",
+        "flip_count": flip_count,
+    }
+
+
+class TestProjectMappings:
+    def test_mappings_are_returned_with_children_above_threshold(self):
+        mongo = mongo_with_mappings(
+            [task_mapping("m1", "src/a.js", 10), task_mapping("m2", "src/b.js", 4)],
+            [task("m1", "t1", 2), task("m1", "t2", 8), task("m2", "t1", 4)],
+        )
+        index = under_test.ProjectMappings.load(mongo, TASK_MAPPING_SCHEMA, "project-1")
+
+        mappings = index.get_correlated(["src/a.js", "src/c.js"], Decimal("0.5"))
+
+        assert mappings == [
+            {
+                "project": "project-1",
+                "repo": "repo",
+                "branch": "master",
+                "source_file": "src/a.js",
+                "source_file_seen_count": 10,
+                "tasks": [{"name": "t2", "variant": "variant", "flip_count": 8}],
+            }
+        ]
+
+    def test_children_are_sorted_by_count_and_keep_fractional_counts(self):
+        mongo = mongo_with_mappings(
+            [task_mapping("m1", "src/a.js", 10)],
+            [task("m1", "t1", 2.5), task("m1", "t2", 8), task("m1", "t3", 1)],
+        )
+        index = under_test.ProjectMappings.load(mongo, TASK_MAPPING_SCHEMA, "project-1")
+
+        mappings = index.get_correlated(["src/a.js"], Decimal("0.2"))
+
+        assert mappings[0]["tasks"] == [
+            {"name": "t2", "variant": "variant", "flip_count": 8},
+            {"name": "t1", "variant": "variant", "flip_count": 2.5},
+        ]
+
+    def test_mapping_without_children_above_threshold_is_still_returned(self):
+        mongo = mongo_with_mappings([task_mapping("m1", "src/a.js", 10)], [task("m1", "t1", 1)])
+        index = under_test.ProjectMappings.load(mongo, TASK_MAPPING_SCHEMA, "project-1")
+
+        mappings = index.get_correlated(["src/a.js"], Decimal("0.5"))
+
+        assert len(mappings) == 1
+        assert mappings[0]["tasks"] == []
+
+
+class TestMappingIndex:
+    def test_projects_are_not_indexed_until_reloaded(self):
+        mongo = mongo_with_mappings([task_mapping("m1", "src/a.js", 10)], [])
+        index = under_test.MappingIndex(mongo)
+        index.invalidate("project-1", 1)
+
+        assert index.get_correlated_task_mappings(["src/a.js"], "project-1", Decimal(0)) is None
+
+    def test_reload_stale_loads_the_invalidated_projects(self):
+        mongo = mongo_with_mappings([task_mapping("m1", "src/a.js", 10)], [task("m1", "t1", 5)])
+        index = under_test.MappingIndex(mongo)
+        index.invalidate("project-1", 1)
+
+        assert index.reload_stale() == 1
+
+        task_mappings = index.get_correlated_task_mappings(["src/a.js"], "project-1", Decimal(0))
+        assert task_mappings[0]["tasks"] == [{"name": "t1", "variant": "variant", "flip_count": 5}]
+        assert index.get_correlated_test_mappings(["src/a.js"], "project-1", Decimal(0)) == []
+        assert index.get_correlated_task_mappings(["src/a.js"], "project-2", Decimal(0)) is None
+        assert index.reload_stale() == 0
+
+    def test_reload_reads_from_the_primary(self):
+        mongo = mongo_with_mappings([task_mapping("m1", "src/a.js", 10)], [task("m1", "t1", 5)])
+        index = under_test.MappingIndex(mongo)
+        index.invalidate("project-1", 1)
+
+        index.reload_stale()
+
+        for collection in [mongo.task_mappings, mongo.task_mappings_tasks]:
+            collection.return_value.with_options.assert_called_once_with(
+                read_preference=ReadPreference.PRIMARY
+            )
+
+    def test_lookups_are_counted_by_whether_the_project_is_indexed(self):
+        mongo = mongo_with_mappings([task_mapping("m1", "src/a.js", 10)], [])
+        index = under_test.MappingIndex(mongo)
+        index.invalidate("project-1", 1)
+        index.reload_stale()
+
+        def lookups(result):
+            return REGISTRY.get_sample_value(
+                "selected_tests_mapping_index_lookups_total",
+                {"mapping_type": "task_mappings", "result": result},
+            )
+
+        hits, misses = lookups("hit"), lookups("miss")
+        index.get_correlated_task_mappings(["src/a.js"], "project-1", Decimal(0))
+        index.get_correlated_task_mappings(["src/a.js"], "project-2", Decimal(0))
+
+        assert hits + 1 == lookups("hit")
+        assert misses + 1 == lookups("miss")
+
+    def test_invalidate_drops_the_project_until_it_is_reloaded(self):
+        tasks = [task("m1", "t1", 5)]
+        mongo = mongo_with_mappings([task_mapping("m1", "src/a.js", 10)], tasks)
+        index = under_test.MappingIndex(mongo)
+        index.invalidate("project-1", 1)
+        index.reload_stale()
+
+        tasks.append(task("m1", "t2", 6))
+        index.invalidate("project-1", 2)
+
+        assert index.get_correlated_task_mappings(["src/a.js"], "project-1", Decimal(0)) is None
+        index.reload_stale()
+        task_mappings = index.get_correlated_task_mappings(["src/a.js"], "project-1", Decimal(0))
+        assert [task["name"] for task in task_mappings[0]["tasks"]] == ["t2", "t1"]
+
+    def test_project_invalidated_while_loading_is_not_swapped_in(self):
+        mongo = mongo_with_mappings([task_mapping("m1", "src/a.js", 10)], [])
+        index = under_test.MappingIndex(mongo)
+        index.invalidate("project-1", 1)
+        find = mongo.task_mappings.return_value.find.side_effect
+
+        def find_then_invalidate(query, projection):
+            index.invalidate("project-1", 2)
+            return find(query, projection)
+
+        mongo.task_mappings.return_value.find.side_effect = find_then_invalidate
+
+        assert index.reload_stale() == 0
+        assert index.get_correlated_task_mappings(["src/a.js"], "project-1", Decimal(0)) is None
+
+    def test_projects_that_fail_to_load_are_retried(self):
+        mongo = mongo_with_mappings([], [])
+        mongo.test_mappings.return_value.find.side_effect = [ValueError("failed"), []]
+        index = under_test.MappingIndex(mongo)
+        index.invalidate("project-1", 1)
+
+        assert index.reload_stale() == 0
+        assert index.reload_stale() == 1
+
+    def test_from_env_is_disabled_by_default(self):
+        assert under_test.MappingIndex.from_env(MagicMock(), {}) is None
+
+    def test_from_env_is_enabled_by_the_environment(self):
+        index = under_test.MappingIndex.from_env(MagicMock(), {under_test.ENABLED_ENV_VAR: "true"})
+
+        assert isinstance(index, under_test.MappingIndex)
+
+    def test_start_reloads_invalidated_projects_in_the_background(self):
+        mongo = mongo_with_mappings([], [])
+        index = under_test.MappingIndex(mongo)
+
+        index.start()
+        index.invalidate("project-1", 1)
+        for _ in range(100):
+            if index.get_correlated_test_mappings([], "project-1", Decimal(0)) is not None:
+                break
+            time.sleep(0.01)
+        index.stop()
+
+        assert (TEST_MAPPING_SCHEMA.collection, "project-1") in index._projects
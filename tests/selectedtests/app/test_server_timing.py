@@ -0,0 +1,114 @@
+import threading
+import time
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from starlette.testclient import TestClient
+
+import selectedtests.app.server_timing as under_test
+
+from selectedtests.app.app import create_app
+
+NS = "selectedtests.app.server_timing"
+CONTROLLER_NS = "selectedtests.app.controllers.project_test_mappings_controller"
+EVERGREEN_NS = "selectedtests.app.evergreen"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+@pytest.fixture()
+def timed_app_client(monkeypatch):
+    monkeypatch.setenv(under_test.ENABLED_ENV_VAR, "true")
+    return TestClient(create_app(MagicMock(), MagicMock()))
+
+
+def parts(server_timing):
+    return [part.split(";")[0] for part in server_timing.split(", ")]
+
+
+class TestIsEnabled:
+    def test_enabled_by_environment(self):
+        assert under_test.is_enabled({under_test.ENABLED_ENV_VAR: "true"})
+        assert not under_test.is_enabled({under_test.ENABLED_ENV_VAR: "false"})
+        assert not under_test.is_enabled({})
+
+
+class TestRequestTimings:
+    def test_header_lists_the_parts_in_milliseconds(self):
+        timings = under_test.RequestTimings()
+        timings.record(under_test.MONGO_TIMING, 0.01)
+        timings.record(under_test.MONGO_TIMING, 0.0025)
+        timings.record(under_test.ENDPOINT_TIMING, 0.02)
+
+        assert 'mongo;dur=12.5;desc="Mongo aggregation"' == timings.header()
+
+
+class TestTimed:
+    def test_nothing_is_recorded_outside_of_a_timed_request(self):
+        with under_test.timed(under_test.MONGO_TIMING):
+            pass
+
+        assert under_test._request_timings.get() is None
+
+
+class TestStackSampler:
+    def test_stacks_of_the_sampled_threads_are_counted(self):
+        def busy_wait():
+            end = time.monotonic() + 0.2
+            while time.monotonic() < end:
+                pass
+
+        thread = threading.Thread(target=busy_wait)
+        thread.start()
+        sampler = under_test.StackSampler({thread.ident}, interval=0.01)
+        sampler.start()
+        thread.join()
+        sampler.stop()
+
+        assert sampler.stacks
+        assert all(stack.endswith("busy_wait") for stack in sampler.stacks)
+
+
+class TestServerTimingMiddleware:
+    @patch(CONTROLLER_NS + ".get_correlated_test_mappings")
+    @patch(EVERGREEN_NS + ".get_evg_project")
+    def test_timed_requests_are_broken_down(
+        self, get_evg_project_mock, get_correlated_test_mappings_mock, timed_app_client
+    ):
+        get_evg_project_mock.return_value = MagicMock(identifier="project")
+        get_correlated_test_mappings_mock.return_value = []
+
+        response = timed_app_client.get(
+            "/projects/project/test-mappings?changed_files=src/file1.js",
+            headers={under_test.TIMING_HEADER: "1"},
+        )
+
+        assert response.status_code == 200
+        assert ["evergreen", "mongo", "serialize", "total"] == sorted(
+            parts(response.headers["Server-Timing"])
+        )
+
+    def test_requests_not_asking_are_not_timed(self, timed_app_client):
+        response = timed_app_client.get("/health")
+
+        assert "Server-Timing" not in response.headers
+
+    def test_nothing_is_timed_when_disabled(self, app_client):
+        response = app_client.get("/health", headers={under_test.TIMING_HEADER: "1"})
+
+        assert "Server-Timing" not in response.headers
+
+    @patch(ns("LOGGER"))
+    def test_profiled_requests_are_logged(self, logger_mock, timed_app_client):
+        response = timed_app_client.get(
+            "/health", headers={under_test.TIMING_HEADER: under_test.PROFILE_HEADER_VALUE}
+        )
+
+        assert ["total"] == parts(response.headers["Server-Timing"])
+        logger_mock.info.assert_called_once()
+        assert "/health" == logger_mock.info.call_args[1]["path"]
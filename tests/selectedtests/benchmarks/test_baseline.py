@@ -0,0 +1,72 @@
+import os
+
+from tempfile import TemporaryDirectory
+
+import pytest
+
+import selectedtests.benchmarks.baseline as under_test
+
+from selectedtests.benchmarks.measure import BenchmarkResult
+
+PARAMETERS = {"commits": 10}
+
+
+def result(items_per_second=100.0, peak_allocated_bytes=1000):
+    return BenchmarkResult("bench", 10, 0.1, items_per_second, 2000, peak_allocated_bytes)
+
+
+class TestBaseline:
+    def test_saved_baseline_is_loaded(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "baseline.json")
+            under_test.save_baseline(path, PARAMETERS, [result()])
+
+            baseline = under_test.load_baseline(path)
+
+        assert baseline["parameters"] == PARAMETERS
+        assert baseline["results"]["bench"]["items_per_second"] == 100.0
+
+    def test_no_regressions_within_tolerance(self):
+        baseline = {"parameters": PARAMETERS, "results": {"bench": result()._asdict()}}
+
+        regressions = under_test.find_regressions(
+            [result(80.0, 1200)], baseline, PARAMETERS, tolerance=0.25
+        )
+
+        assert [] == regressions
+
+    def test_slower_throughput_is_a_regression(self):
+        baseline = {"parameters": PARAMETERS, "results": {"bench": result()._asdict()}}
+
+        regressions = under_test.find_regressions([result(50.0)], baseline, PARAMETERS, 0.25)
+
+        assert [under_test.Regression("bench", "items_per_second", 100.0, 50.0)] == regressions
+
+    def test_more_allocations_are_a_regression(self):
+        baseline = {"parameters": PARAMETERS, "results": {"bench": result()._asdict()}}
+
+        regressions = under_test.find_regressions(
+            [result(peak_allocated_bytes=2000)], baseline, PARAMETERS, 0.25
+        )
+
+        assert ["peak_allocated_bytes"] == [regression.metric for regression in regressions]
+
+    def test_benchmarks_missing_from_the_baseline_are_not_checked(self):
+        baseline = {"parameters": PARAMETERS, "results": {}}
+
+        assert [] == under_test.find_regressions([result(1.0)], baseline, PARAMETERS, 0.25)
+
+    def test_different_parameters_can_not_be_compared(self):
+        baseline = {"parameters": {"commits": 20}, "results": {}}
+
+        with pytest.raises(ValueError):
+            under_test.find_regressions([result()], baseline, PARAMETERS, 0.25)
+
+    def test_only_the_metrics_given_are_checked(self):
+        baseline = {"parameters": PARAMETERS, "results": {"bench": result()._asdict()}}
+
+        regressions = under_test.find_regressions(
+            [result(50.0)], baseline, PARAMETERS, 0.25, checked_metrics={"seconds": False}
+        )
+
+        assert [] == regressions
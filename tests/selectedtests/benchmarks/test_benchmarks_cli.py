@@ -0,0 +1,120 @@
+import os
+
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+import selectedtests.benchmarks.benchmarks_cli as under_test
+
+from selectedtests.benchmarks.load_test import LoadTestResult
+from selectedtests.benchmarks.measure import BenchmarkResult
+from selectedtests.benchmarks.task_mapping_benchmark import TaskMappingResult
+
+NS = "selectedtests.benchmarks.benchmarks_cli"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+def results(items_per_second):
+    return [BenchmarkResult("create_mappings", 11, 0.1, items_per_second, 2000, 1000)]
+
+
+def task_mapping_result(api_calls_per_version):
+    return TaskMappingResult(
+        "generate_task_mappings", 8, 0.1, 80.0, 2000, 1000, api_calls_per_version, 0, 4.0, 0.125
+    )
+
+
+class TestMining:
+    @patch(ns("run_mining_benchmarks"))
+    def test_baseline_is_saved_then_checked(self, run_mining_benchmarks_mock):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            baseline = os.path.abspath("baseline.json")
+            run_mining_benchmarks_mock.return_value = results(100.0)
+            result = runner.invoke(
+                under_test.cli,
+                ["mining", "--commits=10", f"--baseline={baseline}", "--save-baseline"],
+            )
+            assert result.exit_code == 0
+            assert os.path.exists(baseline)
+
+            run_mining_benchmarks_mock.return_value = results(95.0)
+            result = runner.invoke(
+                under_test.cli, ["mining", "--commits=10", f"--baseline={baseline}"]
+            )
+            assert result.exit_code == 0
+            assert "No regressions" in result.output
+
+    @patch(ns("run_mining_benchmarks"))
+    def test_regressions_fail_the_command(self, run_mining_benchmarks_mock):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            baseline = os.path.abspath("baseline.json")
+            run_mining_benchmarks_mock.return_value = results(100.0)
+            runner.invoke(
+                under_test.cli,
+                ["mining", "--commits=10", f"--baseline={baseline}", "--save-baseline"],
+            )
+
+            run_mining_benchmarks_mock.return_value = results(10.0)
+            result = runner.invoke(
+                under_test.cli, ["mining", "--commits=10", f"--baseline={baseline}"]
+            )
+            assert result.exit_code == 1
+            assert "REGRESSION create_mappings items_per_second" in result.output
+
+
+class TestTaskMappings:
+    @patch(ns("run_task_mapping_benchmark"))
+    def test_more_calls_per_version_are_a_regression(self, run_task_mapping_benchmark_mock):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            baseline = os.path.abspath("baseline.json")
+            run_task_mapping_benchmark_mock.return_value = task_mapping_result(21.0)
+            result = runner.invoke(
+                under_test.cli,
+                ["task-mappings", "--commits=10", f"--baseline={baseline}", "--save-baseline"],
+            )
+            assert result.exit_code == 0
+            assert "12.5%" in result.output
+
+            run_task_mapping_benchmark_mock.return_value = task_mapping_result(42.0)
+            result = runner.invoke(
+                under_test.cli, ["task-mappings", "--commits=10", f"--baseline={baseline}"]
+            )
+            assert result.exit_code == 1
+            assert "REGRESSION generate_task_mappings api_calls_per_version" in result.output
+
+
+def load_test_results(mongo_ops_per_request):
+    return [
+        LoadTestResult(
+            "test-mappings/10", 100, 1.0, 100.0, 8.0, 12.0, 15.0, 0, mongo_ops_per_request
+        )
+    ]
+
+
+class TestLoadTest:
+    @patch(ns("run_load_test"))
+    def test_more_mongo_ops_per_request_are_a_regression(self, run_load_test_mock):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            baseline = os.path.abspath("baseline.json")
+            run_load_test_mock.return_value = load_test_results(1.0)
+            result = runner.invoke(
+                under_test.cli,
+                ["load-test", "--changed-files=10", f"--baseline={baseline}", "--save-baseline"],
+            )
+            assert result.exit_code == 0
+            assert "test-mappings/10" in result.output
+
+            run_load_test_mock.return_value = load_test_results(2.0)
+            result = runner.invoke(
+                under_test.cli, ["load-test", "--changed-files=10", f"--baseline={baseline}"]
+            )
+            assert result.exit_code == 1
+            assert "REGRESSION test-mappings/10 mongo_ops_per_request" in result.output
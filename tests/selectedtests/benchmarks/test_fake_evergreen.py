@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytz
+import requests
+
+import selectedtests.benchmarks.fake_evergreen as under_test
+
+from selectedtests.helpers import get_evg_api
+from selectedtests.metrics import EVERGREEN_API_CALLS
+
+FIRST_DATE = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+
+def revisions(count):
+    return [(f"{i:040x}", FIRST_DATE + timedelta(hours=i)) for i in range(count)]
+
+
+def project(count=5, **kwargs):
+    return under_test.FakeProject(revisions(count), under_test.EvergreenSpec(**kwargs))
+
+
+class TestFakeProject:
+    def test_versions_are_listed_most_recent_first(self):
+        fake_project = project(3, variants=2, tasks_per_variant=3)
+
+        assert [f"{i:040x}" for i in (2, 1, 0)] == [
+            version["revision"] for version in fake_project.versions
+        ]
+        assert 6 == len(fake_project.builds)
+        assert all(len(tasks) == 3 for tasks in fake_project.tasks.values())
+
+    def test_statuses_do_not_change_without_flips(self):
+        fake_project = project(5, flip_rate=0.0)
+
+        statuses = {task["status"] for tasks in fake_project.tasks.values() for task in tasks}
+
+        assert {"success"} == statuses
+
+    def test_same_spec_generates_the_same_project(self):
+        assert project(5, flip_rate=0.5).tasks == project(5, flip_rate=0.5).tasks
+
+
+class TestFakeEvergreenServer:
+    def test_project_is_served_through_the_evergreen_client(self):
+        fake_project = project(5, variants=2, tasks_per_variant=3)
+        behavior = under_test.ServerBehavior(page_size=2)
+        with under_test.FakeEvergreenServer(fake_project, behavior) as server:
+            evg_api = get_evg_api(server.url)
+
+            projects = evg_api.all_projects()
+            versions = list(evg_api.versions_by_project(under_test.PROJECT))
+            builds = versions[0].get_builds()
+            tasks = builds[0].get_tasks()
+            build = versions[1].build_by_variant("variant_1")
+            manifest = versions[0].get_manifest()
+
+        assert [under_test.PROJECT] == [evg_project.identifier for evg_project in projects]
+        assert 5 == len(versions)
+        assert FIRST_DATE + timedelta(hours=4) == versions[0].create_time
+        assert ["variant_0", "variant_1"] == [build.build_variant for build in builds]
+        assert ["task_0", "task_1", "task_2"] == [task.display_name for task in tasks]
+        assert versions[1].version_id == build.version
+        assert versions[0].revision == manifest.revision
+        assert {} == manifest.modules
+
+    def test_calls_are_counted(self):
+        behavior = under_test.ServerBehavior(page_size=2)
+        with under_test.FakeEvergreenServer(project(5), behavior) as server:
+            requests.get(f"{server.url}/rest/v2/projects/{under_test.PROJECT}/versions")
+            requests.get(f"{server.url}/rest/v2/projects/{under_test.PROJECT}/versions?start=2")
+            requests.get(f"{server.url}/rest/v2/projects")
+            statistics = server.statistics()
+
+            server.reset_statistics()
+
+            assert {} == server.statistics().calls
+        assert {"versions": 2, "projects": 1} == statistics.calls
+        assert 0 == statistics.errors
+
+    def test_responses_to_the_client_are_counted_in_the_metrics(self):
+        with under_test.FakeEvergreenServer(project(5)) as server:
+            evg_api = get_evg_api(server.url)
+            calls = EVERGREEN_API_CALLS._value.get()
+
+            evg_api.all_projects()
+
+        assert calls + 1 == EVERGREEN_API_CALLS._value.get()
+
+    def test_unknown_ids_are_not_found(self):
+        with under_test.FakeEvergreenServer(project()) as server:
+            response = requests.get(f"{server.url}/rest/v2/builds/unknown")
+
+        assert 404 == response.status_code
+
+    def test_errors_are_injected(self):
+        behavior = under_test.ServerBehavior(error_rate=1.0)
+        with under_test.FakeEvergreenServer(project(), behavior) as server:
+            response = requests.get(f"{server.url}/rest/v2/projects")
+            statistics = server.statistics()
+
+        assert 503 == response.status_code
+        assert 1 == statistics.errors
@@ -0,0 +1,119 @@
+from unittest.mock import MagicMock, patch
+
+from fastapi import FastAPI
+
+import selectedtests.benchmarks.load_test as under_test
+
+from selectedtests.benchmarks.fake_evergreen import PROJECT, PROJECT_JSON
+from selectedtests.benchmarks.mapping_dataset import MappingDatasetSpec
+
+NS = "selectedtests.benchmarks.load_test"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+class TestPercentile:
+    def test_nearest_rank(self):
+        values = [float(value) for value in range(1, 101)]
+
+        assert 50.0 == under_test.percentile(values, 0.5)
+        assert 95.0 == under_test.percentile(values, 0.95)
+        assert 100.0 == under_test.percentile(values, 1.0)
+
+    def test_no_values(self):
+        assert 0.0 == under_test.percentile([], 0.5)
+
+
+class TestScenarioQueries:
+    def test_queries_ask_for_the_given_number_of_files(self):
+        queries = under_test.scenario_queries("test-mappings", 3, MappingDatasetSpec(10), 1)
+
+        assert under_test.QUERIES_PER_SCENARIO == len(queries)
+        for query in queries:
+            assert query.startswith(f"/projects/{PROJECT}/test-mappings?changed_files=")
+            assert 3 == len(query.split("=")[1].split(","))
+
+    def test_queries_are_deterministic(self):
+        spec = MappingDatasetSpec(10)
+
+        assert under_test.scenario_queries(
+            "task-mappings", 2, spec, 1
+        ) == under_test.scenario_queries("task-mappings", 2, spec, 1)
+
+
+class TestStubEvergreenApi:
+    def test_projects_are_served_from_memory(self):
+        evg_api = under_test.StubEvergreenApi([PROJECT_JSON])
+
+        assert [PROJECT] == [project.identifier for project in evg_api.all_projects()]
+
+
+class TestCommandCounter:
+    def test_started_commands_are_counted(self):
+        counter = under_test.CommandCounter()
+        counter.started(MagicMock())
+        counter.started(MagicMock())
+        counter.succeeded(MagicMock())
+
+        assert 2 == counter.count
+        counter.reset()
+        assert 0 == counter.count
+
+
+class TestDriveLoad:
+    def test_requests_are_sent_and_timed(self):
+        app = FastAPI()
+
+        @app.get("/ok")
+        def ok():
+            return {}
+
+        with under_test.AppServer(app) as server:
+            latencies, errors, seconds = under_test.drive_load(
+                server.url, ["/ok", "/missing"], 10, 3
+            )
+
+        assert 10 == len(latencies)
+        assert latencies == sorted(latencies)
+        assert 5 == errors
+        assert seconds > 0
+
+
+class TestRunLoadTest:
+    @patch(ns("clear_mappings"))
+    @patch(ns("seed_mappings"))
+    @patch(ns("MongoClient"))
+    def test_both_controllers_are_load_tested(
+        self, mongo_client_mock, seed_mappings_mock, clear_mappings_mock
+    ):
+        results = under_test.run_load_test(
+            "mongodb://localhost", MappingDatasetSpec(10), [1, 5], 4, 2
+        )
+
+        assert [
+            "test-mappings/1",
+            "test-mappings/5",
+            "task-mappings/1",
+            "task-mappings/5",
+        ] == [result.name for result in results]
+        for result in results:
+            assert 4 == result.requests
+            assert 0 == result.errors
+        seed_mappings_mock.assert_called_once()
+        clear_mappings_mock.assert_called_once()
+
+    @patch(ns("create_app"), wraps=under_test.create_app)
+    @patch(ns("clear_mappings"))
+    @patch(ns("seed_mappings"))
+    @patch(ns("MongoClient"))
+    def test_mapping_index_only_holds_the_synthetic_project(
+        self, mongo_client_mock, seed_mappings_mock, clear_mappings_mock, create_app_mock
+    ):
+        under_test.run_load_test(
+            "mongodb://localhost", MappingDatasetSpec(10), [1], 1, 1, mapping_index=True
+        )
+
+        assert create_app_mock.call_args[1]["watch_config"] is False
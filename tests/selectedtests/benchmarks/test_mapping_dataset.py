@@ -0,0 +1,71 @@
+from unittest.mock import MagicMock, patch
+
+import selectedtests.benchmarks.mapping_dataset as under_test
+
+from selectedtests.benchmarks.synthetic_repo import FanOut
+
+NS = "selectedtests.benchmarks.mapping_dataset"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+class TestGenerateMappings:
+    def test_every_source_file_is_mapped(self):
+        spec = under_test.MappingDatasetSpec(10, tests_per_file=3, fan_out=FanOut.FIXED)
+
+        test_mappings = list(under_test.generate_test_mappings(spec))
+
+        assert under_test.source_file_names(spec) == [
+            mapping["source_file"] for mapping in test_mappings
+        ]
+        for mapping in test_mappings:
+            assert 3 == len(mapping["test_files"])
+            for test_file in mapping["test_files"]:
+                assert test_file["test_file_seen_count"] <= mapping["source_file_seen_count"]
+
+    def test_tasks_are_spread_over_the_variants(self):
+        spec = under_test.MappingDatasetSpec(5, tasks_per_file=4, fan_out=FanOut.FIXED, variants=2)
+
+        task_mappings = list(under_test.generate_task_mappings(spec))
+
+        variants = {task["variant"] for mapping in task_mappings for task in mapping["tasks"]}
+        assert {"variant_0", "variant_1"} == variants
+
+    def test_same_spec_generates_the_same_dataset(self):
+        spec = under_test.MappingDatasetSpec(20)
+
+        assert list(under_test.generate_task_mappings(spec)) == list(
+            under_test.generate_task_mappings(spec)
+        )
+
+
+class TestDatasetParameters:
+    def test_fan_out_is_stored_by_value(self):
+        parameters = under_test.dataset_parameters(under_test.MappingDatasetSpec(10))
+
+        assert 10 == parameters["source_files"]
+        assert "pareto" == parameters["fan_out"]
+
+
+class TestSeedMappings:
+    @patch(ns("update_task_mappings"))
+    @patch(ns("update_test_mappings"))
+    def test_mappings_of_the_project_are_replaced(
+        self, update_test_mappings_mock, update_task_mappings_mock
+    ):
+        mongo = MagicMock()
+        mongo.test_mappings.return_value.distinct.return_value = ["id"]
+
+        under_test.seed_mappings(mongo, under_test.MappingDatasetSpec(10))
+
+        mongo.test_mappings_test_files.return_value.delete_many.assert_called_once_with(
+            {"test_mapping_id": {"$in": ["id"]}}
+        )
+        mongo.task_mappings.return_value.delete_many.assert_called_once_with(
+            {"project": under_test.PROJECT}
+        )
+        assert 10 == len(list(update_test_mappings_mock.call_args[0][0]))
+        assert 10 == len(list(update_task_mappings_mock.call_args[0][0]))
@@ -0,0 +1,19 @@
+import selectedtests.benchmarks.measure as under_test
+
+
+class TestRunBenchmark:
+    def test_each_run_is_prepared(self):
+        prepared = []
+
+        def prepare():
+            prepared.append(True)
+            return lambda: len(bytearray(100000))
+
+        result = under_test.run_benchmark("bench", prepare, repeat=2)
+
+        assert 3 == len(prepared)
+        assert "bench" == result.name
+        assert 100000 == result.items
+        assert result.items_per_second > 0
+        assert result.peak_allocated_bytes >= 100000
+        assert result.peak_rss_kb > 0
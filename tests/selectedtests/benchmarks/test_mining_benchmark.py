@@ -0,0 +1,26 @@
+from tempfile import TemporaryDirectory
+
+import selectedtests.benchmarks.mining_benchmark as under_test
+
+from selectedtests.benchmarks.synthetic_repo import RepoSpec, create_synthetic_repo
+
+
+class TestSpecParameters:
+    def test_parameters_can_be_stored_as_json(self):
+        parameters = under_test.spec_parameters(RepoSpec(10))
+
+        assert parameters["commits"] == 10
+        assert parameters["fan_out"] == "pareto"
+
+
+class TestRunMiningBenchmarks:
+    def test_every_benchmark_is_run(self):
+        with TemporaryDirectory() as tmpdir:
+            create_synthetic_repo(tmpdir, RepoSpec(5, source_files=10, test_files=10))
+
+            results = under_test.run_mining_benchmarks(tmpdir, repeat=1)
+
+        assert list(under_test.MINING_BENCHMARKS) == [result.name for result in results]
+        for result in results:
+            assert result.items > 0
+        assert 6 == results[0].items
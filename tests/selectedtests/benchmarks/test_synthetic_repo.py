@@ -0,0 +1,61 @@
+from tempfile import TemporaryDirectory
+
+import structlog
+
+import selectedtests.benchmarks.synthetic_repo as under_test
+
+from selectedtests.git_helper import modified_files_for_commit
+
+
+class TestGenerateFastImportStream:
+    def test_same_spec_generates_same_history(self):
+        spec = under_test.RepoSpec(20, rename_rate=0.5)
+
+        assert under_test.generate_fast_import_stream(
+            spec
+        ) == under_test.generate_fast_import_stream(spec)
+
+    def test_seed_changes_history(self):
+        assert under_test.generate_fast_import_stream(
+            under_test.RepoSpec(20, seed=1)
+        ) != under_test.generate_fast_import_stream(under_test.RepoSpec(20, seed=2))
+
+    def test_fixed_fan_out(self):
+        spec = under_test.RepoSpec(
+            3, files_per_commit=4, fan_out=under_test.FanOut.FIXED, rename_rate=0, test_files=0
+        )
+
+        stream = under_test.generate_fast_import_stream(spec)
+
+        commits = stream.split("commit refs/heads/")[1:]
+        assert spec.source_files == commits[0].count("M 100644")
+        for commit in commits[1:]:
+            assert 1 <= commit.count("M 100644") <= 4
+
+    def test_renames(self):
+        spec = under_test.RepoSpec(10, rename_rate=1)
+
+        stream = under_test.generate_fast_import_stream(spec)
+
+        assert 10 == stream.count("\nR ")
+
+
+class TestCreateSyntheticRepo:
+    def test_repo_has_the_generated_history(self):
+        spec = under_test.RepoSpec(10, files_per_commit=3, rename_rate=0.5, seed=3)
+        with TemporaryDirectory() as tmpdir:
+            repo = under_test.create_synthetic_repo(tmpdir, spec)
+
+            commits = list(repo.iter_commits(repo.head.commit))
+            assert 11 == len(commits)
+            assert commits[-1].committed_datetime == under_test.FIRST_COMMIT_DATE
+            for commit in commits[:-1]:
+                assert modified_files_for_commit(commit, structlog.get_logger())
+
+    def test_repo_is_deterministic(self):
+        spec = under_test.RepoSpec(5)
+        with TemporaryDirectory() as first_dir, TemporaryDirectory() as second_dir:
+            first = under_test.create_synthetic_repo(first_dir, spec)
+            second = under_test.create_synthetic_repo(second_dir, spec)
+
+            assert first.head.commit.hexsha == second.head.commit.hexsha
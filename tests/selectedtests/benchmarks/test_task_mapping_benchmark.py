@@ -0,0 +1,34 @@
+import json
+
+from tempfile import TemporaryDirectory
+
+import selectedtests.benchmarks.task_mapping_benchmark as under_test
+
+from selectedtests.benchmarks.fake_evergreen import EvergreenSpec, ServerBehavior
+from selectedtests.benchmarks.synthetic_repo import RepoSpec, create_synthetic_repo
+
+
+class TestBenchmarkParameters:
+    def test_parameters_can_be_stored_as_json(self):
+        parameters = under_test.benchmark_parameters(
+            RepoSpec(10), EvergreenSpec(), ServerBehavior()
+        )
+
+        assert json.loads(json.dumps(parameters)) == parameters
+        assert parameters["repo_commits"] == 10
+        assert parameters["server_latency"] == 0.0
+
+
+class TestRunTaskMappingBenchmark:
+    def test_every_version_with_neighbours_is_analyzed(self):
+        with TemporaryDirectory() as tmpdir:
+            create_synthetic_repo(tmpdir, RepoSpec(5, source_files=10, test_files=10))
+
+            result = under_test.run_task_mapping_benchmark(
+                tmpdir, EvergreenSpec(2, 3), ServerBehavior(), repeat=1
+            )
+
+        assert "generate_task_mappings" == result.name
+        assert 4 == result.items
+        assert result.api_calls_per_version > 0
+        assert 0 == result.api_errors
@@ -0,0 +1,48 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import selectedtests.datasource.bucket_expiry as under_test
+
+
+class TestExpireBuckets:
+    def test_expired_buckets_are_subtracted_and_dropped(self):
+        mongo = MagicMock()
+        tasks = mongo.task_mappings_tasks.return_value
+        tasks.find.return_value = [
+            {"_id": 1, "monthly_counts": {"2025-01": 2, "2025-02": 1, "2026-10": 4}}
+        ]
+        tasks.bulk_write.return_value.modified_count = 1
+        tasks.delete_many.return_value.deleted_count = 0
+        for collection in [
+            mongo.test_mappings.return_value,
+            mongo.test_mappings_test_files.return_value,
+            mongo.task_mappings.return_value,
+        ]:
+            collection.find.return_value = []
+            collection.delete_many.return_value.deleted_count = 1
+
+        result = under_test.expire_buckets(mongo, 12, now=datetime(2026, 10, 19))
+
+        assert result == (1, 3)
+        operation = tasks.bulk_write.call_args[0][0][0]
+        assert operation._filter == {
+            "_id": 1,
+            "monthly_counts.2025-01": 2,
+            "monthly_counts.2025-02": 1,
+        }
+        assert operation._doc == {
+            "$inc": {"flip_count": -3},
+            "$unset": {"monthly_counts.2025-01": "", "monthly_counts.2025-02": ""},
+        }
+        tasks.delete_many.assert_called_once_with({"flip_count": {"$lt": under_test.MIN_COUNT}})
+        mongo.test_mappings.return_value.bulk_write.assert_not_called()
+
+    def test_documents_with_expired_buckets_are_found(self):
+        mongo = MagicMock()
+        collection = mongo.test_mappings_test_files.return_value
+        collection.find.return_value = []
+
+        under_test.expire_buckets(mongo, 12, now=datetime(2026, 10, 19))
+
+        query = collection.find.call_args[0][0]
+        assert "2025-11" in str(query["$expr"])
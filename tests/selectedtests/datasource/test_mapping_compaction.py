@@ -0,0 +1,106 @@
+import os
+
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+import selectedtests.datasource.mapping_compaction as under_test
+
+from selectedtests.datasource.mappings_loader import TASK_MAPPING_SCHEMA
+
+
+def mongo_with_mappings(mappings, tasks):
+    """Return a mongo mock with the given task mappings and their tasks."""
+    mongo = MagicMock()
+    collection = mongo.task_mappings.return_value
+    collection.name = "task_mappings"
+    collection.distinct.return_value = ["project-2", "project-1"]
+
+    def find(query, projection):
+        after = query.get("_id", {}).get("$gt")
+        found = [m for m in mappings if m["project"] == query["project"]]
+        found = [m for m in found if after is None or m["_id"] > after]
+        cursor = MagicMock()
+        cursor.sort.return_value.limit.side_effect = lambda limit: found[:limit]
+        return cursor
+
+    collection.find.side_effect = find
+
+    children = mongo.task_mappings_tasks.return_value.with_options.return_value
+    children.find.side_effect = lambda query: [
+        task
+        for task in tasks
+        if task["task_mapping_id"] in query["task_mapping_id"]["$in"]
+        and task["flip_count"] < query["flip_count"]["$lt"]
+    ]
+    children.delete_many.side_effect = lambda query: MagicMock(
+        deleted_count=len(query["_id"]["$in"])
+    )
+    return mongo
+
+
+def task(task_id, mapping_id, flip_count):
+    return {"_id": task_id, "task_mapping_id": mapping_id, "name": "t", "flip_count": flip_count}
+
+
+class TestCompactMappings:
+    def test_children_below_cutoffs_are_deleted(self):
+        mappings = [
+            {"_id": 1, "project": "project-1", "source_file_seen_count": 10},
+            {"_id": 2, "project": "project-1", "source_file_seen_count": 100},
+            {"_id": 3, "project": "project-2", "source_file_seen_count": 4},
+        ]
+        tasks = [task(11, 1, 1), task(12, 1, 5), task(21, 2, 5), task(22, 2, 50), task(31, 3, 2)]
+        mongo = mongo_with_mappings(mappings, tasks)
+
+        result = under_test.compact_mappings(
+            mongo,
+            TASK_MAPPING_SCHEMA,
+            under_test.CompactionCutoffs(min_count=2, min_ratio=0.1),
+            batch_size=2,
+            pause_seconds=0,
+        )
+
+        children = mongo.task_mappings_tasks.return_value.with_options.return_value
+        deleted = [call[0][0]["_id"]["$in"] for call in children.delete_many.call_args_list]
+        assert deleted == [[11, 21]]
+        assert result.documents_deleted == 2
+        assert result.bytes_reclaimed > 0
+
+    def test_compaction_resumes_from_checkpoint(self):
+        mappings = [
+            {"_id": ObjectId(), "project": "project-1", "source_file_seen_count": 10}
+            for _ in range(3)
+        ]
+        tasks = [task(i, mapping["_id"], 1) for i, mapping in enumerate(mappings)]
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint")
+            checkpoint = under_test.CompactionCheckpoint.load(path)
+            checkpoint.complete("task_mappings", "project-1", mappings[0]["_id"])
+
+            mongo = mongo_with_mappings(mappings, tasks)
+            result = under_test.compact_mappings(
+                mongo,
+                TASK_MAPPING_SCHEMA,
+                under_test.CompactionCutoffs(min_count=2, min_ratio=0),
+                projects=["project-1"],
+                pause_seconds=0,
+                checkpoint=under_test.CompactionCheckpoint.load(path),
+            )
+
+            assert result.documents_deleted == 2
+            resumed = under_test.CompactionCheckpoint.load(path)
+            assert resumed.last_mapping_id("task_mappings", "project-1") == mappings[-1]["_id"]
+
+    def test_deletes_wait_for_a_majority(self):
+        mongo = mongo_with_mappings([], [])
+
+        under_test.compact_mappings(
+            mongo, TASK_MAPPING_SCHEMA, under_test.CompactionCutoffs(1, 0), projects=["project-1"]
+        )
+
+        write_concern = mongo.task_mappings_tasks.return_value.with_options.call_args[1][
+            "write_concern"
+        ]
+        assert write_concern.document == {"w": "majority"}
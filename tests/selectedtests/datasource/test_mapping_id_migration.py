@@ -0,0 +1,168 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateMany
+
+import selectedtests.datasource.mapping_id_migration as under_test
+
+from selectedtests.datasource.mappings_loader import TEST_MAPPING_SCHEMA
+from selectedtests.helpers import MAPPING_ID_FIELDS, create_mapping_id
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FakeCollection(object):
+    """A collection that keeps its documents in memory and can be interrupted."""
+
+    def __init__(self, name, writes, unique_fields=None):
+        self.name = name
+        self.database = {}
+        self.documents = {}
+        self._writes = writes
+        self._unique_fields = unique_fields
+
+    def find(self, query=None):
+        documents = list(self.documents.values())
+        if query is not None:
+            documents = [
+                document for document in documents if isinstance(document["_id"], ObjectId)
+            ]
+        cursor = MagicMock()
+        cursor.limit.side_effect = lambda limit: [dict(document) for document in documents[:limit]]
+        return cursor
+
+    def bulk_write(self, operations, ordered=True):
+        self._write()
+        for operation in operations:
+            if isinstance(operation, ReplaceOne):
+                self._replace(operation._filter["_id"], operation._doc)
+            else:
+                ((key, value),) = operation._filter.items()
+                for document in self.documents.values():
+                    if document[key] == value:
+                        document.update(operation._doc["$set"])
+
+    def delete_many(self, query):
+        self._write()
+        for _id in query["_id"]["$in"]:
+            self.documents.pop(_id, None)
+
+    def _write(self):
+        self._writes["count"] += 1
+        if self._writes["count"] == self._writes.get("interrupt_at"):
+            raise Interrupted()
+
+    def _replace(self, _id, document):
+        if self._unique_fields:
+            key = [document[field] for field in self._unique_fields]
+            for other in self.documents.values():
+                if other["_id"] != _id and [other[field] for field in self._unique_fields] == key:
+                    raise ValueError("duplicate key")
+        self.documents[_id] = dict(document)
+
+
+def mapping(source_file):
+    return {
+        "_id": ObjectId(),
+        "project": "mongodb-mongo-master",
+        "repo": "mongo",
+        "branch": "master",
+        "source_file": source_file,
+        "source_file_seen_count": 3,
+    }
+
+
+def create_mongo(mappings, writes):
+    collection = FakeCollection("test_mappings", writes, MAPPING_ID_FIELDS)
+    staging = FakeCollection("test_mappings_id_migration", writes)
+    collection.database["test_mappings_id_migration"] = staging
+    children = FakeCollection("test_mappings_test_files", writes)
+    for i, old_mapping in enumerate(mappings):
+        collection.documents[old_mapping["_id"]] = dict(old_mapping)
+        children.documents[i] = {
+            "_id": i,
+            "name": "jstests/test.js",
+            "test_mapping_id": old_mapping["_id"],
+        }
+
+    mongo = MagicMock()
+    mongo.test_mappings.return_value = collection
+    mongo.test_mappings_test_files.return_value = children
+    return mongo, collection, staging, children
+
+
+class TestMigrateMappingIds:
+    def test_mappings_and_children_are_moved_to_new_ids(self):
+        mappings = [mapping(f"src/file{i}.cpp") for i in range(3)]
+        mongo, collection, staging, children = create_mongo(mappings, {"count": 0})
+
+        migrated = under_test.migrate_mapping_ids(mongo, TEST_MAPPING_SCHEMA, batch_size=2)
+
+        new_ids = [create_mapping_id(old_mapping) for old_mapping in mappings]
+        assert migrated == 3
+        assert sorted(collection.documents) == sorted(new_ids)
+        assert collection.documents[new_ids[0]] == dict(mappings[0], _id=new_ids[0])
+        assert staging.documents == {}
+        assert [child["test_mapping_id"] for child in children.documents.values()] == new_ids
+
+    @pytest.mark.parametrize("interrupt_at", range(1, 6))
+    def test_interrupted_migration_loses_nothing_and_can_be_finished(self, interrupt_at):
+        mappings = [mapping(f"src/file{i}.cpp") for i in range(2)]
+        writes = {"count": 0, "interrupt_at": interrupt_at}
+        mongo, collection, staging, children = create_mongo(mappings, writes)
+
+        with pytest.raises(Interrupted):
+            under_test.migrate_mapping_ids(mongo, TEST_MAPPING_SCHEMA)
+
+        # Every mapping exists with its old or new id, and its children point at one that exists.
+        for old_mapping in mappings:
+            new_id = create_mapping_id(old_mapping)
+            copies = [
+                document
+                for document in list(collection.documents.values())
+                + list(staging.documents.values())
+                if document["_id"] in (old_mapping["_id"], new_id)
+            ]
+            assert copies
+            assert all(copy["source_file_seen_count"] == 3 for copy in copies)
+        existing_ids = set(collection.documents) | set(staging.documents)
+        assert all(
+            child["test_mapping_id"] in existing_ids for child in children.documents.values()
+        )
+
+        writes["interrupt_at"] = None
+        under_test.migrate_mapping_ids(mongo, TEST_MAPPING_SCHEMA)
+
+        new_ids = [create_mapping_id(old_mapping) for old_mapping in mappings]
+        assert sorted(collection.documents) == sorted(new_ids)
+        assert all(
+            under_test.OLD_ID_KEY not in document for document in collection.documents.values()
+        )
+        assert staging.documents == {}
+        assert [child["test_mapping_id"] for child in children.documents.values()] == new_ids
+
+    def test_children_are_moved_to_new_ids(self):
+        old_id = ObjectId()
+        new_id = "new-id"
+        children = MagicMock()
+
+        under_test._move_children(
+            children, TEST_MAPPING_SCHEMA, [{"_id": new_id, under_test.OLD_ID_KEY: old_id}]
+        )
+
+        children.bulk_write.assert_called_once_with(
+            [UpdateMany({"test_mapping_id": old_id}, {"$set": {"test_mapping_id": new_id}})],
+            ordered=False,
+        )
+
+    def test_nothing_to_migrate(self):
+        mongo = MagicMock()
+        collection = mongo.test_mappings.return_value
+        collection.find.return_value.limit.return_value = []
+
+        assert under_test.migrate_mapping_ids(mongo, TEST_MAPPING_SCHEMA) == 0
+        collection.bulk_write.assert_not_called()
@@ -0,0 +1,144 @@
+import os
+
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pymongo.errors import BulkWriteError
+
+import selectedtests.datasource.mappings_loader as under_test
+
+from selectedtests.helpers import create_mapping_id
+
+NS = "selectedtests.datasource.mappings_loader"
+
+
+def ns(relative_name):  # pylint: disable=invalid-name
+    """Return a full name from a name relative to the test module"s name space."""
+    return NS + "." + relative_name
+
+
+def task_mapping(source_file):
+    return {
+        "source_file": source_file,
+        "project": "mongodb-mongo-master",
+        "repo": "mongo",
+        "branch": "master",
+        "source_file_seen_count": 2,
+        "tasks": [{"name": "task1", "variant": "variant1", "flip_count": 1}],
+    }
+
+
+class TestLoadMappings:
+    @patch(ns("get_bucket"))
+    def test_mappings_are_merged_in_batches(self, get_bucket_mock):
+        get_bucket_mock.return_value = "2026-10"
+        mongo = MagicMock()
+        mappings = [task_mapping(f"src/file{i}") for i in range(5)]
+
+        result = under_test.load_mappings(
+            mongo, mappings, under_test.TASK_MAPPING_SCHEMA, batch_size=2, workers=2
+        )
+
+        assert result == (3, 0, 5, {"mongodb-mongo-master"})
+        parent_writes = mongo.task_mappings.return_value.bulk_write.call_args_list
+        assert sum(len(call[0][0]) for call in parent_writes) == 5
+        query = {
+            "source_file": "src/file0",
+            "project": "mongodb-mongo-master",
+            "repo": "mongo",
+            "branch": "master",
+        }
+        # The batches are written by concurrent workers, so they can be written in any order.
+        (operation,) = [
+            operation
+            for call in parent_writes
+            for operation in call[0][0]
+            if operation._filter == {"_id": create_mapping_id(query)}
+        ]
+        assert operation._doc == {
+            "$inc": {"source_file_seen_count": 2, "monthly_counts.2026-10": 2},
+            "$setOnInsert": query,
+        }
+        assert operation._upsert
+        assert all(call[1] == {"ordered": False} for call in parent_writes)
+
+        child_writes = mongo.task_mappings_tasks.return_value.bulk_write.call_args_list
+        child_operations = [operation for call in child_writes for operation in call[0][0]]
+        assert len(child_operations) == 5
+        assert {
+            "name": "task1",
+            "variant": "variant1",
+            "task_mapping_id": create_mapping_id(query),
+        } in [operation._filter for operation in child_operations]
+        mongo.task_mappings.return_value.find.assert_not_called()
+        assert child_operations[0]._doc == {"$inc": {"flip_count": 1, "monthly_counts.2026-10": 1}}
+
+    def test_counts_are_added_to_the_months_they_come_from(self):
+        mongo = MagicMock()
+        mapping = task_mapping("src/file0")
+        mapping["monthly_counts"] = {"2026-08": 2}
+        mapping["tasks"][0]["monthly_counts"] = {"2026-08": 1}
+
+        under_test.load_mappings(mongo, [mapping], under_test.TASK_MAPPING_SCHEMA)
+
+        (operation,) = mongo.task_mappings.return_value.bulk_write.call_args[0][0]
+        assert operation._doc["$inc"] == {
+            "source_file_seen_count": 2,
+            "monthly_counts.2026-08": 2,
+        }
+        assert "monthly_counts" not in operation._doc["$setOnInsert"]
+        (child_operation,) = mongo.task_mappings_tasks.return_value.bulk_write.call_args[0][0]
+        assert "monthly_counts" not in child_operation._filter
+        assert child_operation._doc == {"$inc": {"flip_count": 1, "monthly_counts.2026-08": 1}}
+
+    def test_completed_batches_are_skipped_on_resume(self):
+        mappings = [task_mapping(f"src/file{i}") for i in range(5)]
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint")
+            checkpoint = under_test.LoadCheckpoint.load(path, 2)
+            checkpoint.complete(0)
+            checkpoint.complete(2)
+
+            mongo = MagicMock()
+            result = under_test.load_mappings(
+                mongo,
+                mappings,
+                under_test.TASK_MAPPING_SCHEMA,
+                batch_size=2,
+                checkpoint=under_test.LoadCheckpoint.load(path, 2),
+            )
+
+            assert result == (1, 2, 2, {"mongodb-mongo-master"})
+            assert under_test.LoadCheckpoint.load(path, 2).is_completed(1)
+
+    def test_checkpoint_with_different_batch_size_is_rejected(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint")
+            under_test.LoadCheckpoint.load(path, 2).complete(0)
+
+            with pytest.raises(ValueError):
+                under_test.LoadCheckpoint.load(path, 3)
+
+
+class TestBulkWrite:
+    def test_racing_upserts_are_retried(self):
+        collection = MagicMock()
+        collection.bulk_write.side_effect = [
+            BulkWriteError({"writeErrors": [{"index": 1, "code": 11000}]}),
+            None,
+        ]
+
+        under_test._bulk_write(collection, ["op-0", "op-1"])
+
+        collection.bulk_write.assert_called_with(["op-1"], ordered=False)
+
+    def test_other_errors_are_raised(self):
+        collection = MagicMock()
+        collection.bulk_write.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 0, "code": 2}]}
+        )
+
+        with pytest.raises(BulkWriteError):
+            under_test._bulk_write(collection, ["op-0"])
@@ -1,5 +1,7 @@
 from unittest.mock import MagicMock, patch
 
+import pytest
+
 import selectedtests.datasource.mongo_wrapper as under_test
 
 NS = "selectedtests.datasource.mongo_wrapper"
@@ -51,3 +53,72 @@ class TestMongoWrapper:
         wrapper = under_test.MongoWrapper(client_mock)
 
         assert client_mock.selected_tests.project_config == wrapper.project_config()
+
+    @patch(ns("MongoClient"))
+    def test_connect_passes_client_options(self, mongo_mock):
+        config = under_test.MongoConfig(max_pool_size=50, compressors="zstd,zlib")
+
+        wrapper = under_test.MongoWrapper.connect("mongo_uri", config)
+
+        mongo_mock.assert_called_once_with("mongo_uri", maxPoolSize=50, compressors="zstd,zlib")
+        assert wrapper.config == config
+
+    def test_mappings_use_read_preference_and_bulk_write_concern(self):
+        client_mock = MagicMock()
+        config = under_test.MongoConfig(read_preference="secondaryPreferred", bulk_write_concern=1)
+
+        wrapper = under_test.MongoWrapper(client_mock, config)
+
+        collection = wrapper.test_mappings_test_files()
+        options = client_mock.selected_tests.test_mappings_test_files.with_options.call_args[1]
+        assert collection == client_mock.selected_tests.test_mappings_test_files.with_options()
+        assert options["read_preference"].mongos_mode == "secondaryPreferred"
+        assert options["write_concern"].document == {"w": 1}
+        assert wrapper.project_config() == client_mock.selected_tests.project_config
+
+    def test_project_config_uses_config_write_concern(self):
+        client_mock = MagicMock()
+        config = under_test.MongoConfig(config_write_concern="majority")
+
+        wrapper = under_test.MongoWrapper(client_mock, config)
+
+        wrapper.project_config()
+        options = client_mock.selected_tests.project_config.with_options.call_args[1]
+        assert options == {"write_concern": under_test.WriteConcern(w="majority")}
+        assert wrapper.task_mappings() == client_mock.selected_tests.task_mappings
+
+
+class TestMongoConfig:
+    def test_config_from_env(self):
+        config = under_test.MongoConfig.from_env(
+            {
+                "SELECTED_TESTS_MONGO_MAX_POOL_SIZE": "200",
+                "SELECTED_TESTS_MONGO_MIN_POOL_SIZE": "10",
+                "SELECTED_TESTS_MONGO_READ_PREFERENCE": "secondaryPreferred",
+                "SELECTED_TESTS_MONGO_BULK_WRITE_CONCERN": "1",
+                "SELECTED_TESTS_MONGO_COMPRESSORS": "snappy",
+                "SELECTED_TESTS_MONGO_SERVER_SELECTION_TIMEOUT_MS": "5000",
+            }
+        )
+
+        assert config.client_options() == {
+            "maxPoolSize": 200,
+            "minPoolSize": 10,
+            "compressors": "snappy",
+            "serverSelectionTimeoutMS": 5000,
+        }
+        assert config.read_preference == "secondaryPreferred"
+        assert config.bulk_write_concern == 1
+        assert config.config_write_concern == "majority"
+
+    def test_empty_env_uses_driver_defaults(self):
+        config = under_test.MongoConfig.from_env({})
+
+        assert config.client_options() == {}
+        assert config.mappings_options() == {}
+
+    def test_invalid_values_are_rejected(self):
+        with pytest.raises(ValueError):
+            under_test.MongoConfig.from_env({"SELECTED_TESTS_MONGO_MAX_POOL_SIZE": "lots"})
+        with pytest.raises(ValueError):
+            under_test.MongoConfig(read_preference="nearby").mappings_options()
@@ -0,0 +1,66 @@
+from unittest.mock import MagicMock
+
+from pymongo import ReadPreference
+
+import selectedtests.datasource.project_mappings as under_test
+
+from selectedtests.datasource.mappings_loader import TASK_MAPPING_SCHEMA
+
+
+class TestIterProjectMappings:
+    def test_children_are_read_for_each_batch_of_mappings(self):
+        mappings = [{"_id": "m1"}, {"_id": "m2"}, {"_id": "m3"}]
+        tasks = [
+            {"_id": 1, "task_mapping_id": "m1"},
+            {"_id": 2, "task_mapping_id": "m3"},
+            {"_id": 3, "task_mapping_id": "m1"},
+        ]
+        mongo = MagicMock()
+        mongo.task_mappings.return_value.find.return_value = iter(mappings)
+        children_find = mongo.task_mappings_tasks.return_value.find
+        children_find.side_effect = lambda query, projection: [
+            task for task in tasks if task["task_mapping_id"] in query["task_mapping_id"]["$in"]
+        ]
+
+        result = list(
+            under_test.iter_project_mappings(mongo, TASK_MAPPING_SCHEMA, "project-1", batch_size=2)
+        )
+
+        assert [(mapping["_id"], [c["_id"] for c in children]) for mapping, children in result] == [
+            ("m1", [1, 3]),
+            ("m2", []),
+            ("m3", [2]),
+        ]
+        assert children_find.call_count == 2
+        mongo.task_mappings.return_value.find.assert_called_once_with(
+            {"project": "project-1"}, projection={"monthly_counts": False}
+        )
+
+    def test_mappings_are_read_with_their_read_preference_by_default(self):
+        mongo = MagicMock()
+        mongo.task_mappings.return_value.find.return_value = iter([])
+
+        list(under_test.iter_project_mappings(mongo, TASK_MAPPING_SCHEMA, "project-1"))
+
+        mongo.task_mappings.return_value.with_options.assert_not_called()
+
+    def test_mappings_can_be_read_from_the_primary(self):
+        mongo = MagicMock()
+        collection = mongo.task_mappings.return_value.with_options.return_value
+        collection.find.return_value = iter([{"_id": "m1"}])
+        children_collection = mongo.task_mappings_tasks.return_value.with_options.return_value
+        children_collection.find.return_value = [{"_id": 1, "task_mapping_id": "m1"}]
+
+        result = list(
+            under_test.iter_project_mappings(
+                mongo, TASK_MAPPING_SCHEMA, "project-1", read_from_primary=True
+            )
+        )
+
+        assert [(mapping["_id"], len(children)) for mapping, children in result] == [("m1", 1)]
+        mongo.task_mappings.return_value.with_options.assert_called_once_with(
+            read_preference=ReadPreference.PRIMARY
+        )
+        mongo.task_mappings_tasks.return_value.with_options.assert_called_once_with(
+            read_preference=ReadPreference.PRIMARY
+        )
@@ -6,6 +6,8 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.path_classifier import SOURCE_FILE, PathClassifier
 from selectedtests.task_mappings import create_task_mappings as under_test
 from selectedtests.task_mappings.create_task_mappings import ChangedFile
 from selectedtests.task_mappings.version_limit import VersionLimit
@@ -41,6 +43,7 @@ class TestFullRunThrough:
     ):
         version_limit_mock = MagicMock()
         version_limit_mock.check_version_before_limit.return_value = False
+        version_limit_mock.check_version_after_until_date.return_value = False
 
         mock_evg_api = MagicMock()
         mock_evg_api.versions_by_project.return_value = evg_versions
@@ -70,7 +73,7 @@ class TestFullRunThrough:
 
 class TestCreateTaskMappings:
     @patch(ns("_get_evg_project_and_init_repo"))
-    @patch(ns("_get_diff"))
+    @patch(ns("_get_changed_files"))
     @patch(ns("_get_filtered_files"))
     @patch(ns("_get_associated_module"))
     @patch(ns("_get_module_changed_files"))
@@ -81,13 +84,14 @@ class TestCreateTaskMappings:
         module_changed_mock,
         associated_module_mock,
         filtered_files_mock,
-        diff_mock,
+        changed_files_mock,
         get_evg_project_and_init_repo_mock,
         module_changed_files,
         changed_files,
     ):
         version_limit_mock = MagicMock()
         version_limit_mock.check_version_before_limit.return_value = False
+        version_limit_mock.check_version_after_until_date.return_value = False
 
         evg_api_mock = MagicMock()
         evg_api_mock.versions_by_project.return_value = [
@@ -120,9 +124,9 @@ class TestCreateTaskMappings:
             evg_api_mock,
             project_name,
             version_limit_mock,
-            file_regex=None,
+            file_regex=re.compile(".*"),
             module_name="module",
-            module_file_regex=None,
+            module_file_regex=re.compile(".*"),
         )
 
         assert most_recent_version_analyzed == only_version_analyzed.version_id
@@ -140,7 +144,7 @@ class TestCreateTaskMappings:
                     assert task in variant_output
 
     @patch(ns("_get_evg_project_and_init_repo"))
-    @patch(ns("_get_diff"))
+    @patch(ns("_get_changed_files"))
     @patch(ns("_get_filtered_files"))
     @patch(ns("_get_associated_module"))
     @patch(ns("_get_module_changed_files"))
@@ -151,13 +155,14 @@ class TestCreateTaskMappings:
         module_changed_mock,
         associated_module_mock,
         filtered_mock,
-        diff_mock,
+        changed_files_mock,
         get_evg_project_and_init_repo_mock,
         changed_files,
         module_changed_files,
     ):
         version_limit_mock = MagicMock()
         version_limit_mock.check_version_before_limit.return_value = False
+        version_limit_mock.check_version_after_until_date.return_value = False
 
         evg_api_mock = MagicMock()
         evg_api_mock.versions_by_project.return_value = [
@@ -180,9 +185,9 @@ class TestCreateTaskMappings:
             evg_api_mock,
             project_name,
             version_limit_mock,
-            file_regex=None,
+            file_regex=re.compile(".*"),
             module_name="",
-            module_file_regex=None,
+            module_file_regex=re.compile(".*"),
         )
 
         assert len(expected_file_list) == len(mappings.mappings)
@@ -203,19 +208,20 @@ class TestCreateTaskMappings:
                     assert task in variant_output
 
     @patch(ns("_get_evg_project_and_init_repo"))
-    @patch(ns("_get_diff"))
+    @patch(ns("_get_changed_files"))
     @patch(ns("_get_filtered_files"))
     @patch(ns("_get_flipped_tasks"))
     def test_no_flipped_tasks_creates_mappings_with_no_builds(
         self,
         flipped_mock,
         filtered_mock,
-        diff_mock,
+        changed_files_mock,
         get_evg_project_and_init_repo_mock,
         changed_files,
     ):
         version_limit_mock = MagicMock()
         version_limit_mock.check_version_before_limit.return_value = False
+        version_limit_mock.check_version_after_until_date.return_value = False
 
         evg_api_mock = MagicMock()
         evg_api_mock.versions_by_project.return_value = [
@@ -231,25 +237,72 @@ class TestCreateTaskMappings:
             evg_api_mock,
             project_name,
             version_limit_mock,
-            file_regex=None,
+            file_regex=re.compile(".*"),
             module_name="",
-            module_file_regex=None,
+            module_file_regex=re.compile(".*"),
         )
 
         assert mappings.mappings == {
-            ChangedFile("src/file1", "my_repo"): {"builds": {}, "seen_count": 1},
-            ChangedFile("src/file2", "my_repo"): {"builds": {}, "seen_count": 1},
+            ChangedFile("src/file1", "my_repo"): {
+                "builds": {},
+                "seen_count": 1,
+                "monthly_counts": {"0001-01": 1},
+            },
+            ChangedFile("src/file2", "my_repo"): {
+                "builds": {},
+                "seen_count": 1,
+                "monthly_counts": {"0001-01": 1},
+            },
         }
 
+    @patch(ns("_get_evg_project_and_init_repo"))
+    @patch(ns("_get_changed_files"))
+    @patch(ns("_get_filtered_files"))
+    @patch(ns("_get_flipped_tasks"))
+    def test_versions_changing_too_many_files_are_skipped(
+        self,
+        flipped_mock,
+        filtered_mock,
+        changed_files_mock,
+        get_evg_project_and_init_repo_mock,
+        changed_files,
+    ):
+        version_limit_mock = MagicMock()
+        version_limit_mock.check_version_before_limit.return_value = False
+        version_limit_mock.check_version_after_until_date.return_value = False
+
+        evg_api_mock = MagicMock()
+        evg_api_mock.versions_by_project.return_value = [
+            MagicMock(create_time=datetime.combine(date(1, 1, 1), time(1, 2, i))) for i in range(3)
+        ]
+        filtered_mock.return_value = changed_files
+
+        mappings, _ = under_test.TaskMappings.create_task_mappings(
+            evg_api_mock,
+            "project",
+            version_limit_mock,
+            file_regex=re.compile(".*"),
+            fan_out_limit=FanOutLimit(1),
+        )
+
+        assert mappings.mappings == {}
+        assert mappings.versions_skipped == 1
+        flipped_mock.assert_not_called()
+
     @patch(ns("_get_evg_project_and_init_repo"))
     @patch(ns("_filter_non_matching_distros"))
-    @patch(ns("_get_diff"))
+    @patch(ns("_get_changed_files"))
     @patch(ns("_get_filtered_files"))
     def test_build_variant_regex_passed_correctly(
-        self, filtered_mock, diff_mock, non_matching_filter_mock, get_evg_project_and_init_repo_mock
+        self,
+        filtered_mock,
+        changed_files_mock,
+        non_matching_filter_mock,
+        get_evg_project_and_init_repo_mock,
     ):
         version_limit_mock = MagicMock()
         version_limit_mock.check_version_before_limit.return_value = False
+        version_limit_mock.check_version_after_until_date.return_value = False
 
         evg_api_mock = MagicMock()
         evg_api_mock.versions_by_project.return_value = [
@@ -267,14 +320,47 @@ class TestCreateTaskMappings:
             evg_api_mock,
             project_name,
             version_limit_mock,
-            file_regex=None,
+            file_regex=re.compile(".*"),
             module_name="",
-            module_file_regex=None,
+            module_file_regex=re.compile(".*"),
             build_regex=build_regex,
         )
 
         assert build_regex == non_matching_filter_mock.call_args[0][1]
 
+    @patch(ns("_get_evg_project_and_init_repo"))
+    @patch(ns("_get_changed_files"))
+    @patch(ns("_get_filtered_files"))
+    @patch(ns("_get_flipped_tasks"))
+    def test_given_versions_are_walked_rather_than_listed(
+        self,
+        flipped_mock,
+        filtered_mock,
+        changed_files_mock,
+        get_evg_project_and_init_repo_mock,
+    ):
+        version_limit_mock = MagicMock()
+        version_limit_mock.check_version_before_limit.return_value = False
+        version_limit_mock.check_version_after_until_date.return_value = False
+        versions = [
+            MagicMock(version_id=f"version-{i}", create_time=datetime(2020, 1, 1, 1, 2, i))
+            for i in range(3)
+        ]
+        versions.reverse()
+        evg_api_mock = MagicMock()
+        filtered_mock.return_value = []
+
+        _, most_recent_version_analyzed = under_test.TaskMappings.create_task_mappings(
+            evg_api_mock,
+            "project",
+            version_limit_mock,
+            file_regex=re.compile(".*"),
+            versions=versions,
+        )
+
+        assert most_recent_version_analyzed == "version-1"
+        evg_api_mock.versions_by_project.assert_not_called()
+
 
 class TestTransformationOfTaskMappings:
     def test_basic_transformation(self):
@@ -313,6 +399,29 @@ class TestTransformationOfTaskMappings:
             assert transformed_tasks[2]["flip_count"] == 1
             assert transformed_tasks[3]["flip_count"] == 1
 
+    def test_monthly_counts_are_transformed(self):
+        task_mappings_dict = {
+            ChangedFile("src-file-0", "repo"): {
+                "builds": {"build-1": {"task-0": 3}},
+                "seen_count": 4,
+                "monthly_counts": {"2020-01": 1, "2020-02": 3},
+                "monthly_builds": {"build-1": {"task-0": {"2020-01": 1, "2020-02": 2}}},
+            },
+        }
+        task_mappings = under_test.TaskMappings(task_mappings_dict, "evergreen", "branch")
+
+        transformed_mappings = task_mappings.transform()
+
+        assert transformed_mappings[0]["monthly_counts"] == {"2020-01": 1, "2020-02": 3}
+        assert transformed_mappings[0]["tasks"] == [
+            {
+                "name": "task-0",
+                "variant": "build-1",
+                "flip_count": 3,
+                "monthly_counts": {"2020-01": 1, "2020-02": 2},
+            }
+        ]
+
     def test_transform_files_with_no_builds_that_have_flipped_tasks(self):
         evergreen_project, repo_name, branch_name = "evergreen", "repo", "branch"
         task_mappings_dict = {
@@ -326,15 +435,11 @@ class TestTransformationOfTaskMappings:
 
 
 class TestFilteredFiles:
-    @patch(ns("get_changed_files"))
-    def test_filter_files_by_regex(self, changed_files_mock):
-        def changed_files(diff, logger):
-            return ["a", "b", "c", "ab", "ac", "ba", "bc", "ca", "cb", "abc/test"]
+    def test_filter_files_by_regex(self):
+        changed_paths = ["a", "b", "c", "ab", "ac", "ba", "bc", "ca", "cb", "abc/test"]
 
-        changed_files_mock.side_effect = changed_files
-
-        regex = re.compile("a.*")
-        filtered = under_test._get_filtered_files(None, regex, "my_repo")
+        classifier = PathClassifier([(SOURCE_FILE, re.compile("a.*"))])
+        filtered = under_test._get_filtered_files(changed_paths, classifier, "my_repo")
 
         expected = ["a", "ab", "ac", "abc/test"]
 
@@ -411,6 +516,37 @@ class TestMapTasksToFiles:
 
         assert expected_task_mappings == task_mappings
 
+    def test_weighted_mapping(self, changed_files):
+        task_mappings = {}
+        flipped_tasks = {"build1": ["task1"]}
+
+        under_test._map_tasks_to_files(changed_files, flipped_tasks, task_mappings, 0.25)
+
+        for file in changed_files:
+            assert task_mappings[file] == {
+                "builds": {"build1": {"task1": 0.25}},
+                "seen_count": 0.25,
+            }
+
+    def test_counts_are_bucketed_by_month(self, changed_files):
+        task_mappings = {}
+
+        under_test._map_tasks_to_files(
+            changed_files, {"build1": ["task1"]}, task_mappings, 1, "2020-01"
+        )
+        under_test._map_tasks_to_files(changed_files, {}, task_mappings, 1, "2020-02")
+        under_test._map_tasks_to_files(
+            changed_files, {"build1": ["task1"]}, task_mappings, 1, "2020-02"
+        )
+
+        for file in changed_files:
+            assert task_mappings[file] == {
+                "builds": {"build1": {"task1": 2}},
+                "seen_count": 3,
+                "monthly_counts": {"2020-01": 1, "2020-02": 2},
+                "monthly_builds": {"build1": {"task1": {"2020-01": 1, "2020-02": 1}}},
+            }
+
 
 class TestFilterDistros:
     def test_filter_non_matching_distros(self, required_builds_regex):
@@ -1,7 +1,14 @@
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import selectedtests.task_mappings.get_task_mappings as under_test
 
+NS = "selectedtests.task_mappings.get_task_mappings"
+
+
+def ns(relative_name):  # pylint: disable=invalid-name
+    """Return a full name from a name relative to the test module"s name space."""
+    return NS + "." + relative_name
+
 
 class TestGetCorrelatedTaskMappings:
     def test_mappings_found(self):
@@ -36,3 +43,28 @@ class TestGetCorrelatedTaskMappings:
 
         assert task_mappings == []
         collection_mock.aggregate.assert_called_once()
+
+    @patch(ns("get_oldest_bucket"))
+    def test_lookback_counts_only_recent_buckets(self, get_oldest_bucket_mock):
+        collection_mock = MagicMock()
+        collection_mock.name = "task_mappings"
+        get_oldest_bucket_mock.return_value = "2026-05"
+
+        under_test.get_correlated_task_mappings(
+            collection_mock, ["src/file1.js"], "my-project", 0, lookback_months=6
+        )
+
+        get_oldest_bucket_mock.assert_called_once_with(6)
+        pipeline = collection_mock.aggregate.call_args[0][0]
+        stages = [next(iter(stage)) for stage in pipeline]
+        assert stages == [
+            "$match",
+            "$addFields",
+            "$match",
+            "$lookup",
+            "$addFields",
+            "$addFields",
+            "$project",
+        ]
+        assert pipeline[3]["$lookup"]["from"] == "task_mappings_tasks"
+        assert "flip_count" in pipeline[4]["$addFields"]["tasks"]["$filter"]["cond"]["$gt"][0]
@@ -0,0 +1,48 @@
+from itertools import islice
+from unittest.mock import MagicMock
+
+from selectedtests.task_mappings import shared_versions as under_test
+
+
+def listed_versions(count):
+    """Return versions listed one at a time and the list of those listed so far."""
+    listed = []
+
+    def list_versions():
+        for i in range(count):
+            listed.append(i)
+            yield MagicMock(version_id=f"version-{i}")
+
+    return list_versions(), listed
+
+
+class TestSharedVersions:
+    def test_each_walk_sees_every_version(self):
+        versions, _ = listed_versions(3)
+        shared = under_test.SharedVersions(versions)
+
+        first = [version.version_id for version in shared]
+        second = [version.version_id for version in shared]
+
+        assert first == ["version-0", "version-1", "version-2"]
+        assert second == first
+
+    def test_versions_are_only_listed_as_far_as_a_walk_reached(self):
+        versions, listed = listed_versions(5)
+        shared = under_test.SharedVersions(versions)
+
+        list(islice(shared, 2))
+        list(islice(shared, 2))
+        assert listed == [0, 1]
+
+        list(islice(shared, 3))
+        assert listed == [0, 1, 2]
+
+    def test_of_project_lists_the_versions_of_the_project(self):
+        evg_api = MagicMock()
+        evg_api.versions_by_project.return_value = iter([MagicMock(version_id="version-0")])
+
+        shared = under_test.SharedVersions.of_project(evg_api, "my-project")
+
+        assert [version.version_id for version in shared] == ["version-0"]
+        evg_api.versions_by_project.assert_called_once_with("my-project")
@@ -1,9 +1,11 @@
+import gzip
 import json
 
 from unittest.mock import MagicMock, patch
 
 from click.testing import CliRunner
 
+from selectedtests.mapping_snapshot import write_snapshot
 from selectedtests.task_mappings.task_mappings_cli import cli
 
 NS = "selectedtests.task_mappings.task_mappings_cli"
@@ -48,6 +50,37 @@ class TestCli:
                 output = json.load(data)
                 assert expected_mappings == output
 
+    @patch(ns("get_evg_api"))
+    @patch(ns("generate_task_mappings"))
+    def test_create_streams_jsonl(self, generate_task_mappings_mock, get_evg_api_mock):
+        expected_mappings = [{"source_file": "src/file1"}, {"source_file": "src/file2"}]
+        generate_task_mappings_mock.return_value = (iter(expected_mappings), "most-recent-sha")
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            output_file = "output.jsonl.gz"
+            result = runner.invoke(
+                cli,
+                [
+                    "create",
+                    "mongodb-mongo-master",
+                    "--source-file-regex",
+                    ".*",
+                    "--after",
+                    "2019-10-11T19:10:38",
+                    "--output-file",
+                    output_file,
+                    "--format",
+                    "jsonl",
+                    "--compression",
+                    "gzip",
+                ],
+            )
+            assert result.exit_code == 0
+            assert generate_task_mappings_mock.call_args[1]["stream"]
+            with gzip.open(output_file, "rt") as data:
+                assert [json.loads(line) for line in data] == expected_mappings
+
     @patch(ns("get_evg_api"))
     @patch(ns("generate_task_mappings"))
     def test_create_with_invalid_dates(self, generate_task_mappings_mock, get_evg_api_mock):
@@ -126,3 +159,36 @@ class TestCli:
         with runner.isolated_filesystem():
             result = runner.invoke(cli, ["update", "--mongo-uri=localhost"])
             assert result.exit_code == 0
+
+    @patch(ns("get_evg_api"))
+    def test_query_snapshot_prints_task_mappings(self, get_evg_api_mock):
+        task_mappings = [
+            (
+                {
+                    "project": "project-1",
+                    "repo": "repo",
+                    "branch": "master",
+                    "source_file": "src/a.js",
+                    "source_file_seen_count": 10,
+                },
+                [{"name": "auth", "variant": "linux", "flip_count": 4}],
+            )
+        ]
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            write_snapshot("snapshot.bin", "project-1", [], task_mappings)
+            result = runner.invoke(
+                cli,
+                [
+                    "query-snapshot",
+                    "snapshot.bin",
+                    "--changed-files",
+                    "src/a.js",
+                    "--threshold",
+                    "0.5",
+                ],
+            )
+
+        assert result.exit_code == 0
+        assert json.loads(result.output) == {"task_mappings": [dict(task_mappings[0][0], tasks=[])]}
@@ -2,11 +2,15 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from pymongo import ReturnDocument
+from pymongo import UpdateOne
 from pymongo.errors import BulkWriteError
 
 import selectedtests.task_mappings.update_task_mappings as under_test
 
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode
+from selectedtests.helpers import create_mapping_id
+
 NS = "selectedtests.task_mappings.update_task_mappings"
 
 
@@ -59,8 +63,12 @@ class TestUpdateTaskMappingsSinceLastCommit:
             my_version_limit,
             "^src",
             build_variant_pattern="^!",
+            clone_mode=CloneMode.FULL,
+            changed_files_index=None,
+            fan_out_limit=FanOutLimit(),
             module_name="module-1",
             module_source_file_pattern="^src",
+            clones=None,
         )
         task_config_mock = project_config_mock.return_value.task_config
         task_config_mock.update_most_recent_version_analyzed.assert_called_once_with(
@@ -71,8 +79,10 @@ class TestUpdateTaskMappingsSinceLastCommit:
 
 
 class TestUpdateTaskMappings:
+    @patch(ns("get_bucket"), autospec=True)
     @patch(ns("update_task_mappings_tasks"), autospec=True)
-    def test_task_mappings_are_updated(self, update_task_mappings_tasks_mock):
+    def test_task_mappings_are_updated(self, update_task_mappings_tasks_mock, get_bucket_mock):
+        get_bucket_mock.return_value = "2026-10"
         mongo_mock = MagicMock()
 
         source_file_seen_count = 1
@@ -91,42 +101,121 @@ class TestUpdateTaskMappings:
             dict(**query, **dict(source_file_seen_count=source_file_seen_count, tasks=[task]))
         ]
 
-        mongo_mock.task_mappings.return_value.find_one_and_update.return_value = {"_id": 1}
-
         under_test.update_task_mappings(mappings, mongo_mock)
-        mongo_mock.task_mappings.return_value.find_one_and_update.assert_called_once_with(
-            query,
-            {"$inc": {"source_file_seen_count": source_file_seen_count}},
-            projection={"_id": 1},
-            upsert=True,
-            return_document=ReturnDocument.AFTER,
+
+        task_mapping_id = create_mapping_id(query)
+        mongo_mock.task_mappings.return_value.bulk_write.assert_called_once_with(
+            [
+                UpdateOne(
+                    {"_id": task_mapping_id},
+                    {
+                        "$inc": {
+                            "source_file_seen_count": source_file_seen_count,
+                            "monthly_counts.2026-10": source_file_seen_count,
+                        },
+                        "$setOnInsert": query,
+                    },
+                    upsert=True,
+                )
+            ],
+            ordered=False,
         )
+        mongo_mock.task_mappings.return_value.find_one_and_update.assert_not_called()
         update_task_mappings_tasks_mock.assert_called_once_with(
-            [task], {"task_mapping_id": 1}, mongo_mock
+            [dict(**task, task_mapping_id=task_mapping_id)], mongo_mock, "2026-10"
         )
 
+    @patch(ns("update_task_mappings_tasks"), autospec=True)
+    def test_counts_are_added_to_the_months_of_their_versions(
+        self, update_task_mappings_tasks_mock
+    ):
+        mongo_mock = MagicMock()
+        query = {
+            "project": "mongodb-mongo-master",
+            "repo": "mongo",
+            "branch": "master",
+            "source_file": "src/file.cpp",
+        }
+        mappings = [
+            dict(
+                **query,
+                source_file_seen_count=3,
+                monthly_counts={"2026-08": 1, "2026-09": 2},
+                tasks=[],
+            )
+        ]
+
+        under_test.update_task_mappings(mappings, mongo_mock)
+
+        (operation,) = mongo_mock.task_mappings.return_value.bulk_write.call_args[0][0]
+        assert operation._doc == {
+            "$inc": {
+                "source_file_seen_count": 3,
+                "monthly_counts.2026-08": 1,
+                "monthly_counts.2026-09": 2,
+            },
+            "$setOnInsert": query,
+        }
+
+    @patch(ns("update_task_mappings_tasks"), autospec=True)
+    def test_mappings_without_tasks_write_no_tasks(self, update_task_mappings_tasks_mock):
+        mongo_mock = MagicMock()
+        mappings = [
+            {
+                "project": "mongodb-mongo-master",
+                "repo": "mongo",
+                "branch": "master",
+                "source_file": "src/file.cpp",
+                "source_file_seen_count": 1,
+                "tasks": [],
+            }
+        ]
+
+        under_test.update_task_mappings(mappings, mongo_mock)
+
+        mongo_mock.task_mappings.return_value.bulk_write.assert_called_once()
+        update_task_mappings_tasks_mock.assert_not_called()
+
 
 class TestUpdateTaskMappingsTasks:
     @patch(ns("UpdateOne"), autospec=True)
     def test_task_mappings_are_updated(self, update_one_mock):
         mongo_mock = MagicMock()
 
-        task_mapping_id = {"task_mapping_id": 1}
         task = {
             "name": "query_fuzzer_standalone_3_enterprise-rhel-62-64-bit",
             "variant": "enterprise-rhel-62-64-bit",
             "flip_count": 1,
+            "task_mapping_id": 1,
         }
 
-        under_test.update_task_mappings_tasks([task], task_mapping_id, mongo_mock)
+        under_test.update_task_mappings_tasks([task], mongo_mock, "2026-10")
         update_one_mock.assert_called_once_with(
             {"name": task["name"], "variant": task["variant"], "task_mapping_id": 1},
-            {"$inc": {"flip_count": task["flip_count"]}},
+            {"$inc": {"flip_count": 1, "monthly_counts.2026-10": 1}},
             upsert=True,
         )
 
         mongo_mock.task_mappings_tasks.return_value.bulk_write.assert_called_once_with(
-            [update_one_mock.return_value]
+            [update_one_mock.return_value], ordered=False
+        )
+
+    @patch(ns("UpdateOne"), autospec=True)
+    def test_tasks_are_added_to_the_months_of_their_versions(self, update_one_mock):
+        task = {
+            "name": "task1",
+            "variant": "variant1",
+            "flip_count": 3,
+            "monthly_counts": {"2026-08": 1, "2026-09": 2},
+            "task_mapping_id": 1,
+        }
+
+        under_test.update_task_mappings_tasks([task], MagicMock(), "2026-10")
+
+        update_one_mock.assert_called_once_with(
+            {"name": "task1", "variant": "variant1", "task_mapping_id": 1},
+            {"$inc": {"flip_count": 3, "monthly_counts.2026-08": 1, "monthly_counts.2026-09": 2}},
+            upsert=True,
         )
 
     @patch(ns("LOGGER.exception"), autospec=True)
@@ -134,25 +223,16 @@ class TestUpdateTaskMappingsTasks:
     def test_task_mappings_exceptions(self, update_one_mock, exception_mock):
         mongo_mock = MagicMock()
 
-        task_mapping_id = {"task_mapping_id": 1}
         task = {
             "name": "query_fuzzer_standalone_3_enterprise-rhel-62-64-bit",
             "variant": "enterprise-rhel-62-64-bit",
             "flip_count": 1,
+            "task_mapping_id": 1,
         }
 
         details = {"errorLabels": []}
         mongo_mock.task_mappings_tasks.return_value.bulk_write.side_effect = BulkWriteError(details)
-        pytest.raises(
-            BulkWriteError,
-            under_test.update_task_mappings_tasks,
-            [task],
-            task_mapping_id,
-            mongo_mock,
-        )
+        pytest.raises(BulkWriteError, under_test.update_task_mappings_tasks, [task], mongo_mock)
         exception_mock.assert_called_once_with(
-            "bulk_write error",
-            parent=task_mapping_id,
-            operations=[update_one_mock.return_value],
-            details=details,
+            "bulk_write error", operations=[update_one_mock.return_value], details=details
         )
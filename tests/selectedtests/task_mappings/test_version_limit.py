@@ -32,3 +32,27 @@ class TestCheckVersionBeforeLimit:
         version_limit = under_test.VersionLimit(stop_at_version_id="other-version")
 
         assert not version_limit.check_version_before_limit(version_mock)
+
+
+class TestCheckVersionAfterUntilDate:
+    def test_when_version_date_is_after_until_date(self):
+        now = datetime.utcnow()
+        two_days_ago = now - timedelta(days=2)
+        version_mock = MagicMock(version_id="version", create_time=now)
+        version_limit = under_test.VersionLimit(until_date=two_days_ago)
+
+        assert version_limit.check_version_after_until_date(version_mock)
+
+    def test_when_version_date_is_before_until_date(self):
+        now = datetime.utcnow()
+        two_days_ago = now - timedelta(days=2)
+        version_mock = MagicMock(version_id="version", create_time=two_days_ago)
+        version_limit = under_test.VersionLimit(until_date=now)
+
+        assert not version_limit.check_version_after_until_date(version_mock)
+
+    def test_when_there_is_no_until_date(self):
+        version_mock = MagicMock(version_id="version", create_time=datetime.utcnow())
+        version_limit = under_test.VersionLimit(stop_at_version_id="my-version")
+
+        assert not version_limit.check_version_after_until_date(version_mock)
@@ -0,0 +1,100 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+
+import selectedtests.changed_files_index as under_test
+
+
+class TestChangedFilesIndex:
+    def test_entries_are_persisted(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index")
+            with under_test.open_changed_files_index(path) as index:
+                index.add("sha-2", "sha-1", ["src/file1", "src/file2"])
+                index.add("sha-3", "sha-2", [])
+
+            with under_test.open_changed_files_index(path) as index:
+                assert len(index) == 2
+                assert index.get("sha-2") == ("sha-1", frozenset(["src/file1", "src/file2"]))
+                assert index.get("sha-3") == ("sha-2", frozenset())
+                assert index.get("sha-4") is None
+
+    def test_existing_entries_are_not_appended_again(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index")
+            with under_test.open_changed_files_index(path) as index:
+                index.add("sha-2", "sha-1", ["src/file1"])
+            size = os.path.getsize(path)
+
+            with under_test.open_changed_files_index(path) as index:
+                index.add("sha-2", "sha-1", ["src/file1"])
+
+            assert os.path.getsize(path) == size
+
+    def test_incomplete_record_is_dropped(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index")
+            with under_test.open_changed_files_index(path) as index:
+                index.add("sha-2", "sha-1", ["src/file1"])
+            size = os.path.getsize(path)
+            with open(path, "ab") as index_file:
+                index_file.write(b"sha-3\0sha-2\x002\0src/file2\0src/fi")
+
+            with under_test.open_changed_files_index(path) as index:
+                assert "sha-2" in index
+                assert "sha-3" not in index
+                index.add("sha-4", "sha-3", ["src/file3"])
+
+            assert os.path.getsize(path) > size
+            with under_test.open_changed_files_index(path) as index:
+                assert index.get("sha-4") == ("sha-3", frozenset(["src/file3"]))
+
+    def test_corrupt_record_is_skipped(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index")
+            with under_test.open_changed_files_index(path) as index:
+                index.add("sha-2", "sha-1", ["src/file1"])
+            with open(path, "ab") as index_file:
+                index_file.write(b"sha-3\0sha-2\0two\0src/file2\0\0")
+            with under_test.open_changed_files_index(path) as index:
+                index.add("sha-4", "sha-3", ["src/file3"])
+
+            with under_test.open_changed_files_index(path) as index:
+                assert index.get("sha-2") == ("sha-1", frozenset(["src/file1"]))
+                assert "sha-3" not in index
+                assert index.get("sha-4") == ("sha-3", frozenset(["src/file3"]))
+
+    def test_records_written_without_terminators_are_loaded(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index")
+            with open(path, "wb") as index_file:
+                index_file.write(b"sha-2\0sha-1\x001\0src/file1\0sha-3\0sha-2\x000\0")
+            with under_test.open_changed_files_index(path) as index:
+                index.add("sha-4", "sha-3", ["src/file3"])
+
+            with under_test.open_changed_files_index(path) as index:
+                assert index.get("sha-2") == ("sha-1", frozenset(["src/file1"]))
+                assert index.get("sha-3") == ("sha-2", frozenset())
+                assert index.get("sha-4") == ("sha-3", frozenset(["src/file3"]))
+
+    def test_indexes_sharing_a_file_do_not_interleave_records(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index")
+            changed_files = [f"src/file{i}" for i in range(1000)]
+
+            def add_records(name):
+                with under_test.open_changed_files_index(path) as index:
+                    for i in range(20):
+                        index.add(f"{name}-{i}", "parent", changed_files)
+
+            with ThreadPoolExecutor(max_workers=2) as exe:
+                list(exe.map(add_records, ["first", "second"]))
+
+            with under_test.open_changed_files_index(path) as index:
+                assert len(index) == 40
+                assert index.get("second-19") == ("parent", frozenset(changed_files))
+
+    def test_no_path_opens_no_index(self):
+        with under_test.open_changed_files_index(None) as index:
+            assert index is None
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import selectedtests.count_buckets as under_test
+
+
+class TestGetBucket:
+    def test_bucket_is_the_utc_month(self):
+        when = datetime(2026, 11, 1, 1, 0, tzinfo=timezone(timedelta(hours=5)))
+
+        assert under_test.get_bucket(when) == "2026-10"
+
+    def test_naive_times_are_taken_as_utc(self):
+        assert under_test.get_bucket(datetime(2026, 3, 31, 23, 59)) == "2026-03"
+
+
+class TestGetOldestBucket:
+    @pytest.mark.parametrize(
+        "months,expected", [(1, "2026-02"), (2, "2026-01"), (3, "2025-12"), (26, "2024-01")]
+    )
+    def test_window_ends_at_current_month(self, months, expected):
+        assert under_test.get_oldest_bucket(months, datetime(2026, 2, 14)) == expected
+
+    def test_empty_window_is_invalid(self):
+        with pytest.raises(ValueError):
+            under_test.get_oldest_bucket(0)
+
+
+class TestBucketedIncrement:
+    def test_count_is_added_to_total_and_bucket(self):
+        assert under_test.bucketed_increment("flip_count", 2, "2026-10") == {
+            "flip_count": 2,
+            "monthly_counts.2026-10": 2,
+        }
+
+
+class TestMonthlyIncrement:
+    def test_counts_are_added_to_the_months_they_come_from(self):
+        document = {"flip_count": 3, "monthly_counts": {"2026-08": 1, "2026-09": 2}}
+
+        assert under_test.monthly_increment(document, "flip_count", "2026-10") == {
+            "flip_count": 3,
+            "monthly_counts.2026-08": 1,
+            "monthly_counts.2026-09": 2,
+        }
+
+    def test_counts_not_split_by_month_are_added_to_the_bucket(self):
+        document = {"flip_count": 3}
+
+        assert under_test.monthly_increment(document, "flip_count", "2026-10") == {
+            "flip_count": 3,
+            "monthly_counts.2026-10": 3,
+        }
@@ -20,3 +20,44 @@ class TestCreateQuery:
             joined=["tests", "tasks"],
         )
         assert query == {"imput": 1}
+
+
+class TestCreateMappingId:
+    def test_id_is_stable(self):
+        mapping = {"project": "p", "repo": "r", "branch": "b", "source_file": "src/a.cpp"}
+
+        mapping_id = under_test.create_mapping_id(mapping)
+
+        assert mapping_id == under_test.create_mapping_id(dict(mapping, source_file_seen_count=3))
+        assert mapping_id == "2aee2b80a7768298d1bbe3c6cb9af4863aea4862"
+
+    def test_id_depends_on_all_the_identifying_fields(self):
+        mapping = {"project": "p", "repo": "r", "branch": "b", "source_file": "src/a.cpp"}
+        ids = {under_test.create_mapping_id(mapping)}
+        for field in under_test.MAPPING_ID_FIELDS:
+            ids.add(under_test.create_mapping_id(dict(mapping, **{field: "x"})))
+
+        assert len(ids) == 5
+
+
+class TestGetEvgApi:
+    def test_api_server_is_evergreen_by_default(self, monkeypatch):
+        monkeypatch.delenv("EVG_API_SERVER", raising=False)
+
+        evg_api = under_test.get_evg_api()
+
+        assert evg_api._create_url("/projects").startswith("https://evergreen.mongodb.com/")
+
+    def test_api_server_from_the_environment(self, monkeypatch):
+        monkeypatch.setenv("EVG_API_SERVER", "http://localhost:9090")
+
+        evg_api = under_test.get_evg_api()
+
+        assert evg_api._create_url("/projects") == "http://localhost:9090/rest/v2/projects"
+
+    def test_api_server_passed_in_overrides_the_environment(self, monkeypatch):
+        monkeypatch.setenv("EVG_API_SERVER", "http://localhost:9090")
+
+        evg_api = under_test.get_evg_api("http://localhost:8080")
+
+        assert evg_api._create_url("/projects") == "http://localhost:8080/rest/v2/projects"
@@ -0,0 +1,20 @@
+import selectedtests.fan_out_limit as under_test
+
+
+class TestFanOutLimit:
+    def test_no_limit_counts_every_change(self):
+        fan_out_limit = under_test.FanOutLimit()
+
+        assert fan_out_limit.weight(10000) == 1
+
+    def test_changes_above_limit_are_skipped(self):
+        fan_out_limit = under_test.FanOutLimit(100)
+
+        assert fan_out_limit.weight(100) == 1
+        assert fan_out_limit.weight(101) == 0
+
+    def test_changes_above_limit_are_downweighted(self):
+        fan_out_limit = under_test.FanOutLimit(100, weighted=True)
+
+        assert fan_out_limit.weight(100) == 1
+        assert fan_out_limit.weight(400) == 0.25
@@ -1,12 +1,23 @@
 import os
 
+from datetime import datetime
 from tempfile import TemporaryDirectory
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import git
 
 import selectedtests.git_helper as under_test
 
+from selectedtests.changed_files_index import ChangedFilesEntry, ChangedFilesIndex
+from selectedtests.git_helper import CloneMode
+
+NS = "selectedtests.git_helper"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
 
 def initialize_temp_repo(directory):
     repo = git.Repo.init(directory)
@@ -63,3 +74,186 @@ class TestModifiedFilesForCommit:
             assert "now-renamed-file" in modified_files
             assert "file-to-rename" not in modified_files
             assert "unchanged-file" not in modified_files
+
+    def test_blobless_clone(self):
+        with TemporaryDirectory() as tmpdir:
+            source_repo = repo_with_many_changed_files(os.path.join(tmpdir, "source"))
+            source_repo.git.config("uploadpack.allowFilter", "true")
+            clone_options = under_test._clone_options(
+                source_repo.active_branch.name, CloneMode.BLOBLESS, None
+            )
+            repo = git.Repo.clone_from(
+                f"file://{source_repo.working_dir}", os.path.join(tmpdir, "clone"), **clone_options
+            )
+            log_mock = MagicMock()
+            modified_files = under_test.modified_files_for_commit(repo.head.commit, log_mock)
+            assert "file-to-delete" in modified_files
+            assert "file-to-modify" in modified_files
+            assert "new-file" in modified_files
+            assert "now-renamed-file" in modified_files
+            assert "unchanged-file" not in modified_files
+            assert not os.path.exists(os.path.join(tmpdir, "clone", "unchanged-file"))
+
+
+class TestCloneOptions:
+    def test_full_clone(self):
+        assert under_test._clone_options("master", CloneMode.FULL, None) == {"branch": "master"}
+
+    def test_blobless_clone(self):
+        options = under_test._clone_options("master", CloneMode.BLOBLESS, datetime(2020, 1, 1))
+        assert options == {"branch": "master", "filter": "blob:none", "no_checkout": True}
+
+    def test_shallow_clone(self):
+        options = under_test._clone_options("master", CloneMode.SHALLOW, datetime(2020, 1, 1))
+        assert options == {
+            "branch": "master",
+            "filter": "blob:none",
+            "no_checkout": True,
+            "single_branch": True,
+            "shallow_since": "2020-01-01T00:00:00",
+        }
+
+    def test_shallow_clone_without_date(self):
+        options = under_test._clone_options("master", CloneMode.SHALLOW, None)
+        assert "shallow_since" not in options
+        assert options["single_branch"]
+
+
+class TestGetShallowSince:
+    def test_no_date(self):
+        assert under_test.get_shallow_since(None) is None
+
+    def test_date_includes_margin(self):
+        stop_at_date = datetime(2020, 1, 8)
+        assert under_test.get_shallow_since(stop_at_date) == datetime(2020, 1, 1)
+
+
+class TestInitRepo:
+    @patch(ns("Repo"))
+    def test_clone_options_are_passed_to_git(self, repo_mock):
+        repo = under_test.init_repo(
+            "tmp", "my-repo", "master", "my-org", CloneMode.BLOBLESS, datetime(2020, 1, 1)
+        )
+
+        assert repo == repo_mock.clone_from.return_value
+        repo_mock.clone_from.assert_called_once_with(
+            "git@github.com:my-org/my-repo.git",
+            os.path.join("tmp", "my-repo"),
+            branch="master",
+            filter="blob:none",
+            no_checkout=True,
+        )
+
+    def test_repos_are_cloned_from_up_to_date_mirrors(self):
+        with TemporaryDirectory() as tmpdir:
+            source_repo = initialize_temp_repo(os.path.join(tmpdir, "source"))
+            branch = source_repo.active_branch.name
+            mirrors = under_test.RepoMirrors(os.path.join(tmpdir, "mirrors"))
+            # Mirror the local repo rather than github, further clones update the mirror.
+            git.Repo.clone_from(
+                source_repo.working_dir,
+                os.path.join(tmpdir, "mirrors", "org", "repo.git"),
+                mirror=True,
+            )
+
+            first = under_test.init_repo(
+                os.path.join(tmpdir, "first"), "repo", branch, "org", clones=mirrors
+            )
+            source_repo.index.commit("second commit")
+            second = under_test.init_repo(
+                os.path.join(tmpdir, "second"),
+                "repo",
+                branch,
+                "org",
+                CloneMode.BLOBLESS,
+                clones=mirrors,
+            )
+
+            assert first.head.commit.hexsha != second.head.commit.hexsha
+            assert second.head.commit.hexsha == source_repo.head.commit.hexsha
+
+
+class TestSharedClones:
+    def test_repos_are_cloned_once(self):
+        with TemporaryDirectory() as tmpdir:
+            source_repo = initialize_temp_repo(os.path.join(tmpdir, "source"))
+            branch = source_repo.active_branch.name
+            shared_clones = under_test.SharedClones(os.path.join(tmpdir, "shared"))
+            url = f"file://{source_repo.working_dir}"
+
+            first = shared_clones.clone(url, "unused", "org", "repo", branch)
+            source_repo.index.commit("second commit")
+            second = shared_clones.clone(url, "unused", "org", "repo", branch)
+
+            assert first.working_dir == second.working_dir
+            assert first is not second
+            assert second.head.commit.hexsha == first.head.commit.hexsha
+
+    @patch(ns("Repo"))
+    def test_shared_clones_use_their_own_clone_options(self, repo_mock):
+        inner_clones = MagicMock()
+        shared_clones = under_test.SharedClones(
+            "shared", CloneMode.SHALLOW, datetime(2020, 1, 1), clones=inner_clones
+        )
+
+        under_test.init_repo(
+            "tmp", "my-repo", "master", "my-org", CloneMode.FULL, None, shared_clones
+        )
+
+        inner_clones.clone.assert_called_once_with(
+            "git@github.com:my-org/my-repo.git",
+            os.path.join("shared", "my-org", "my-repo", "master"),
+            "my-org",
+            "my-repo",
+            "master",
+            CloneMode.SHALLOW,
+            datetime(2020, 1, 1),
+        )
+
+
+class TestChangedFilesIndexUsage:
+    def test_changes_are_added_to_index(self):
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_many_changed_files(tmpdir)
+            commit = repo.head.commit
+            index = ChangedFilesIndex({})
+
+            modified_files = under_test.modified_files_for_commit(commit, MagicMock(), index)
+
+            entry = index.get(commit.hexsha)
+            assert entry.parent_sha == commit.parents[0].hexsha
+            assert entry.changed_files == modified_files
+
+    def test_indexed_changes_are_not_diffed(self):
+        commit = MagicMock(hexsha="sha-2")
+        index = ChangedFilesIndex({"sha-2": ChangedFilesEntry("sha-1", frozenset(["file"]))})
+
+        modified_files = under_test.modified_files_for_commit(commit, MagicMock(), index)
+
+        assert modified_files == {"file"}
+        commit.diff.assert_not_called()
+
+    def test_revisions_of_single_commit_use_index(self):
+        repo = MagicMock()
+        index = ChangedFilesIndex({"sha-2": ChangedFilesEntry("sha-1", frozenset(["file"]))})
+
+        changed_files = under_test.changed_files_between_revisions(
+            repo, "sha-2", "sha-1", MagicMock(), index
+        )
+
+        assert changed_files == {"file"}
+        repo.commit.assert_not_called()
+
+    def test_revisions_of_several_commits_are_diffed(self):
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_many_changed_files(tmpdir)
+            commits = list(repo.iter_commits())
+            index = ChangedFilesIndex({})
+
+            changed_files = under_test.changed_files_between_revisions(
+                repo, commits[0].hexsha, commits[2].hexsha, MagicMock(), index
+            )
+
+            assert "new-file" in changed_files
+            assert "unchanged-file" in changed_files
+            assert len(index) == 0
@@ -0,0 +1,120 @@
+import os
+
+from decimal import Decimal
+from tempfile import TemporaryDirectory
+
+import pytest
+
+import selectedtests.mapping_snapshot as under_test
+
+
+def mapping(source_file, seen_count, repo="repo"):
+    return {
+        "_id": f"{repo}-{source_file}",
+        "project": "project-1",
+        "repo": repo,
+        "branch": "master",
+        "source_file": source_file,
+        "source_file_seen_count": seen_count,
+    }
+
+
+def child_test_file(name, count):
+    return {"_id": name, "test_mapping_id": "id", "name": name, "test_file_seen_count": count}
+
+
+def task(name, variant, count):
+    return {
+        "_id": name,
+        "task_mapping_id": "id",
+        "name": name,
+        "variant": variant,
+        "flip_count": count,
+    }
+
+
+TEST_MAPPINGS = [
+    (
+        mapping("src/b.js", 10),
+        [child_test_file("jstests/b1.js", 2), child_test_file("jstests/b2.js", 8)],
+    ),
+    (mapping("src/a.js", 4), [child_test_file("jstests/b1.js", 4)]),
+    (mapping("src/a.js", 5, repo="module"), [child_test_file("jstests/m1.js", 2.5)]),
+]
+TASK_MAPPINGS = [
+    (mapping("src/a.js", 10), [task("auth", "linux", 1), task("auth", "windows", 9)]),
+]
+
+
+@pytest.fixture()
+def snapshot_path():
+    with TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "snapshot.bin")
+        under_test.write_snapshot(path, "project-1", TEST_MAPPINGS, TASK_MAPPINGS)
+        yield path
+
+
+class TestMappingSnapshot:
+    def test_test_mappings_are_returned_above_threshold(self, snapshot_path):
+        with under_test.MappingSnapshot.open(snapshot_path) as snapshot:
+            test_mappings = snapshot.get_correlated_test_mappings(["src/b.js"], Decimal("0.5"))
+
+        assert snapshot.project == "project-1"
+        assert test_mappings == [
+            {
+                "project": "project-1",
+                "repo": "repo",
+                "branch": "master",
+                "source_file": "src/b.js",
+                "source_file_seen_count": 10,
+                "test_files": [{"name": "jstests/b2.js", "test_file_seen_count": 8}],
+            }
+        ]
+
+    def test_all_the_mappings_of_a_source_file_are_returned(self, snapshot_path):
+        with under_test.MappingSnapshot.open(snapshot_path) as snapshot:
+            test_mappings = snapshot.get_correlated_test_mappings(
+                ["src/a.js", "src/missing.js"], Decimal(0)
+            )
+
+        assert sorted((m["repo"], m["test_files"][0]["name"]) for m in test_mappings) == [
+            ("module", "jstests/m1.js"),
+            ("repo", "jstests/b1.js"),
+        ]
+        counts = {m["repo"]: m["test_files"][0]["test_file_seen_count"] for m in test_mappings}
+        assert counts == {"module": 2.5, "repo": 4}
+
+    def test_task_mappings_are_sorted_by_flip_count(self, snapshot_path):
+        with under_test.MappingSnapshot.open(snapshot_path) as snapshot:
+            task_mappings = snapshot.get_correlated_task_mappings(["src/a.js"], Decimal(0))
+
+        assert task_mappings[0]["tasks"] == [
+            {"name": "auth", "variant": "windows", "flip_count": 9},
+            {"name": "auth", "variant": "linux", "flip_count": 1},
+        ]
+
+    def test_empty_sections_return_no_mappings(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "snapshot.bin")
+            under_test.write_snapshot(path, "project-1", [], [])
+
+            with under_test.MappingSnapshot.open(path) as snapshot:
+                assert snapshot.get_correlated_test_mappings(["src/a.js"], Decimal(0)) == []
+                assert snapshot.get_correlated_task_mappings(["src/a.js"], Decimal(0)) == []
+
+    def test_files_that_are_not_snapshots_are_rejected(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "snapshot.bin")
+            with open(path, "wb") as snapshot_file:
+                snapshot_file.write(b"not a snapshot, but long enough to hold a header")
+
+            with pytest.raises(ValueError):
+                under_test.MappingSnapshot.open(path)
+
+    def test_other_versions_are_rejected(self, snapshot_path):
+        with open(snapshot_path, "r+b") as snapshot_file:
+            snapshot_file.seek(len(under_test.MAGIC))
+            snapshot_file.write(b"\x02")
+
+        with pytest.raises(ValueError, match="version 2"):
+            under_test.MappingSnapshot.open(snapshot_path)
@@ -47,3 +47,36 @@ class TestCheckCommitBeforeLimit:
             commit_limit = under_test.CommitLimit(stop_at_commit_sha="some-other-commit-sha")
 
             assert not commit_limit.check_commit_before_limit(commit)
+
+
+class TestCheckCommitAfterUntilDate:
+    def test_when_commit_date_is_after_until_date(self):
+        with TemporaryDirectory() as tmpdir:
+            repo = git.Repo.init(tmpdir)
+            commit = repo.index.commit("initial commit -- no files changed")
+
+            now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+            two_days_ago = now - timedelta(days=2)
+            commit_limit = under_test.CommitLimit(until_date=two_days_ago)
+
+            assert commit_limit.check_commit_after_until_date(commit)
+
+    def test_when_commit_date_is_before_until_date(self):
+        with TemporaryDirectory() as tmpdir:
+            repo = git.Repo.init(tmpdir)
+            commit = repo.index.commit("initial commit -- no files changed")
+
+            now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+            two_days_from_now = now + timedelta(days=2)
+            commit_limit = under_test.CommitLimit(until_date=two_days_from_now)
+
+            assert not commit_limit.check_commit_after_until_date(commit)
+
+    def test_when_there_is_no_until_date(self):
+        with TemporaryDirectory() as tmpdir:
+            repo = git.Repo.init(tmpdir)
+            commit = repo.index.commit("initial commit -- no files changed")
+
+            commit_limit = under_test.CommitLimit(stop_at_commit_sha="some-other-commit-sha")
+
+            assert not commit_limit.check_commit_after_until_date(commit)
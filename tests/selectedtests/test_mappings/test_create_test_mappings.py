@@ -2,16 +2,24 @@ import os
 import re
 
 from tempfile import TemporaryDirectory
+from threading import Barrier
 from unittest.mock import MagicMock, patch
 
+from git import Repo
+from prometheus_client import REGISTRY
+
 import selectedtests.test_mappings.create_test_mappings as under_test
 
+from selectedtests.count_buckets import get_bucket
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import SharedClones
 from selectedtests.test_mappings.commit_limit import CommitLimit
 
 NS = "selectedtests.test_mappings.create_test_mappings"
 SOURCE_RE = re.compile(".*source")
 TEST_RE = re.compile(".*test")
 PROJECT = "my_project"
+REPO = "my_repo"
 BRANCH = "master"
 
 
@@ -24,11 +32,12 @@ class TestCreateMappings:
     def test_no_source_files_changed(self, repo_with_no_source_files_changed):
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_no_source_files_changed(tmpdir)
             test_mappings = under_test.TestMappings.create_mappings(
-                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, BRANCH
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
             )
             test_mappings_list = test_mappings.get_mappings()
             assert len(test_mappings_list) == 0
@@ -38,11 +47,12 @@ class TestCreateMappings:
     ):
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_one_source_file_and_no_test_files_changed(tmpdir)
             test_mappings = under_test.TestMappings.create_mappings(
-                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, BRANCH
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
             )
             test_mappings_list = test_mappings.get_mappings()
             assert len(test_mappings_list) == 0
@@ -52,11 +62,12 @@ class TestCreateMappings:
     ):
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_no_source_files_and_one_test_file_changed(tmpdir)
             test_mappings = under_test.TestMappings.create_mappings(
-                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, BRANCH
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
             )
             test_mappings_list = test_mappings.get_mappings()
             assert len(test_mappings_list) == 0
@@ -66,18 +77,19 @@ class TestCreateMappings:
     ):
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_source_and_test_file_changed_in_same_commit(tmpdir)
             test_mappings = under_test.TestMappings.create_mappings(
-                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, BRANCH
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
             )
             test_mappings_list = test_mappings.get_mappings()
 
             source_file_test_mapping = test_mappings_list[0]
             assert source_file_test_mapping["source_file"] == "new-source-file"
             assert source_file_test_mapping["project"] == PROJECT
-            assert source_file_test_mapping["repo"] == os.path.basename(tmpdir)
+            assert source_file_test_mapping["repo"] == REPO
             assert source_file_test_mapping["branch"] == BRANCH
             assert source_file_test_mapping["source_file_seen_count"] == 1
             for test_file_mapping in source_file_test_mapping["test_files"]:
@@ -89,23 +101,86 @@ class TestCreateMappings:
     ):
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_source_and_test_file_changed_in_different_commits(tmpdir)
             test_mappings = under_test.TestMappings.create_mappings(
-                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, BRANCH
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
             )
             test_mappings_list = test_mappings.get_mappings()
             assert len(test_mappings_list) == 0
 
+    def test_commits_analyzed_are_counted(
+        self, repo_with_source_and_test_file_changed_in_different_commits
+    ):
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_source_and_test_file_changed_in_different_commits(tmpdir)
+            under_test.TestMappings.create_mappings(
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, "counted-project", REPO, BRANCH
+            )
+            commit_count = len(list(repo.iter_commits()))
+
+        labels = {"mapping_type": "test_mappings", "project": "counted-project"}
+        commits = REGISTRY.get_sample_value(
+            "selected_tests_items_processed_total", dict(labels, item="commits")
+        )
+        assert commits == commit_count
+        assert (
+            REGISTRY.get_sample_value(
+                "selected_tests_phase_seconds_total", dict(labels, phase="walk")
+            )
+            > 0
+        )
+
+    @patch(ns("LOGGER"))
+    @patch(ns("is_debug_enabled"))
+    def test_commits_are_not_logged_unless_debugging(
+        self,
+        is_debug_enabled_mock,
+        logger_mock,
+        repo_with_source_and_test_file_changed_in_different_commits,
+    ):
+        is_debug_enabled_mock.return_value = False
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_source_and_test_file_changed_in_different_commits(tmpdir)
+            under_test.TestMappings.create_mappings(
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
+            )
+
+        logger_mock.debug.assert_not_called()
+
+    def test_diffing_is_timed(self, repo_with_source_and_test_file_changed_in_different_commits):
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_source_and_test_file_changed_in_different_commits(tmpdir)
+            under_test.TestMappings.create_mappings(
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, "diffed-project", REPO, BRANCH
+            )
+
+        labels = {"mapping_type": "test_mappings", "project": "diffed-project", "phase": "diff"}
+        assert REGISTRY.get_sample_value("selected_tests_phase_seconds_total", labels) > 0
+
     def test_commit_range_includes_time_of_file_changes(self, repo_with_files_added_two_days_ago):
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_files_added_two_days_ago(tmpdir)
             test_mappings = under_test.TestMappings.create_mappings(
-                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, BRANCH
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
             )
             test_mappings_list = test_mappings.get_mappings()
 
@@ -118,15 +193,144 @@ class TestCreateMappings:
     def test_commit_range_excludes_time_of_file_changes(self, repo_with_files_added_two_days_ago):
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = True
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_files_added_two_days_ago(tmpdir)
             test_mappings = under_test.TestMappings.create_mappings(
-                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, BRANCH
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
             )
             test_mappings_list = test_mappings.get_mappings()
             assert len(test_mappings_list) == 0
 
+    def test_commits_after_until_date_are_skipped(self, repo_with_files_added_two_days_ago):
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = True
+
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_files_added_two_days_ago(tmpdir)
+            test_mappings = under_test.TestMappings.create_mappings(
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
+            )
+            test_mappings_list = test_mappings.get_mappings()
+            assert len(test_mappings_list) == 0
+
+    def test_commits_changing_too_many_files_are_skipped(
+        self, repo_with_source_and_test_file_changed_in_same_commit
+    ):
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_source_and_test_file_changed_in_same_commit(tmpdir)
+            test_mappings = under_test.TestMappings.create_mappings(
+                repo,
+                SOURCE_RE,
+                TEST_RE,
+                commit_limit_mock,
+                PROJECT,
+                REPO,
+                BRANCH,
+                None,
+                FanOutLimit(1),
+            )
+            assert len(test_mappings.get_mappings()) == 0
+            assert test_mappings.commits_skipped == 1
+
+    def test_commits_changing_too_many_files_are_downweighted(
+        self, repo_with_source_and_test_file_changed_in_same_commit
+    ):
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_source_and_test_file_changed_in_same_commit(tmpdir)
+            test_mappings = under_test.TestMappings.create_mappings(
+                repo,
+                SOURCE_RE,
+                TEST_RE,
+                commit_limit_mock,
+                PROJECT,
+                REPO,
+                BRANCH,
+                fan_out_limit=FanOutLimit(1, weighted=True),
+            )
+            test_mappings_list = test_mappings.get_mappings()
+            bucket = get_bucket(repo.head.commit.committed_datetime)
+
+            assert test_mappings.commits_skipped == 0
+            source_file_test_mapping = test_mappings_list[0]
+            assert source_file_test_mapping["source_file_seen_count"] == 0.5
+            assert source_file_test_mapping["monthly_counts"] == {bucket: 0.5}
+            assert source_file_test_mapping["test_files"] == [
+                {
+                    "name": "new-test-file",
+                    "test_file_seen_count": 0.5,
+                    "monthly_counts": {bucket: 0.5},
+                }
+            ]
+
+    def test_counts_are_bucketed_by_the_month_of_their_commit(self):
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            repo = Repo.init(tmpdir)
+            repo.index.commit("initial commit", commit_date="2019-12-01T00:00:00 +0000")
+            for i, commit_date in enumerate(
+                [
+                    "2020-01-31T23:00:00 +0000",
+                    "2020-02-01T01:00:00 +0000",
+                    "2020-02-02T00:00:00 +0000",
+                ]
+            ):
+                for name in ["source", "test"]:
+                    with open(os.path.join(tmpdir, name), "w") as changed_file:
+                        changed_file.write(str(i))
+                repo.index.add([os.path.join(tmpdir, "source"), os.path.join(tmpdir, "test")])
+                repo.index.commit(f"commit {i}", commit_date=commit_date, author_date=commit_date)
+
+            test_mappings = under_test.TestMappings.create_mappings(
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
+            )
+            mappings = test_mappings.get_mappings()
+
+        assert mappings == [
+            {
+                "source_file": "source",
+                "project": PROJECT,
+                "repo": REPO,
+                "branch": BRANCH,
+                "source_file_seen_count": 3,
+                "monthly_counts": {"2020-02": 2, "2020-01": 1},
+                "test_files": [
+                    {
+                        "name": "test",
+                        "test_file_seen_count": 3,
+                        "monthly_counts": {"2020-02": 2, "2020-01": 1},
+                    }
+                ],
+            }
+        ]
+
+    def test_mappings_can_be_iterated(self, repo_with_source_and_test_file_changed_in_same_commit):
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            repo = repo_with_source_and_test_file_changed_in_same_commit(tmpdir)
+            test_mappings = under_test.TestMappings.create_mappings(
+                repo, SOURCE_RE, TEST_RE, commit_limit_mock, PROJECT, REPO, BRANCH
+            )
+
+            assert len(test_mappings) == 1
+            assert list(test_mappings.iter_mappings()) == test_mappings.get_mappings()
+
 
 class TestGenerateProjectTestMappings:
     @patch(ns("init_repo"))
@@ -145,17 +349,24 @@ class TestGenerateProjectTestMappings:
 
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_source_and_test_file_changed_in_same_commit(tmpdir)
             init_repo_mock.return_value = repo
             commits = list(repo.iter_commits("master"))
             repo_newest_commit = commits[0]
-            mappings, most_recent_commit_analyzed = under_test.generate_project_test_mappings(
+            bucket = get_bucket(repo_newest_commit.committed_datetime)
+            (
+                mappings,
+                most_recent_commit_analyzed,
+                commits_skipped,
+            ) = under_test.generate_project_test_mappings(
                 mock_evg_api, "mongodb-mongo-master", tmpdir, SOURCE_RE, TEST_RE, commit_limit_mock
             )
 
         assert most_recent_commit_analyzed == repo_newest_commit.hexsha
+        assert commits_skipped == 0
 
         assert len(mappings) == 1
         test_mapping = mappings[0]
@@ -167,7 +378,42 @@ class TestGenerateProjectTestMappings:
             test_mapping["source_file_seen_count"]
             == expected_test_mapping["source_file_seen_count"]
         )
-        assert test_mapping["test_files"] == expected_test_mapping["test_files"]
+        assert test_mapping["monthly_counts"] == {bucket: 1}
+        assert test_mapping["test_files"] == [
+            dict(test_file, monthly_counts={bucket: 1})
+            for test_file in expected_test_mapping["test_files"]
+        ]
+
+    def test_repo_of_shared_clone_is_named_after_evergreen_repo(
+        self, evg_projects, repo_with_source_and_test_file_changed_in_same_commit
+    ):
+        mock_evg_api = MagicMock()
+        mock_evg_api.all_projects.return_value = evg_projects
+        commit_limit_mock = MagicMock()
+        commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
+
+        with TemporaryDirectory() as tmpdir:
+            source_repo = repo_with_source_and_test_file_changed_in_same_commit(
+                os.path.join(tmpdir, "source")
+            )
+            inner_clones = MagicMock()
+            inner_clones.clone.side_effect = lambda url, repo_path, *args: Repo.clone_from(
+                source_repo.working_dir, repo_path
+            )
+            shared_clones = SharedClones(os.path.join(tmpdir, "shared"), clones=inner_clones)
+            mappings, _, _ = under_test.generate_project_test_mappings(
+                mock_evg_api,
+                "mongodb-mongo-master",
+                tmpdir,
+                SOURCE_RE,
+                TEST_RE,
+                commit_limit_mock,
+                clones=shared_clones,
+            )
+
+        # The shared clone is in <clone dir>/10gen/my-repo-2/master.
+        assert ["my-repo-2"] == [mapping["repo"] for mapping in mappings]
 
 
 class TestGenerateModuleTestMappings:
@@ -184,13 +430,19 @@ class TestGenerateModuleTestMappings:
 
         commit_limit_mock = MagicMock()
         commit_limit_mock.check_commit_before_limit.return_value = False
+        commit_limit_mock.check_commit_after_until_date.return_value = False
 
         with TemporaryDirectory() as tmpdir:
             repo = repo_with_source_and_test_file_changed_in_same_commit(tmpdir)
             init_repo_mock.return_value = repo
             commits = list(repo.iter_commits("master"))
             repo_newest_commit = commits[0]
-            mappings, most_recent_commit_analyzed = under_test.generate_module_test_mappings(
+            bucket = get_bucket(repo_newest_commit.committed_datetime)
+            (
+                mappings,
+                most_recent_commit_analyzed,
+                commits_skipped,
+            ) = under_test.generate_module_test_mappings(
                 mock_evg_api,
                 "mongodb-mongo-master",
                 "my-module",
@@ -201,6 +453,7 @@ class TestGenerateModuleTestMappings:
             )
 
         assert most_recent_commit_analyzed == repo_newest_commit.hexsha
+        assert commits_skipped == 0
 
         assert len(mappings) == 1
         test_mapping = mappings[0]
@@ -212,7 +465,11 @@ class TestGenerateModuleTestMappings:
             test_mapping["source_file_seen_count"]
             == expected_test_mapping["source_file_seen_count"]
         )
-        assert test_mapping["test_files"] == expected_test_mapping["test_files"]
+        assert test_mapping["monthly_counts"] == {bucket: 1}
+        assert test_mapping["test_files"] == [
+            dict(test_file, monthly_counts={bucket: 1})
+            for test_file in expected_test_mapping["test_files"]
+        ]
 
 
 class TestGenerateTestMappings:
@@ -225,10 +482,12 @@ class TestGenerateTestMappings:
         generate_project_test_mappings_mock.return_value = (
             ["mock-project-mappings"],
             "last-project-sha-analyzed",
+            1,
         )
         generate_module_test_mappings_mock.return_value = (
             ["mock-module-mappings"],
             "last-module-sha-analyzed",
+            2,
         )
         test_mappings_result = under_test.generate_test_mappings(
             mock_evg_api,
@@ -249,6 +508,43 @@ class TestGenerateTestMappings:
             test_mappings_result.most_recent_project_commit_analyzed == "last-project-sha-analyzed"
         )
         assert test_mappings_result.most_recent_module_commit_analyzed == "last-module-sha-analyzed"
+        assert test_mappings_result.commits_skipped == 3
+
+    @patch(ns("generate_project_test_mappings"))
+    @patch(ns("generate_module_test_mappings"))
+    def test_project_and_module_are_mined_concurrently(
+        self, generate_module_test_mappings_mock, generate_project_test_mappings_mock
+    ):
+        # Each mock waits for the other one to start, which only succeeds if they run in parallel.
+        barrier = Barrier(2, timeout=10)
+
+        def project_mappings(*args):
+            barrier.wait()
+            return ["mock-project-mappings"], "last-project-sha-analyzed", 0
+
+        def module_mappings(*args):
+            barrier.wait()
+            return ["mock-module-mappings"], "last-module-sha-analyzed", 0
+
+        generate_project_test_mappings_mock.side_effect = project_mappings
+        generate_module_test_mappings_mock.side_effect = module_mappings
+
+        test_mappings_result = under_test.generate_test_mappings(
+            MagicMock(),
+            "mongodb-mongo-master",
+            CommitLimit(stop_at_commit_sha="some-project-commit-sha"),
+            ".*src",
+            ".*test",
+            "my-module",
+            CommitLimit(stop_at_commit_sha="some-module-commit-sha"),
+            ".*src",
+            ".*test",
+        )
+
+        assert test_mappings_result.test_mappings_list == [
+            "mock-project-mappings",
+            "mock-module-mappings",
+        ]
 
     @patch(ns("generate_project_test_mappings"))
     def test_no_module_name_passed_in(self, generate_project_test_mappings_mock):
@@ -256,6 +552,7 @@ class TestGenerateTestMappings:
         generate_project_test_mappings_mock.return_value = (
             ["mock-project-mappings"],
             "last-project-sha-analyzed",
+            1,
         )
         test_mappings_result = under_test.generate_test_mappings(
             mock_evg_api,
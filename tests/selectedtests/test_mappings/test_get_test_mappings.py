@@ -1,7 +1,14 @@
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import selectedtests.test_mappings.get_test_mappings as under_test
 
+NS = "selectedtests.test_mappings.get_test_mappings"
+
+
+def ns(relative_name):  # pylint: disable=invalid-name
+    """Return a full name from a name relative to the test module"s name space."""
+    return NS + "." + relative_name
+
 
 class TestGetCorrelatedTestMappings:
     def test_mappings_found(self):
@@ -29,3 +36,37 @@ class TestGetCorrelatedTestMappings:
 
         assert test_mappings == []
         collection_mock.aggregate.assert_called_once()
+
+    @patch(ns("get_oldest_bucket"))
+    def test_lookback_counts_only_recent_buckets(self, get_oldest_bucket_mock):
+        collection_mock = MagicMock()
+        collection_mock.name = "test_mappings"
+        get_oldest_bucket_mock.return_value = "2026-05"
+
+        under_test.get_correlated_test_mappings(
+            collection_mock, ["src/file1.js"], "my-project", 0, lookback_months=6
+        )
+
+        get_oldest_bucket_mock.assert_called_once_with(6)
+        pipeline = collection_mock.aggregate.call_args[0][0]
+        stages = [next(iter(stage)) for stage in pipeline]
+        assert stages == [
+            "$match",
+            "$addFields",
+            "$match",
+            "$lookup",
+            "$addFields",
+            "$addFields",
+            "$project",
+        ]
+        assert pipeline[2] == {"$match": {"source_file_seen_count": {"$gt": 0}}}
+        assert "2026-05" in str(pipeline[1]) and "2026-05" in str(pipeline[4])
+
+    def test_no_lookback_counts_all_buckets(self):
+        collection_mock = MagicMock()
+
+        under_test.get_correlated_test_mappings(collection_mock, ["src/file1.js"], "my-project", 0)
+
+        pipeline = collection_mock.aggregate.call_args[0][0]
+        stages = [next(iter(stage)) for stage in pipeline]
+        assert stages == ["$match", "$lookup", "$addFields", "$project"]
@@ -1,9 +1,11 @@
 import json
+import os
 
 from unittest.mock import MagicMock, patch
 
 from click.testing import CliRunner
 
+from selectedtests.git_helper import CloneMode
 from selectedtests.test_mappings.create_test_mappings import TestMappingsResult
 from selectedtests.test_mappings.test_mappings_cli import cli
 
@@ -144,3 +146,54 @@ class TestCli:
         with runner.isolated_filesystem():
             result = runner.invoke(cli, ["update", "--mongo-uri=localhost"])
             assert result.exit_code == 0
+
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("update_test_mappings_since_last_commit"))
+    def test_update_with_clone_mode(
+        self, update_test_mappings_since_last_commit_mock, mongo_wrapper_mock, evg_api_mock
+    ):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                cli, ["update", "--mongo-uri=localhost", "--clone-mode", "blobless"]
+            )
+            assert result.exit_code == 0
+            update_test_mappings_since_last_commit_mock.assert_called_once_with(
+                evg_api_mock.return_value,
+                mongo_wrapper_mock.return_value,
+                CloneMode.BLOBLESS,
+                None,
+            )
+
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("update_test_mappings_since_last_commit"))
+    def test_update_writes_metrics_to_textfile(
+        self, update_test_mappings_since_last_commit_mock, mongo_wrapper_mock, evg_api_mock
+    ):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                cli, ["--metrics-textfile", "metrics.prom", "update", "--mongo-uri=localhost"]
+            )
+            assert result.exit_code == 0
+            with open("metrics.prom") as metrics_file:
+                assert "selected_tests_phase_seconds" in metrics_file.read()
+
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("update_test_mappings_since_last_commit"))
+    def test_update_writes_profiles(
+        self, update_test_mappings_since_last_commit_mock, mongo_wrapper_mock, evg_api_mock
+    ):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                cli,
+                ["--profile", "--profile-output", "out", "update", "--mongo-uri=localhost"],
+            )
+            assert result.exit_code == 0
+            [run] = os.listdir("out")
+            assert run.startswith("test-mappings-")
+            assert os.path.exists(os.path.join("out", run, "profile.prof"))
@@ -2,11 +2,15 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from pymongo import ReturnDocument
+from prometheus_client import REGISTRY
+from pymongo import UpdateOne
 from pymongo.errors import BulkWriteError
 
 import selectedtests.test_mappings.update_test_mappings as under_test
 
+from selectedtests.fan_out_limit import FanOutLimit
+from selectedtests.git_helper import CloneMode
+from selectedtests.helpers import create_mapping_id
 from selectedtests.test_mappings.create_test_mappings import TestMappingsResult
 
 NS = "selectedtests.test_mappings.update_test_mappings"
@@ -67,6 +71,10 @@ class TestUpdateTestMappingsSinceLastCommit:
             module_name="module-1",
             module_source_file_pattern="^src",
             module_test_file_pattern="^src",
+            clone_mode=CloneMode.FULL,
+            changed_files_index=None,
+            fan_out_limit=FanOutLimit(),
+            clones=None,
         )
         test_config_mock = project_config_mock.return_value.test_config
         test_config_mock.update_most_recent_commits_analyzed.assert_called_once_with(
@@ -77,8 +85,10 @@ class TestUpdateTestMappingsSinceLastCommit:
 
 
 class TestUpdateTestMappings:
+    @patch(ns("get_bucket"), autospec=True)
     @patch(ns("update_test_mappings_test_files"), autospec=True)
-    def test_mappings_are_updated(self, update_test_mappings_test_files_mock):
+    def test_mappings_are_updated(self, update_test_mappings_test_files_mock, get_bucket_mock):
+        get_bucket_mock.return_value = "2026-10"
         mongo_mock = MagicMock()
 
         source_file_seen_count = 1
@@ -99,19 +109,115 @@ class TestUpdateTestMappings:
             )
         ]
 
-        mongo_mock.test_mappings.return_value.find_one_and_update.return_value = {"_id": 1}
-
         under_test.update_test_mappings(mappings, mongo_mock)
-        mongo_mock.test_mappings.return_value.find_one_and_update.assert_called_once_with(
-            query,
-            {"$inc": {"source_file_seen_count": source_file_seen_count}},
-            projection={"_id": 1},
-            upsert=True,
-            return_document=ReturnDocument.AFTER,
+
+        test_mapping_id = create_mapping_id(query)
+        bulk_write = mongo_mock.test_mappings.return_value.bulk_write
+        bulk_write.assert_called_once_with(
+            [
+                UpdateOne(
+                    {"_id": test_mapping_id},
+                    {
+                        "$inc": {
+                            "source_file_seen_count": source_file_seen_count,
+                            "monthly_counts.2026-10": source_file_seen_count,
+                        },
+                        "$setOnInsert": query,
+                    },
+                    upsert=True,
+                )
+            ],
+            ordered=False,
         )
+        mongo_mock.test_mappings.return_value.find_one_and_update.assert_not_called()
 
         update_test_mappings_test_files_mock.assert_called_once_with(
-            [test_file], {"test_mapping_id": 1}, mongo_mock
+            [dict(**test_file, test_mapping_id=test_mapping_id)], mongo_mock, "2026-10"
+        )
+
+    @patch(ns("update_test_mappings_test_files"), autospec=True)
+    def test_counts_are_added_to_the_months_of_their_commits(
+        self, update_test_mappings_test_files_mock
+    ):
+        mongo_mock = MagicMock()
+        query = {
+            "project": "mongodb-mongo-master",
+            "repo": "mongo",
+            "branch": "master",
+            "source_file": "src/file.cpp",
+        }
+        test_file = {
+            "name": "jstests/test.js",
+            "test_file_seen_count": 1,
+            "monthly_counts": {"2026-08": 1},
+        }
+        mappings = [
+            dict(
+                **query,
+                source_file_seen_count=3,
+                monthly_counts={"2026-08": 1, "2026-09": 2},
+                test_files=[test_file],
+            )
+        ]
+
+        under_test.update_test_mappings(mappings, mongo_mock)
+
+        (operation,) = mongo_mock.test_mappings.return_value.bulk_write.call_args[0][0]
+        assert operation._doc == {
+            "$inc": {
+                "source_file_seen_count": 3,
+                "monthly_counts.2026-08": 1,
+                "monthly_counts.2026-09": 2,
+            },
+            "$setOnInsert": query,
+        }
+        ((test_files, _, _), _) = update_test_mappings_test_files_mock.call_args
+        assert test_files == [dict(**test_file, test_mapping_id=create_mapping_id(query))]
+
+    @patch(ns("update_test_mappings_test_files"), autospec=True)
+    def test_mappings_are_written_in_batches(self, update_test_mappings_test_files_mock):
+        mongo_mock = MagicMock()
+        mappings = [
+            {
+                "project": "mongodb-mongo-master",
+                "repo": "mongo",
+                "branch": "master",
+                "source_file": f"src/file{i}.cpp",
+                "source_file_seen_count": 1,
+                "test_files": [{"name": "jstests/test.js", "test_file_seen_count": 1}],
+            }
+            for i in range(5)
+        ]
+
+        under_test.update_test_mappings(mappings, mongo_mock, batch_size=2)
+
+        bulk_write = mongo_mock.test_mappings.return_value.bulk_write
+        assert [len(call[0][0]) for call in bulk_write.call_args_list] == [2, 2, 1]
+        assert update_test_mappings_test_files_mock.call_count == 3
+
+    @patch(ns("update_test_mappings_test_files"), autospec=True)
+    def test_documents_written_are_counted_by_project(self, update_test_mappings_test_files_mock):
+        mappings = [
+            {
+                "project": "counted-project",
+                "repo": "mongo",
+                "branch": "master",
+                "source_file": f"src/file{i}.cpp",
+                "source_file_seen_count": 1,
+                "test_files": [{"name": "jstests/test.js", "test_file_seen_count": 1}] * 2,
+            }
+            for i in range(3)
+        ]
+
+        under_test.update_test_mappings(mappings, MagicMock(), batch_size=2)
+
+        assert 3 == REGISTRY.get_sample_value(
+            "selected_tests_documents_written_total",
+            {"collection": "test_mappings", "project": "counted-project"},
+        )
+        assert 6 == REGISTRY.get_sample_value(
+            "selected_tests_documents_written_total",
+            {"collection": "test_mappings_test_files", "project": "counted-project"},
         )
 
 
@@ -120,21 +226,44 @@ class TestUpdateTestMappingsTestFiles:
     def test_test_mappings_test_files_are_updated(self, update_one_mock):
         mongo_mock = MagicMock()
 
-        test_mapping_id = {"test_mapping_id": 1}
         test_file = {
             "name": "jstests/core/txns/commands_not_allowed_in_txn.js",
             "test_file_seen_count": 1,
+            "test_mapping_id": 1,
         }
 
-        under_test.update_test_mappings_test_files([test_file], test_mapping_id, mongo_mock)
+        under_test.update_test_mappings_test_files([test_file], mongo_mock, "2026-10")
         update_one_mock.assert_called_once_with(
             {"name": test_file["name"], "test_mapping_id": 1},
-            {"$inc": {"test_file_seen_count": test_file["test_file_seen_count"]}},
+            {"$inc": {"test_file_seen_count": 1, "monthly_counts.2026-10": 1}},
             upsert=True,
         )
 
         mongo_mock.test_mappings_test_files.return_value.bulk_write.assert_called_once_with(
-            [update_one_mock.return_value]
+            [update_one_mock.return_value], ordered=False
+        )
+
+    @patch(ns("UpdateOne"), autospec=True)
+    def test_test_files_are_added_to_the_months_of_their_commits(self, update_one_mock):
+        test_file = {
+            "name": "jstests/test.js",
+            "test_file_seen_count": 3,
+            "monthly_counts": {"2026-08": 1, "2026-09": 2},
+            "test_mapping_id": 1,
+        }
+
+        under_test.update_test_mappings_test_files([test_file], MagicMock(), "2026-10")
+
+        update_one_mock.assert_called_once_with(
+            {"name": "jstests/test.js", "test_mapping_id": 1},
+            {
+                "$inc": {
+                    "test_file_seen_count": 3,
+                    "monthly_counts.2026-08": 1,
+                    "monthly_counts.2026-09": 2,
+                }
+            },
+            upsert=True,
         )
 
     @patch(ns("LOGGER.exception"), autospec=True)
@@ -142,10 +271,10 @@ class TestUpdateTestMappingsTestFiles:
     def test_task_mappings_exceptions(self, update_one_mock, exception_mock):
         mongo_mock = MagicMock()
 
-        test_mapping_id = {"test_mapping_id": 1}
         test_file = {
             "name": "jstests/core/txns/commands_not_allowed_in_txn.js",
             "test_file_seen_count": 1,
+            "test_mapping_id": 1,
         }
 
         details = {"errorLabels": []}
@@ -153,15 +282,8 @@ class TestUpdateTestMappingsTestFiles:
             details
         )
         pytest.raises(
-            BulkWriteError,
-            under_test.update_test_mappings_test_files,
-            [test_file],
-            test_mapping_id,
-            mongo_mock,
+            BulkWriteError, under_test.update_test_mappings_test_files, [test_file], mongo_mock
         )
         exception_mock.assert_called_once_with(
-            "bulk_write error",
-            parent=test_mapping_id,
-            operations=[update_one_mock.return_value],
-            details=details,
+            "bulk_write error", operations=[update_one_mock.return_value], details=details
         )
@@ -0,0 +1,35 @@
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+import selectedtests.mappings_cli as under_test
+
+from selectedtests.git_helper import CloneMode, RepoMirrors
+
+NS = "selectedtests.mappings_cli"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+class TestCli:
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("update_all_mappings_since_last_analyzed"))
+    def test_update_all(self, update_all_mock, mongo_wrapper_mock, evg_api_mock):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                under_test.cli,
+                ["update-all", "--mongo-uri=localhost", "--clone-mode=shallow", "--mirror-dir=m"],
+            )
+            assert result.exit_code == 0
+
+        evg_api, mongo, clone_mode, index, clones = update_all_mock.call_args[0]
+        assert evg_api == evg_api_mock.return_value
+        assert mongo == mongo_wrapper_mock.return_value
+        assert clone_mode == CloneMode.SHALLOW
+        assert index is None
+        assert isinstance(clones, RepoMirrors)
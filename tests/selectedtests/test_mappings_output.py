@@ -0,0 +1,85 @@
+import gzip
+import json
+import os
+
+from tempfile import TemporaryDirectory
+
+import pytest
+
+import selectedtests.mappings_output as under_test
+
+MAPPINGS = [{"source_file": "src/file1", "tasks": []}, {"source_file": "src/file2", "tasks": []}]
+
+
+class TestWriteMappings:
+    def test_json_is_written_to_stdout(self, capsys):
+        n_mappings = under_test.write_mappings(iter(MAPPINGS))
+
+        assert n_mappings == 2
+        assert json.loads(capsys.readouterr().out) == MAPPINGS
+
+    def test_jsonl_is_appended_to_file(self):
+        with TemporaryDirectory() as tmpdir:
+            output_file = os.path.join(tmpdir, "mappings.jsonl")
+            under_test.write_mappings(MAPPINGS[:1], under_test.OutputFormat.JSONL, output_file)
+            under_test.write_mappings(MAPPINGS[1:], under_test.OutputFormat.JSONL, output_file)
+
+            with open(output_file) as data:
+                assert [json.loads(line) for line in data] == MAPPINGS
+
+    def test_gzip_compressed_jsonl(self):
+        with TemporaryDirectory() as tmpdir:
+            output_file = os.path.join(tmpdir, "mappings.jsonl.gz")
+            under_test.write_mappings(
+                (mapping for mapping in MAPPINGS),
+                under_test.OutputFormat.JSONL,
+                output_file,
+                under_test.Compression.GZIP,
+            )
+
+            with gzip.open(output_file, "rt") as data:
+                assert [json.loads(line) for line in data] == MAPPINGS
+
+    def test_zstd_compressed_json(self):
+        zstandard = pytest.importorskip("zstandard")
+        with TemporaryDirectory() as tmpdir:
+            output_file = os.path.join(tmpdir, "mappings.json.zst")
+            under_test.write_mappings(
+                MAPPINGS, under_test.OutputFormat.JSON, output_file, under_test.Compression.ZSTD
+            )
+
+            with open(output_file, "rb") as data:
+                decompressed = zstandard.ZstdDecompressor().stream_reader(data).read()
+            assert json.loads(decompressed) == MAPPINGS
+
+
+class TestReadMappings:
+    @pytest.mark.parametrize(
+        "output_format,compression",
+        [
+            (under_test.OutputFormat.JSON, under_test.Compression.NONE),
+            (under_test.OutputFormat.JSONL, under_test.Compression.NONE),
+            (under_test.OutputFormat.JSONL, under_test.Compression.GZIP),
+        ],
+    )
+    def test_written_mappings_are_read_back(self, output_format, compression):
+        with TemporaryDirectory() as tmpdir:
+            output_file = os.path.join(tmpdir, "mappings")
+            under_test.write_mappings(MAPPINGS[:1], output_format, output_file, compression)
+            under_test.write_mappings(MAPPINGS[1:], output_format, output_file, compression)
+
+            assert list(under_test.read_mappings(output_file)) == MAPPINGS
+
+    def test_zstd_compressed_mappings_are_read_back(self):
+        pytest.importorskip("zstandard")
+        with TemporaryDirectory() as tmpdir:
+            output_file = os.path.join(tmpdir, "mappings")
+            for mapping in MAPPINGS:
+                under_test.write_mappings(
+                    [mapping],
+                    under_test.OutputFormat.JSONL,
+                    output_file,
+                    under_test.Compression.ZSTD,
+                )
+
+            assert list(under_test.read_mappings(output_file)) == MAPPINGS
@@ -0,0 +1,189 @@
+from time import sleep
+from unittest.mock import MagicMock, patch
+
+from prometheus_client import CollectorRegistry, Counter
+
+import selectedtests.metrics as under_test
+
+NS = "selectedtests.metrics"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+def phase_seconds(project, phase):
+    return under_test.PHASE_SECONDS.labels(under_test.TEST_MAPPINGS, project, phase)._value.get()
+
+
+class TestTimedPhase:
+    @patch(ns("perf_counter"))
+    def test_time_of_block_is_added_to_phase(self, perf_counter_mock):
+        perf_counter_mock.side_effect = [10.0, 12.5, 20.0, 21.0]
+
+        with under_test.timed_phase(under_test.TEST_MAPPINGS, "timed-phase", "clone"):
+            pass
+        with under_test.timed_phase(under_test.TEST_MAPPINGS, "timed-phase", "clone"):
+            pass
+
+        assert 3.5 == phase_seconds("timed-phase", "clone")
+
+    @patch(ns("perf_counter"))
+    def test_failed_block_is_timed(self, perf_counter_mock):
+        perf_counter_mock.side_effect = [10.0, 11.0]
+
+        try:
+            with under_test.timed_phase(under_test.TEST_MAPPINGS, "failed-phase", "walk"):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        assert 1.0 == phase_seconds("failed-phase", "walk")
+
+    @patch(ns("LOGGER"))
+    @patch(ns("is_debug_enabled"))
+    @patch(ns("perf_counter"))
+    def test_span_is_logged_when_debugging(
+        self, perf_counter_mock, is_debug_enabled_mock, logger_mock
+    ):
+        perf_counter_mock.side_effect = [10.0, 12.5]
+        is_debug_enabled_mock.return_value = True
+
+        with under_test.timed_phase(under_test.TEST_MAPPINGS, "logged-phase", "clone"):
+            pass
+
+        logger_mock.debug.assert_called_once_with(
+            "Phase ended",
+            mapping_type=under_test.TEST_MAPPINGS,
+            project="logged-phase",
+            phase="clone",
+            seconds=2.5,
+        )
+
+    @patch(ns("LOGGER"))
+    @patch(ns("is_debug_enabled"))
+    def test_span_is_not_logged_unless_debugging(self, is_debug_enabled_mock, logger_mock):
+        is_debug_enabled_mock.return_value = False
+
+        with under_test.timed_phase(under_test.TEST_MAPPINGS, "quiet-phase", "clone"):
+            pass
+
+        logger_mock.debug.assert_not_called()
+
+
+class TestTimedIter:
+    @patch(ns("perf_counter"))
+    def test_only_time_generating_items_is_added_to_phase(self, perf_counter_mock):
+        perf_counter_mock.side_effect = [0.0, 1.0, 5.0, 6.0, 10.0, 11.0]
+
+        items = list(
+            under_test.timed_iter([1, 2], under_test.TEST_MAPPINGS, "timed-iter", "transform")
+        )
+
+        assert [1, 2] == items
+        assert 3.0 == phase_seconds("timed-iter", "transform")
+
+
+class TestCountEvergreenApiCall:
+    def test_responses_are_counted(self):
+        calls = under_test.EVERGREEN_API_CALLS._value.get()
+
+        under_test.count_evergreen_api_call(MagicMock(), timeout=10)
+
+        assert calls + 1 == under_test.EVERGREEN_API_CALLS._value.get()
+
+
+class TestThroughputLogger:
+    @patch(ns("LOGGER"))
+    @patch(ns("perf_counter"))
+    def test_throughput_and_summary_are_logged(self, perf_counter_mock, logger_mock):
+        perf_counter_mock.side_effect = [10.0, 20.0, 30.0]
+        versions = under_test.ITEMS_PROCESSED.labels(
+            under_test.TASK_MAPPINGS, "throughput", "versions"
+        )
+        diff_seconds = under_test.PHASE_SECONDS.labels(
+            under_test.TASK_MAPPINGS, "throughput", under_test.DIFF_PHASE
+        )
+        in_flight = under_test.VERSIONS_IN_FLIGHT.labels("throughput")
+
+        with under_test.ThroughputLogger(
+            under_test.TASK_MAPPINGS, "throughput", "versions", interval=3600
+        ) as throughput:
+            versions.inc(50)
+            under_test.EVERGREEN_API_CALLS.inc(100)
+            in_flight.inc(3)
+            throughput.log_throughput()
+            versions.inc(10)
+            diff_seconds.inc(4.0)
+            in_flight.dec(3)
+
+        throughput_call, summary_call = logger_mock.info.call_args_list
+        assert "Mapping generation throughput" == throughput_call[0][0]
+        assert 5.0 == throughput_call[1]["versions_per_second"]
+        assert 10.0 == throughput_call[1]["api_calls_per_second"]
+        assert 3.0 == throughput_call[1]["versions_in_flight"]
+        assert "Mapping generation summary" == summary_call[0][0]
+        assert 20.0 == summary_call[1]["seconds"]
+        assert 60.0 == summary_call[1]["versions"]
+        assert 3.0 == summary_call[1]["versions_per_second"]
+        assert 100.0 == summary_call[1]["api_calls"]
+        assert {"diff": 4.0} == summary_call[1]["phase_seconds"]
+
+    @patch(ns("LOGGER"))
+    def test_throughput_is_logged_every_interval(self, logger_mock):
+        with under_test.ThroughputLogger(
+            under_test.TEST_MAPPINGS, "periodic", "commits", interval=0.01
+        ):
+            while logger_mock.info.call_count < 2:
+                sleep(0.01)
+
+        assert "Mapping generation throughput" == logger_mock.info.call_args_list[0][0][0]
+        assert "Mapping generation summary" == logger_mock.info.call_args_list[-1][0][0]
+
+
+class TestExportMetrics:
+    def test_metrics_are_written_to_textfile(self, tmpdir):
+        registry = CollectorRegistry()
+        Counter("documents", "Documents written.", registry=registry).inc(3)
+        path = str(tmpdir.join("metrics.prom"))
+
+        under_test.export_metrics("test-mappings", textfile=path, registry=registry)
+
+        with open(path) as metrics_file:
+            assert "documents_total 3.0" in metrics_file.read()
+
+    @patch(ns("push_to_gateway"))
+    def test_metrics_are_pushed_under_job(self, push_to_gateway_mock):
+        registry = CollectorRegistry()
+
+        under_test.export_metrics("work-items", pushgateway="gateway:9091", registry=registry)
+
+        push_to_gateway_mock.assert_called_once_with(
+            "gateway:9091", job="work-items", registry=registry
+        )
+
+    @patch(ns("push_to_gateway"))
+    def test_failed_push_is_not_raised(self, push_to_gateway_mock):
+        push_to_gateway_mock.side_effect = OSError("Connection refused")
+
+        under_test.export_metrics("work-items", pushgateway="gateway:9091")
+
+
+class TestExportMetricsOnClose:
+    def test_nothing_is_exported_if_not_asked_for(self):
+        ctx = MagicMock()
+
+        under_test.export_metrics_on_close(ctx, "mappings", None, None)
+
+        ctx.call_on_close.assert_not_called()
+
+    @patch(ns("export_metrics"))
+    def test_metrics_are_exported_when_context_closes(self, export_metrics_mock):
+        ctx = MagicMock()
+
+        under_test.export_metrics_on_close(ctx, "mappings", "metrics.prom", None)
+        export_metrics_mock.assert_not_called()
+        ctx.call_on_close.call_args[0][0]()
+
+        export_metrics_mock.assert_called_once_with("mappings", "metrics.prom", None)
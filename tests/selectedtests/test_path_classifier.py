@@ -0,0 +1,60 @@
+import re
+
+import pytest
+
+import selectedtests.path_classifier as under_test
+
+
+class TestGetLiteralPrefixes:
+    @pytest.mark.parametrize(
+        "pattern,expected",
+        [
+            ("src/mongo/.*", ["src/mongo/"]),
+            ("^src/.*\\.cpp", ["src/"]),
+            ("(jstests|src)/.*", ["jstests", "src"]),
+            ("jstests/core/.*|buildscripts/.*", ["jstests/core/", "buildscripts/"]),
+            ("src/(db|s)/.*", ["src/db", "src/s"]),
+            (".*\\.js", [""]),
+            ("(?i)src/.*", [""]),
+            ("s?rc/.*", [""]),
+        ],
+    )
+    def test_prefixes(self, pattern, expected):
+        assert under_test.get_literal_prefixes(re.compile(pattern)) == expected
+
+
+class TestPathClassifier:
+    def test_first_matching_pattern_wins(self):
+        classifier = under_test.PathClassifier(
+            [
+                (under_test.TEST_FILE, re.compile("src/.*_test\\.cpp")),
+                (under_test.SOURCE_FILE, re.compile("src/.*\\.cpp")),
+            ]
+        )
+
+        assert classifier.classify("src/mongo/db/query_test.cpp") == under_test.TEST_FILE
+        assert classifier.classify("src/mongo/db/query.cpp") == under_test.SOURCE_FILE
+        assert classifier.classify("buildscripts/query.cpp") is None
+        assert classifier.classify("src") is None
+
+    def test_classification_agrees_with_regex(self):
+        paths = ["jstests/core/a.js", "jstests/a.js", "src/a.js", "docs/a.md", "JSTESTS/core/a.js"]
+        for pattern in [
+            "jstests/core/.*\\.js",
+            "(?i)jstests/.*",
+            ".*\\.md|src/.*",
+            "(jstests|docs)/",
+        ]:
+            regex = re.compile(pattern)
+            classifier = under_test.PathClassifier([(under_test.SOURCE_FILE, regex)])
+            for path in paths:
+                assert classifier.matches(path) == bool(regex.match(path))
+
+    def test_classifications_are_remembered(self):
+        regex = re.compile("src/.*")
+        classifier = under_test.PathClassifier([(under_test.SOURCE_FILE, regex)])
+
+        classifier.classify("src/file")
+        classifier.classify("src/file")
+
+        assert classifier.classify.cache_info().hits == 1
@@ -0,0 +1,92 @@
+import json
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import selectedtests.profiling as under_test
+
+from selectedtests.metrics import TEST_MAPPINGS, timed_phase
+
+NS = "selectedtests.profiling"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+def allocate_in_thread(size):
+    return len([str(i) for i in range(size)])
+
+
+class TestProfiler:
+    def test_calls_of_every_thread_and_allocations_of_phases_are_written(self, tmpdir):
+        output_dir = str(tmpdir.join("run"))
+        profiler = under_test.Profiler(output_dir)
+
+        profiler.start()
+        try:
+            assert under_test.active_profiler is profiler
+            with timed_phase(TEST_MAPPINGS, "my-project", "walk"):
+                with ThreadPoolExecutor(max_workers=2) as exe:
+                    list(exe.map(allocate_in_thread, [1000, 1000]))
+            with timed_phase(TEST_MAPPINGS, "my-project", "walk"):
+                pass
+        finally:
+            profiler.stop()
+
+        assert under_test.active_profiler is None
+        with open(os.path.join(output_dir, "profile.txt")) as summary:
+            assert "allocate_in_thread" in summary.read()
+        with open(os.path.join(output_dir, "phases.json")) as phases_file:
+            phases = json.load(phases_file)
+        assert 2 == phases["test_mappings-my-project-walk"]["calls"]
+        assert phases["test_mappings-my-project-walk"]["peak_bytes"] > 0
+        assert os.path.exists(os.path.join(output_dir, "profile.prof"))
+        assert os.path.exists(os.path.join(output_dir, "test_mappings-my-project-walk.tracemalloc"))
+
+    @patch(ns("tracemalloc"))
+    def test_one_snapshot_is_taken_per_phase(self, tracemalloc_mock, tmpdir):
+        profiler = under_test.Profiler(str(tmpdir))
+        tracemalloc_mock.get_traced_memory.side_effect = [(10, 20), (30, 40), (5, 50), (5, 10)]
+
+        for _ in range(3):
+            profiler.phase_ended(TEST_MAPPINGS, "my-project", "walk")
+        profiler.phase_ended(TEST_MAPPINGS, "my-project", "write")
+
+        assert 2 == tracemalloc_mock.take_snapshot.call_count
+        assert profiler._phases["test_mappings-my-project-walk"] == {
+            "calls": 3,
+            "peak_bytes": 50,
+            "snapshot_bytes": 10,
+        }
+
+    def test_phases_are_not_recorded_when_not_profiling(self):
+        with patch.object(under_test.Profiler, "phase_ended") as phase_ended_mock:
+            with timed_phase(TEST_MAPPINGS, "my-project", "walk"):
+                pass
+
+        phase_ended_mock.assert_not_called()
+
+
+class TestProfileUntilClose:
+    @patch(ns("Profiler"))
+    def test_nothing_is_profiled_if_not_asked_for(self, profiler_mock):
+        ctx = MagicMock()
+
+        under_test.profile_until_close(ctx, "work-items", False, "profiles")
+
+        profiler_mock.assert_not_called()
+        ctx.call_on_close.assert_not_called()
+
+    @patch(ns("Profiler"))
+    def test_profiles_are_written_to_a_directory_per_run(self, profiler_mock):
+        ctx = MagicMock()
+
+        under_test.profile_until_close(ctx, "work-items", True, "profiles")
+
+        output_dir = profiler_mock.call_args[0][0]
+        assert output_dir.startswith(os.path.join("profiles", "work-items-"))
+        profiler_mock.return_value.start.assert_called_once()
+        ctx.call_on_close.assert_called_once_with(profiler_mock.return_value.stop)
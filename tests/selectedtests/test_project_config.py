@@ -1,7 +1,10 @@
+from datetime import datetime
 from unittest.mock import MagicMock
 
 import selectedtests.project_config as under_test
 
+from selectedtests.fan_out_limit import FanOutLimit
+
 
 class TestTaskConfig:
     def test_update(self):
@@ -53,6 +56,26 @@ class TestTestConfig:
         assert test_config.most_recent_module_commit_analyzed == "last-module-sha-analyzed"
         assert not test_config.source_file_regex
 
+    def test_fan_out_limit_round_trips(self):
+        test_config = under_test.TestConfig()
+        test_config.update(
+            "last-project-sha-analyzed",
+            "^src",
+            "^test",
+            None,
+            None,
+            None,
+            None,
+            FanOutLimit(500, weighted=True),
+        )
+
+        json = test_config.as_dict()
+
+        assert json["max_changed_files"] == 500
+        assert json["weight_large_changes"]
+        assert under_test.TestConfig.from_json(json).fan_out_limit == FanOutLimit(500, True)
+        assert under_test.TestConfig.from_json({}).fan_out_limit == FanOutLimit()
+
 
 class TestProjectConfig:
     def test_get_when_config_exists(self):
@@ -103,3 +126,49 @@ class TestProjectConfig:
         project_config.save(collection_mock)
 
         collection_mock.update.assert_called_once()
+
+    def test_save_advances_generation(self):
+        collection_mock = MagicMock()
+        project_config = under_test.ProjectConfig(
+            "project-1", under_test.TaskConfig(), under_test.TestConfig()
+        )
+
+        project_config.save(collection_mock)
+
+        update = collection_mock.update.call_args[0][1]
+        assert update["$inc"] == {under_test.GENERATION_KEY: 1}
+
+    def test_save_keeps_analyzed_at_unless_updated(self):
+        collection_mock = MagicMock()
+        project_config = under_test.ProjectConfig(
+            "project-1", under_test.TaskConfig(), under_test.TestConfig()
+        )
+
+        project_config.save(collection_mock)
+        project_config.update_analyzed_at(datetime(2020, 1, 1))
+        project_config.save(collection_mock)
+
+        first_update, second_update = collection_mock.update.call_args_list
+        assert under_test.ANALYZED_AT_KEY not in first_update[0][1]["$set"]
+        assert second_update[0][1]["$set"][under_test.ANALYZED_AT_KEY] == datetime(2020, 1, 1)
+
+
+class TestAdvanceGenerations:
+    def test_generations_of_given_projects_are_advanced(self):
+        collection_mock = MagicMock()
+
+        under_test.advance_generations(collection_mock, ["project-1", "project-2"])
+
+        collection_mock.update_many.assert_called_once_with(
+            {"project": {"$in": ["project-1", "project-2"]}},
+            {"$inc": {under_test.GENERATION_KEY: 1}},
+        )
+
+    def test_generations_of_all_projects_are_advanced_by_default(self):
+        collection_mock = MagicMock()
+
+        under_test.advance_generations(collection_mock)
+
+        collection_mock.update_many.assert_called_once_with(
+            {}, {"$inc": {under_test.GENERATION_KEY: 1}}
+        )
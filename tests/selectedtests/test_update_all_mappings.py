@@ -0,0 +1,172 @@
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytz
+
+import selectedtests.update_all_mappings as under_test
+
+from selectedtests.git_helper import CloneMode, SharedClones, get_shallow_since
+from selectedtests.project_config import ANALYZED_AT_KEY
+from selectedtests.test_mappings.create_test_mappings import TestMappingsResult
+
+NS = "selectedtests.update_all_mappings"
+
+
+def ns(relative_name):
+    """Return a full name from a name relative to the tested module"s name space."""
+    return NS + "." + relative_name
+
+
+class TestUpdateProjectMappingsSinceLastAnalyzed:
+    @patch(ns("update_task_mappings"))
+    @patch(ns("update_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    @patch(ns("generate_task_mappings_since_last_version"))
+    @patch(ns("generate_test_mappings_since_last_commit"))
+    def test_mappings_share_clones_and_diffs(
+        self,
+        generate_test_mappings_mock,
+        generate_task_mappings_mock,
+        project_config_mock,
+        update_test_mappings_mock,
+        update_task_mappings_mock,
+    ):
+        evg_api_mock = MagicMock()
+        mongo_mock = MagicMock()
+        project_config = {"project": "project-1"}
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=["test-mapping"],
+            most_recent_project_commit_analyzed="project-sha",
+            most_recent_module_commit_analyzed="module-sha",
+        )
+        generate_task_mappings_mock.return_value = (["task-mapping"], "version-1")
+        # The web service reloads the mappings once the config is saved.
+        for update_mappings_mock in [update_test_mappings_mock, update_task_mappings_mock]:
+            update_mappings_mock.side_effect = (
+                lambda *args: project_config_mock.return_value.save.assert_not_called()
+            )
+
+        under_test.update_project_mappings_since_last_analyzed(
+            evg_api_mock, mongo_mock, project_config, CloneMode.BLOBLESS
+        )
+
+        test_args = generate_test_mappings_mock.call_args[0]
+        task_args = generate_task_mappings_mock.call_args[0]
+        assert test_args[:3] == (evg_api_mock, project_config, CloneMode.BLOBLESS)
+        assert test_args[3] is not None and test_args[3] is task_args[3]
+        assert isinstance(test_args[4], SharedClones) and test_args[4] is task_args[4]
+        assert test_args[4].clone_mode == CloneMode.BLOBLESS
+
+        config_mock = project_config_mock.return_value
+        config_mock.test_config.update_most_recent_commits_analyzed.assert_called_once_with(
+            "project-sha", "module-sha"
+        )
+        config_mock.task_config.update_most_recent_version_analyzed.assert_called_once_with(
+            "version-1"
+        )
+        config_mock.save.assert_called_once_with(mongo_mock.project_config())
+        update_test_mappings_mock.assert_called_once_with(["test-mapping"], mongo_mock)
+        update_task_mappings_mock.assert_called_once_with(["task-mapping"], mongo_mock)
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("update_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    @patch(ns("generate_task_mappings_since_last_version"))
+    @patch(ns("generate_test_mappings_since_last_commit"))
+    def test_no_mappings_generated(
+        self,
+        generate_test_mappings_mock,
+        generate_task_mappings_mock,
+        project_config_mock,
+        update_test_mappings_mock,
+        update_task_mappings_mock,
+    ):
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=[],
+            most_recent_project_commit_analyzed="project-sha",
+            most_recent_module_commit_analyzed=None,
+        )
+        generate_task_mappings_mock.return_value = ([], "version-1")
+
+        under_test.update_project_mappings_since_last_analyzed(
+            MagicMock(), MagicMock(), {"project": "project-1"}
+        )
+
+        project_config_mock.return_value.save.assert_called_once()
+        update_test_mappings_mock.assert_not_called()
+        update_task_mappings_mock.assert_not_called()
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("update_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    @patch(ns("generate_task_mappings_since_last_version"))
+    @patch(ns("generate_test_mappings_since_last_commit"))
+    def test_shallow_clones_reach_back_to_last_analysis(
+        self,
+        generate_test_mappings_mock,
+        generate_task_mappings_mock,
+        project_config_mock,
+        update_test_mappings_mock,
+        update_task_mappings_mock,
+    ):
+        project_config = {"project": "project-1", ANALYZED_AT_KEY: datetime(2020, 3, 1)}
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=[],
+            most_recent_project_commit_analyzed="project-sha",
+            most_recent_module_commit_analyzed=None,
+        )
+        generate_task_mappings_mock.return_value = ([], "version-1")
+
+        under_test.update_project_mappings_since_last_analyzed(
+            MagicMock(), MagicMock(), project_config, CloneMode.SHALLOW
+        )
+
+        shared_clones = generate_test_mappings_mock.call_args[0][4]
+        assert shared_clones.shallow_since == get_shallow_since(
+            datetime(2020, 3, 1, tzinfo=pytz.UTC)
+        )
+        analyzed_at = project_config_mock.return_value.update_analyzed_at.call_args[0][0]
+        assert analyzed_at > datetime(2020, 3, 1, tzinfo=pytz.UTC)
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("update_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    @patch(ns("generate_task_mappings_since_last_version"))
+    @patch(ns("generate_test_mappings_since_last_commit"))
+    def test_shallow_clones_are_not_limited_before_first_analysis(
+        self,
+        generate_test_mappings_mock,
+        generate_task_mappings_mock,
+        project_config_mock,
+        update_test_mappings_mock,
+        update_task_mappings_mock,
+    ):
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=[],
+            most_recent_project_commit_analyzed="project-sha",
+            most_recent_module_commit_analyzed=None,
+        )
+        generate_task_mappings_mock.return_value = ([], "version-1")
+
+        under_test.update_project_mappings_since_last_analyzed(
+            MagicMock(), MagicMock(), {"project": "project-1"}, CloneMode.SHALLOW
+        )
+
+        assert generate_test_mappings_mock.call_args[0][4].shallow_since is None
+
+
+class TestUpdateAllMappingsSinceLastAnalyzed:
+    @patch(ns("update_project_mappings_since_last_analyzed"))
+    def test_every_project_is_updated(self, update_project_mappings_mock):
+        mongo_mock = MagicMock()
+        mongo_mock.project_config.return_value.find.return_value = [
+            {"project": "project-1"},
+            {"project": "project-2"},
+        ]
+
+        under_test.update_all_mappings_since_last_analyzed(MagicMock(), mongo_mock)
+
+        assert [call[0][2]["project"] for call in update_project_mappings_mock.call_args_list] == [
+            "project-1",
+            "project-2",
+        ]
@@ -1,7 +1,14 @@
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
+import pytz
+
 import selectedtests.work_items.process_task_mapping_work_items as under_test
 
+from selectedtests.git_helper import SharedClones, get_shallow_since
+from selectedtests.task_mappings.shared_versions import SharedVersions
+from selectedtests.work_items.work_item_priority import SLICE_LENGTH
+
 NS = "selectedtests.work_items.process_task_mapping_work_items"
 
 
@@ -33,6 +40,18 @@ class TestProcessQueuedTaskMappingWorkItems:
 
         under_test.process_queued_task_mapping_work_items(evg_api_mock, mongo_mock, after_date=None)
 
+    @patch(ns("_process_task_mapping_work_items"))
+    def test_each_worker_has_its_own_owner(self, mock_process_task_mapping_work_items):
+        evg_api_mock = MagicMock()
+        mongo_mock = MagicMock()
+
+        under_test.process_queued_task_mapping_work_items(
+            evg_api_mock, mongo_mock, after_date=None, workers=3
+        )
+
+        owners = {call[0][3] for call in mock_process_task_mapping_work_items.call_args_list}
+        assert 3 == len(owners)
+
 
 class TestGenerateTaskMappingWorkItems:
     @patch(ns("ProjectTaskMappingWorkItem.next"))
@@ -85,6 +104,20 @@ class TestProcessOneTaskMappingWorkItem:
         )
 
         work_item_mock.next.return_value.complete.assert_not_called()
+        work_item_mock.requeue.assert_called_once_with(mongo_mock.task_mappings_queue())
+
+    @patch(ns("_seed_task_mappings_for_project"))
+    def test_work_items_whose_lease_was_lost_are_left_alone(self, seed_mock):
+        work_item_mock = MagicMock()
+        # The lease is lost while the work item is processed.
+        seed_mock.side_effect = lambda *args: setattr(args[-1], "lost", True)
+
+        under_test._process_one_task_mapping_work_item(
+            work_item_mock, MagicMock(), MagicMock(), after_date=None
+        )
+
+        work_item_mock.complete.assert_not_called()
+        work_item_mock.requeue.assert_not_called()
 
 
 class TestSeedTaskMappingsForProject:
@@ -100,6 +133,10 @@ class TestSeedTaskMappingsForProject:
         mongo_mock = MagicMock()
         logger_mock = MagicMock()
         work_item_mock = MagicMock(source_file_regex="src", module=None)
+        # The web service reloads the mappings once the config is saved.
+        update_task_mappings_mock.side_effect = (
+            lambda *args: project_config_mock.return_value.save.assert_not_called()
+        )
 
         under_test._seed_task_mappings_for_project(
             evg_api_mock, mongo_mock, work_item_mock, after_date=None, log=logger_mock
@@ -111,6 +148,7 @@ class TestSeedTaskMappingsForProject:
             work_item_mock.build_variant_regex,
             work_item_mock.module,
             work_item_mock.module_source_file_regex,
+            None,
         )
         project_config_mock.return_value.save.assert_called_once_with(mongo_mock.project_config())
         update_task_mappings_mock.assert_called_once_with(task_mappings, mongo_mock)
@@ -137,6 +175,169 @@ class TestSeedTaskMappingsForProject:
             work_item_mock.build_variant_regex,
             work_item_mock.module,
             work_item_mock.module_source_file_regex,
+            None,
         )
         project_config_mock.return_value.save.assert_called_once_with(mongo_mock.project_config())
         mongo_mock.task_mappings.return_value.insert_many.assert_not_called()
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("generate_task_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_work_item_yields_at_the_end_of_its_time_budget(
+        self, project_config_mock, generate_task_mappings_mock, update_task_mappings_mock
+    ):
+        mongo_mock = MagicMock()
+        generate_task_mappings_mock.return_value = (["mock-response"], "most-recent-version")
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(days=365)
+
+        finished = under_test._seed_task_mappings_for_project(
+            MagicMock(), mongo_mock, work_item_mock, after_date, MagicMock(), time_budget=0
+        )
+
+        assert not finished
+        version_limit = generate_task_mappings_mock.call_args[0][2]
+        assert version_limit.stop_at_date == after_date
+        assert version_limit.until_date == after_date + SLICE_LENGTH
+        update_task_mappings_mock.assert_called_once_with(["mock-response"], mongo_mock)
+        assert work_item_mock.checkpoint.call_args[0][1] == version_limit.until_date
+        project_config_mock.return_value.save.assert_not_called()
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("generate_task_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_work_item_analyzes_slices_until_finished_within_its_budget(
+        self, project_config_mock, generate_task_mappings_mock, update_task_mappings_mock
+    ):
+        mongo_mock = MagicMock()
+        generate_task_mappings_mock.return_value = (["mock-response"], "most-recent-version")
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 2 * SLICE_LENGTH
+
+        finished = under_test._seed_task_mappings_for_project(
+            MagicMock(), mongo_mock, work_item_mock, after_date, MagicMock(), time_budget=3600
+        )
+
+        assert finished
+        assert 3 == generate_task_mappings_mock.call_count
+        assert generate_task_mappings_mock.call_args[0][2].until_date is None
+        project_config_mock.return_value.task_config.update.assert_called_once()
+        assert work_item_mock.checkpoint.call_args[0][1] is None
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("generate_task_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_slices_share_the_clones_of_the_work_item(
+        self, project_config_mock, generate_task_mappings_mock, update_task_mappings_mock
+    ):
+        generate_task_mappings_mock.return_value = (["mock-response"], "most-recent-version")
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 2 * SLICE_LENGTH
+        clones = MagicMock()
+
+        under_test._seed_task_mappings_for_project(
+            MagicMock(),
+            MagicMock(),
+            work_item_mock,
+            after_date,
+            MagicMock(),
+            clones=clones,
+            time_budget=3600,
+        )
+
+        slice_clones = [call[1]["clones"] for call in generate_task_mappings_mock.call_args_list]
+        assert 3 == len(slice_clones)
+        assert all(shared is slice_clones[0] for shared in slice_clones)
+        assert isinstance(slice_clones[0], SharedClones)
+        assert slice_clones[0].clones is clones
+        assert slice_clones[0].shallow_since == get_shallow_since(after_date)
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("generate_task_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_slices_share_the_versions_of_the_project(
+        self, project_config_mock, generate_task_mappings_mock, update_task_mappings_mock
+    ):
+        generate_task_mappings_mock.return_value = (["mock-response"], "most-recent-version")
+        evg_api_mock = MagicMock()
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 2 * SLICE_LENGTH
+
+        under_test._seed_task_mappings_for_project(
+            evg_api_mock,
+            MagicMock(),
+            work_item_mock,
+            after_date,
+            MagicMock(),
+            time_budget=3600,
+        )
+
+        slice_versions = [
+            call[1]["versions"] for call in generate_task_mappings_mock.call_args_list
+        ]
+        assert 3 == len(slice_versions)
+        assert all(shared is slice_versions[0] for shared in slice_versions)
+        assert isinstance(slice_versions[0], SharedVersions)
+        evg_api_mock.versions_by_project.assert_called_once_with(work_item_mock.project)
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("generate_task_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_nothing_is_written_once_the_lease_is_lost(
+        self, project_config_mock, generate_task_mappings_mock, update_task_mappings_mock
+    ):
+        lease = MagicMock(lost=False)
+        result = (["mock-mapping"], "most-recent-version")
+
+        def generate(*args, **kwargs):
+            # The lease is lost while the second slice is generated.
+            lease.lost = generate_task_mappings_mock.call_count == 2
+            return result
+
+        generate_task_mappings_mock.side_effect = generate
+        mongo_mock = MagicMock()
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 3 * SLICE_LENGTH
+
+        finished = under_test._seed_task_mappings_for_project(
+            MagicMock(),
+            mongo_mock,
+            work_item_mock,
+            after_date,
+            MagicMock(),
+            time_budget=3600,
+            lease=lease,
+        )
+
+        assert not finished
+        assert 2 == generate_task_mappings_mock.call_count
+        update_task_mappings_mock.assert_called_once_with(["mock-mapping"], mongo_mock)
+        work_item_mock.checkpoint.assert_called_once()
+        project_config_mock.return_value.save.assert_not_called()
+
+    @patch(ns("update_task_mappings"))
+    @patch(ns("generate_task_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_slices_stop_when_the_checkpoint_finds_the_lease_lost(
+        self, project_config_mock, generate_task_mappings_mock, update_task_mappings_mock
+    ):
+        generate_task_mappings_mock.return_value = (["mock-mapping"], "most-recent-version")
+        mongo_mock = MagicMock()
+        work_item_mock = MagicMock(analyzed_until=None)
+        work_item_mock.checkpoint.return_value = False
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 3 * SLICE_LENGTH
+
+        finished = under_test._seed_task_mappings_for_project(
+            MagicMock(),
+            mongo_mock,
+            work_item_mock,
+            after_date,
+            MagicMock(),
+            time_budget=3600,
+            lease=MagicMock(lost=False),
+        )
+
+        assert not finished
+        assert 1 == generate_task_mappings_mock.call_count
+        work_item_mock.checkpoint.assert_called_once()
+        project_config_mock.return_value.save.assert_not_called()
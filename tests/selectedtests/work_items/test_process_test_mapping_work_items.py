@@ -1,8 +1,13 @@
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
+import pytz
+
 import selectedtests.work_items.process_test_mapping_work_items as under_test
 
+from selectedtests.git_helper import SharedClones, get_shallow_since
 from selectedtests.test_mappings.create_test_mappings import TestMappingsResult
+from selectedtests.work_items.work_item_priority import SLICE_LENGTH
 
 NS = "selectedtests.work_items.process_test_mapping_work_items"
 
@@ -35,6 +40,18 @@ class TestProcessQueuedTestMappingWorkItems:
 
         under_test.process_queued_test_mapping_work_items(evg_api_mock, mongo_mock, after_date=None)
 
+    @patch(ns("_process_test_mapping_work_items"))
+    def test_each_worker_has_its_own_owner(self, mock_process_test_mapping_work_items):
+        evg_api_mock = MagicMock()
+        mongo_mock = MagicMock()
+
+        under_test.process_queued_test_mapping_work_items(
+            evg_api_mock, mongo_mock, after_date=None, workers=3
+        )
+
+        owners = {call[0][3] for call in mock_process_test_mapping_work_items.call_args_list}
+        assert 3 == len(owners)
+
 
 class TestProcessOneTestMappingWorkItem:
     @patch(ns("_seed_test_mappings_for_project"))
@@ -66,6 +83,20 @@ class TestProcessOneTestMappingWorkItem:
         )
 
         work_item_mock.complete.assert_not_called()
+        work_item_mock.requeue.assert_called_once_with(mongo_mock.test_mappings_queue())
+
+    @patch(ns("_seed_test_mappings_for_project"))
+    def test_work_items_whose_lease_was_lost_are_left_alone(self, seed_mock):
+        work_item_mock = MagicMock()
+        # The lease is lost while the work item is processed.
+        seed_mock.side_effect = lambda *args: setattr(args[-1], "lost", True)
+
+        under_test._process_one_test_mapping_work_item(
+            work_item_mock, MagicMock(), MagicMock(), after_date=None
+        )
+
+        work_item_mock.complete.assert_not_called()
+        work_item_mock.requeue.assert_not_called()
 
 
 class TestSeedTestMappingsForProject:
@@ -85,6 +116,10 @@ class TestSeedTestMappingsForProject:
             most_recent_module_commit_analyzed="last-module-sha-analyzed",
         )
         work_item_mock = MagicMock(source_file_regex="src", test_file_regex="test", module=None)
+        # The web service reloads the mappings once the config is saved.
+        update_test_mappings_mock.side_effect = (
+            lambda *args: project_config_mock.return_value.save.assert_not_called()
+        )
 
         under_test._seed_test_mappings_for_project(
             evg_api_mock, mongo_mock, work_item_mock, after_date=None, log=logger_mock
@@ -98,6 +133,7 @@ class TestSeedTestMappingsForProject:
             "last-module-sha-analyzed",
             work_item_mock.module_source_file_regex,
             work_item_mock.module_test_file_regex,
+            None,
         )
         project_config_mock.return_value.save.assert_called_once_with(mongo_mock.project_config())
         update_test_mappings_mock.assert_called_once_with(test_mappings_list, mongo_mock)
@@ -130,6 +166,188 @@ class TestSeedTestMappingsForProject:
             "last-module-sha-analyzed",
             work_item_mock.module_source_file_regex,
             work_item_mock.module_test_file_regex,
+            None,
         )
         project_config_mock.return_value.save.assert_called_once_with(mongo_mock.project_config())
         mongo_mock.test_mappings.return_value.insert_many.assert_not_called()
+
+    @patch(ns("update_test_mappings"))
+    @patch(ns("generate_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_work_item_yields_at_the_end_of_its_time_budget(
+        self, project_config_mock, generate_test_mappings_mock, update_test_mappings_mock
+    ):
+        mongo_mock = MagicMock()
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=["mock-mapping"],
+            most_recent_project_commit_analyzed="last-project-sha-analyzed",
+            most_recent_module_commit_analyzed=None,
+        )
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(days=365)
+
+        finished = under_test._seed_test_mappings_for_project(
+            MagicMock(), mongo_mock, work_item_mock, after_date, MagicMock(), time_budget=0
+        )
+
+        assert not finished
+        commit_limit = generate_test_mappings_mock.call_args[0][2]
+        assert commit_limit.stop_at_date == after_date
+        assert commit_limit.until_date == after_date + SLICE_LENGTH
+        update_test_mappings_mock.assert_called_once_with(["mock-mapping"], mongo_mock)
+        work_item_mock.checkpoint.assert_called_once()
+        assert work_item_mock.checkpoint.call_args[0][1] == commit_limit.until_date
+        project_config_mock.return_value.save.assert_not_called()
+
+    @patch(ns("update_test_mappings"))
+    @patch(ns("generate_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_work_item_resumes_from_its_checkpoint(
+        self, project_config_mock, generate_test_mappings_mock, update_test_mappings_mock
+    ):
+        mongo_mock = MagicMock()
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=[],
+            most_recent_project_commit_analyzed="last-project-sha-analyzed",
+            most_recent_module_commit_analyzed=None,
+        )
+        analyzed_until = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(days=10)
+        work_item_mock = MagicMock(analyzed_until=analyzed_until)
+        after_date = analyzed_until - timedelta(days=365)
+
+        finished = under_test._seed_test_mappings_for_project(
+            MagicMock(), mongo_mock, work_item_mock, after_date, MagicMock(), time_budget=3600
+        )
+
+        assert finished
+        commit_limit = generate_test_mappings_mock.call_args[0][2]
+        assert commit_limit.stop_at_date == analyzed_until
+        assert commit_limit.until_date is None
+        project_config_mock.return_value.save.assert_called_once_with(mongo_mock.project_config())
+        assert work_item_mock.checkpoint.call_args[0][1] is None
+
+    @patch(ns("update_test_mappings"))
+    @patch(ns("generate_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_slices_share_the_clones_of_the_work_item(
+        self, project_config_mock, generate_test_mappings_mock, update_test_mappings_mock
+    ):
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=["mock-mapping"],
+            most_recent_project_commit_analyzed="last-project-sha-analyzed",
+            most_recent_module_commit_analyzed=None,
+        )
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 2 * SLICE_LENGTH
+        clones = MagicMock()
+
+        under_test._seed_test_mappings_for_project(
+            MagicMock(),
+            MagicMock(),
+            work_item_mock,
+            after_date,
+            MagicMock(),
+            clones=clones,
+            time_budget=3600,
+        )
+
+        slice_clones = [call[1]["clones"] for call in generate_test_mappings_mock.call_args_list]
+        assert 3 == len(slice_clones)
+        assert all(shared is slice_clones[0] for shared in slice_clones)
+        assert isinstance(slice_clones[0], SharedClones)
+        assert slice_clones[0].clones is clones
+        assert slice_clones[0].shallow_since == get_shallow_since(after_date)
+
+    @patch(ns("update_test_mappings"))
+    @patch(ns("generate_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_shared_clones_are_not_shared_again(
+        self, project_config_mock, generate_test_mappings_mock, update_test_mappings_mock
+    ):
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=[],
+            most_recent_project_commit_analyzed="last-project-sha-analyzed",
+            most_recent_module_commit_analyzed=None,
+        )
+        clones = SharedClones("clone-dir")
+
+        under_test._seed_test_mappings_for_project(
+            MagicMock(),
+            MagicMock(),
+            MagicMock(analyzed_until=None),
+            datetime.utcnow().replace(tzinfo=pytz.UTC),
+            MagicMock(),
+            clones=clones,
+        )
+
+        assert generate_test_mappings_mock.call_args[1]["clones"] is clones
+
+    @patch(ns("update_test_mappings"))
+    @patch(ns("generate_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_nothing_is_written_once_the_lease_is_lost(
+        self, project_config_mock, generate_test_mappings_mock, update_test_mappings_mock
+    ):
+        lease = MagicMock(lost=False)
+        result = TestMappingsResult(
+            test_mappings_list=["mock-mapping"],
+            most_recent_project_commit_analyzed="last-project-sha-analyzed",
+            most_recent_module_commit_analyzed=None,
+        )
+
+        def generate(*args, **kwargs):
+            # The lease is lost while the second slice is generated.
+            lease.lost = generate_test_mappings_mock.call_count == 2
+            return result
+
+        generate_test_mappings_mock.side_effect = generate
+        mongo_mock = MagicMock()
+        work_item_mock = MagicMock(analyzed_until=None)
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 3 * SLICE_LENGTH
+
+        finished = under_test._seed_test_mappings_for_project(
+            MagicMock(),
+            mongo_mock,
+            work_item_mock,
+            after_date,
+            MagicMock(),
+            time_budget=3600,
+            lease=lease,
+        )
+
+        assert not finished
+        assert 2 == generate_test_mappings_mock.call_count
+        update_test_mappings_mock.assert_called_once_with(["mock-mapping"], mongo_mock)
+        work_item_mock.checkpoint.assert_called_once()
+        project_config_mock.return_value.save.assert_not_called()
+
+    @patch(ns("update_test_mappings"))
+    @patch(ns("generate_test_mappings"))
+    @patch(ns("ProjectConfig.get"))
+    def test_slices_stop_when_the_checkpoint_finds_the_lease_lost(
+        self, project_config_mock, generate_test_mappings_mock, update_test_mappings_mock
+    ):
+        generate_test_mappings_mock.return_value = TestMappingsResult(
+            test_mappings_list=["mock-mapping"],
+            most_recent_project_commit_analyzed="last-project-sha-analyzed",
+            most_recent_module_commit_analyzed=None,
+        )
+        mongo_mock = MagicMock()
+        work_item_mock = MagicMock(analyzed_until=None)
+        work_item_mock.checkpoint.return_value = False
+        after_date = datetime.utcnow().replace(tzinfo=pytz.UTC) - 3 * SLICE_LENGTH
+
+        finished = under_test._seed_test_mappings_for_project(
+            MagicMock(),
+            mongo_mock,
+            work_item_mock,
+            after_date,
+            MagicMock(),
+            time_budget=3600,
+            lease=MagicMock(lost=False),
+        )
+
+        assert not finished
+        assert 1 == generate_test_mappings_mock.call_count
+        work_item_mock.checkpoint.assert_called_once()
+        project_config_mock.return_value.save.assert_not_called()
@@ -120,3 +120,117 @@ class TestProjectTaskMappingWorkItem:
         assert not work_item.build_variant_regex
         assert not work_item.start_time
         assert not work_item.end_time
+
+    def test_next_claims_a_lease(self):
+        collection = MagicMock()
+        collection.find_one_and_update.return_value = None
+
+        under_test.ProjectTaskMappingWorkItem.next(collection, "worker-1", lease_seconds=30)
+
+        query, update = collection.find_one_and_update.call_args[0]
+        assert query["end_time"] is None
+        assert update["$set"][under_test.LEASE_OWNER_KEY] == "worker-1"
+
+    def test_extend_lease_without_owner(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTaskMappingWorkItem.new_task_mappings(
+            PROJECT, SOURCE_FILE_REGEX
+        )
+
+        assert not work_item.extend_lease(collection)
+        collection.update_one.assert_not_called()
+
+    def test_complete_releases_the_lease(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTaskMappingWorkItem.new_task_mappings(
+            PROJECT, SOURCE_FILE_REGEX
+        )
+
+        work_item.complete(collection)
+
+        update = collection.update_one.call_args[0][1]
+        assert under_test.LEASE_OWNER_KEY in update["$unset"]
+
+    def test_complete_is_conditional_on_the_lease(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 0
+        work_item = under_test.ProjectTaskMappingWorkItem.new_task_mappings(
+            PROJECT, SOURCE_FILE_REGEX
+        )
+        work_item.lease_owner = "worker-1"
+
+        assert not work_item.complete(collection)
+
+        query = collection.update_one.call_args[0][0]
+        assert query["project"] == PROJECT
+        assert query[under_test.LEASE_OWNER_KEY] == "worker-1"
+
+    def test_insert_sets_the_priority(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTaskMappingWorkItem.new_task_mappings(
+            PROJECT, SOURCE_FILE_REGEX, priority=under_test.Priority.HIGH
+        )
+
+        work_item.insert(collection)
+
+        document = collection.insert_one.call_args[0][0]
+        assert document[under_test.PRIORITY_KEY] == under_test.Priority.HIGH
+        assert document[under_test.ELAPSED_SECONDS_KEY] == 0
+
+    def test_next_claims_by_priority_then_least_processed(self):
+        collection = MagicMock()
+        collection.find_one_and_update.return_value = {
+            "created_on": datetime.now(),
+            "project": "my-project",
+            "source_file_regex": "my-source-file-regex",
+            "module": None,
+            "module_source_file_regex": None,
+            "build_variant_regex": None,
+            under_test.PRIORITY_KEY: 2,
+            under_test.ELAPSED_SECONDS_KEY: 42.0,
+        }
+
+        work_item = under_test.ProjectTaskMappingWorkItem.next(collection)
+
+        assert collection.find_one_and_update.call_args[1]["sort"] == under_test.CLAIM_ORDER
+        assert work_item.priority == under_test.Priority.LOW
+        assert work_item.elapsed_seconds == 42.0
+        assert work_item.analyzed_until is None
+
+    def test_checkpoint_records_progress(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 1
+        now = datetime.now()
+        work_item = under_test.ProjectTaskMappingWorkItem.new_task_mappings(
+            PROJECT, SOURCE_FILE_REGEX
+        )
+
+        work_item.checkpoint(collection, now, 10.0)
+        work_item.checkpoint(collection, None, 5.0)
+
+        assert 2 == collection.update_one.call_count
+        assert work_item.elapsed_seconds == 15.0
+        assert work_item.analyzed_until is None
+
+    def test_checkpoint_without_the_lease_records_nothing(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 0
+        work_item = under_test.ProjectTaskMappingWorkItem.new_task_mappings(
+            PROJECT, SOURCE_FILE_REGEX
+        )
+
+        assert not work_item.checkpoint(collection, datetime.now(), 10.0)
+
+        assert work_item.elapsed_seconds == 0
+        assert work_item.analyzed_until is None
+
+    def test_requeue_releases_the_lease(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTaskMappingWorkItem.new_task_mappings(
+            PROJECT, SOURCE_FILE_REGEX
+        )
+
+        work_item.requeue(collection)
+
+        update = collection.update_one.call_args[0][1]
+        assert under_test.LEASE_OWNER_KEY in update["$unset"]
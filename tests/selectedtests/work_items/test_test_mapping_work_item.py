@@ -129,3 +129,90 @@ class TestProjectTestMappingWorkItem:
         assert not work_item.module_test_file_regex
         assert not work_item.start_time
         assert not work_item.end_time
+
+    def test_next_claims_a_lease(self):
+        collection = MagicMock()
+        collection.find_one_and_update.return_value = None
+
+        under_test.ProjectTestMappingWorkItem.next(collection, "worker-1", lease_seconds=30)
+
+        query, update = collection.find_one_and_update.call_args[0]
+        assert query["end_time"] is None
+        assert update["$set"][under_test.LEASE_OWNER_KEY] == "worker-1"
+
+    def test_extend_lease_without_owner(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTestMappingWorkItem.new_test_mappings(
+            PROJECT, SOURCE_FILE_REGEX, TEST_FILE_REGEX
+        )
+
+        assert not work_item.extend_lease(collection)
+        collection.update_one.assert_not_called()
+
+    def test_complete_releases_the_lease(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTestMappingWorkItem.new_test_mappings(
+            PROJECT, SOURCE_FILE_REGEX, TEST_FILE_REGEX
+        )
+
+        work_item.complete(collection)
+
+        update = collection.update_one.call_args[0][1]
+        assert under_test.LEASE_OWNER_KEY in update["$unset"]
+
+    def test_complete_is_conditional_on_the_lease(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 0
+        work_item = under_test.ProjectTestMappingWorkItem.new_test_mappings(
+            PROJECT, SOURCE_FILE_REGEX, TEST_FILE_REGEX
+        )
+        work_item.lease_owner = "worker-1"
+
+        assert not work_item.complete(collection)
+
+        query = collection.update_one.call_args[0][0]
+        assert query["project"] == PROJECT
+        assert query[under_test.LEASE_OWNER_KEY] == "worker-1"
+
+    def test_insert_sets_the_priority(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTestMappingWorkItem.new_test_mappings(
+            PROJECT, SOURCE_FILE_REGEX, TEST_FILE_REGEX, priority=under_test.Priority.LOW
+        )
+
+        work_item.insert(collection)
+
+        document = collection.insert_one.call_args[0][0]
+        assert document[under_test.PRIORITY_KEY] == under_test.Priority.LOW
+        assert document[under_test.ELAPSED_SECONDS_KEY] == 0
+
+    def test_next_reads_the_checkpoint(self):
+        collection = MagicMock()
+        collection.find_one_and_update.return_value = {
+            "created_on": datetime.now(),
+            "project": "my-project",
+            "source_file_regex": "my-source-file-regex",
+            "test_file_regex": "my-test-file-regex",
+            "module": None,
+            "module_source_file_regex": None,
+            "module_test_file_regex": None,
+            "analyzed_until": datetime(2020, 1, 1),
+        }
+
+        work_item = under_test.ProjectTestMappingWorkItem.next(collection)
+
+        assert collection.find_one_and_update.call_args[1]["sort"] == under_test.CLAIM_ORDER
+        assert work_item.priority == under_test.Priority.NORMAL
+        assert work_item.analyzed_until.year == 2020
+        assert work_item.analyzed_until.tzinfo is not None
+
+    def test_requeue_releases_the_lease(self):
+        collection = MagicMock()
+        work_item = under_test.ProjectTestMappingWorkItem.new_test_mappings(
+            PROJECT, SOURCE_FILE_REGEX, TEST_FILE_REGEX
+        )
+
+        work_item.requeue(collection)
+
+        update = collection.update_one.call_args[0][1]
+        assert under_test.LEASE_OWNER_KEY in update["$unset"]
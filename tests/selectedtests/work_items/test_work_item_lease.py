@@ -0,0 +1,110 @@
+import threading
+
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from pymongo.errors import PyMongoError
+
+import selectedtests.work_items.work_item_lease as under_test
+
+
+class TestClaimableQuery:
+    def test_unleased_and_expired_items_are_claimable(self):
+        now = datetime.utcnow()
+
+        query = under_test.claimable_query(now)
+
+        assert query["end_time"] is None
+        assert {under_test.LEASE_EXPIRES_KEY: None} in query["$or"]
+        assert {under_test.LEASE_EXPIRES_KEY: {"$lt": now}} in query["$or"]
+
+
+class TestExtendLease:
+    def test_lease_still_held(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 1
+
+        assert under_test.extend_lease(collection, "my-project", "worker-1", 30)
+
+        query = collection.update_one.call_args[0][0]
+        assert query[under_test.LEASE_OWNER_KEY] == "worker-1"
+
+    def test_lease_lost(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 0
+
+        assert not under_test.extend_lease(collection, "my-project", "worker-1", 30)
+
+
+class TestComplete:
+    def test_lease_still_held(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 1
+
+        assert under_test.complete(collection, "my-project", "worker-1")
+
+        query, update = collection.update_one.call_args[0]
+        assert query == {
+            "project": "my-project",
+            under_test.LEASE_OWNER_KEY: "worker-1",
+            "end_time": None,
+        }
+        assert update["$currentDate"] == {"end_time": True}
+        assert under_test.LEASE_OWNER_KEY in update["$unset"]
+
+    def test_lease_lost(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 0
+
+        assert not under_test.complete(collection, "my-project", "worker-1")
+
+
+class TestLeaseHeartbeat:
+    def test_lease_is_extended_until_stopped(self):
+        extended = threading.Event()
+
+        def extend():
+            extended.set()
+            return True
+
+        with under_test.LeaseHeartbeat(extend, interval_seconds=0.01) as heartbeat:
+            assert extended.wait(5)
+
+        assert not heartbeat.lost
+
+    def test_lost_lease_stops_the_heartbeat(self):
+        extend = MagicMock(return_value=False)
+
+        with under_test.LeaseHeartbeat(extend, interval_seconds=0.01) as heartbeat:
+            heartbeat._thread.join(5)
+
+        assert heartbeat.lost
+        extend.assert_called_once()
+
+    def test_errors_do_not_stop_the_heartbeat(self):
+        calls = []
+        extended = threading.Event()
+
+        def extend():
+            calls.append(1)
+            if len(calls) == 1:
+                raise PyMongoError("network error")
+            extended.set()
+            return True
+
+        with under_test.LeaseHeartbeat(extend, interval_seconds=0.01) as heartbeat:
+            assert extended.wait(5)
+
+        assert not heartbeat.lost
+
+
+class TestLeaseLost:
+    def test_lost_lease(self):
+        log = MagicMock()
+
+        assert under_test.lease_lost(MagicMock(lost=True), log)
+        log.warning.assert_called_once()
+
+    def test_held_or_no_lease(self):
+        assert not under_test.lease_lost(MagicMock(lost=False), MagicMock())
+        assert not under_test.lease_lost(None, MagicMock())
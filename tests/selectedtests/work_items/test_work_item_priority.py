@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytz
+
+import selectedtests.work_items.work_item_priority as under_test
+
+NOW = datetime(2020, 6, 1, tzinfo=pytz.UTC)
+
+
+class TestReadAnalyzedUntil:
+    def test_work_item_without_checkpoint(self):
+        assert under_test.read_analyzed_until({}) is None
+
+    def test_naive_dates_are_read_as_utc(self):
+        analyzed_until = under_test.read_analyzed_until(
+            {under_test.ANALYZED_UNTIL_KEY: datetime(2020, 1, 1)}
+        )
+
+        assert analyzed_until == datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+
+class TestNextWindow:
+    def test_whole_history_when_not_sliced(self):
+        start = NOW - timedelta(days=1000)
+
+        assert (start, None) == under_test.next_window(start, NOW, sliced=False)
+
+    def test_oldest_slice_first(self):
+        start = NOW - timedelta(days=1000)
+
+        assert (start, start + under_test.SLICE_LENGTH) == under_test.next_window(
+            start, NOW, sliced=True
+        )
+
+    def test_last_slice_reaches_the_most_recent_history(self):
+        start = NOW - under_test.SLICE_LENGTH / 2
+
+        assert (start, None) == under_test.next_window(start, NOW, sliced=True)
+
+
+class TestCheckpoint:
+    def test_elapsed_time_is_accumulated(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 1
+
+        assert under_test.checkpoint(collection, "my-project", "worker-1", NOW, 12.5)
+
+        query, update = collection.update_one.call_args[0]
+        assert query == {
+            "project": "my-project",
+            under_test.LEASE_OWNER_KEY: "worker-1",
+            "end_time": None,
+        }
+        assert update["$set"] == {under_test.ANALYZED_UNTIL_KEY: NOW}
+        assert update["$inc"] == {under_test.ELAPSED_SECONDS_KEY: 12.5}
+
+    def test_lost_lease_is_reported(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 0
+
+        assert not under_test.checkpoint(collection, "my-project", "worker-1", NOW, 12.5)
+
+
+class TestRequeue:
+    def test_lease_is_released(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 1
+
+        assert under_test.requeue(collection, "my-project", "worker-1")
+
+        query, update = collection.update_one.call_args[0]
+        assert query == {
+            "project": "my-project",
+            under_test.LEASE_OWNER_KEY: "worker-1",
+            "end_time": None,
+        }
+        assert under_test.LEASE_OWNER_KEY in update["$unset"]
+        assert under_test.LEASE_EXPIRES_KEY in update["$unset"]
+
+    def test_lost_lease_is_reported(self):
+        collection = MagicMock()
+        collection.update_one.return_value.matched_count = 0
+
+        assert not under_test.requeue(collection, "my-project", "worker-1")
@@ -0,0 +1,179 @@
+import queue
+import threading
+
+from unittest.mock import MagicMock
+
+from pymongo.errors import OperationFailure
+
+import selectedtests.work_items.work_item_scheduler as under_test
+
+
+class ChangeStreamStandIn(object):
+    """Stand-in for a change stream, returning the changes put on its queue."""
+
+    def __init__(self):
+        self.changes = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def try_next(self):
+        try:
+            return self.changes.get(timeout=0.01)
+        except queue.Empty:
+            return None
+
+
+class QueueStandIn(object):
+    """Stand-in for a work item queue, of a replica set or of a standalone server."""
+
+    def __init__(self, replica_set=True):
+        self.work_items = []
+        self.replica_set = replica_set
+        self.streams = []
+        self.lock = threading.Lock()
+
+    def watch(self, pipeline, max_await_time_ms):
+        if not self.replica_set:
+            raise OperationFailure("only supported on replica sets", code=40573)
+        stream = ChangeStreamStandIn()
+        self.streams.append(stream)
+        return stream
+
+    def insert(self, work_item):
+        with self.lock:
+            self.work_items.append(work_item)
+        for stream in self.streams:
+            stream.changes.put({"operationType": "insert"})
+
+    def next(self, owner):
+        with self.lock:
+            return self.work_items.pop(0) if self.work_items else None
+
+
+def source(name, collection, processed):
+    return under_test.WorkItemSource(
+        name,
+        lambda: collection,
+        lambda queue, owner: queue.next(owner),
+        lambda work_item: processed.put((name, work_item)),
+    )
+
+
+class TestClaimAndProcess:
+    def test_queues_take_turns(self):
+        processed = queue.Queue()
+        test_queue = QueueStandIn()
+        task_queue = QueueStandIn()
+        for item in range(3):
+            test_queue.insert(f"test-{item}")
+            task_queue.insert(f"task-{item}")
+        scheduler = under_test.WorkItemScheduler(
+            [source("test", test_queue, processed), source("task", task_queue, processed)]
+        )
+
+        for _ in range(4):
+            assert scheduler.claim_and_process("worker-1")
+
+        assert [processed.get_nowait()[1] for _ in range(4)] == [
+            "test-0",
+            "task-0",
+            "test-1",
+            "task-1",
+        ]
+
+    def test_other_queues_are_checked_when_one_is_empty(self):
+        processed = queue.Queue()
+        task_queue = QueueStandIn()
+        task_queue.insert("task-0")
+        scheduler = under_test.WorkItemScheduler(
+            [source("test", QueueStandIn(), processed), source("task", task_queue, processed)]
+        )
+
+        assert scheduler.claim_and_process("worker-1")
+        assert not scheduler.claim_and_process("worker-1")
+        assert processed.get_nowait() == ("task", "task-0")
+
+
+class TestWorkItemScheduler:
+    def test_inserted_work_items_wake_the_workers(self):
+        processed = queue.Queue()
+        test_queue = QueueStandIn()
+        scheduler = under_test.WorkItemScheduler(
+            [source("test", test_queue, processed)], poll_seconds=60
+        )
+
+        scheduler.start()
+        try:
+            # Wait for the worker to find the queue empty and for the change stream to be open.
+            while not test_queue.streams:
+                threading.Event().wait(0.01)
+            test_queue.insert("test-0")
+            assert processed.get(timeout=5) == ("test", "test-0")
+        finally:
+            scheduler.stop()
+
+        assert scheduler.wait(0)
+
+    def test_requested_stop_does_not_wait_for_the_workers(self):
+        processed = queue.Queue()
+        scheduler = under_test.WorkItemScheduler(
+            [source("test", QueueStandIn(replica_set=False), processed)], poll_seconds=60
+        )
+
+        scheduler.start()
+        try:
+            scheduler.request_stop()
+            assert scheduler.wait(0)
+        finally:
+            scheduler.stop()
+
+        assert not any(thread.name.startswith("work-item-") for thread in threading.enumerate())
+
+    def test_queues_are_polled_without_change_streams(self):
+        processed = queue.Queue()
+        test_queue = QueueStandIn(replica_set=False)
+        scheduler = under_test.WorkItemScheduler(
+            [source("test", test_queue, processed)], workers=2, poll_seconds=0.01
+        )
+
+        scheduler.start()
+        try:
+            test_queue.insert("test-0")
+            test_queue.insert("test-1")
+            assert {processed.get(timeout=5)[1], processed.get(timeout=5)[1]} == {
+                "test-0",
+                "test-1",
+            }
+        finally:
+            scheduler.stop()
+
+    def test_failed_work_items_do_not_stop_the_workers(self):
+        processed = queue.Queue()
+        test_queue = QueueStandIn(replica_set=False)
+        failing_source = under_test.WorkItemSource(
+            "test",
+            lambda: test_queue,
+            lambda queue, owner: queue.next(owner),
+            MagicMock(side_effect=[ValueError("failed"), None]),
+        )
+        scheduler = under_test.WorkItemScheduler(
+            [failing_source, source("task", QueueStandIn(replica_set=False), processed)],
+            poll_seconds=0.01,
+        )
+        test_queue.insert("test-0")
+        test_queue.insert("test-1")
+
+        scheduler.start()
+        try:
+            for _ in range(200):
+                if failing_source.process.call_count == 2:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            scheduler.stop()
+
+        assert failing_source.process.call_count == 2
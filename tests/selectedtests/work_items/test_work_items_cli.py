@@ -1,3 +1,5 @@
+import signal
+
 from datetime import datetime
 from unittest.mock import MagicMock, patch
 
@@ -63,3 +65,90 @@ class TestCli:
                 under_test.cli, ["--mongo-uri=localhost", "process-task-mappings"]
             )
             assert result.exit_code == 0
+
+    @patch(ns("signal.signal"))
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("WorkItemScheduler"))
+    def test_daemon(self, scheduler_mock, mongo_wrapper_mock, evg_api_mock, signal_mock):
+        scheduler_mock.return_value.wait.return_value = True
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                under_test.cli,
+                ["--mongo-uri=localhost", "daemon", "--workers=2", "--mirror-dir=mirrors"],
+            )
+            assert result.exit_code == 0
+
+        sources, workers = scheduler_mock.call_args[0][:2]
+        assert [source.name for source in sources] == ["test_mappings", "task_mappings"]
+        assert workers == 2
+        scheduler_mock.return_value.start.assert_called_once()
+
+    @patch(ns("signal.signal"))
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("WorkItemScheduler"))
+    def test_daemon_threads_are_joined_by_the_main_loop_on_sigterm(
+        self, scheduler_mock, mongo_wrapper_mock, evg_api_mock, signal_mock
+    ):
+        scheduler = scheduler_mock.return_value
+
+        def wait(timeout):
+            if scheduler.request_stop.called:
+                return True
+            handler = signal_mock.call_args[0][1]
+            handler(signal.SIGTERM, None)
+            scheduler.stop.assert_not_called()
+            return False
+
+        scheduler.wait.side_effect = wait
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(under_test.cli, ["--mongo-uri=localhost", "daemon"])
+            assert result.exit_code == 0
+
+        assert signal_mock.call_args[0][0] == signal.SIGTERM
+        scheduler.request_stop.assert_called_once()
+        scheduler.stop.assert_called_once()
+
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("process_queued_test_mapping_work_items"))
+    def test_process_test_mappings_with_a_time_budget(
+        self, process_queued_test_mapping_work_items_mock, mongo_wrapper_mock, evg_api_mock
+    ):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                under_test.cli,
+                ["--mongo-uri=localhost", "process-test-mappings", "--time-budget-minutes=1.5"],
+            )
+            assert result.exit_code == 0
+
+        assert process_queued_test_mapping_work_items_mock.call_args[1]["time_budget"] == 90
+
+    @patch(ns("get_evg_project"))
+    @patch(ns("get_evg_api"))
+    @patch(ns("MongoWrapper.connect"))
+    @patch(ns("ProjectTaskMappingWorkItem.new_task_mappings"))
+    def test_create_task_mapping_with_a_priority(
+        self, new_task_mappings_mock, mongo_wrapper_mock, evg_api_mock, get_evg_project_mock
+    ):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                under_test.cli,
+                [
+                    "--mongo-uri=localhost",
+                    "create-task-mapping",
+                    "--project=my-project",
+                    "--src-regex=src",
+                    "--priority=high",
+                ],
+            )
+            assert result.exit_code == 0
+
+        assert new_task_mappings_mock.call_args[1]["priority"] == under_test.Priority.HIGH